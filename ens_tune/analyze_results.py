@@ -1,4 +1,4 @@
-#!/home/roehls/python_plots/my_py/bin/python
+#!/usr/bin/env python3
 
 ###############################################################################
 # analyze_results.py
@@ -10,290 +10,408 @@
 #
 # File History:
 #  v1.0: Initial Release
+#  v2.0: Python 3. The ens_tune_* folders are read in parallel into a table
+#        (one row per ensemble member, one column per parameter) that is saved
+#        to an NPZ file, and the plots are made from that table. There is no
+#        limit on the number of members or parameters.
 #
 # Notes:
-#  To use this program you MUST have pylab and numpy installed.  To see instructions on 
-#  how to do this see the TWiki page: 
-#  https://github.com/larson-group/sys_admin/wiki/Pylab
-#  You must then also change the location of python to the virtual environment 
-#  python location.
+#  To use this program you MUST have numpy and matplotlib installed.
 # Required Arguments
 #  -The folders that contain the ens_tune_* folders.
+# Example
+#  ./analyze_results.py bomex_ens dycoms2_rf01_ens --jobs 8
 ###############################################################################
 
-import os
+import argparse
 import glob
-import re
-from pylab import *
-from matplotlib.backends.backend_pdf import PdfPages
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 
 # Set up our colors that we will use, they are: orange, blue, green
 # purple, black
-ourColors =[(1,.65,0),(0,0,1),(0,1,0),(.63,.13,.94),(0,0,0)];
+ourColors = [(1,.65,0),(0,0,1),(0,1,0),(.63,.13,.94),(0,0,0)]
+
+# Name of the group with the parameter values in the tuned parameter files
+PARAMS_GROUP = "clubb_params_nl"
 
 
-# Set up some global variables
-name = []
-values = []
-costFunc = []
-numCases = len(sys.argv)-1
+##############################################################
+# findMemberFolders
+# Finds the ens_tune_* folders of a case, sorted by member number
+# Arguments: String, folder that contains the ens_tune_* folders
+##############################################################
+def findMemberFolders(caseFolder):
+    folders = [folder for folder in glob.glob(os.path.join(glob.escape(caseFolder), "ens_tune_*"))
+               if os.path.isdir(folder)]
+    return sorted(folders, key=lambda folder: (len(memberName(folder)), memberName(folder)))
 
-# Set up all of the arrays that we will need
-files = []
-folders = []
-allCost = zeros((numCases,2000))
-allNames = zeros((numCases,2000))
-allParam = zeros((numCases,4000,53))
-topResults = ones((numCases,500))
-topResultsName = ones((numCases,500))
+
+def memberName(folder):
+    return os.path.basename(folder.rstrip("/")).split("_")[-1]
 
 
 ##############################################################
 # readParameterFile
-# Function that will read the parameter file
-# Fills the name array with parameters names and
-# Fills the values array with parameters values
+# Reads the parameter names and values of a tuned parameter file
+# (the clubb_params_nl group, or the first group if it isn't there)
+# Returns a dictionary of parameter values
 # Arguments: String, file to be read
 ##############################################################
-def readParameterFile(file):
-	input = []
-	list([values.pop() for z in xrange(len(values))])	#Clear the array
-	currFile = open(file)
-
-	for line in currFile:
-		input = re.split('=',line)
-		if len(input) == 2:
-			name.append(input[0].replace(' ','')) 
-			values.append(float(input[1]))
-	currFile.close()
+def readParameterFile(filename):
+    groups = {}
+    group = None
+    with open(filename) as currFile:
+        for line in currFile:
+            line = line.split("!")[0].strip()
+            if line.startswith("&"):
+                group = line[1:].strip().lower()
+                groups.setdefault(group, {})
+            elif line == "/":
+                group = None
+            elif "=" in line:
+                name, value = line.split("=", 1)
+                try:
+                    groups.setdefault(group, {})[name.strip()] = float(value.strip().rstrip(",").replace("d", "e"))
+                except ValueError:
+                    continue
+    if PARAMS_GROUP in groups:
+        return groups[PARAMS_GROUP]
+    return next((values for values in groups.values() if values), {})
 
 
 ##############################################################
 # readCostFunction
-# Function that will read the cost function of a given ensemble run
-# It must open the tune.log file and get the cost function
+# Reads the optimal cost function of an ensemble member, from
+# the line of tune.log that starts with $$
+# Returns NaN if there is none
 # Arguments: String, folder where tune.log is located
 ##############################################################
 def readCostFunction(folder):
-	input = []
-	currFile = open(folder+'/tune.log')
-	for line in currFile:
-		input = re.split('\$\$',line)
-		if len(input) > 1:
-			costFunc.append(float(input[1].replace('\n','').replace(' ','')))
-			break
+    try:
+        with open(os.path.join(folder, "tune.log")) as currFile:
+            for line in currFile:
+                if "$$" in line:
+                    return float(line.split("$$")[1].strip())
+    except (OSError, ValueError):
+        pass
+    return np.nan
 
 
 ##############################################################
-# writeBoxHtml
-# A function that will write the html file the box plots.
-# It looks through all the box plots created and makes a html
-# page for them so they can be easily viewed
-# Arguments: None
+# readMember
+# Reads the cost function and parameters of one ensemble member
+# Arguments: String, ens_tune_* folder
 ##############################################################
-def writeBoxHtml():
-	boxFile = open('plots/box/box.html', 'w')
-	boxFile.write("<html>\n<head>\n<title>Box Plots</title>\n</head>\n<body>\n")
-	boxFile.write("<table border=\"1\" ALIGN=\"center\"><tr><th>Legend</th></tr>")
-	for i in range(1,len(sys.argv)):
-		boxFile.write("<tr><td>" + str(i) +"</td><td>"+ sys.argv[i]+"</td></tr>")
-	boxFile.write("</table>\n")
-	for pngFiles in glob.glob("plots/box/*.png"):
-		pngFiles = re.split('/',pngFiles)
-		pngFiles = pngFiles[2]
-		boxFile.write("<img width=\"324\" height=\"312\" align=\"BOTTOM\" border=\"0\" style=\"padding: 5px;\" src=\"" + pngFiles + "\" alt=\"" + pngFiles + "\" />\n")
-	boxFile.write("</div>\n</body>\n</html>")
-	boxFile.close()
+def readMember(folder):
+    parameterFiles = sorted(glob.glob(os.path.join(glob.escape(folder), "tunable_parameters*.in")))
+    params = readParameterFile(parameterFiles[0]) if parameterFiles else {}
+    return readCostFunction(folder), params
 
 
+##############################################################
+# inputFiles
+# Returns the files the table is read from
+# Arguments: List, ens_tune_* folders
+##############################################################
+def inputFiles(folders):
+    files = []
+    for folder in folders:
+        files += glob.glob(os.path.join(glob.escape(folder), "tunable_parameters*.in"))
+        files += glob.glob(os.path.join(glob.escape(folder), "tune.log"))
+    return files
+
 
 ##############################################################
-# writeScatterHtml
-# A function that will write the html file the scatter plots.
-# It looks through all the scatter plots created and makes a html
-# page for them so they can be easily viewed
-# Arguments: None
+# buildTable
+# Reads all ensemble members of all cases in parallel into a
+# table: the case index, member name, folder and cost function
+# of every member, and an array (member, parameter) of the
+# parameter values (NaN if a member doesn't have a parameter)
+# Arguments: List, case folders; Integer, number of processes
 ##############################################################
-def writeScatterHtml():
-	scatterFile = open('plots/scatter/scatter.html', 'w')
-	scatterFile.write("<html>\n<head>\n<title>Scatter Plots</title>\n</head>\n<body>\n")
-	for pngFiles in glob.glob("plots/scatter/*.png"):
-		pngFiles = re.split('/',pngFiles)
-		pngFiles = pngFiles[2]
-		scatterFile.write("<img width=\"324\" height=\"312\" align=\"BOTTOM\" border=\"0\" style=\"padding: 5px;\" src=\"" + pngFiles + "\" alt=\"" + pngFiles + "\" />\n")
-	scatterFile.write("</div>\n</body>\n</html>")
-	scatterFile.close()
+def buildTable(caseFolders, numProcesses):
+    folders = []
+    cases = []
+    for caseIndex, caseFolder in enumerate(caseFolders):
+        caseMembers = findMemberFolders(caseFolder)
+        folders += caseMembers
+        cases += [caseIndex] * len(caseMembers)
+
+    with ProcessPoolExecutor(max_workers=max(1, numProcesses)) as executor:
+        members = list(executor.map(readMember, folders, chunksize=max(1, len(folders) // (8 * max(1, numProcesses)))))
+
+    paramNames = []
+    paramColumns = {}
+    for _, params in members:
+        for name in params:
+            if name not in paramColumns:
+                paramColumns[name] = len(paramNames)
+                paramNames.append(name)
+    paramValues = np.full((len(members), len(paramNames)), np.nan)
+    for row, (_, params) in enumerate(members):
+        for name, value in params.items():
+            paramValues[row, paramColumns[name]] = value
+
+    return {"caseFolders": np.array(caseFolders), "case": np.array(cases, dtype=int),
+            "member": np.array([memberName(folder) for folder in folders]), "folder": np.array(folders),
+            "cost": np.array([cost for cost, _ in members], dtype=float),
+            "paramNames": np.array(paramNames), "params": paramValues}
 
 
 ##############################################################
-# writeIndexHtml
-# A function that will write the index html file.  This simply
-# creates a page with links to correct page
-# Arguments: None
+# loadTable
+# Loads the table from the NPZ file if it is for the same case
+# folders and members, and newer than their files. Otherwise
+# the table is read from the folders and saved to the file.
+# Arguments: String, NPZ file; List, case folders;
+#            Integer, number of processes; Boolean, rebuild
 ##############################################################
-def writeIndexHtml():
-	indexFile = open('plots/index.html', 'w')
-	indexFile.write("<html>\n<head>\n<title>index</title>\n</head>\n<body>\n")
-	indexFile.write("<a href=\"scatter/scatter.html\">Scatter Plots</a><br>\n")
-	indexFile.write("<a href=\"box/box.html\">Box Plots</a><br>\n")
-	indexFile.write("<a href=\"plotgen/index.html\">Plotgen Plots</a><br>\n")
-	indexFile.write("</body>\n</html>")
-	indexFile.close()
+def loadTable(tableFilename, caseFolders, numProcesses, rebuild=False):
+    folders = [folder for caseFolder in caseFolders for folder in findMemberFolders(caseFolder)]
+    if not rebuild and os.path.exists(tableFilename):
+        with np.load(tableFilename) as cache:
+            table = dict(cache)
+        files = inputFiles(folders)
+        if list(table["caseFolders"]) == list(caseFolders) and list(table["folder"]) == folders and \
+           (not files or max(os.path.getmtime(filename) for filename in files) <= os.path.getmtime(tableFilename)):
+            print("Using the table in " + tableFilename)
+            return table
+
+    table = buildTable(caseFolders, numProcesses)
+    np.savez(tableFilename, **table)
+    print("Read " + str(len(table["member"])) + " members into " + tableFilename)
+    return table
 
 
 ##############################################################
-# fileReading
-# A function that will write the index html file.  This simply
-# creates a page with links to correct page
-# Arguments: None
-##############################################################
-def fileReading():
-	index = 0
-	for runs in range(0,numCases):
-		list([costFunc.pop() for z in xrange(len(costFunc))])		#Clear the array
-		tempFolder=glob.glob(sys.argv[runs+1]+'/ens_tune_*')		#Get all the tuning folders for each case
-		folders.append([])
-		for p in range(0,len(tempFolder)-1):
-			folders[runs].append(tempFolder[p])			#append them to the folder array
-		folders[runs].sort()	
-		files.append([])
-		for fold in folders[runs]:					#For each folder find:
-			fileNum=re.sub('.+/.+_','',fold)			
-			allNames[runs][index]=fileNum				#the name
-			files[runs].append(glob.glob(fold+'/tunable_parameters*.in')[0]) #the locatin of tunable_parameters.in
-			readCostFunction(fold)					#the cost function
-			for p in range(0,(len(costFunc))):			#Append cost function to all cost functions
-				allCost[runs][p]=costFunc[p]
-			index = index + 1
-		temp = list(topResults[runs])					#Set up temp arrays
-		tempName = list(topResultsName[runs])
-		for numFile in range(0,len(costFunc)):				#Search for the lowest cost functions
-			for numResult in range(0,(len(costFunc))):
-				if(allCost[runs][numFile] < temp[numResult]):
-					temp.insert(numResult,allCost[runs][numFile])
-					tempName.insert(numResult,allNames[runs][numFile])
-					break
-		for numResult in range(0,len(costFunc)):			#Set the global arrays equal to the temp arrays
-			topResults[runs][numResult] = temp[numResult]
-			topResultsName[runs][numResult] = tempName[numResult]
-		index = 0 
-
-	for k in range(0,numCases):						#Reads all of the files parameters
-		i = 0
-		for paraFile in files[k]:
-			readParameterFile(paraFile)
-			for p in range(0,(len(values)-1)):
-				allParam[k][i][p] = values[p]
-			i = i +1
-			if(values[p] == 0):
-				print "Error at i=",i," and k=",k
-				exit()
+# rankInCase
+# The rank of every member by cost function within its case
+# (0 is the lowest cost, members without a cost come last)
+##############################################################
+def rankInCase(table):
+    cost = np.where(np.isnan(table["cost"]), np.inf, table["cost"])
+    order = np.lexsort((cost, table["case"]))
+    firstOfCase = np.searchsorted(table["case"][order], table["case"][order], side="left")
+    rank = np.empty(len(order), dtype=int)
+    rank[order] = np.arange(len(order)) - firstOfCase
+    return rank
+
 
+##############################################################
+# topK
+# Indices of the k members with the lowest cost function of
+# each case, best first, as a list with an array per case
+##############################################################
+def topK(table, k):
+    rank = rankInCase(table)
+    top = []
+    for caseIndex in range(len(table["caseFolders"])):
+        rows = np.nonzero((table["case"] == caseIndex) & (rank < k) & ~np.isnan(table["cost"]))[0]
+        top.append(rows[np.argsort(rank[rows])])
+    return top
+
+
+##############################################################
+# topFraction
+# Mask of the members whose cost function is in the lowest
+# fraction (e.g. 0.25 for the top 25%) of their case
+##############################################################
+def topFraction(table, fraction):
+    rank = rankInCase(table)
+    caseSizes = np.bincount(table["case"], weights=~np.isnan(table["cost"]), minlength=len(table["caseFolders"]))
+    limit = np.maximum(1, np.floor(fraction * caseSizes)).astype(int)
+    return (rank < limit[table["case"]]) & ~np.isnan(table["cost"])
 
 
+##############################################################
+# varyingParameters
+# Indices of the parameters that are not the same for all members
+##############################################################
+def varyingParameters(table):
+    with np.errstate(invalid="ignore"):
+        if table["params"].size == 0:
+            return np.array([], dtype=int)
+        return np.nonzero(np.nanmax(table["params"], axis=0) > np.nanmin(table["params"], axis=0))[0]
 
 
 ##############################################################
 # plotScatterPlots
-# Creates the scatter plots for all of the points
+# Creates the scatter plots of the cost function against each
+# parameter for all of the members, the best members of each
+# case are labeled with their member number
 # It saves each scatter plot as a .png
-##############################################################	
-def plotScatterPlots():
-	for j in range(0,len(values)):
-	#for j in range(0,1):
-		if (allParam[0][0][j] == allParam[0][1][j] == allParam[0][2][j] == allParam[0][3][j]) :	
-			print "Skipping Plot ", name[j]
-		else:
-			#Creates the scatter plots
-			maxX=allParam[0][0][j]
-			minX=allParam[0][0][j]
-			maxY=allCost[0][0]
-			print "Creating Plot ", name[j]
-			for k in range(0,numCases):
-				for i in range(0,len(files[k])):
-					scatter(allParam[k][i][j],allCost[k][i],s=0,color='white')
-					plt.text(allParam[k][i][j],allCost[k][i],int(allNames[k][i]),size='xx-small',color=ourColors[k%5])
-					if(allParam[k][i][j] > maxX):
-						maxX = allParam[k][i][j]
-					if(allParam[k][i][j] < minX):
-						minX = allParam[k][i][j]
-					if(allCost[k][i]>maxY):
-						maxY = allCost[k][i]
-			for t in range(0,numCases):
-				plt.text(maxX,(maxY-((maxY/100)*(t*2))),sys.argv[t+1].rstrip('/'),color=ourColors[t%5],size='medium')
-			title(name[j]+ ' Parameter vs Cost Function')
-			xlabel(name[j]+ ' Value')
-			ylabel('Cost Function')	
-			grid(True)
-			draw()
-			savefig("plots/scatter/"+str(j)+"temp.png")
-			#pdfScatter.savefig()
-			clf()
+##############################################################
+def plotScatterPlots(plt, table, plotDir, numLabels):
+    caseFolders = table["caseFolders"]
+    top = topK(table, numLabels)
+    for j in varyingParameters(table):
+        name = table["paramNames"][j]
+        print("Creating Plot ", name)
+        fig, ax = plt.subplots()
+        for k in range(len(caseFolders)):
+            rows = table["case"] == k
+            ax.scatter(table["params"][rows, j], table["cost"][rows], s=4, color=ourColors[k%5],
+                       label=caseFolders[k].rstrip("/"))
+            for i in top[k]:
+                ax.text(table["params"][i, j], table["cost"][i], table["member"][i], size="xx-small",
+                        color=ourColors[k%5])
+        ax.set_title(name + " Parameter vs Cost Function")
+        ax.set_xlabel(name + " Value")
+        ax.set_ylabel("Cost Function")
+        ax.grid(True)
+        ax.legend(fontsize="small")
+        fig.savefig(os.path.join(plotDir, "scatter", str(j) + "temp.png"))
+        plt.close(fig)
 
 
 ##############################################################
 # plotBoxPlots
-# Creates the box plots for the top 25% of the points
+# Creates the box plots of each parameter for the top 25%
+# (fraction) of the members of each case
 # It saves each box plot as a .png
-##############################################################	
-def plotBoxPlots():
-	for j in range(0,len(values)):
-	#for j in range(0,1):
-		if (not(allParam[0][1][j] == allParam[0][1][j] == allParam[0][2][j] == allParam[0][3][j])):
-
-			limit = zeros(len(sys.argv))
-			data = []
-			highestLimit = 0
-			legendStr = ""
-			for k in range(0,numCases):
-					limit[k] = len(files[k])/4
-					if(limit[k] > highestLimit):
-						highestLimit = limit[k]
-			top25Results = zeros(((numCases),highestLimit))
-			top25ResultsName = zeros(((numCases),highestLimit))
-			for k in range(0,numCases):
-				for i in range(0,int(limit[k])):
-					top25Results[k][i]=allParam[k][i][j]
-					top25ResultsName[k][i]=topResultsName[k][i]
-			box = []
-			allBox = []
-			#Creates the Box and Wisker Plots
-			for k in range(0,numCases):
-				data.append(top25Results[k])
-			boxplot(data)
-			ylabel('Value')
-			title(name[j])
-			grid(True)
-			savefig("plots/box/"+str(j)+"temp.png")
-			clf()
-				
-				
+##############################################################
+def plotBoxPlots(plt, table, plotDir, fraction):
+    selected = topFraction(table, fraction)
+    for j in varyingParameters(table):
+        data = []
+        for k in range(len(table["caseFolders"])):
+            values = table["params"][selected & (table["case"] == k), j]
+            data.append(values[~np.isnan(values)])
+        fig, ax = plt.subplots()
+        ax.boxplot(data)
+        ax.set_ylabel("Value")
+        ax.set_title(table["paramNames"][j])
+        ax.grid(True)
+        fig.savefig(os.path.join(plotDir, "box", str(j) + "temp.png"))
+        plt.close(fig)
+
+
 ##############################################################
 # plotPlotgen
-# Runs plotgen for all of the cases. 
-##############################################################	
-def plotPlotgen():
-	plotgenString = "plotgen -c -l -r -ensemble "
-	for k in range(0,numCases):
-		for i in range(0,10):
-			plotgenString += str(sys.argv[k+1]) + '/ens_tune_' + str(int(topResultsName[k][i])) + '/ '
-	plotgenString += "./plots/plotgen"
-	os.system(plotgenString)
+# Runs plotgen for the top 10 members of all of the cases.
+##############################################################
+def plotPlotgen(table, plotDir, numMembers):
+    plotgenString = "plotgen -c -l -r -ensemble "
+    for rows in topK(table, numMembers):
+        for i in rows:
+            plotgenString += table["folder"][i].rstrip("/") + "/ "
+    plotgenString += os.path.join(plotDir, "plotgen")
+    os.system(plotgenString)
 
 
-# Clear out the folders and make sure they exsist
-os.system("rm -rf plots && mkdir plots")
-os.system("mkdir plots/scatter")
-os.system("mkdir plots/box")
+##############################################################
+# writeBoxHtml
+# A function that will write the html file the box plots.
+# It looks through all the box plots created and makes a html
+# page for them so they can be easily viewed
+##############################################################
+def writeBoxHtml(plotDir, caseFolders):
+    with open(os.path.join(plotDir, "box", "box.html"), "w") as boxFile:
+        boxFile.write("<html>\n<head>\n<title>Box Plots</title>\n</head>\n<body>\n")
+        boxFile.write("<table border=\"1\" ALIGN=\"center\"><tr><th>Legend</th></tr>")
+        for i, caseFolder in enumerate(caseFolders, 1):
+            boxFile.write("<tr><td>" + str(i) + "</td><td>" + caseFolder + "</td></tr>")
+        boxFile.write("</table>\n")
+        writeImages(boxFile, os.path.join(plotDir, "box"))
+        boxFile.write("</div>\n</body>\n</html>")
 
 
-fileReading()
-plotScatterPlots()
-plotBoxPlots()
-plotPlotgen()
+##############################################################
+# writeScatterHtml
+# A function that will write the html file the scatter plots.
+# It looks through all the scatter plots created and makes a html
+# page for them so they can be easily viewed
+##############################################################
+def writeScatterHtml(plotDir):
+    with open(os.path.join(plotDir, "scatter", "scatter.html"), "w") as scatterFile:
+        scatterFile.write("<html>\n<head>\n<title>Scatter Plots</title>\n</head>\n<body>\n")
+        writeImages(scatterFile, os.path.join(plotDir, "scatter"))
+        scatterFile.write("</div>\n</body>\n</html>")
 
-writeBoxHtml()
-writeScatterHtml()
-writeIndexHtml()
 
-os.system("rm -rf tuner_results.maff && zip -r tuner_results.maff plots/")
+def writeImages(htmlFile, directory):
+    for pngFile in sorted(glob.glob(os.path.join(directory, "*.png"))):
+        pngFile = os.path.basename(pngFile)
+        htmlFile.write("<img width=\"324\" height=\"312\" align=\"BOTTOM\" border=\"0\" style=\"padding: 5px;\" src=\"" +
+                       pngFile + "\" alt=\"" + pngFile + "\" />\n")
+
+
+##############################################################
+# writeIndexHtml
+# A function that will write the index html file.  This simply
+# creates a page with links to correct page
+##############################################################
+def writeIndexHtml(plotDir):
+    with open(os.path.join(plotDir, "index.html"), "w") as indexFile:
+        indexFile.write("<html>\n<head>\n<title>index</title>\n</head>\n<body>\n")
+        indexFile.write("<a href=\"scatter/scatter.html\">Scatter Plots</a><br>\n")
+        indexFile.write("<a href=\"box/box.html\">Box Plots</a><br>\n")
+        indexFile.write("<a href=\"plotgen/index.html\">Plotgen Plots</a><br>\n")
+        indexFile.write("</body>\n</html>")
+
+
+##############################################################
+# printTopResults
+# Prints the members with the lowest cost functions of each case
+##############################################################
+def printTopResults(table, numMembers):
+    for k, rows in enumerate(topK(table, numMembers)):
+        print(table["caseFolders"][k] + ": " + str(np.count_nonzero(table["case"] == k)) + " members")
+        for i in rows:
+            print("  ens_tune_%-10s %15.6f" % (table["member"][i], table["cost"][i]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze the results of an ensemble tuning run")
+    parser.add_argument("caseFolders", nargs="+", help="folders that contain the ens_tune_* folders")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="number of processes that read the folders (default: number of CPUs)")
+    parser.add_argument("--table", default="tuner_results.npz",
+                        help="NPZ file for the table of members (default: %(default)s)")
+    parser.add_argument("--rebuild", action="store_true", help="read the folders even if the table is current")
+    parser.add_argument("-k", "--top", type=int, default=10,
+                        help="number of best members per case for plotgen and the labels (default: %(default)s)")
+    parser.add_argument("-f", "--fraction", type=float, default=0.25,
+                        help="fraction of best members per case in the box plots (default: %(default)s)")
+    parser.add_argument("-o", "--plot-dir", default="plots", help="directory for the plots (default: %(default)s)")
+    parser.add_argument("--no-plots", action="store_true", help="only print the best members")
+    parser.add_argument("--no-plotgen", action="store_true", help="don't run plotgen")
+    args = parser.parse_args()
+
+    table = loadTable(args.table, args.caseFolders, args.jobs, args.rebuild)
+    if len(table["member"]) == 0:
+        sys.exit("No ens_tune_* folders in " + " ".join(args.caseFolders))
+    printTopResults(table, args.top)
+    if args.no_plots:
+        return
+
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    # Clear out the folders and make sure they exist
+    shutil.rmtree(args.plot_dir, ignore_errors=True)
+    os.makedirs(os.path.join(args.plot_dir, "scatter"))
+    os.makedirs(os.path.join(args.plot_dir, "box"))
+
+    plotScatterPlots(plt, table, args.plot_dir, args.top)
+    plotBoxPlots(plt, table, args.plot_dir, args.fraction)
+    if not args.no_plotgen:
+        plotPlotgen(table, args.plot_dir, args.top)
+
+    writeBoxHtml(args.plot_dir, table["caseFolders"])
+    writeScatterHtml(args.plot_dir)
+    writeIndexHtml(args.plot_dir)
+
+    if os.path.exists("tuner_results.maff"):
+        os.remove("tuner_results.maff")
+    shutil.move(shutil.make_archive("tuner_results", "zip", ".", args.plot_dir), "tuner_results.maff")
+
+
+if __name__ == "__main__":
+    main()
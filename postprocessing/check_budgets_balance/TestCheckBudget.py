@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import checkBudget
+
+# .ctl file as written by output_grads.F90. The variable descriptions are those of the stats modules,
+# which contain no units.
+CTL_TEXT = """OPTIONS BIG_ENDIAN
+DSET ^bomex_zt.dat
+UNDEF -0.99900E+34
+XDEF    1 LINEAR  295.500 1.
+YDEF    1 LINEAR   15.000 1.
+ZDEF    4 LEVELS
+      -20.0000      20.0000      60.0000     100.0000
+TDEF    {numTimes:5d} LINEAR 00:01Z24JUN1969    1mn
+VARS    5
+thlm    4 99 thlm, Liquid water potential temperature (theta_l)
+rtm    4 99 rtm, Total (vapor+liquid) water mixing ratio
+rtm_bt    4 99 rtm_bt, rtm budget: rtm time tendency
+rtm_ma    4 99 rtm_ma, rtm budget: rtm vertical mean advection
+rtm_ta    4 99 rtm_ta, rtm budget: rtm turbulent advection
+ENDVARS
+"""
+
+NUM_LEVELS = 4
+TIMESTEP = 60.0
+
+
+class CheckBudgetTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        checkBudget.setOptions(self.folder.name + "/", checkBudget.COMPLETENESS_VARIABLES)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def writeGradsFile(self, numTimes, rtmError=None):
+        """
+        Writes a balanced rtm budget: rtm_bt = rtm_ma + rtm_ta, and rtm changes by rtm_bt * TIMESTEP
+        from one output time to the next. rtmError is added to the change of rtm.
+        """
+        random = np.random.RandomState(0)
+        rtmMa = random.uniform(-1e-7, 1e-7, (numTimes, NUM_LEVELS))
+        rtmTa = random.uniform(-1e-7, 1e-7, (numTimes, NUM_LEVELS))
+        rtmBt = (rtmMa.astype('>f4') + rtmTa.astype('>f4')).astype(float)
+        rtmChange = rtmBt * TIMESTEP
+        if rtmError is not None:
+            rtmChange = rtmChange + rtmError
+        rtmChange[0] = 0.0
+        rtm = 1e-2 + np.cumsum(rtmChange, axis=0)
+        thlm = np.full((numTimes, NUM_LEVELS), 300.0)
+
+        with open(os.path.join(self.folder.name, "bomex_zt.ctl"), 'w') as ctlFile:
+            ctlFile.write(CTL_TEXT.format(numTimes=numTimes))
+        values = np.stack([thlm, rtm, rtmBt, rtmMa, rtmTa], axis=1)
+        values.astype('>f4').tofile(os.path.join(self.folder.name, "bomex_zt.dat"))
+
+    def test_grads_units(self):
+        self.writeGradsFile(10)
+        report = checkBudget.checkFiles(["bomex_zt.ctl"], 0, 1)
+        fileReport = report["cases"]["bomex"]["files"]["bomex_zt.ctl"]
+        self.assertIsNone(fileReport["error"])
+        self.assertTrue(report["success"])
+        units = dict((check["name"], check["units"]) for check in fileReport["checks"])
+        self.assertEqual("kg kg^{-1} s^{-1}", units["rtm"])
+        self.assertEqual("kg kg^{-1} s^{-1}", units["rtm completeness test"])
+        self.assertEqual("(kg kg^{-1} s^{-1}) s", units["rtm drift test"])
+
+    def test_iteration_out_of_range(self):
+        self.writeGradsFile(10)
+        report = checkBudget.checkFiles(["bomex_zt.ctl"], 11, 1)
+        self.assertFalse(report["success"])
+        self.assertIn("only indicates 10 iterations", report["cases"]["bomex"]["files"]["bomex_zt.ctl"]["error"])
+
+    def test_drift_over_whole_run(self):
+        # The change of rtm drifts away from rtm_bt during the first time range of checkFiles only
+        numTimes = 2 * checkBudget.ITERATIONS_PER_TASK + 200
+        rtmError = np.zeros((numTimes, NUM_LEVELS))
+        rtmError[:checkBudget.ITERATIONS_PER_TASK] = 1e-3
+        self.writeGradsFile(numTimes, rtmError)
+
+        driftChecks = []
+        for numProcesses in (1, 2):
+            report = checkBudget.checkFiles(["bomex_zt.ctl"], 0, numProcesses)
+            self.assertFalse(report["success"])
+            checks = report["cases"]["bomex"]["files"]["bomex_zt.ctl"]["checks"]
+            driftChecks.append([check for check in checks if check["name"] == "rtm drift test"])
+        self.assertEqual(driftChecks[0], driftChecks[1])
+        self.assertEqual(1, len(driftChecks[0]))
+        self.assertGreater(driftChecks[0][0]["numFailures"], 0)
+        self.assertEqual(numTimes, driftChecks[0][0]["firstIteration"])
+
+        # Checking the whole run in one time range gives the same drift test
+        iterationsPerTask = checkBudget.ITERATIONS_PER_TASK
+        checkBudget.ITERATIONS_PER_TASK = numTimes
+        try:
+            report = checkBudget.checkFiles(["bomex_zt.ctl"], 0, 1)
+        finally:
+            checkBudget.ITERATIONS_PER_TASK = iterationsPerTask
+        checks = report["cases"]["bomex"]["files"]["bomex_zt.ctl"]["checks"]
+        self.assertEqual(driftChecks[0], [check for check in checks if check["name"] == "rtm drift test"])
+
+
+if __name__ == '__main__':
+    unittest.main()
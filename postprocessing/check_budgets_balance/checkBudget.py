@@ -11,11 +11,17 @@ from builtins import zip
 from builtins import str
 from builtins import range
 import sys  # Handles command line arguments
+import os
 import re   # Regular expressions
-import futurizedReadBinaryData  # Reads GrADS .dat files
+import json
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree import ElementTree
 from netCDF4 import Dataset
+# GradsDataset reads GrADS .ctl/.dat files. It is part of the pyplotgen package in the postprocessing directory.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pyplotgen.src.GradsDataset import GradsDataset
 from numpy import * # External library for handling large data sets
-from time import strftime
+from time import strftime, perf_counter
 import random
 import pdb
 # NOTE: This script contains some kludges to hide budget errors we don't have time to fix, marked with TODO
@@ -26,6 +32,15 @@ FILEPATH = "../../output/"
 # Set this to false to skip the completeness tests
 COMPLETENESS_TEST = True
 
+# State variables whose budgets get the completeness test at every single iteration. Set this to None
+# (or use --all-completeness-tests) to test all budgets.
+COMPLETENESS_VARIABLES = ["rtm", "thlm"] #TODO Ignore completeness test failures except for rtm and thlm. See ticket 153
+
+# Set this to false to skip the drift tests. The drift test is the time-integrated completeness test:
+# the budget summed over all checked iterations must equal the total change of the state variable at
+# every z level. Noise of single iterations cancels out, so it is done for all budgets.
+DRIFT_TEST = True
+
 # Scale for calculating budget balance tolerance since we cannot easily access the
 # model timestep (dt_main). Completeness tests use the frequency of statistical
 # output which is obtained from the output files
@@ -43,9 +58,23 @@ SKIP_LIST = ["nov11_altocu", \
              "gabls3_night"]
              
 # If more failures than this are reported, the test will exit to avoid a huge failure log.
+# When checking several files with checkFiles, this is the number of failures printed per case.
 MAX_FAILURES = 1000
 numFails = 0 # Global variable indicating the current number of errors found.
 
+# Units of the budget variables (e.g. rtm_bt for "rtm") as in the stats_*_module.F90 files. GrADS .ctl
+# files have no units, so these are used when a file does not give the units of a budget variable.
+BUDGET_UNITS = {"Ncm": "(num/kg)/s", "Ngm": "(num/kg)/s", "Nim": "(num/kg)/s", "Nrm": "(num/kg)/s", \
+                "Nsm": "(num/kg)/s", "rgm": "(kg/kg)/s", "rim": "(kg/kg)/s", "rrm": "kg kg^{-1} s^{-1}", \
+                "rsm": "(kg/kg)/s", "rtm": "kg kg^{-1} s^{-1}", "rtp2": "(kg^2)/(kg^2 s)", \
+                "rtp3": "kg^{3} kg^{-3} s^{-1}", "rtpthlp": "(kg K)/(kg s)", "thlm": "K s^{-1}", \
+                "thlp2": "(K^2)/s", "thlp3": "K^{3} s^{-1}", "um": "m s^{-2}", "up2": "m^2/s^3", \
+                "upwp": "m^2/s^3", "vm": "m s^{-2}", "vp2": "m^2/s^3", "vpwp": "m^2/s^3", "wp2": "m^2/s^3", \
+                "wp3": "m^{3} s^{-4}", "wprtp": "(m kg)/(s^2 kg)", "wpthlp": "(m K)/s^2"}
+
+# Files with more iterations than this are split into time ranges that are checked concurrently
+ITERATIONS_PER_TASK = 500
+
 #--------------------------------------------------------------------------------------------------
 def checkGradsBudgets(fileName, iteration):
     """
@@ -53,10 +82,8 @@ def checkGradsBudgets(fileName, iteration):
     the budget term (henceforth: leftHandValue)
     is the sum of the budget term components(RightHandValue).
     For example, vm_bt = vm_ma + vm_gf + vm_cf + vm_ta + vm_f + vm_sdmp.
-    The script also assumes that in the .ctl file, the components of a budget
-    term are listed immediately following the budget variable.
     
-    Requires: ReadBinaryData.py for reading binary Grads ".dat" files
+    Requires: GradsDataset (from pyplotgen) for memory mapping binary GrADS ".dat" files
     
     Input: fileName: Name of a GrADS .ctl/.dat file pair. Program automatically applies extensions
            iteration: The iteration to look at when balancing the budgets. 0 for all iterations
@@ -64,70 +91,57 @@ def checkGradsBudgets(fileName, iteration):
 
     testSuccess = True
     
+    gradsFile, varList, numIterations, timestep = openGradsFile(fileName)
+    
+    # Check that user entered a valid iteration
+    if iteration > numIterations:
+        sys.stderr.write(fileName + " only indicates " + str(numIterations) + " iterations\n")
+        gradsFile.close()
+        return False
+        
+    # Check the budgets for errors. Check all timesteps if iteration <= 0, otherwise
+    # just test the specified timestep
+    if iteration <= 0:
+        testSuccess = findBudgetErrors(list(range(1,numIterations+1)), gradsFile, varList, timestep, \
+                                       numIterations, testSuccess)
+    else:
+        testSuccess = findBudgetErrors([iteration], gradsFile, varList, timestep, numIterations, testSuccess)
+
+    gradsFile.close()
+    
+    return testSuccess
+    
+#--------------------------------------------------------------------------------------------------
+def openGradsFile(fileName):
+    """
+    Parses a GrADS .ctl file and memory maps its .dat file
+    
+    Input: fileName: Name of a GrADS .ctl/.dat file pair. Program automatically applies extensions
+    Output: gradsFile: GradsDataset of the file
+            varList: A list of all the variables in the order budgets are reported
+            numIterations: number of iterations
+            timestep: time in seconds between model output
+    """
     # Automatically append proper file extensions
     if fileName.find(".") != -1:
         fileName = fileName[:fileName.find(".")]
     
     ctlFileName = fileName + ".ctl"
 
-    # Extract text from file
+    # Parse the .ctl file and map the .dat file
     try:
-        ctlFile = open(FILEPATH + ctlFileName, "r")
-        text = ctlFile.read()
+        gradsFile = GradsDataset(FILEPATH + ctlFileName)
     except IOError:
         sys.stderr.write("Cannot find file " + FILEPATH + ctlFileName + "\n")
         sys.exit(1)
-        
-    # Find number of z levels (ZDEF)
-    try:
-        numLevels = re.search("ZDEF\s+[0-9]+", text).group()
-        numLevels = int( re.search("[0-9]+", numLevels).group() )
-    except AttributeError:
-        sys.stderr.write("Error parsing number of z levels from *.ctl file\n")
-        sys.exit(1)
-        
-    # Find the number of iterations (TDEF)
-    try:
-        numIterations = re.search("TDEF\s+[0-9]+", text).group()
-        numIterations = int( re.search("[0-9]+", numIterations).group() )
-    except AttributeError:
-        sys.stderr.write("Error parsing number of iterations from *.ctl file\n")
-        sys.exit(1)
-        
-    # Find the timestep and convert to seconds
-    try:
-        timestep = re.search("TDEF.+", text).group()
-        timestep = int( re.search("[0-9]+mn", timestep).group()[:-2] ) * 60
-    except AttributeError:
-        sys.stderr.write("Error parsing timestep from *.ctl file\n")
-        sys.exit(1)
-    
-    # Find number of variables (VARS)
-    try:
-        numVarsIndx = re.search("VARS\s+[0-9]+", text)
-        numVars = int( re.search("[0-9]+", numVarsIndx.group()).group() )
-    except AttributeError:
-        sys.stderr.write("Error parsing number of variables from *.ctl file\n")
+    except (ValueError, IndexError) as error:
+        sys.stderr.write("Error parsing " + ctlFileName + ": " + str(error) + "\n")
         sys.exit(1)
     
-    # Check that user entered a valid iteration
-    if iteration > numIterations:
-        sys.stderr.write(ctlFileName + " only indicates " + str(numIterations) + " iterations\n")
-        return True
-        
-    # Check the budgets for errors. Loop through all timesteps if iteration <= 0, otherwise
-    # just test the specified timestep
-    if iteration <= 0:
-        for t in range(1,numIterations+1):
-            testSuccess = findGradsErrorsAtTimestep(t, ctlFile, fileName, numVarsIndx, numVars, \
-                                                   numLevels, timestep, numIterations, testSuccess)
-    else:
-        testSuccess = findGradsErrorsAtTimestep(iteration, ctlFile, fileName, numVarsIndx, numVars, \
-                                           numLevels, timestep, numIterations, testSuccess)
-
-    ctlFile.close()
+    # Budgets are reported in the order of the .ctl file
+    varList = list(gradsFile.variables.keys())
     
-    return testSuccess
+    return gradsFile, varList, len(gradsFile.dimensions['time']), gradsFile.timestep
     
 #--------------------------------------------------------------------------------------------------
 def checkNetcdfBudgets(fileName, iteration):
@@ -137,8 +151,7 @@ def checkNetcdfBudgets(fileName, iteration):
     is the sum of the budget term components(RightHandValue).
     For example, vm_bt = vm_ma + vm_gf + vm_cf + vm_ta + vm_f + vm_sdmp.
     
-    Requires: pupynere for reading NetCDF binary files
-              NumPy to use pupynere
+    Requires: netCDF4 for reading NetCDF files
               
     Input: fileName: Name of a NetCDF file.
            iteration: The iteration to look at when balancing the budgets. 0 for all iterations
@@ -146,9 +159,37 @@ def checkNetcdfBudgets(fileName, iteration):
 
     testSuccess = True
 
+    ncFile, varList, numIterations, timestep = openNetcdfFile(fileName)
+    
+    # Check that user entered a valid iteration
+    if iteration > numIterations:
+        sys.stderr.write(fileName + " only indicates " + str(numIterations) + " iterations\n")
+        sys.exit(1)
+    
+    # Check the budgets for errors. Check all timesteps if iteration <= 0, otherwise
+    # just test the specified timestep
+    if iteration <= 0:
+        testSuccess = findBudgetErrors(list(range(1,numIterations+1)), ncFile, varList, timestep, \
+                                       numIterations, testSuccess)
+    else:
+        testSuccess = findBudgetErrors([iteration], ncFile, varList, timestep, numIterations, testSuccess)
+    ncFile.close()
+    return testSuccess
+
+#--------------------------------------------------------------------------------------------------
+def openNetcdfFile(fileName):
+    """
+    Opens a NetCDF file read-only and finds its number of iterations and output timestep
+    
+    Input: fileName: Name of a NetCDF file.
+    Output: ncFile: File object representing NetCDF file
+            varList: A list of all the variables in the order budgets are reported
+            numIterations: number of iterations
+            timestep: time in seconds between model output
+    """
     # Open File
     try:
-        ncFile = Dataset(FILEPATH + fileName, 'r+', format="NETCDF3")
+        ncFile = Dataset(FILEPATH + fileName, 'r')
     except IOError:
         sys.stderr.write("\nCannot find file " + FILEPATH + fileName + "\n\n")
         sys.exit(1)
@@ -163,315 +204,561 @@ def checkNetcdfBudgets(fileName, iteration):
     
     # Find the number of iterations
     try:
-        # Pick a random variable and see how many timesteps it has
-        varName = random.choice(list(ncFile.variables.keys()))
-        numIterations = ncFile.variables[varName].shape[0]
+        numIterations = ncFile.variables['time'].shape[0]
     except Exception:
         sys.stderr.write("Error parsing number of iterations\n")
         sys.exit(1)
         
     # Find the timestep
     try:
+        times = ncFile.variables['time'][numIterations-2:numIterations]
         if "seconds" in ncFile.variables['time'].units.lower():
-            timestep = (ncFile.variables['time'][numIterations-1:numIterations] - \
-                        ncFile.variables['time'][numIterations-2:numIterations-1])
+            timestep = float(times[1] - times[0])
         elif "minutes" in ncFile.variables['time'].units.lower():
-           timestep = 60 * (ncFile.variables['time'][numIterations-1:numIterations] - \
-                            ncFile.variables['time'][numIterations-2:numIterations-1])
+           timestep = 60 * float(times[1] - times[0])
         else:
             sys.stderr.write("Invalid units for timestep\n")
             sys.exit(1)
     except Exception:
         sys.stderr.write("Error parsing timestep\n")
         sys.exit(1)
-
-    # Find number of variables (VARS)
-    try:
-        numVars = list(ncFile.variables.keys())
-        #print(numVars)
-        # List includes the 4 dimensions. We don't want these
-        numVars = len(numVars) - 4
-    except Exception:
-        sys.stderr.write("Error parsing number of variables\n")
-        sys.exit(1)
-    
-    # Check that user entered a valid iteration
-    if iteration > numIterations:
-        sys.stderr.write(fileName + " only indicates " + str(numIterations) + " iterations\n")
-        sys.exit(1)
     
     #Prep for finding budget variables
     varList =  list(ncFile.variables.keys())
     varList.sort()
     
+    return ncFile, varList, numIterations, timestep
+
+#--------------------------------------------------------------------------------------------------
+def openBudgetFile(fileName):
+    """
+    Opens a NetCDF file (.nc or .cdf) or GrADS file (.ctl/.dat) read-only
     
-    # Check the budgets for errors. Loop through all timesteps if iteration <= 0, otherwise
-    # just test the specified timestep
-    if iteration <= 0:
-        for t in range(1,numIterations+1):
-            testSuccess = findNetcdfErrorsAtTimestep(t, ncFile, numVars, varList, numLevels, \
-                                                     timestep, numIterations, testSuccess)
-    else:
-        testSuccess = findNetcdfErrorsAtTimestep(iteration, ncFile, numVars, varList, numLevels, \
-                                                 timestep, numIterations, testSuccess)
-    #print(varList)
-    #print(numVars)
-    ncFile.close()
-    return testSuccess
+    Input: fileName: Name of the file
+    Output: budgetFile, varList, numIterations, timestep as returned by openNetcdfFile
+    """
+    if isNetcdfFile(fileName):
+        return openNetcdfFile(fileName)
+    return openGradsFile(fileName)
 
 #--------------------------------------------------------------------------------------------------
-def findGradsErrorsAtTimestep(iteration, ctlFile, fileName, numVarsIndx, numVars, \
-                         numLevels, timestep, numIterations, testSuccess):
+def isNetcdfFile(fileName):
     """
-    Looks through a .ctl file for a budget variable (a variable ending in _bt). Once found,
-    it finds all variables that are components of the budget variable (variables with the same
-    prefix, e.g. thlm_ma and thlm_sdmp for the budget variable thlm_bt) and adds these together.
-    If the difference is greater than a given tolerance the failure is output to std output.
+    Input: fileName: Name of a data file
+    Output: True if the file is a NetCDF file, False if it is assumed to be a GrADS file
+    """
+    return fileName.find(".nc") != -1 or fileName.find(".cdf") != -1
+
+#--------------------------------------------------------------------------------------------------
+def findTestableFiles():
+    """
+    Lists the zt and zm files in FILEPATH, without GrADS .dat files, radiation files and
+    cases in SKIP_LIST
     
-    Input: iteration: The value of t
-           ctlFile: File object representing .ctl file
-           fileName: Name of .ctl and .dat file (no extension)
-           numVarsIndx: Index in ctlFile right before variable list
-           numVars: number of variables in .ctl file
-           numLevels: number of z levels
-           timestep: time between model iterations
-           numIterations: number of iterations
-           testSuccess: Whether the test is succeeding or failing
+    Output: Sorted list of file names
     """
+    testableFiles = []
     
-    findingBudget = False
+    for dataFile in os.listdir(FILEPATH):
+        skipCase = False
+        for case in SKIP_LIST:
+            if dataFile.find(case) > -1:
+                skipCase = True
+        
+        # Only keep files ending with zt or zm not including .dat or rad files
+        if (dataFile.find("zt.") > -1 or dataFile.find("zm.") > -1) and dataFile.find(".dat") == -1 and dataFile.find("rad") == -1 and skipCase == False:
+            testableFiles.append(dataFile)
     
-    datFileName = fileName + ".dat"
+    testableFiles.sort()
+    return testableFiles
+
+#--------------------------------------------------------------------------------------------------
+def findCaseName(fileName):
+    """
+    Input: fileName: Name of a data file, e.g. "bomex_zt.nc"
+    Output: Name of the case, e.g. "bomex"
+    """
+    return re.sub("_(zt|zm)$", "", os.path.splitext(fileName)[0])
+
+#--------------------------------------------------------------------------------------------------
+def checkFiles(dataFiles, iteration, numProcesses):
+    """
+    Checks the budgets of several files concurrently in a process pool. Files with more than
+    ITERATIONS_PER_TASK iterations are split into time ranges that are checked concurrently, too.
+    All files are opened read-only.
+    Failures are printed in the same format as checkNetcdfBudgets, in the order of dataFiles.
+    Instead of exiting after MAX_FAILURES failures, at most MAX_FAILURES failures are printed per
+    case and the remaining ones are only counted.
+    
+    Input: dataFiles: List of NetCDF or GrADS files in FILEPATH
+           iteration: The iteration to look at when balancing the budgets. 0 for all iterations
+           numProcesses: Number of worker processes. With 1, all files are checked in this process.
+    Output: Report of the results per case, file and budget, see writeJsonReport
+    """
+    # Split the files into time ranges
+    tasks = []
+    fileResults = dict((dataFile, []) for dataFile in dataFiles)
+    for dataFile in dataFiles:
+        try:
+            budgetFile, varList, numIterations, timestep = openBudgetFile(dataFile)
+            budgetFile.close()
+        except (Exception, SystemExit) as error:
+            fileResults[dataFile].append(makeErrorResult(dataFile, error))
+            continue
         
-    # Count lines to budget term
-    ctlFile.seek(numVarsIndx.end()) # Move file pointer to start of variable declarations
-    varNum = 0 # Used for finding variables in GrADS .dat files
-    rightHandValue = [0]*numLevels # RHS of budget equation. Each z level is treated separately
+        if iteration > numIterations:
+            fileResults[dataFile].append(makeErrorResult(dataFile, \
+                ValueError(dataFile + " only indicates " + str(numIterations) + " iterations")))
+        elif iteration > 0:
+            tasks.append((dataFile, iteration, iteration))
+        else:
+            for firstIteration in range(1, numIterations + 1, ITERATIONS_PER_TASK):
+                tasks.append((dataFile, firstIteration, int(minimum(firstIteration + ITERATIONS_PER_TASK - 1, numIterations))))
+    
+    if numProcesses > 1 and len(tasks) > 1:
+        executor = ProcessPoolExecutor(max_workers=int(minimum(numProcesses, len(tasks))), initializer=setOptions, \
+                                       initargs=(FILEPATH, COMPLETENESS_VARIABLES))
+        pendingResults = [(task[0], executor.submit(checkIterationRange, *task)) for task in tasks]
+    else:
+        executor = None
+        pendingResults = [(task[0], task) for task in tasks]
     
-    for line in ctlFile:
+    # Print the results of every file as soon as all of its time ranges are checked
+    report = {"success": len(dataFiles) > 0, "iteration": iteration, "cases": {}}
+    try:
+        for dataFile in dataFiles:
+            print("".join(["\n", strftime("%H:%M:%S"), " - Testing ", dataFile]))
+            for taskFile, pendingResult in pendingResults:
+                if taskFile == dataFile:
+                    if executor is None:
+                        fileResults[dataFile].append(checkIterationRange(*pendingResult))
+                    else:
+                        fileResults[dataFile].append(pendingResult.result())
             
-        # Once a budget term is found, sum each following line that contains the same 
-        # variable prefix. Then determine whether the difference between this sum and
-        # the budget term is within a passable tolerance
-        if findingBudget == True:
+            caseReport = report["cases"].setdefault(findCaseName(dataFile), {"numFailures": 0, "files": {}})
+            fileReport = mergeResults(fileResults[dataFile], caseReport)
+            caseReport["files"][dataFile] = fileReport
+            if fileReport["error"] is not None or sum([check["numFailures"] for check in fileReport["checks"]]) > 0:
+                report["success"] = False
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    
+    return report
+
+#--------------------------------------------------------------------------------------------------
+def setOptions(filePath, completenessVariables):
+    """
+    Sets the options that can be changed when running the script. The worker processes of
+    checkFiles are initialized with this, so they use the same options as the main process.
+    
+    Input: filePath: New value of FILEPATH
+           completenessVariables: New value of COMPLETENESS_VARIABLES
+    """
+    global FILEPATH, COMPLETENESS_VARIABLES
+    
+    FILEPATH = filePath
+    COMPLETENESS_VARIABLES = completenessVariables
+
+#--------------------------------------------------------------------------------------------------
+def checkIterationRange(fileName, firstIteration, lastIteration):
+    """
+    Checks the budgets of one file at a range of iterations. This runs in the worker processes
+    of checkFiles.
+    
+    Input: fileName: Name of a NetCDF or GrADS file in FILEPATH
+           firstIteration: First value of t to check
+           lastIteration: Last value of t to check
+    Output: Dictionary with the statistics of every check ("checks"), the first MAX_FAILURES
+            failures as (termName, iteration, zLevel, difference, termUnits, percentError) tuples
+            ("failures"), the partial sums of the drift tests ("driftSums", see calcBudgetFailures)
+            and the reason why the file could not be checked ("error")
+    """
+    startTime = perf_counter()
+    driftSums = {}
+    try:
+        budgetFile, varList, numIterations, timestep = openBudgetFile(fileName)
+        try:
+            checkStats, failures = summarizeFailures(*calcBudgetFailures(arange(firstIteration, lastIteration + 1), \
+                budgetFile, varList, timestep, numIterations, driftSums))
+        finally:
+            budgetFile.close()
+    except (Exception, SystemExit) as error:
+        return makeErrorResult(fileName, error)
+    
+    return {"file": fileName, "checks": checkStats, "failures": failures, "driftSums": driftSums, "error": None, \
+            "time": perf_counter() - startTime}
+
+#--------------------------------------------------------------------------------------------------
+def summarizeFailures(checks, failedIterations, failedChecks, failedLevels, failedDifferences, failedErrors):
+    """
+    Input: checks, failedIterations, failedChecks, failedLevels, failedDifferences, failedErrors:
+           Output of calcBudgetFailures
+    Output: checkStats: Number of failures, first failure and largest error of every check
+            failures: The first MAX_FAILURES failures as (termName, iteration, zLevel, difference,
+                      termUnits, percentError) tuples
+    """
+    checkStats = []
+    for checkNum, (termName, termUnits) in enumerate(checks):
+        failureIndx = nonzero(failedChecks == checkNum)[0]
+        stats = {"name": termName, "units": termUnits, "numFailures": len(failureIndx)}
+        if len(failureIndx) > 0:
+            # Failures are sorted by iteration, so the first one is the earliest
+            worstIndx = failureIndx[argmax(absolute(failedErrors[failureIndx]))]
+            stats["firstIteration"] = int(failedIterations[failureIndx[0]])
+            stats["firstLevel"] = int(failedLevels[failureIndx[0]])
+            stats["maxPercentError"] = float(failedErrors[worstIndx])
+            stats["maxErrorIteration"] = int(failedIterations[worstIndx])
+            stats["maxErrorLevel"] = int(failedLevels[worstIndx])
+        checkStats.append(stats)
+    
+    failures = [(checks[checkNum][0], int(failedIteration), int(failedLevel), float(failedDifference), checks[checkNum][1], \
+                 float(failedError)) for failedIteration, checkNum, failedLevel, failedDifference, failedError \
+                in zip(*[failed[:MAX_FAILURES] for failed in (failedIterations, failedChecks, failedLevels, failedDifferences, failedErrors)])]
+    
+    return checkStats, failures
+
+#--------------------------------------------------------------------------------------------------
+def makeErrorResult(fileName, error):
+    """
+    Input: fileName: Name of a file that could not be checked
+           error: The exception. For SystemExit, the reason was already written to stderr.
+    Output: Result in the format of checkIterationRange
+    """
+    if isinstance(error, SystemExit):
+        message = "Cannot check " + fileName + ", see the error output"
+    else:
+        message = "Cannot check " + fileName + ": " + type(error).__name__ + ": " + str(error)
+        sys.stderr.write(message + "\n")
+    return {"file": fileName, "checks": [], "failures": [], "driftSums": {}, "error": message, "time": 0.0}
+
+#--------------------------------------------------------------------------------------------------
+def mergeResults(results, caseReport):
+    """
+    Prints the failures of all time ranges of a file, up to MAX_FAILURES per case, and combines
+    their statistics. The drift tests are done here over all time ranges together, by adding up
+    their partial sums.
+    
+    Input: results: Results of checkIterationRange for the time ranges of one file, in order
+           caseReport: Report of the case of the file. Its number of failures is updated.
+    Output: Report of the file, see writeJsonReport
+    """
+    fileReport = {"checks": [], "failures": [], "error": None, "time": 0.0}
+    checkReports = {}
+    
+    driftSums = {}
+    for result in results:
+        for termName, partialSums in result["driftSums"].items():
+            if termName not in driftSums:
+                driftSums[termName] = dict(partialSums)
+                continue
+            for key in ("budgetSum", "stateChange", "numIterations"):
+                driftSums[termName][key] = driftSums[termName][key] + partialSums[key]
+            driftSums[termName]["lastIteration"] = int(maximum(driftSums[termName]["lastIteration"], \
+                                                                partialSums["lastIteration"]))
+    if len(driftSums) > 0 and not any([result["error"] is not None for result in results]):
+        checkStats, failures = summarizeFailures(*findFailures(calcDriftChecks(driftSums)))
+        results = results + [{"checks": checkStats, "failures": failures, "error": None, "time": 0.0}]
+    
+    for result in results:
+        fileReport["time"] += result["time"]
+        if result["error"] is not None:
+            fileReport["error"] = result["error"]
         
-            # See if line contains same variable prefix as budget term
-            componentTerm = re.match("\w+?_", line).group()
-            if componentTerm == termName:
-            
-                # Vars in the budget have descriptions that include "budget:"
-                if line.find("budget:") != -1:
-                    
-                    componentValue = array(readBinaryData.readGradsData \
-                        (FILEPATH + datFileName, numLevels, iteration, iteration, varNum, numVars))
-                        
-                    # Add componentValue to rightHandValue,
-                    # gradually summing up all the component variables
-                    rightHandValue = add(rightHandValue, componentValue)
+        for stats in result["checks"]:
+            if stats["name"] not in checkReports:
+                checkReports[stats["name"]] = dict(stats)
+                fileReport["checks"].append(checkReports[stats["name"]])
+                continue
+            checkReport = checkReports[stats["name"]]
+            if "firstIteration" not in checkReport and stats["numFailures"] > 0:
+                checkReport.update(stats)
+                checkReport["numFailures"] = 0
+            elif stats["numFailures"] > 0 and abs(stats["maxPercentError"]) > abs(checkReport["maxPercentError"]):
+                for key in ("maxPercentError", "maxErrorIteration", "maxErrorLevel"):
+                    checkReport[key] = stats[key]
+            checkReport["numFailures"] += stats["numFailures"]
         
-            # Find error between budget term and sum of component terms
-            else:
-                errorDifference = leftHandValue - rightHandValue
-                allowedTolerance = calcTolerance(termUnits, TIME_SCALE_DENOMINATOR, termName[0:-1])
-
-                # Ignore zt(1) since it is below ground. Still use zm(1) however
-                if fileName.find("_zt") != -1:
-                    zLevel = 1
-                    errorDifference = errorDifference[1:]
-                else:
-                    zLevel = 0
-                
-                testSuccess = dispError(leftHandValue, rightHandValue, errorDifference, allowedTolerance, iteration, zLevel, termName[:-1], \
-                    termUnits, testSuccess)
-                    
-                findingBudget = False
-                
-        # Find budget term of the form [variablePrefix]_bt
-        if findingBudget == False and re.match("\w+_bt", line) != None:
-            termName = re.match("\w+_bt", line).group()[0:-2]
-            termUnits = re.search("[[].+[]]", line).group()[1:-1]
-            leftHandValue = array(readBinaryData.readGradsData \
-                (FILEPATH + datFileName, numLevels, iteration, iteration, varNum, numVars))
-
-            # Can't do completeness check when iteration is 1
-            if iteration != 1 and COMPLETENESS_TEST == True:
-                if termName[:-1] == "rtm" or termName[:-1] == "thlm": #TODO Ignore completeness test failures except for rtm and thlm. See ticket 153
-                    # Check that the budget is consistent with previous and next time iterations
-                    testSuccess = checkGradsCompleteness(fileName, numLevels, iteration, numVars, \
-                                  termName[:-1], termUnits, timestep, leftHandValue, numVarsIndx.end(), testSuccess)
+        for failure in result["failures"]:
+            if caseReport["numFailures"] + len(fileReport["failures"]) < MAX_FAILURES:
+                print(formatFailure(*failure))
+                fileReport["failures"].append(failure)
+    
+    numFailures = int(sum([checkReport["numFailures"] for checkReport in fileReport["checks"]]))
+    if caseReport["numFailures"] < MAX_FAILURES <= caseReport["numFailures"] + numFailures:
+        print("Too many failures in this case: not showing more. (Change MAX_FAILURES variable to view more)")
+    caseReport["numFailures"] += numFailures
+    
+    return fileReport
 
-                
-            rightHandValue = [0]*numLevels    # Clear old data
-            findingBudget = True
-             
-        varNum += 1
+#--------------------------------------------------------------------------------------------------
+def writeJsonReport(report, fileName):
+    """
+    Writes the report of checkFiles as JSON. It contains "success", the checked "iteration" and
+    "cases", which holds the total "numFailures" and the "files" of every case. For every file,
+    "checks" lists the number of failures of each budget and completeness test, together with its
+    first failure and largest error. "failures" holds the failures that were printed, and "error"
+    gives the reason if the file could not be checked.
+    
+    Input: report: Report returned by checkFiles
+           fileName: Name of the JSON file
+    """
+    jsonReport = dict(report)
+    jsonReport["cases"] = {}
+    for caseName, caseReport in report["cases"].items():
+        jsonReport["cases"][caseName] = {"numFailures": caseReport["numFailures"], "files": {}}
+        for dataFile, fileReport in caseReport["files"].items():
+            jsonFileReport = dict(fileReport)
+            jsonFileReport["failures"] = [dict(zip(("name", "iteration", "zLevel", "difference", "units", "percentError"), failure)) \
+                                          for failure in fileReport["failures"]]
+            jsonReport["cases"][caseName]["files"][dataFile] = jsonFileReport
+    
+    with open(fileName, "w") as jsonFile:
+        json.dump(jsonReport, jsonFile, indent=2)
+
+#--------------------------------------------------------------------------------------------------
+def writeJunitReport(report, fileName):
+    """
+    Writes the report of checkFiles as JUnit XML, e.g. for CI systems. Every case is a test suite
+    and every budget and completeness test of its files is a test case.
+    
+    Input: report: Report returned by checkFiles
+           fileName: Name of the XML file
+    """
+    testSuites = ElementTree.Element("testsuites", name="checkBudget")
+    totals = {"tests": 0, "failures": 0, "errors": 0, "skipped": 0}
+    
+    for caseName, caseReport in report["cases"].items():
+        testSuite = ElementTree.SubElement(testSuites, "testsuite", name=caseName)
+        counts = {"tests": 0, "failures": 0, "errors": 0, "skipped": 0}
+        suiteTime = 0.0
         
-    return testSuccess
+        for dataFile, fileReport in caseReport["files"].items():
+            className = os.path.splitext(dataFile)[0]
+            suiteTime += fileReport["time"]
+            if fileReport["error"] is not None:
+                testCase = ElementTree.SubElement(testSuite, "testcase", classname=className, name=dataFile)
+                counts["tests"] += 1
+                ElementTree.SubElement(testCase, "error", message=fileReport["error"])
+                counts["errors"] += 1
+            
+            for checkReport in fileReport["checks"]:
+                testCase = ElementTree.SubElement(testSuite, "testcase", classname=className, name=checkReport["name"])
+                counts["tests"] += 1
+                if checkReport["numFailures"] > 0:
+                    failure = ElementTree.SubElement(testCase, "failure", type="BudgetImbalance", message= \
+                        "%d failures, first at t= %d and z= %d, largest error %.9f %% at t= %d and z= %d" % \
+                        (checkReport["numFailures"], checkReport["firstIteration"], checkReport["firstLevel"], \
+                         checkReport["maxPercentError"], checkReport["maxErrorIteration"], checkReport["maxErrorLevel"]))
+                    failure.text = "\n".join([formatFailure(*failedCheck) for failedCheck in fileReport["failures"] \
+                                              if failedCheck[0] == checkReport["name"]])
+                    counts["failures"] += 1
+        
+        for key, count in counts.items():
+            testSuite.set(key, str(count))
+            totals[key] += count
+        testSuite.set("time", "%.3f" % suiteTime)
+    
+    for key, count in totals.items():
+        testSuites.set(key, str(count))
     
+    ElementTree.ElementTree(testSuites).write(fileName, encoding="utf-8", xml_declaration=True)
+
 #--------------------------------------------------------------------------------------------------
-def findNetcdfErrorsAtTimestep(iteration, ncFile, numVars, varList, numLevels, timestep, numIterations, testSuccess):
+def findBudgetErrors(iterations, ncFile, varList, timestep, numIterations, testSuccess):
     """
-    Looks through a list of variables in alphabetical order for budget variables (ending in _bt)
+    Checks all budget variables (ending in _bt) at all requested iterations at once. Every variable
+    is read only once as a (time, level) array, and the budget residuals and tolerance violations
+    of all iterations are computed in one NumPy pass. Failures are reported in the same order and
+    format as checking one iteration after the other with dispError.
     
-    Input: iteration: The value of t
-           ncFile: File object representing NetCDF file
-           numVars: number of variables
-           varList: A list of all the variables in alphabetical order
-           numLevels: number of z levels
+    Input: iterations: List of values of t to check
+           ncFile: File object representing NetCDF file or GradsDataset
+           varList: A list of all the variables in the order budgets are reported
+           timestep: time in seconds between model output
            numIterations: number of iterations
            testSuccess: Whether the test is succeeding or failing
     """
+    checks, failedIterations, failedChecks, failedLevels, failedDifferences, failedErrors = \
+        calcBudgetFailures(iterations, ncFile, varList, timestep, numIterations)
     
-    rightHandValue = array( [0]*numLevels ) # RHS of budget equation. Each z level is treated separately
-    # Find a budget variable (_bt)
-    for varName in varList:
-        try:
-            # If varName is not budget var, exception will be thrown and next var checked
-            budgetVarName = re.match("\w+_bt", varName).group()
-            
-            budgetVar = ncFile.variables[varName]           
-            leftHandValue = budgetVar[iteration-1:iteration] # First index of list is 0 
-            
-            # Can't do completeness check when iteration is 1
-            if iteration != 1 and COMPLETENESS_TEST == True:
-                if budgetVarName[:-3] == "rtm" or budgetVarName[:-3] == "thlm": #TODO Ignore completeness test failures except for rtm and thlm. See ticket 153
-                    # Check that the budget is consistent with previous and next time iterations
-                    testSuccess = checkNetcdfCompleteness(ncFile, numLevels, iteration, numVars, \
-                                  budgetVarName[:-3], varList, budgetVar.units, timestep, leftHandValue, testSuccess)
-            
-            # Find components of the budget variable
-            for variableName in varList:
-                try:
-                    varPrefix = re.match("\w+?_", variableName).group()
-                    if varPrefix == budgetVarName[:-2] and variableName[-2:] != "bt":
-                            var = ncFile.variables[variableName]
-                            
-                            # Vars in the budget have descriptions that include eg. "thlm budget:"
-                            if var.long_name.find("budget:") != -1:
-                                componentValue = array(var[iteration-1:iteration] )
-                                rightHandValue = rightHandValue + componentValue
-                        
-                except AttributeError:
-                    pass
-                    
-            # All component terms have been summed up
-            errorDifference = [a - b for a,b in zip(leftHandValue, rightHandValue)]
-            allowedTolerance = calcTolerance(budgetVar.units, TIME_SCALE_DENOMINATOR, budgetVarName[0:-3])
-
-            # Ignore zt(1) since it is below ground. Still use zm(1) however
-            if ncFile.filepath().find("_zt") != -1:
-                zLevel = 1
-                errorDifference = errorDifference[1:]
-            else:
-                zLevel = 0
-
-            testSuccess = dispError(leftHandValue, rightHandValue, errorDifference, allowedTolerance, iteration, zLevel, budgetVarName[:-3], \
-                budgetVar.units, testSuccess)
-            #print(varName)
-            #set_printoptions(threshold=sys.maxsize)
-            #print(errorDifference)
-            
+    for i in range(len(failedIterations)):
+        termName, termUnits = checks[failedChecks[i]]
+        testSuccess = reportFailure(termName, failedIterations[i], failedLevels[i], failedDifferences[i], \
+                                    termUnits, failedErrors[i])
     
-            # Clear old data
-            rightHandValue = [0]*numLevels 
-           
-        except AttributeError:
-            pass
-        
     return testSuccess
 
 #--------------------------------------------------------------------------------------------------
-def checkGradsCompleteness(fileName, numLevels, iteration, numVars, \
-                           termName, termUnits, timestep, leftHandValue, numVarsIndx, testSuccess):
-    """
-    Check that the budgets are complete with the equation:
-    rtm_bt = (rtm_after - rtm_before) / timestep
-    This cannot run when t = 1 as rtm_before does not exist in this case.
-    Input: datFileName: Needed to read Grads .dat file
-           numLevels:       ""
-           iteration:       ""
-           numVars:         ""
-           termName: Name of variable
-           termUnits: Units of variable, used for deciding error tolerance
-           timestep: time in model that passes before variables are updated
-           leftHandValue: value of budget term
-           numVarsIndx: Index of ctlFile where variables start
-           testSuccess: Whether the test is succeeding or failing
+def calcBudgetFailures(iterations, ncFile, varList, timestep, numIterations, driftSums=None):
     """
+    Computes the budget residuals and tolerance violations of all budget variables at all requested
+    iterations. Only the iterations that are needed are read from the file.
     
-    ctlFileName = fileName + ".ctl"
-    datFileName = fileName + ".dat"
+    Input: iterations: List of values of t to check
+           ncFile: File object representing NetCDF file or GradsDataset
+           varList: A list of all the variables in the order budgets are reported
+           timestep: time in seconds between model output
+           numIterations: number of iterations
+           driftSums: If given, the drift tests are not done. Instead, this dictionary is filled
+                      with their partial sums over iterations, by name of the budgeted variable,
+                      so the drift tests of consecutive ranges of iterations can be done together
+                      by calcDriftChecks.
+    Output: checks: List of (name, units) of every check, e.g. ("rtm", "(kg/kg)/s"),
+                    ("rtm completeness test", "(kg/kg)/s") and ("rtm drift test", "kg/kg")
+            failedIterations, failedChecks, failedLevels, failedDifferences, failedErrors: Arrays
+                    with the iteration, index into checks, z level (starting at 1), difference and
+                    percent error of every failure, sorted by iteration, check and z level
+    """
+    iterations = array(iterations)
+    
+    # The completeness and drift tests at iteration t need the state variable at t-1
+    firstIteration = maximum(1, iterations.min() - 1)
+    lastIteration = iterations.max()
+    rows = iterations - firstIteration
     
-    ctlFile = open(FILEPATH + ctlFileName, "r")
+    # Each check consists of: name, units, iterations checked, leftHandValue, rightHandValue, allowedTolerance
+    checks = []
+    for varName, termName, componentNames in findBudgetTerms(ncFile, varList):
+        budgetUnits = findBudgetUnits(ncFile, varName, termName)
+        leftHandValue = readNetcdfVariable(ncFile, varName, firstIteration, lastIteration)[rows]
+        
+        # Can't do completeness or drift tests when iteration is 1
+        completenessIterations = iterations[iterations != 1]
+        isCompletenessTest = COMPLETENESS_TEST == True and \
+                             (COMPLETENESS_VARIABLES is None or termName in COMPLETENESS_VARIABLES)
+        isDriftTest = DRIFT_TEST == True and len(completenessIterations) > (1 if driftSums is None else 0)
+        if termName in ncFile.variables and (isCompletenessTest or isDriftTest):
+            # Change of the state variable from the previous iteration, at all checked iterations and z levels
+            statVar = readNetcdfVariable(ncFile, termName, firstIteration, lastIteration)
+            stateChange = diff(statVar, axis=0)[rows[iterations != 1] - 1]
+            
+            if isCompletenessTest:
+                # Check that the budget is consistent with previous and next time iterations.
+                checks.append((termName + " completeness test", budgetUnits, completenessIterations, \
+                               leftHandValue[iterations != 1], stateChange / float64(timestep), \
+                               calcTolerance(budgetUnits, timestep, termName)))
+            
+            if isDriftTest:
+                # Check that the budget integrated over time adds up to the total change of the state
+                # variable. The difference is the cumulative drift at the last iteration, its tolerance the
+                # completeness test tolerance accumulated over all iterations.
+                partialSums = {"units": getattr(ncFile.variables[termName], "units", "") or "(" + budgetUnits + ") s", \
+                               "budgetSum": sum(leftHandValue[iterations != 1], axis=0, dtype=float64) * timestep, \
+                               "stateChange": sum(stateChange, axis=0, dtype=float64), \
+                               "numIterations": len(completenessIterations), \
+                               "lastIteration": int(completenessIterations[-1]), \
+                               "tolerance": calcTolerance(budgetUnits, timestep, termName) * timestep}
+                if driftSums is None:
+                    checks.extend(calcDriftChecks({termName: partialSums}))
+                else:
+                    driftSums[termName] = partialSums
+        
+        # Sum up all component terms
+        rightHandValue = zeros(leftHandValue.shape)
+        for componentName in componentNames:
+            rightHandValue = rightHandValue + readNetcdfVariable(ncFile, componentName, firstIteration, lastIteration)[rows]
+        
+        checks.append((termName, budgetUnits, iterations, leftHandValue, rightHandValue, \
+                       calcTolerance(budgetUnits, TIME_SCALE_DENOMINATOR, termName)))
     
-    # Find variable number of the real, non-budget variable
-    ctlFile.seek(numVarsIndx)
-    varNum = 0
-    for line in ctlFile:
-        if re.match(termName+"[^_]", line) != None:
-            break
-        varNum += 1
+    return findFailures(checks)
 
-    varAfter = array(readBinaryData.readGradsData \
-        (FILEPATH + datFileName, numLevels, iteration, iteration, varNum, numVars))
-    varBefore = array(readBinaryData.readGradsData \
-        (FILEPATH + datFileName, numLevels, iteration-1, iteration-1, varNum, numVars))
+#--------------------------------------------------------------------------------------------------
+def calcDriftChecks(driftSums):
+    """
+    Input: driftSums: Partial sums of the drift tests over all checked iterations, see calcBudgetFailures
+    Output: The drift tests in the format of the checks of findFailures. Drift tests over less than
+            2 iterations are left out.
+    """
+    return [(termName + " drift test", partialSums["units"], array([partialSums["lastIteration"]]), \
+             partialSums["budgetSum"][newaxis], partialSums["stateChange"][newaxis], \
+             partialSums["tolerance"] * partialSums["numIterations"]) \
+            for termName, partialSums in driftSums.items() if partialSums["numIterations"] > 1]
+
+#--------------------------------------------------------------------------------------------------
+def findFailures(checks):
+    """
+    Input: checks: List of (name, units, iterations checked, leftHandValue, rightHandValue,
+                   allowedTolerance) of every check. The values are (iteration, level) arrays.
+    Output: The output of calcBudgetFailures
+    """
+    # Collect the failures of all checks, then sort them by iteration, check and z level
+    failedIterations, failedChecks, failedLevels, failedDifferences, failedErrors = [], [], [], [], []
+    for checkNum, (termName, termUnits, checkIterations, leftHandValue, rightHandValue, allowedTolerance) in enumerate(checks):
+        errorDifference, percentError = calcBudgetErrors(leftHandValue, rightHandValue, allowedTolerance)
+        timeIndx, levelIndx = nonzero(absolute(percentError) >= TEST_LENIENCY)
+        failedIterations.append(checkIterations[timeIndx])
+        failedChecks.append(full(len(timeIndx), checkNum))
+        # z levels are numbered starting at 1
+        failedLevels.append(levelIndx + 1)
+        failedDifferences.append(errorDifference[timeIndx, levelIndx])
+        failedErrors.append(percentError[timeIndx, levelIndx])
     
-    rightHandValue = (varAfter - varBefore) / timestep
+    failed = [concatenate(failedValues) if len(failedValues) > 0 else array([], dtype=int) \
+              for failedValues in (failedIterations, failedChecks, failedLevels, failedDifferences, failedErrors)]
+    order = lexsort((failed[2], failed[1], failed[0]))
     
-    errorDifference = leftHandValue - rightHandValue
-    allowedTolerance = calcTolerance(termUnits, timestep, termName)
+    return [check[:2] for check in checks], *[failedValues[order] for failedValues in failed]
+
+#--------------------------------------------------------------------------------------------------
+def findBudgetTerms(ncFile, varList):
+    """
+    Builds the map from every budget variable (ending in _bt) to its component terms in a single
+    pass over the variable list. Components are variables with the same prefix as the budget
+    variable (e.g. thlm_ma and thlm_sdmp for the budget variable thlm_bt) whose descriptions
+    include "budget:", e.g. "thlm_ma, thlm budget: thlm vertical mean advection".
     
-    # Specify that this is the completeness test when printing to stdout
-    termName = termName + " completeness test"
+    Input: ncFile: File object representing NetCDF file or GradsDataset
+           varList: A list of all the variables in the order budgets are reported
+    Output: List of (budget variable, name of budgeted variable, list of component variables)
+            in the order of varList
+    """
+    budgetVars = []
+    componentsByPrefix = {}
     
-    zLevel = 0
-    testSuccess = dispError(leftHandValue, rightHandValue, errorDifference, allowedTolerance, iteration, zLevel, termName, termUnits, testSuccess)
-                    
-    return testSuccess
+    for varName in varList:
+        budgetVarName = re.match("\w+_bt", varName)
+        if budgetVarName != None:
+            budgetVars.append((varName, budgetVarName.group()))
+            
+        varPrefix = re.match("\w+?_", varName)
+        if varPrefix != None and varName[-2:] != "bt":
+            # Vars in the budget have descriptions that include eg. "thlm budget:"
+            if getattr(ncFile.variables[varName], "long_name", "").find("budget:") != -1:
+                componentsByPrefix.setdefault(varPrefix.group(), []).append(varName)
     
+    return [(varName, budgetVarName[:-3], componentsByPrefix.get(budgetVarName[:-2], [])) \
+            for varName, budgetVarName in budgetVars]
+
 #--------------------------------------------------------------------------------------------------
-def checkNetcdfCompleteness(ncFile, numLevels, iteration, numVars, \
-                              termName, varList, termUnits, timestep, leftHandValue, testSuccess):
+def findBudgetUnits(ncFile, varName, termName):
     """
-    Check that the budgets are complete with the equation (using rtm as an example):
-    rtm_bt = (rtm_after - rtm_before) / timestep
-    This cannot run when t = 1 as rtm_before does not exist in this case.
-    Input: ncFile: The NetCDF data file
-           numLevels: Number of z levels in data file
-           iteration: Value of t
-           numVars: Number of variables in data file
-           termName: Name of variable
-           varList: List of variables in data file
-           termUnits: Units of variable, used for deciding error tolerance
-           timestep: time in model that passes before variables are updated
-           leftHandValue: value of budget term
-           testSuccess: Whether the test is succeeding or failing
+    Input: ncFile: File object representing NetCDF file or GradsDataset
+           varName: Name of a budget variable, e.g. "rtm_bt"
+           termName: Name of the budgeted variable, e.g. "rtm"
+    Output: Units of the budget variable. If the file does not give them (GrADS files), they are
+            taken from BUDGET_UNITS.
     """
-    for varName in varList:
-        # Look through list of variables for main stats variable related to budget variable
-        if termName == varName:
-        
-            statVar = ncFile.variables[varName]
-            varAfter = statVar[iteration-1:iteration].flatten()  # First index in python list is 0
-            varBefore = statVar[iteration-2:iteration-1].flatten() # while iteration starts at t = 1
+    units = getattr(ncFile.variables[varName], "units", "")
+    if units == "":
+        units = BUDGET_UNITS.get(termName, "")
+    return units
 
-            rightHandValue = (varAfter - varBefore) / timestep
-
-            errorDifference = leftHandValue - rightHandValue
-            #print(varName)
-            #set_printoptions(threshold=sys.maxsize)
-            #print(errorDifference.flatten())
-            allowedTolerance = calcTolerance(termUnits, timestep, termName)
-            
-            # Specify that this is the completeness test when printing to stdout
-            varName = varName + " completeness test"
-            
-            zLevel = 0
-            testSuccess = dispError(leftHandValue, rightHandValue, errorDifference, allowedTolerance, iteration, zLevel, varName, termUnits, testSuccess)
-                    
-    return testSuccess
+#--------------------------------------------------------------------------------------------------
+def readNetcdfVariable(ncFile, varName, firstIteration, lastIteration):
+    """
+    Reads a range of iterations of a variable at once
     
+    Input: ncFile: File object representing NetCDF file or GradsDataset
+           varName: Name of the variable
+           firstIteration: First value of t to read, starting at 1
+           lastIteration: Last value of t to read
+    Output: Array of shape (lastIteration - firstIteration + 1, number of z levels)
+    """
+    values = ncFile.variables[varName][firstIteration-1:lastIteration]
+    return ma.getdata(values).reshape(lastIteration - firstIteration + 1, -1)
+
 #--------------------------------------------------------------------------------------------------
 def dispError(leftHandValue, rightHandValue, errorDifference, allowedTolerance, iteration, zLevel, termName, termUnits, testSuccess):
     """
@@ -485,32 +772,77 @@ def dispError(leftHandValue, rightHandValue, errorDifference, allowedTolerance,
            termUnits: Units of term being tested
            testSuccess: Whether the test is succeeding or failing
     """
-    global numFails
-
     for value in errorDifference:
         zLevel += 1
         if(zLevel > 1): #TODO: Hides errors at z level 1. See ticket 360 for more info.
             # Check to make sure tolerance is not smaller than a values precision   
 
             valuePrecision = calcPrecision(leftHandValue[zLevel-1], rightHandValue[zLevel-1])
-            allowedTolerance = max( abs(allowedTolerance), abs(valuePrecision) )
+            allowedTolerance = maximum( absolute(allowedTolerance), absolute(valuePrecision) )
             
             percentError = calcPercentError(leftHandValue, rightHandValue, allowedTolerance)
             
             # Display failure message for each error difference thats greater than the tolerance
             if abs(percentError[zLevel-1]) >= TEST_LENIENCY: # [zLevel-1] because array starts at 0
-                testSuccess = False
-                numFails += 1
-                print(" ".join([ termName, "fails at t=", \
-                    str(iteration), "and z=", str(zLevel), "with a difference of", "%e" % value, \
-                    termUnits, "and error", "%.9f" % percentError[zLevel-1], "%" ]))
-                
-                if numFails >= MAX_FAILURES:
-                    print("Too many failures: exiting test. (Change MAX_FAILURES variable to view more)")
-                    sys.exit(1)
+                testSuccess = reportFailure(termName, iteration, zLevel, value, termUnits, percentError[zLevel-1])
                 
     return testSuccess
     
+#--------------------------------------------------------------------------------------------------
+def reportFailure(termName, iteration, zLevel, value, termUnits, percentError):
+    """
+    Displays a single budget failure to stdout and exits once MAX_FAILURES is reached
+    Input: termName: Name of variable that is being tested
+           iteration: Value of t
+           zLevel: z level of the failure, starting at 1
+           value: Difference between the two sides of the equation
+           termUnits: Units of term being tested
+           percentError: Error relative to the allowed tolerance
+    Output: False, the new value of testSuccess
+    """
+    global numFails
+
+    numFails += 1
+    print(formatFailure(termName, iteration, zLevel, value, termUnits, percentError))
+    
+    if numFails >= MAX_FAILURES:
+        print("Too many failures: exiting test. (Change MAX_FAILURES variable to view more)")
+        sys.exit(1)
+        
+    return False
+    
+#--------------------------------------------------------------------------------------------------
+def formatFailure(termName, iteration, zLevel, value, termUnits, percentError):
+    """
+    Input: See reportFailure
+    Output: Message describing a single budget failure
+    """
+    return " ".join([ termName, "fails at t=", \
+        str(iteration), "and z=", str(zLevel), "with a difference of", "%e" % value, \
+        termUnits, "and error", "%.9f" % percentError, "%" ])
+    
+#--------------------------------------------------------------------------------------------------
+def calcBudgetErrors(leftHandValue, rightHandValue, allowedTolerance):
+    """
+    Array version of the tolerance calculation in dispError. As in dispError, the tolerance at a
+    z level is never smaller than the precision of the values at this or any lower z level, and
+    z level 1 is not checked (see ticket 360).
+    Input: leftHandValue: Array of shape (iterations, z levels) of the left side of the equation
+           rightHandValue: Array of the same shape of the right side of the equation
+           allowedTolerance: Tolerance the errorDifference may be off before considered a fail
+    Output: errorDifference, percentError: Arrays of shape (iterations, z levels), with 0 percent
+            error at z level 1
+    """
+    errorDifference = leftHandValue - rightHandValue
+    
+    valuePrecision = calcPrecisions(leftHandValue[:, 1:], rightHandValue[:, 1:])
+    tolerance = maximum.accumulate(maximum(absolute(allowedTolerance), valuePrecision), axis=1)
+    
+    percentError = zeros(errorDifference.shape)
+    percentError[:, 1:] = calcPercentError(leftHandValue[:, 1:], rightHandValue[:, 1:], tolerance)
+    
+    return errorDifference, percentError
+    
 #--------------------------------------------------------------------------------------------------
 def calcPercentError(experimental, accepted, denominator):
     """
@@ -601,87 +933,110 @@ def calcPrecision(value1, value2):
     valueStr2 = '%e' %(value2)
     valuePrecision2 = int(valueStr2[-3:])
     
-    retVal = min(valuePrecision1, valuePrecision2)
+    retVal = valuePrecision1 if valuePrecision1 < valuePrecision2 else valuePrecision2
     
     return 10**(retVal)
     
+#--------------------------------------------------------------------------------------------------
+def calcPrecisions(values1, values2):
+    """
+    Array version of calcPrecision: finds the smallest precision of each pair of numbers and
+    returns the smallest representable number with the same precision.
+    
+    Input: values1: Array of floating point numbers
+           values2: Array of floating point numbers with the same shape
+    """
+    exponents = minimum(calcExponents(values1), calcExponents(values2))
+    
+    # Use the same powers of ten as calcPrecision, numpy's power may differ in the last digit
+    uniqueExponents, exponentIndx = unique(exponents, return_inverse=True)
+    powers = array([10**int(exponent) if isfinite(exponent) else nan for exponent in uniqueExponents])
+    
+    return powers[exponentIndx].reshape(exponents.shape)
+    
+#--------------------------------------------------------------------------------------------------
+def calcExponents(values):
+    """
+    Finds the exponents that '%e' prints for an array of numbers. 0 is treated as 1e-40, like in
+    calcPrecision.
+    
+    Input: values: Array of floating point numbers
+    """
+    values = absolute(array(values, dtype=float64))
+    values[values == 0] = 1e-40
+    
+    exponents = floor(log10(values))
+    # '%e' rounds to 7 significant digits, which can carry over to the next power of ten
+    exponents[values >= 9.9999995 * 10.0**exponents] += 1
+    
+    return exponents
+    
 #--------------------------------------------------------------------------------------------------
 # Allows this module to be run as a script
 if __name__ == "__main__":
 
     import sys
     import os
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Checks that CLUBB budgets balance")
+    parser.add_argument("filename", help="NetCDF file (.nc or .cdf) or GrADS file (.ctl/.dat) in FILEPATH, " + \
+                        "or 'all' for all files in FILEPATH")
+    parser.add_argument("iteration", type=int, help="iteration to check, 0 for all iterations")
+    parser.add_argument("-j", "--processes", type=int, default=os.cpu_count(), \
+                        help="number of files or time ranges checked in parallel (default: number of CPUs)")
+    parser.add_argument("--json", metavar="FILE", help="write the failure statistics of every case and budget to a JSON file")
+    parser.add_argument("--junit", metavar="FILE", help="write the results as JUnit XML, with one test per case and budget")
+    parser.add_argument("--all-completeness-tests", action="store_true", \
+                        help="do the completeness test of every single iteration for all budgets, not only " + \
+                             "for COMPLETENESS_VARIABLES")
     
     # If wrong arguments were given, print a helpful message
-    if len(sys.argv) != 3:
+    if len(sys.argv) < 3:
         print("Program Help:")
-        print("Arguments must be: filename iteration")
+        print("Arguments must be: filename iteration [-j processes] [--json file] [--junit file] [--all-completeness-tests]")
         print("")
         print("Filename can be either a NetCDF file (.nc or .cdf) or grads files (.ctl/.dat)")
         print("Set filename to 'all' for all files in the directory specified by the FILEPATH variable")
         print("Set iteration to '0' for all iterations")
+        print("Files and long runs are checked in parallel by -j processes. At most MAX_FAILURES")
+        print("failures are shown per case. --json and --junit save the results per case and budget")
         print("")
         print("This script verifies that the budget variable equals the sum of the budget terms")
         print("e.g. vm_bt = vm_ma + vm_gf + vm_cf +...+ vm_sf")
         print("The completeness test verifies that the budgets are consistent")
         print("e.g. rtm_bt(t=5) = ( rtm(t=6) - rtm(t=5) ) / timestep")
+        print("It is done for the budgets of COMPLETENESS_VARIABLES unless --all-completeness-tests is given")
+        print("The drift test verifies the budgets integrated over time at each z level for all budgets")
+        print("e.g. sum of rtm_bt(t=2...n) * timestep = rtm(t=n) - rtm(t=1)")
         print("")
         sys.exit(1)
-        
-    testSuccess = True
-    skipCase = False
+    
+    args = parser.parse_args()
+    if args.all_completeness_tests:
+        setOptions(FILEPATH, None)
     
     # Check all files in FILEPATH
-    if sys.argv[1] == "all":
-        testableFiles = []
-        
-        # Make a list of all files in FILEPATH
-        files = os.listdir(FILEPATH)
-        
-        for dataFile in files:
-            for case in SKIP_LIST:
-                if dataFile.find(case) > -1:
-                    skipCase = True
-            
-            # Only keep files ending with zt or zm not including .dat or rad files
-            if (dataFile.find("zt.") > -1 or dataFile.find("zm.") > -1) and dataFile.find(".dat") == -1 and dataFile.find("rad") == -1 and skipCase == False:
-                testableFiles.append(dataFile)
-                
-            skipCase = False
-
-        testableFiles.sort()
+    if args.filename == "all":
+        testableFiles = findTestableFiles()
         
         # Make sure data exists
         if len(testableFiles) == 0:
             print("Unable to find testable data")
-            testSuccess = False
-        
-        # Test all remaining files
-        for dataFile in testableFiles:
-            print("".join(["\n", strftime("%H:%M:%S"), " - Testing ", dataFile]))
-            
-            # Check if file is NetCDF, otherwise assume GrADS
-            if dataFile.find(".nc") != -1 or dataFile.find(".cdf") != -1:
-                if checkNetcdfBudgets( dataFile, int(sys.argv[2]) ) == False:
-                    testSuccess = False
-            else:
-                if checkGradsBudgets( dataFile, int(sys.argv[2]) ) == False:
-                    testSuccess = False
-                    
+    
     # Only check 1 file
     else:
-        print("\nTesting " +  sys.argv[1])
-        
-        # Check if file is NetCDF, otherwise assume GrADS
-        if sys.argv[1].find(".nc") != -1 or sys.argv[1].find(".cdf") != -1:
-            if checkNetcdfBudgets( sys.argv[1], int(sys.argv[2]) ) == False:
-                testSuccess = False
-        else:
-            if checkGradsBudgets( sys.argv[1], int(sys.argv[2]) ) == False:
-                testSuccess = False
-            
+        testableFiles = [args.filename]
+    
+    report = checkFiles(testableFiles, args.iteration, args.processes)
+    
+    if args.json is not None:
+        writeJsonReport(report, args.json)
+    if args.junit is not None:
+        writeJunitReport(report, args.junit)
+    
     # Print resolution to the screen
-    if testSuccess == True:
+    if report["success"] == True:
         print("Budgets successfully balance!")
         sys.exit(0)
     else:
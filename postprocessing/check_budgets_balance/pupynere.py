@@ -1,25 +1,25 @@
-#! /usr/bin/python
+#! /usr/bin/env python3
 """
-NetCDF reader/writer module.
+Read-only NetCDF 3 reader module.
 Author: Roberto De Almeida
 Website: http://dealmeida.net/projects/pupynere
 Modified by: Cavyn VonDeylen
+Rewritten as a read-only, zero-copy reader for Python 3: October 2026
 
-This module implements the Scientific.IO.NetCDF API to read and create
-NetCDF files. The same API is also used in the PyNIO and pynetcdf
-modules, allowing these modules to be used interchangebly when working
-with NetCDF files. The major advantage of ``scipy.io.netcdf`` over other 
-modules is that it doesn't require the code to be linked to the NetCDF
-libraries as the other modules do.
+This module implements the reading part of the Scientific.IO.NetCDF API
+for NetCDF 3 files, i.e. the classic format (CDF-1) and the 64-bit offset
+format (CDF-2). CLUBB writes its NetCDF output in the classic format. The
+major advantage of this module over netCDF4 is that it only needs NumPy:
+it works on machines where the netCDF/HDF5 libraries are missing, and it
+imports and opens files much faster than netCDF4 does. NetCDF 4 (HDF5)
+files cannot be read with it.
 
 The code is based on the `NetCDF file format specification
-<http://www.unidata.ucar.edu/software/netcdf/guide_15.html>`_. A NetCDF
-file is a self-describing binary format, with a header followed by
+<https://docs.unidata.ucar.edu/netcdf-c/current/file_format_specifications.html>`_.
+A NetCDF file is a self-describing binary format, with a header followed by
 data. The header contains metadata describing dimensions, variables
 and the position of the data in the file, so access can be done in an
-efficient manner without loading unnecessary data into memory. We use
-the ``mmap`` module to create Numpy arrays mapped to the data on disk,
-for the same purpose.
+efficient manner without loading unnecessary data into memory.
 
 The structure of a NetCDF file is as follows:
 
@@ -32,46 +32,21 @@ will. All record variables share a same dimension at the first axis,
 and they are stored at the end of the file per record, ie
 
     A[0], B[0], ..., A[1], B[1], ..., etc,
-    
+
 so that new data can be appended to the file without changing its original
 structure. Non-record data are padded to a 4n bytes boundary. Record data
 are also padded, unless there is exactly one record variable in the file,
 in which case the padding is dropped.  All data is stored in big endian
 byte order.
 
-The Scientific.IO.NetCDF API allows attributes to be added directly to
-instances of ``netcdf_file`` and ``netcdf_variable``. To differentiate
-between user-set attributes and instance attributes, user-set attributes
-are automatically stored in the ``_attributes`` attribute by overloading
-``__setattr__``. This is the reason why the code sometimes uses
-``obj.__dict__['key'] = value``, instead of simply ``obj.key = value``;
-otherwise the key would be inserted into userspace attributes.
-
-To create a NetCDF file::
-
-    >>> import time
-    >>> f = netcdf_file('simple.nc', 'w')
-    >>> f.history = 'Created for a test'
-    >>> f.createDimension('time', 10)
-    >>> time = f.createVariable('time', 'i', ('time',))
-    >>> time[:] = range(10)
-    >>> time.units = 'days since 2008-01-01'
-    >>> f.close()
-
-To read the NetCDF file we just created::
-
-    >>> f = netcdf_file('simple.nc', 'r')
-    >>> print f.history
-    Created for a test
-    >>> time = f.variables['time']
-    >>> print time.units
-    days since 2008-01-01
-    >>> print time.shape
-    (10,)
-    >>> print time[-1]
-    9
-    >>> f.close()
-    
+The whole file is memory mapped once. The data of every variable is a
+read-only NumPy array that points directly into the map: non-record
+variables are contiguous views, and record variables are strided views
+that step over the other variables of each record. Nothing is read from
+disk until the values are used, and reading e.g. ``var[-1]`` only touches
+the pages of the last record. Attributes are located while parsing the
+header, but their values are only decoded when they are first accessed.
+
 **********************************************************************************
 ADDITION BY CAVYN
 I have modified this module slightly to better fit our needs
@@ -81,64 +56,73 @@ To read a NetCDF file:
 
     # Open a file for reading
     ncFile = NetCDFFile(fileName, 'r')
-    
+
     # Display all the dimensions to stdout
-    print ncFile.dimensions.keys() 
-    
-    # Get the value of a dimension (This doesn't seem to work properly, use var.shape instead)
-    dimValue = file.dimensions['altitude'] 
-    
+    print(ncFile.dimensions.keys())
+
+    # Get the length of a dimension (None for the record dimension, use var.shape instead)
+    dimValue = ncFile.dimensions['altitude']
+
     # Display all the variables to stdout
-    print ncFile.variables.keys() 
-    
+    print(ncFile.variables.keys())
+
     # Get a variable object
-    var = file.variables['thlm']
-    
+    var = ncFile.variables['thlm']
+
     # Find value of variable (timestep): returns list of values across all z levels
     var.getValue(0)
-    
+
+    # Get all values of a variable as a NumPy array
+    var[:]
+
+    # Get an attribute of a variable
+    var.units
+
     # Get shape of a variable
     var.shape
-    
+
     # Get dimension names of a variable
     var.dimensions
-    
+
     # Close the NetCDF file
     ncFile.close()
-    
+
 For more documentation on how to use this module, you can look for
 documentation on Scientific.IO.NetCDF since they both use a similar API.
+The files can also be opened in a with statement, and ``ncattrs()`` lists
+the attribute names the same way netCDF4 does.
 ************************************************************************************
 
-TODO:
- * properly implement ``_FillValue``.
- * implement Jeff Whitaker's patch for masked variables.
- * fix character variables.
- * implement PAGESIZE for Python 2.6?
+Running this module as a script compares it with netCDF4 on CLUBB output files:
+    python3 pupynere.py ../../output/*_zt.nc
 """
 
-__all__ = ['netcdf_file', 'netcdf_variable']
+__all__ = ['netcdf_file', 'netcdf_variable', 'NetCDFFile', 'NetCDFVariable']
 
 
-from operator import mul
-from mmap import mmap, ACCESS_READ
+import struct
+import sys
+import time
 
-from numpy import fromstring, ndarray, dtype, empty, array, asarray, prod
-from numpy import little_endian as LITTLE_ENDIAN
+from mmap import mmap as memoryMap, ACCESS_READ
 
+import numpy as np
 
-ABSENT       = '\x00\x00\x00\x00\x00\x00\x00\x00' 
-ZERO         = '\x00\x00\x00\x00'
-NC_BYTE      = '\x00\x00\x00\x01'
-NC_CHAR      = '\x00\x00\x00\x02'
-NC_SHORT     = '\x00\x00\x00\x03'
-NC_INT       = '\x00\x00\x00\x04'
-NC_FLOAT     = '\x00\x00\x00\x05'
-NC_DOUBLE    = '\x00\x00\x00\x06'
-NC_DIMENSION = '\x00\x00\x00\n'
-NC_VARIABLE  = '\x00\x00\x00\x0b'
-NC_ATTRIBUTE = '\x00\x00\x00\x0c'
 
+ABSENT       = b'\x00\x00\x00\x00\x00\x00\x00\x00'
+ZERO         = b'\x00\x00\x00\x00'
+NC_BYTE      = 1
+NC_CHAR      = 2
+NC_SHORT     = 3
+NC_INT       = 4
+NC_FLOAT     = 5
+NC_DOUBLE    = 6
+NC_DIMENSION = 10
+NC_VARIABLE  = 11
+NC_ATTRIBUTE = 12
+
+# Value of numrecs while a file is still being written by a streaming writer
+STREAMING = 0xffffffff
 
 TYPEMAP = { NC_BYTE:   ('b', 1),
             NC_CHAR:   ('c', 1),
@@ -147,293 +131,120 @@ TYPEMAP = { NC_BYTE:   ('b', 1),
             NC_FLOAT:  ('f', 4),
             NC_DOUBLE: ('d', 8) }
 
-REVERSE = { 'b': NC_BYTE,
-            'c': NC_CHAR,
-            'h': NC_SHORT,
-            'i': NC_INT,
-            'f': NC_FLOAT,
-            'd': NC_DOUBLE,
+# Big endian NumPy dtypes of the data in a NetCDF 3 file
+DTYPEMAP = { NC_BYTE:   np.dtype('>i1'),
+             NC_CHAR:   np.dtype('S1'),
+             NC_SHORT:  np.dtype('>i2'),
+             NC_INT:    np.dtype('>i4'),
+             NC_FLOAT:  np.dtype('>f4'),
+             NC_DOUBLE: np.dtype('>f8') }
 
-            # these come from asarray(1).dtype.char and asarray('foo').dtype.char,
-            # used when getting the types from generic attributes.
-            'l': NC_INT,
-            'S': NC_CHAR }
+UNPACK_INT = struct.Struct('>i').unpack_from
+UNPACK_UINT = struct.Struct('>I').unpack_from
+UNPACK_INT64 = struct.Struct('>q').unpack_from
 
 
 class netcdf_file(object):
     """
-    A ``netcdf_file`` object has two standard attributes: ``dimensions`` and
-    ``variables``. The values of both are dictionaries, mapping dimension
-    names to their associated lengths and variable names to variables,
-    respectively. Application programs should never modify these
-    dictionaries.
-
-    All other attributes correspond to global attributes defined in the
-    NetCDF file. Global file attributes are created by assigning to an
-    attribute of the ``netcdf_file`` object.
+    A read-only NetCDF 3 file.
 
+    Input: filename: Name of a NetCDF file, or a file-like object opened in binary mode
+           mode: Only 'r' is supported. Use netCDF4 to create or modify NetCDF files.
+           mmap: Memory map the file (default). If False, the file is read into memory at once.
+                 File-like objects are always read into memory.
     """
-    def __init__(self, filename, mode='r', mmap=True, version=1):
-        if hasattr(filename, 'seek'):
-            self.fp = filename
-            self.filename = 'None'
-            self.use_mmap = False
+    def __init__(self, filename, mode='r', mmap=True):
+        if mode != 'r':
+            raise ValueError("pupynere can only read NetCDF files (mode 'r'), not mode " + repr(mode))
+
+        self.__dict__['filename'] = filename
+        self.__dict__['mode'] = mode
+        self.__dict__['_file'] = None
+        self.__dict__['_attributeSpecs'] = {}
+        self.__dict__['dimensions'] = {}
+        self.__dict__['variables'] = {}
+        self.__dict__['_dims'] = []
+        self.__dict__['_recs'] = 0
+        self.__dict__['_recsize'] = 0
+
+        if hasattr(filename, 'read'):
+            self.__dict__['_buffer'] = filename.read()
         else:
-            self.filename = filename
-            self.fp = open(self.filename, '%sb' % mode)
-            self.use_mmap = mmap
-
-        self.version_byte = version
-
-        assert mode in 'rw', "Mode must be either 'r' or 'w'."
-        self.mode = mode
+            self.__dict__['_file'] = open(filename, 'rb')
+            if mmap:
+                self.__dict__['_buffer'] = memoryMap(self._file.fileno(), 0, access=ACCESS_READ)
+            else:
+                self.__dict__['_buffer'] = self._file.read()
+        self.__dict__['_pos'] = 0
 
-        self.dimensions = {}
-        self.variables = {}
+        try:
+            self._read()
+        except:
+            self.close()
+            raise
 
-        self._dims = []
-        self._recs = 0
-        self._recsize = 0
+    def __getattr__(self, name):
+        return _decodeAttribute(self, name)
 
-        self._attributes = {}
+    def __setattr__(self, name, value):
+        raise AttributeError("NetCDF file " + str(self.filename) + " is read-only")
 
-        if mode is 'r':
-            self._read()
+    def __enter__(self):
+        return self
 
-    def __setattr__(self, attr, value):
-        # Store user defined attributes in a separate dict,
-        # so we can save them to file later.
-        try:
-            self._attributes[attr] = value
-        except AttributeError:
-            pass
-        self.__dict__[attr] = value
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
 
     def close(self):
-        if not self.fp.closed:
+        """
+        Closes the file. Arrays that were taken from the variables keep the memory map
+        alive until they are deleted.
+        """
+        buffer = self.__dict__.get('_buffer')
+        if isinstance(buffer, memoryMap):
             try:
-                self.flush()
-            finally:
-                self.fp.close()
+                buffer.close()
+            except BufferError:
+                # Still referenced by data arrays, it is unmapped once they are gone
+                pass
+        self.__dict__['_buffer'] = None
+        if self.__dict__.get('_file') is not None:
+            self._file.close()
+            self.__dict__['_file'] = None
     __del__ = close
 
-    def createDimension(self, name, length):
-        self.dimensions[name] = length
-        self._dims.append(name)
-
-    def createVariable(self, name, type, dimensions):
-        shape = tuple([self.dimensions[dim] for dim in dimensions]) 
-        shape_ = tuple([dim or 0 for dim in shape])  # replace None with 0 for numpy
-
-        if isinstance(type, basestring): type = dtype(type)
-        typecode, size = type.char, type.itemsize
-        dtype_ = '>%s' % typecode
-        if size > 1: dtype_ += str(size)
-
-        data = empty(shape_, dtype=dtype_)
-        self.variables[name] = netcdf_variable(data, typecode, shape, dimensions)
-        return self.variables[name]
-
-    def flush(self):
-        if self.mode is 'w':
-            self._write()
-    sync = flush
-
-    def _write(self):
-        self.fp.write('CDF')
-        self.fp.write(array(self.version_byte, '>b').tostring())
-
-        # Write headers and data.
-        self._write_numrecs()
-        self._write_dim_array()
-        self._write_gatt_array()
-        self._write_var_array()
-
-    def _write_numrecs(self):
-        # Get highest record count from all record variables.
-        for var in self.variables.values():
-            if var.isrec and len(var.data) > self._recs:
-                self.__dict__['_recs'] = len(var.data)
-        self._pack_int(self._recs)
-
-    def _write_dim_array(self):
-        if self.dimensions:
-            self.fp.write(NC_DIMENSION)
-            self._pack_int(len(self.dimensions))
-            for name in self._dims:
-                self._pack_string(name)
-                length = self.dimensions[name]
-                self._pack_int(length or 0)  # replace None with 0 for record dimension
-        else:
-            self.fp.write(ABSENT)
-
-    def _write_gatt_array(self):
-        self._write_att_array(self._attributes)
-
-    def _write_att_array(self, attributes):
-        if attributes:
-            self.fp.write(NC_ATTRIBUTE)
-            self._pack_int(len(attributes))
-            for name, values in attributes.items():
-                self._pack_string(name)
-                self._write_values(values)
-        else:
-            self.fp.write(ABSENT)
-
-    def _write_var_array(self):
-        if self.variables:
-            self.fp.write(NC_VARIABLE)
-            self._pack_int(len(self.variables))
-
-            # Sort variables non-recs first, then recs. We use a DSU 
-            # since some people use pupynere with Python 2.3.x.
-            deco = [ (v._shape and not v.isrec, k) for (k, v) in self.variables.items() ]
-            deco.sort()
-            variables = [ k for (unused, k) in deco ][::-1]
-
-            # Set the metadata for all variables.
-            for name in variables:
-                self._write_var_metadata(name)
-            # Now that we have the metadata, we know the vsize of
-            # each record variable, so we can calculate recsize.
-            self.__dict__['_recsize'] = sum([
-                    var._vsize for var in self.variables.values()
-                    if var.isrec])
-            # Set the data for all variables.
-            for name in variables:
-                self._write_var_data(name)
-        else:
-            self.fp.write(ABSENT)
-
-    def _write_var_metadata(self, name):
-        var = self.variables[name]
-
-        self._pack_string(name)
-        self._pack_int(len(var.dimensions))
-        for dimname in var.dimensions:
-            dimid = self._dims.index(dimname)
-            self._pack_int(dimid)
-
-        self._write_att_array(var._attributes)
-
-        nc_type = REVERSE[var.typecode()]
-        self.fp.write(nc_type)
-
-        if not var.isrec:
-            vsize = var.data.size * var.data.itemsize
-            vsize += -vsize % 4
-        else:  # record variable
-            try:
-                vsize = var.data[0].size * var.data.itemsize
-            except IndexError:
-                vsize = 0
-            rec_vars = len([var for var in self.variables.values()
-                    if var.isrec])
-            if rec_vars > 1:
-                vsize += -vsize % 4
-        self.variables[name].__dict__['_vsize'] = vsize
-        self._pack_int(vsize)
-
-        # Pack a bogus begin, and set the real value later.
-        self.variables[name].__dict__['_begin'] = self.fp.tell()
-        self._pack_begin(0)
-
-    def _write_var_data(self, name):
-        var = self.variables[name]
-        
-        # Set begin in file header.
-        the_beguine = self.fp.tell()
-        self.fp.seek(var._begin)
-        self._pack_begin(the_beguine)
-        self.fp.seek(the_beguine)
-
-        # Write data.
-        if not var.isrec:
-            self.fp.write(var.data.tostring())    
-            count = var.data.size * var.data.itemsize
-            self.fp.write('0' * (var._vsize - count))
-        else:  # record variable
-            # Handle rec vars with shape[0] < nrecs.
-            if self._recs > len(var.data):
-                shape = (self._recs,) + var.data.shape[1:]
-                var.data.resize(shape)
-
-            pos0 = pos = self.fp.tell()
-            for rec in var.data:
-                # Apparently scalars cannot be converted to big endian. If we
-                # try to convert a ``=i4`` scalar to, say, '>i4' the dtype
-                # will remain as ``=i4``.
-                if not rec.shape and (rec.dtype.byteorder == '<' or
-                        (rec.dtype.byteorder == '=' and LITTLE_ENDIAN)):
-                    rec = rec.byteswap()
-                self.fp.write(rec.tostring())
-                # Padding
-                count = rec.size * rec.itemsize
-                self.fp.write('0' * (var._vsize - count))
-                pos += self._recsize
-                self.fp.seek(pos)
-            self.fp.seek(pos0 + var._vsize)
-
-    def _write_values(self, values):
-        if hasattr(values, 'dtype'):
-            nc_type = REVERSE[values.dtype.char]
-        else:
-            types = [
-                    (int, NC_INT),
-                    (long, NC_INT),
-                    (float, NC_FLOAT),
-                    (basestring, NC_CHAR),
-                    ]
-            try:
-                sample = values[0]
-            except TypeError:
-                sample = values
-            for class_, nc_type in types:
-                if isinstance(sample, class_): break
-
-        typecode, size = TYPEMAP[nc_type]
-        if typecode == 'd': typecode = 'f'
-        if typecode is 'c':
-            dtype_ = '>c'
-        else:
-            dtype_ = '>%s' % typecode
-            if size > 1: dtype_ += str(size)
-
-        values = asarray(values, dtype=dtype_) 
+    def ncattrs(self):
+        """
+        Returns the names of the global attributes, like netCDF4.Dataset.ncattrs()
+        """
+        return list(self._attributeSpecs)
 
-        self.fp.write(nc_type)
-
-        if values.dtype.char == 'S':
-            nelems = values.itemsize
-        else:
-            nelems = values.size
-        self._pack_int(nelems)
-
-        if not values.shape and (values.dtype.byteorder == '<' or
-                (values.dtype.byteorder == '=' and LITTLE_ENDIAN)):
-            values = values.byteswap()
-        self.fp.write(values.tostring())
-        count = values.size * values.itemsize
-        self.fp.write('0' * (-count % 4))  # pad
+    def filepath(self):
+        """
+        Returns the name of the file, like netCDF4.Dataset.filepath()
+        """
+        return self.filename
 
     def _read(self):
         # Check magic bytes and version
-        magic = self.fp.read(3)
-        assert magic == 'CDF', "Error: %s is not a valid NetCDF 3 file" % self.filename
-        self.__dict__['version_byte'] = fromstring(self.fp.read(1), '>b')[0]
+        magic = bytes(self._buffer[0:3])
+        if magic != b'CDF':
+            raise TypeError("Error: " + str(self.filename) + " is not a valid NetCDF 3 file")
+        self.__dict__['version_byte'] = self._buffer[3]
+        if self.version_byte not in (1, 2):
+            raise TypeError("Error: " + str(self.filename) + " uses the unsupported NetCDF 3 version " +
+                            str(self.version_byte))
+        self.__dict__['_pos'] = 4
 
         # Read file headers and set data.
-        self._read_numrecs()
+        recs = self._unpack_uint()
         self._read_dim_array()
-        self._read_gatt_array()
-        self._read_var_array()
-
-    def _read_numrecs(self):
-        self.__dict__['_recs'] = self._unpack_int()
+        self.__dict__['_attributeSpecs'] = self._read_att_array()
+        self._read_var_array(recs)
 
     def _read_dim_array(self):
-        header = self.fp.read(4)
-        assert header in [ZERO, NC_DIMENSION]
+        header = self._read_header()
+        assert header in (ZERO, NC_DIMENSION)
         count = self._unpack_int()
 
         for dim in range(count):
@@ -442,252 +253,306 @@ class netcdf_file(object):
             self.dimensions[name] = length
             self._dims.append(name)  # preserve order
 
-    def _read_gatt_array(self):
-        for k, v in self._read_att_array().items():
-            self.__setattr__(k, v)
-
     def _read_att_array(self):
-        header = self.fp.read(4)
-        assert header in [ZERO, NC_ATTRIBUTE]
+        """
+        Skips over an attribute list, remembering where the values of each attribute are
+        so they can be decoded on first access.
+        """
+        header = self._read_header()
+        assert header in (ZERO, NC_ATTRIBUTE)
         count = self._unpack_int()
 
-        attributes = {}
+        attributeSpecs = {}
         for attr in range(count):
             name = self._unpack_string()
-            attributes[name] = self._read_values()
-        return attributes
-
-    def _read_var_array(self):
-        header = self.fp.read(4)
-        assert header in [ZERO, NC_VARIABLE]
-
-        begin = 0
-        dtypes = {'names': [], 'formats': []}
-        rec_vars = []
+            nc_type = self._unpack_int()
+            n = self._unpack_int()
+            attributeSpecs[name] = (nc_type, n, self._pos)
+            size = n * TYPEMAP[nc_type][1]
+            self.__dict__['_pos'] += size + (-size % 4)
+        return attributeSpecs
+
+    def _read_var_array(self, recs):
+        header = self._read_header()
+        assert header in (ZERO, NC_VARIABLE)
         count = self._unpack_int()
-        for var in range(count):
-            name, dimensions, shape, attributes, typecode, size, dtype_, begin_, vsize = self._read_var()
-            if shape and shape[0] is None:
-                rec_vars.append(name)
-                self.__dict__['_recsize'] += vsize
-                if begin == 0: begin = begin_
-                dtypes['names'].append(name)
-                dtypes['formats'].append(str(shape[1:]) + dtype_)
-
-                # Handle padding with a virtual variable.
-                if typecode in 'bch':
-                    actual_size = reduce(mul, (1,) + shape[1:]) * size
-                    padding = -actual_size % 4
-                    if padding:
-                        dtypes['names'].append('_padding_%d' % var)
-                        dtypes['formats'].append('(%d,)>b' % padding)
-
-                # Data will be set later.
-                data = None
-            else:
-                if self.use_mmap:
-                    mm = mmap(self.fp.fileno(), int(begin_+vsize), access=ACCESS_READ)
-                    data = ndarray.__new__(ndarray, shape, dtype=dtype_,
-                            buffer=mm, offset=begin_, order=0)
-                else:
-                    pos = self.fp.tell()
-                    self.fp.seek(begin_)
-                    #data = fromstring(self.fp.read(vsize), dtype=dtype_)
-                    data = fromstring(self.fp.read(size*prod(shape)), dtype=dtype_)
-                    data.shape = shape
-                    self.fp.seek(pos)
-
-            # Add variable.
-            self.variables[name] = netcdf_variable(
-                    data, typecode, shape, dimensions, attributes)
-
-        if rec_vars:
-            # Remove padding when only one record variable.
-            if len(rec_vars) == 1:
-                dtypes['names'] = dtypes['names'][:1]
-                dtypes['formats'] = dtypes['formats'][:1]
-
-            # Build rec array.
-            if self.use_mmap:
-                mm = mmap(self.fp.fileno(), begin+self._recs*self._recsize, access=ACCESS_READ)
-                rec_array = ndarray.__new__(ndarray, (self._recs,), dtype=dtypes,
-                        buffer=mm, offset=begin, order=0)
-            else:
-                pos = self.fp.tell()
-                self.fp.seek(begin)
-                rec_array = fromstring(self.fp.read(self._recs*self._recsize), dtype=dtypes)
-                rec_array.shape = (self._recs,)
-                self.fp.seek(pos)
 
-            for var in rec_vars:
-                self.variables[var].__dict__['data'] = rec_array[var]
+        varHeaders = [self._read_var() for var in range(count)]
+        recVars = [var for var in varHeaders if var[1] and self.dimensions[var[1][0]] is None]
+        recVarNames = set(var[0] for var in recVars)
+
+        # Per-record sizes from the shapes, since vsize is truncated for large variables.
+        # Record data is padded to 4 bytes unless there is a single record variable
+        recsize = 0
+        completeRecs = []
+        for name, dimensions, shape, attributeSpecs, nc_type, begin in recVars:
+            size = int(np.prod(shape[1:], dtype=np.int64)) * TYPEMAP[nc_type][1]
+            recsize += size if len(recVars) == 1 else size + (-size % 4)
+            completeRecs.append((begin, size))
+        self.__dict__['_recsize'] = recsize
+
+        # Only use the records that are completely in the file. This also gives the number of records
+        # of files that are still being written, whose numrecs may be outdated or STREAMING.
+        if recsize > 0:
+            fileSize = len(self._buffer)
+            completeRecs = min(max(0, (fileSize - begin - size) // recsize + 1) for begin, size in completeRecs)
+            recs = completeRecs if recs == STREAMING else min(recs, completeRecs)
+        elif recs == STREAMING:
+            recs = 0
+        self.__dict__['_recs'] = recs
+
+        # All variables are views of this array. Unlike views created directly from the memory map, it holds
+        # on to the map's buffer, so the file can't be unmapped while the data of a variable is still in use.
+        fileData = np.frombuffer(self._buffer, dtype=np.uint8)
+        for name, dimensions, shape, attributeSpecs, nc_type, begin in varHeaders:
+            dtype_ = DTYPEMAP[nc_type]
+            if name in recVarNames:
+                shape = (recs,) + shape[1:]
+                # Strided view into the record data: step over all other variables of each record
+                strides = (recsize,) + _contiguousStrides(shape[1:], dtype_.itemsize)
+                data = np.ndarray(shape, dtype=dtype_, buffer=fileData, offset=begin, strides=strides)
+            else:
+                if begin + int(np.prod(shape, dtype=np.int64)) * dtype_.itemsize > len(self._buffer):
+                    raise TypeError("Error: " + str(self.filename) + " is truncated in variable " + name)
+                data = np.ndarray(shape, dtype=dtype_, buffer=fileData, offset=begin)
+            self.variables[name] = netcdf_variable(data, TYPEMAP[nc_type][0], shape, dimensions,
+                                                   attributeSpecs, self)
 
     def _read_var(self):
         name = self._unpack_string()
         dimensions = []
         shape = []
         dims = self._unpack_int()
-        
+
         for i in range(dims):
             dimid = self._unpack_int()
-            dimid = int(dimid)
             dimname = self._dims[dimid]
             dimensions.append(dimname)
             dim = self.dimensions[dimname]
-            shape.append(dim)
+            shape.append(dim or 0)
         dimensions = tuple(dimensions)
         shape = tuple(shape)
 
-        attributes = self._read_att_array()
-        nc_type = self.fp.read(4)
+        attributeSpecs = self._read_att_array()
+        nc_type = self._unpack_int()
         vsize = self._unpack_int()
-        begin = [self._unpack_int, self._unpack_int64][self.version_byte-1]()
-
-        typecode, size = TYPEMAP[nc_type]
-        if typecode == 'd': typecode = 'f'
-        if typecode is 'c':
-            dtype_ = '>c'
-        else:
-            dtype_ = '>%s' % typecode
-            if size > 1: dtype_ += str(size)
-
-        return name, dimensions, shape, attributes, typecode, size, dtype_, begin, vsize
+        begin = [self._unpack_int, self._unpack_int64][self.version_byte - 1]()
 
-    def _read_values(self):
-        nc_type = self.fp.read(4)
-        n = self._unpack_int()
+        return name, dimensions, shape, attributeSpecs, nc_type, begin
 
-        typecode, size = TYPEMAP[nc_type]
+    def _read_values(self, nc_type, n, pos):
+        """
+        Decodes the values of an attribute.
 
-        count = n*size
-        values = self.fp.read(count)
-        self.fp.read(-count % 4)  # read padding
-
-        if typecode is not 'c':
-            if typecode == 'd': typecode = 'f'
-            values = fromstring(values, dtype='>%s%d' % (typecode, size))
-            if values.shape == (1,): values = values[0]
-        else:
-            values = values.rstrip('\x00') 
+        Input: nc_type: NetCDF type of the values
+               n: Number of values
+               pos: Position of the first value in the file
+        """
+        if nc_type == NC_CHAR:
+            values = bytes(self._buffer[pos:pos + n]).rstrip(b'\x00')
+            try:
+                return values.decode('utf-8')
+            except UnicodeDecodeError:
+                return values.decode('latin-1')
+
+        values = np.frombuffer(self._buffer, dtype=DTYPEMAP[nc_type], count=n, offset=pos)
+        # Copy the few values, so attributes don't keep the memory map alive
+        values = values.astype(DTYPEMAP[nc_type].newbyteorder('='))
+        if values.shape == (1,):
+            values = values[0]
         return values
 
-    def _pack_begin(self, begin):
-        if self.version_byte == 1:
-            self._pack_int(begin)
-        elif self.version_byte == 2:
-            self._pack_int64(begin)
-
-    def _pack_int(self, value):
-        self.fp.write(array(value, '>i').tostring())
-    _pack_int32 = _pack_int
+    def _read_header(self):
+        header = bytes(self._buffer[self._pos:self._pos + 4])
+        self.__dict__['_pos'] += 4
+        if header == ZERO:
+            # An absent list is ZERO followed by a count of zero
+            return ZERO
+        return UNPACK_INT(header)[0]
 
     def _unpack_int(self):
-        return fromstring(self.fp.read(4), '>i')[0]
+        value = UNPACK_INT(self._buffer, self._pos)[0]
+        self.__dict__['_pos'] += 4
+        return value
     _unpack_int32 = _unpack_int
 
-    def _pack_int64(self, value):
-        self.fp.write(array(value, '>q').tostring())
+    def _unpack_uint(self):
+        value = UNPACK_UINT(self._buffer, self._pos)[0]
+        self.__dict__['_pos'] += 4
+        return value
 
     def _unpack_int64(self):
-        return fromstring(self.fp.read(8), '>q')[0]
-
-    def _pack_string(self, s):
-        count = len(s)
-        self._pack_int(count)
-        self.fp.write(s)
-        self.fp.write('0' * (-count % 4))  # pad
+        value = UNPACK_INT64(self._buffer, self._pos)[0]
+        self.__dict__['_pos'] += 8
+        return value
 
     def _unpack_string(self):
         count = self._unpack_int()
-        s = self.fp.read(count).rstrip('\x00')
-        self.fp.read(-count % 4)  # read padding
-        return s
+        value = bytes(self._buffer[self._pos:self._pos + count]).decode('utf-8')
+        self.__dict__['_pos'] += count + (-count % 4)  # read padding
+        return value
 
 
 class netcdf_variable(object):
     """
-    ``netcdf_variable`` objects are constructed by calling the method
-    ``createVariable`` on the netcdf_file object.
-
-    ``netcdf_variable`` objects behave much like array objects defined in
-    Numpy, except that their data resides in a file. Data is read by
-    indexing and written by assigning to an indexed subset; the entire
-    array can be accessed by the index ``[:]`` or using the methods
-    ``getValue`` and ``assignValue``. ``netcdf_variable`` objects also
-    have attribute ``shape`` with the same meaning as for arrays, but
-    the shape cannot be modified. There is another read-only attribute
-    ``dimensions``, whose value is the tuple of dimension names.
-
-    All other attributes correspond to variable attributes defined in
-    the NetCDF file. Variable attributes are created by assigning to an
-    attribute of the ``netcdf_variable`` object.
-
+    A variable of a NetCDF 3 file. The values are a read-only NumPy array in the ``data``
+    attribute, which is indexed by indexing the variable.
     """
-    def __init__(self, data, typecode, shape, dimensions, attributes=None):
-        self.data = data
-        self._typecode = typecode
-        self._shape = shape
-        self.dimensions = dimensions
-
-        self._attributes = attributes or {}
-        for k, v in self._attributes.items():
-            self.__dict__[k] = v
-
-    def __setattr__(self, attr, value):
-        # Store user defined attributes in a separate dict,
-        # so we can save them to file later.
-        try:
-            self._attributes[attr] = value
-        except AttributeError:
-            pass
-        self.__dict__[attr] = value
+    def __init__(self, data, typecode, shape, dimensions, attributeSpecs=None, ncFile=None):
+        self.__dict__['data'] = data
+        self.__dict__['_typecode'] = typecode
+        self.__dict__['_shape'] = shape
+        self.__dict__['dimensions'] = dimensions
+        self.__dict__['_attributeSpecs'] = attributeSpecs or {}
+        self.__dict__['_ncFile'] = ncFile
 
-    def isrec(self):
-        return self.data.shape and not self._shape[0]
-    isrec = property(isrec)
+    def __getattr__(self, name):
+        return _decodeAttribute(self, name)
 
+    def __setattr__(self, name, value):
+        raise AttributeError("NetCDF variables of pupynere are read-only")
+
+    @property
     def shape(self):
         return self.data.shape
-    shape = property(shape)
-
-    def getValue(self, time):
-        if self.data[time].shape:
-            retVal = self.data[time].tolist()
-            # getValue returns a list of lists of lists. We just want one flat list
-            retVal = [item for sublist in retVal for item in sublist]
-            retVal = [item for sublist in retVal for item in sublist]
-            return retVal
-        else:
-            return self.data[time].item()
 
-    def assignValue(self, value):
-        if self.data.shape:
-            self.data[:] = value[:]
-        else:
-            self.data.itemset(value)
+    @property
+    def ndim(self):
+        return self.data.ndim
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def isrec(self):
+        return bool(self.dimensions) and self._ncFile is not None and \
+               self._ncFile.dimensions[self.dimensions[0]] is None
+
+    def ncattrs(self):
+        """
+        Returns the names of the attributes of this variable, like netCDF4.Variable.ncattrs()
+        """
+        return list(self._attributeSpecs)
+
+    def getValue(self, time=0):
+        """
+        Input: time: Index of the timestep
+        Returns a list of the values of this variable at the timestep, across all z levels
+        """
+        return self.data[time].ravel().tolist()
 
     def typecode(self):
         return self._typecode
 
+    def __len__(self):
+        return len(self.data)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.data, dtype=dtype)
+
     def __getitem__(self, index):
         return self.data[index]
 
-    def __setitem__(self, index, data):
-        # Expand data for record vars?
-        if self.isrec:
-            if isinstance(index, tuple):
-                rec_index = index[0]
-            else:
-                rec_index = index
-            if isinstance(rec_index, slice):
-                recs = (rec_index.start or 0) + len(data)
-            else:
-                recs = rec_index + 1
-            if recs > len(self.data):
-                shape = (recs,) + self._shape[1:]
-                self.data.resize(shape)
-        self.data[index] = data
+
+def _decodeAttribute(obj, name):
+    """
+    Decodes an attribute of a file or variable on first access and caches the value.
+
+    Input: obj: netcdf_file or netcdf_variable
+           name: Name of the attribute
+    """
+    specs = obj.__dict__.get('_attributeSpecs')
+    if name.startswith('__') or specs is None or name not in specs:
+        raise AttributeError(name)
+    ncFile = obj if isinstance(obj, netcdf_file) else obj.__dict__['_ncFile']
+    if ncFile._buffer is None:
+        raise ValueError("Attribute " + name + " cannot be read from a closed NetCDF file")
+    value = ncFile._read_values(*specs[name])
+    obj.__dict__[name] = value
+    return value
+
+
+def _contiguousStrides(shape, itemsize):
+    """
+    Returns the strides of a C contiguous array
+    """
+    strides = []
+    stride = itemsize
+    for length in reversed(shape):
+        strides.insert(0, stride)
+        stride *= length
+    return tuple(strides)
 
 
 NetCDFFile = netcdf_file
 NetCDFVariable = netcdf_variable
+
+
+#--------------------------------------------------------------------------------------------------
+def benchmark(fileNames, repeats=3):
+    """
+    Compares pupynere with netCDF4 on NetCDF 3 files, e.g. CLUBB "_zt.nc" output, and checks that
+    both read the same values.
+    Prints the time it takes to open a file, to read the last timestep of all variables
+    (e.g. for a budget check of a single iteration) and to read all variables completely.
+
+    Input: fileNames: List of NetCDF 3 files
+           repeats: Number of times each measurement is repeated. The fastest run is printed.
+    """
+    startTime = time.perf_counter()
+    import netCDF4
+    print("Importing netCDF4 took %.3f s" % (time.perf_counter() - startTime))
+
+    def timeRuns(readFile):
+        times = []
+        for i in range(repeats):
+            startTime = time.perf_counter()
+            readFile()
+            times.append(time.perf_counter() - startTime)
+        return min(times)
+
+    def readAll(openFile, index):
+        def readFile():
+            ncFile = openFile()
+            for var in ncFile.variables.values():
+                if index is Ellipsis or not var.dimensions:
+                    np.array(var[...])
+                else:
+                    np.array(var[index])
+            ncFile.close()
+        return readFile
+
+    print("%-30s %10s %12s %14s %14s" % ("File", "Reader", "Open [s]", "Last step [s]", "All data [s]"))
+    for fileName in fileNames:
+        with open(fileName, 'rb') as ncFile:
+            if ncFile.read(3) != b'CDF':
+                print("%-30s skipped, it is not a NetCDF 3 file" % fileName)
+                continue
+
+        readers = [("netCDF4", lambda: netCDF4.Dataset(fileName, 'r')),
+                   ("pupynere", lambda: netcdf_file(fileName, 'r'))]
+        for readerName, openFile in readers:
+            openTime = timeRuns(lambda: openFile().close())
+            lastStepTime = timeRuns(readAll(openFile, -1))
+            allTime = timeRuns(readAll(openFile, Ellipsis))
+            print("%-30s %10s %12.4f %14.4f %14.4f" % (fileName[-30:], readerName, openTime, lastStepTime,
+                                                     allTime))
+
+        # Both readers must return the same values and attributes
+        with netCDF4.Dataset(fileName, 'r') as reference, netcdf_file(fileName, 'r') as ncFile:
+            for name, referenceVar in reference.variables.items():
+                referenceVar.set_auto_maskandscale(False)
+                var = ncFile.variables[name]
+                if not np.array_equal(referenceVar[...], var[...], equal_nan=var.dtype.kind == 'f'):
+                    print("  Values of " + name + " differ from netCDF4")
+                for attribute in referenceVar.ncattrs():
+                    if not np.array_equal(referenceVar.getncattr(attribute), getattr(var, attribute)):
+                        print("  Attribute " + name + ":" + attribute + " differs from netCDF4")
+
+#--------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python3 pupynere.py file_zt.nc [file2_zt.nc ...]")
+        sys.exit(1)
+    benchmark(sys.argv[1:])
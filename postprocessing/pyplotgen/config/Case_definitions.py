@@ -64,22 +64,28 @@ alphabetical order.
         group. An example would be: 'var_groups': [VariableGroupBase, VariableGroupWs].
         The variables inside a VariableGroup can be found in the file with the same name,
         i.e. config/VariableGroupBase.py. An example would be thlm in VariableGroupBase.
+        The names used here are registered with getVariableGroup() below, so a new VariableGroup only has to be
+        registered there; its module is imported the first time a case using it is plotted.
 
 """
 
 import os
 
-from config.VariableGroupBase import VariableGroupBase
-from config.VariableGroupCorrelations import VariableGroupCorrelations
-from config.VariableGroupIceMP import VariableGroupIceMP
-from config.VariableGroupKKMP import VariableGroupKKMP
-from config.VariableGroupLiquidMP import VariableGroupLiquidMP
-from config.VariableGroupSamProfiles import VariableGroupSamProfiles
-from config.VariableGroupScalars import VariableGroupScalars
-from config.VariableGroupWs import VariableGroupWs
-from config.VariableGroupTaus import VariableGroupTaus
-from config.VariableGroupNondimMoments import VariableGroupNondimMoments
-from config.VariableGroupNormalizedVariations import VariableGroupNormalizedVariations
+from src.VariableGroupRegistry import getVariableGroup
+
+# VariableGroups are registered lazily. The module defining a group (e.g. config/VariableGroupBase.py)
+# is only imported once that group is actually plotted. See src/VariableGroupRegistry.py
+VariableGroupBase = getVariableGroup('VariableGroupBase')
+VariableGroupCorrelations = getVariableGroup('VariableGroupCorrelations')
+VariableGroupIceMP = getVariableGroup('VariableGroupIceMP')
+VariableGroupKKMP = getVariableGroup('VariableGroupKKMP')
+VariableGroupLiquidMP = getVariableGroup('VariableGroupLiquidMP')
+VariableGroupSamProfiles = getVariableGroup('VariableGroupSamProfiles')
+VariableGroupScalars = getVariableGroup('VariableGroupScalars')
+VariableGroupWs = getVariableGroup('VariableGroupWs')
+VariableGroupTaus = getVariableGroup('VariableGroupTaus')
+VariableGroupNondimMoments = getVariableGroup('VariableGroupNondimMoments')
+VariableGroupNormalizedVariations = getVariableGroup('VariableGroupNormalizedVariations')
 
 # ---------------------------
 BENCHMARK_OUTPUT_ROOT = "/home/pub/les_and_clubb_benchmark_runs/"
@@ -1151,3 +1157,16 @@ CASES_TO_PLOT = ALL_CASES
 # If uncommented, this line will override the real CASES_TO_PLOT given above, forcing pyplotgen to only plot some cases.
 # CASES_TO_PLOT = [ARM]
 # CASES_TO_PLOT = CASES_TO_PLOT[:3]
+
+
+def getCaseByName(casename):
+    """
+    Returns the case definition with the given 'name' parameter
+
+    :param casename: Name of the case, e.g. 'bomex'
+    :return: The case definition dict, or None if no case with that name is defined in ALL_CASES
+    """
+    for case_def in ALL_CASES:
+        if case_def['name'] == casename:
+            return case_def
+    return None
@@ -21,13 +21,10 @@ from difflib import SequenceMatcher
 from multiprocessing import Pool, Array
 from multiprocessing import freeze_support
 
-from fpdf import FPDF
-
+# Only lightweight modules are imported here. fpdf, matplotlib, netCDF4, the html gallery and the
+# VariableGroup definitions are imported where they are first needed, so that e.g. ./pyplotgen.py -h
+# and pool workers started with the spawn method don't have to load them.
 from config import Case_definitions, Style_definitions
-from python_html_gallery import gallery
-from src import Panel
-from src.CaseGallerySetup import CaseGallerySetup
-from src.DataReader import DataReader
 from src.interoperability import clean_path
 import src.OutputHandler
 from src.OutputHandler import logToFile, logToFileAndConsole
@@ -47,7 +44,8 @@ class PyPlotGen:
                  e3sm_folders=[""], sam_folders=[""], wrf_folders=[""], cam_folders=[""], priority_vars=False,
                  plot_budgets=False, bu_morr=False, diff=None, show_alphabetic_id=False,
                  time_height=False, animation=None, samstyle=False, disable_multithreading=False, pdf=False,
-                 pdf_filesize_limit=None, plot_subcolumns=False, image_extension=".png"):
+                 pdf_filesize_limit=None, plot_subcolumns=False, image_extension=".png", skill_scores=False,
+                 image_extensions=None, encoding_threads=0, archive_format="zip"):
         """
         This creates an instance of PyPlotGen. Each parameter is a command line parameter passed in from the argparser
         below.
@@ -69,7 +67,8 @@ class PyPlotGen:
             This is currently limited to disabling case output if not all models have data for a given case.
             E.g. this prevents wrf plots from including cases that only have clubb plots and no wrf plots.
             Do not plot this with clubb-only plots, just plot clubb normally for clubb nightly tests.
-        :param zip: If True, output dependent_data into a compressed zip file. Not implemented.
+        :param zip: If True, all images, movies and web pages are also streamed into a compressed archive
+            next to the output folder while they are being created (see src/ArchiveWriter.py).
         :param thin: If True, plot using thin solid lines.
         :param no_legends: If True, plots will not have legend boxes listing the line types.
         :param ensemble: If True, plot ensemble tuner runs. Not implemented.
@@ -90,6 +89,13 @@ class PyPlotGen:
         :param time_height: If True, plot time-height (contourf) plots instead of profile-like plots
         :param animation: If True, create time animations instead of time-averaged plots
             (works with profile and budget plots) (Not yet implemented).
+        :param skill_scores: If True, score the clubb lines against the LES benchmarks
+            (see src/SkillScores.py) instead of plotting anything. With zip, the score tables are archived.
+        :param image_extension: Image format displayed in the html gallery, e.g. ".png"
+        :param image_extensions: List of all image formats every panel is saved as, e.g. [".png", ".svg"].
+            Defaults to [image_extension].
+        :param encoding_threads: Number of background threads per case used to encode raster images.
+        :param archive_format: Format of the archive written if zip is True. One of 'zip', 'tar.gz' or 'tar.zst'.
         """
         self.clubb_folders = clubb_folders
         self.output_folder = output_folder
@@ -103,6 +109,7 @@ class PyPlotGen:
         self.hoc = hoc
         self.plot_diff = diff
         self.zip = zip
+        self.archive_format = archive_format
         self.thin = thin
         self.no_legends = no_legends
         self.ensemble = ensemble
@@ -112,6 +119,7 @@ class PyPlotGen:
         self.diff = diff
         self.cases_plotted = []
         self.clubb_datasets = None
+        from src.DataReader import DataReader
         self.data_reader = DataReader()
         self.diff_files_data_reader = DataReader()
         self.sam_data_reader = DataReader()
@@ -127,6 +135,11 @@ class PyPlotGen:
         self.pdf = pdf
         self.pdf_filesize_limit = pdf_filesize_limit
         self.image_extension = image_extension
+        self.image_extensions = image_extensions
+        if self.image_extensions is None:
+            self.image_extensions = [image_extension]
+        self.encoding_threads = encoding_threads
+        self.skill_scores = skill_scores
 
         if os.path.isdir(self.output_folder) and self.replace_images is False:
             current_date_time = datetime.now()
@@ -190,6 +203,23 @@ class PyPlotGen:
         # for case_def in all_enabled_cases:
         cases_plotted_bools = []
 
+        if self.skill_scores:
+            self.__runSkillScores__(all_enabled_cases)
+            return
+
+        # Start writing the archive, so that images can be added while the remaining panels are plotted.
+        # A manager queue is used because items put into a multiprocessing.Queue may still be in flight when
+        # the pool is terminated.
+        archive_writer = None
+        archive_queue = None
+        if self.zip:
+            from src.ArchiveWriter import ArchiveWriter
+            archive_manager = multiprocessing.Manager()
+            archive_queue = archive_manager.Queue()
+            archive_writer = ArchiveWriter(self.output_folder, archive_format=self.archive_format,
+                                           file_queue=archive_queue)
+            archive_writer.start()
+
         # initialize counter and progress display
         total_progress_counter = Array('i',[0,0])
         initializeProgress(self.image_extension, self.animation)
@@ -197,9 +227,11 @@ class PyPlotGen:
         if self.multithreaded:
             freeze_support()  # Required for multithreading
             n_processors = multiprocessing.cpu_count()
-            with Pool(processes=n_processors,initializer=tpc_init,initargs=(total_progress_counter, )) as pool:
+            with Pool(processes=n_processors,initializer=tpc_init,
+                      initargs=(total_progress_counter, archive_queue)) as pool:
                 cases_plotted_bools = pool.map(self.__plotCase__, all_enabled_cases)
         else:
+            tpc_init(total_progress_counter, archive_queue)
             for case_def in all_enabled_cases:
                 cases_plotted_bools.append(self.__plotCase__(case_def))
         logToFileAndConsole('')
@@ -223,6 +255,7 @@ class PyPlotGen:
                 "CASES_TO_PLOT = " + str(all_cases_casenames) +
                 "\nPlease run ./pyplotgen.py -h for more information on parameters.")
         logToFile("Generating webpage for viewing plots ")
+        from python_html_gallery import gallery
 
         if not os.path.exists(self.output_folder):
             os.mkdir(self.output_folder)
@@ -236,6 +269,12 @@ class PyPlotGen:
             gallery.main(self.output_folder, multithreaded=False, file_extension=movie_extension)
         else:
             gallery.main(self.output_folder, multithreaded=False, file_extension=self.image_extension)
+        if archive_writer is not None:
+            # Add the web pages, setup files and anything else that has not been archived yet
+            archive_writer.addFolder(exclude=[self.errorlog])
+            archive_filename = archive_writer.close()
+            archive_manager.shutdown()
+            logToFileAndConsole("Compressed output was written to " + archive_filename)
         logToFileAndConsole('-------------------------------------------')
         logToFileAndConsole("Output can be viewed at file://" + self.output_folder + "/index.html with a web browser")
 
@@ -316,6 +355,10 @@ class PyPlotGen:
         :param case_descriptions: A dict of name -> description maps. E.g. {'bomex': "I am the bomex case. Fear me!"}
         :return: None
         """
+        from fpdf import FPDF
+        from src.FigureWriter import getPdfExtension
+        # Only embed one of the saved formats, even if each panel was saved in several
+        pdf_image_extension = getPdfExtension(self.image_extensions)
         pdf = FPDF()
         for foldername in sorted(os.listdir(self.output_folder)):
             if os.path.isdir(foldername):
@@ -334,7 +377,7 @@ class PyPlotGen:
                 for filename in sorted(os.listdir(self.output_folder + "/" + foldername)):
                     filename = self.output_folder + '/' + foldername + '/' + filename
 
-                    if "html" not in filename and "txt" not in filename and os.path.isfile(filename):
+                    if filename.endswith(pdf_image_extension) and os.path.isfile(filename):
                         x_coord = 20 + loop_counter * 60
                         pdf.set_x(x_coord)
                         pdf.image(filename, w=50, h=30)
@@ -379,6 +422,63 @@ class PyPlotGen:
         new_dpi = round(previous_dpi - dpi_reduction_amount)
         return new_dpi
 
+    def __runSkillScores__(self, all_enabled_cases):
+        """
+        Loads every enabled case and scores its clubb lines against the LES benchmarks without rendering any panel.
+        Loading and interpolating is done per case (in parallel if multithreading is enabled),
+        the scores of all cases are then computed together and written into the output folder.
+
+        :param all_enabled_cases: List of case definitions to score
+        :return: None
+        """
+        from src.SkillScores import computeSkillScores, summarizeSkillScores, writeSkillScores
+        from src.SkillScores import SKILL_SCORE_HTML
+
+        if self.multithreaded:
+            freeze_support()  # Required for multithreading
+            with Pool(processes=multiprocessing.cpu_count()) as pool:
+                case_pairs = pool.map(self.__scoreCase__, all_enabled_cases)
+        else:
+            case_pairs = [self.__scoreCase__(case_def) for case_def in all_enabled_cases]
+
+        all_pairs = [pair for pairs in case_pairs if pairs is not None for pair in pairs]
+        self.num_cases_plotted = sum(pairs is not None for pairs in case_pairs)
+        scores = computeSkillScores(all_pairs)
+        summary = summarizeSkillScores(scores)
+        writeSkillScores(scores, summary, self.output_folder)
+
+        logToFileAndConsole('-------------------------------------------')
+        logToFileAndConsole("Scored {} line pairs in {} cases".format(len(scores), self.num_cases_plotted))
+        if self.zip:
+            from src.ArchiveWriter import ArchiveWriter
+            archive_writer = ArchiveWriter(self.output_folder, archive_format=self.archive_format)
+            archive_writer.start()
+            archive_writer.addFolder(exclude=[self.errorlog])
+            logToFileAndConsole("Compressed output was written to " + archive_writer.close())
+        logToFileAndConsole("Skill scores can be viewed at file://" + self.output_folder + "/" + SKILL_SCORE_HTML +
+                            " with a web browser")
+
+    def __scoreCase__(self, case_def):
+        """
+        Loads the given case and returns the clubb/benchmark line pairs to score.
+        This is the skill score counterpart of __plotCase__().
+
+        :param case_def: The case definition object
+        :return: List of line pairs as returned by SkillScores.getScoringPairs(), or None if there is no data for
+            the case
+        """
+        if not self.__dataForCaseExists__(case_def):
+            return None
+        from src.CaseGallerySetup import CaseGallerySetup
+        from src.SkillScores import getScoringPairs
+        logToFile('-------------------------------------------')
+        logToFile("Processing: {}".format(case_def['name'].upper()))
+        case_gallery_setup = CaseGallerySetup(case_def, clubb_folders=self.clubb_folders, plot_les=True,
+                                              sam_folders=self.sam_folders, wrf_folders=self.wrf_folders,
+                                              e3sm_folders=self.e3sm_folders, cam_folders=self.cam_folders,
+                                              priority_vars=self.priority_vars)
+        return getScoringPairs(case_gallery_setup)
+
     def __extractNumCasesPlotted__(self, plotCaseDataArray):
         """
         The __plotCase__() function is often called via a pooling map.
@@ -405,6 +505,7 @@ class PyPlotGen:
         casename = case_def['name']
         case_plotted = False
         if self.__dataForCaseExists__(case_def):
+            from src.CaseGallerySetup import CaseGallerySetup
             logToFile('-------------------------------------------')
             logToFile("Processing: {}".format(case_def['name'].upper()))
             if self.diff is not None:
@@ -417,11 +518,13 @@ class PyPlotGen:
                                                   animation=self.animation, samstyle=self.sam_style_budgets, 
                                                   plot_subcolumns=self.plot_subcolumns,
                                                   image_extension=self.image_extension, total_panels_to_plot=0,
-                                                  priority_vars=self.priority_vars)
+                                                  priority_vars=self.priority_vars,
+                                                  image_extensions=self.image_extensions,
+                                                  encoding_threads=self.encoding_threads)
             # Call plot function of case instance
             case_gallery_setup.plot(self.output_folder, replace_images=self.replace_images, no_legends=self.no_legends,
                                     thin_lines=self.thin, show_alphabetic_id=self.show_alphabetic_id,
-                                    total_progress_counter=total_progress_counter)
+                                    total_progress_counter=total_progress_counter, archive_queue=archive_queue)
             self.cases_plotted.append(case_def)
             case_plotted = True
 
@@ -473,17 +576,18 @@ class PyPlotGen:
         :param rel_filepath: TODO
         :return: TODO
         """
+        from src.DataReader import findDatasetFile
         any_nc_file_found = False
         if rel_filepath is not None and list_of_src_folders is not None:
             for folder in list_of_src_folders:
                 if isinstance(rel_filepath, dict):
                     for temp_filename in rel_filepath.values():
                         filename = folder + temp_filename
-                        if os.path.exists(filename):
+                        if findDatasetFile(filename) is not None:
                             any_nc_file_found = True
                 else:
                     filename = folder + '/' + rel_filepath
-                    if os.path.exists(filename):
+                    if findDatasetFile(filename) is not None:
                         any_nc_file_found = True
         return any_nc_file_found
 
@@ -557,13 +661,10 @@ def __convertCasenamesToCaseInstances__(casenames_list):
     converted_cases = []
     cases_not_found = []
     for casename in casenames_list:
-        case_found = False
-        for case_def in Case_definitions.ALL_CASES:
-            if case_def['name'] == casename:
-                case_found = True
-                converted_cases.append(case_def)
-                break
-        if not case_found:
+        case_def = Case_definitions.getCaseByName(casename)
+        if case_def is not None:
+            converted_cases.append(case_def)
+        else:
             cases_not_found.append(casename)
 
     return converted_cases, cases_not_found
@@ -632,7 +733,12 @@ def __processArguments__():
     parser.add_argument("-a", "--all-best",
                         help="Same as -lgd. Plots LES, Golaz Best Ever, and HOC 2005 dependent_data for comparison.",
                         action="store_true")
-    parser.add_argument("-z", "--zip", help="Output dependent_data into a compressed zip file.", action="store_true")
+    parser.add_argument("-z", "--zip", help="Also stream all images, movies and web pages into a compressed archive "
+                                            "next to the output folder while they are being created.",
+                        action="store_true")
+    parser.add_argument("--archive-format", help="Format of the archive written by -z. tar.zst requires the "
+                                                 "zstandard package. Defaults to zip.",
+                        action="store", choices=['zip', 'tar.gz', 'tar.zst'], default='zip')
     parser.add_argument("--show-alphabetic-id", help="Add an identifying character to the top right of a panel.",
                         action="store_true")
     parser.add_argument("--thin", help="Plot using thin solid lines.", action="store_true")
@@ -702,6 +808,15 @@ def __processArguments__():
                              " please visit this page: "
                              "https://github.com/JazzCore/python-pdfkit/wiki/Installing-wkhtmltopdf",
                         action="store_true")
+    parser.add_argument("--image-formats", help="Save every panel in all of the given image formats in a single "
+                                                "run, e.g. --image-formats png svg eps. The html gallery shows the "
+                                                "first of png, svg, eps and --pdf embeds the png images. "
+                                                "Cannot be combined with --svg or --eps.",
+                        action="store", nargs='+', default=[])
+    parser.add_argument("--encoding-threads", help="Number of background threads per case used to encode raster "
+                                                   "images (png, jpg, tif), so that the next panel is drawn while the "
+                                                   "previous one is being compressed. Defaults to 0 (no threads).",
+                        action="store", type=int, default=0)
     parser.add_argument("--pdf-filesize-limit", help="Adjust pdf filesize so that it is no larger than the given size "
                                                      "in MB. Note that this argument only works if --pdf is also "
                                                      "specified",
@@ -716,10 +831,16 @@ def __processArguments__():
     parser.add_argument("--sam-style-budgets", help="Lump together certain CLUBB budget terms so that the relevant " 
                                                     "CLUBB budgets look comparable to SAM's budgets.",
                         action="store_true")
+    parser.add_argument("--skill-scores", help="Instead of plotting, score the CLUBB lines against the LES "
+                                               "benchmarks (bias, RMSE, correlation, normalized error) and write "
+                                               "the results to skill_scores.csv/.html and skill_summary.csv.",
+                        action="store_true")
     args = parser.parse_args()
 
-    if args.zip:
-        logToFileAndConsole("Zip flag detected, but that feature is not yet implemented")
+    if args.zip and args.archive_format == 'tar.zst':
+        # Fail before plotting anything if the optional zstandard package is missing
+        from src.ArchiveWriter import getZstdCompressor
+        getZstdCompressor()
     if args.bu_morr:
         logToFileAndConsole("Morrison breakdown flag detected, but that feature is not yet implemented")
 
@@ -746,6 +867,10 @@ def __processArguments__():
         cgbest = args.plot_golaz_best
         hoc = args.plot_hoc_2005
 
+    # Skill scores are computed against the LES benchmarks, so those have to be available
+    if args.skill_scores:
+        les = True
+
     image_extension = ".png"
     if args.movies is not None and (args.svg or args.eps):
        raise RuntimeError("The --movies option currently only works with .png images.  Please remove --eps or --svg "
@@ -762,8 +887,33 @@ def __processArguments__():
     if (args.eps or args.svg) and args.pdf:
         raise RuntimeError("SVG and EPS are not supported alongside the pdf parameter. This is due to a limitation of "
                            "the FPDF engine used. Please remove either the --svg or --eps option (whichever was used) or "
-                           "remove the --pdf option. Note that you can create --svg/--eps output if desired, and then "
-                           "rerun pyplotgen without that option to produce pdf output.")
+                           "remove the --pdf option. Note that you can create png and svg/eps output in a single run "
+                           "with e.g. --image-formats png svg, which is compatible with --pdf.")
+
+    image_extensions = [image_extension]
+    if len(args.image_formats) > 0:
+        from src.FigureWriter import getGalleryExtension, getPdfExtension, RASTER_EXTENSIONS, VECTOR_EXTENSIONS
+        if args.svg or args.eps:
+            raise RuntimeError("The --image-formats option replaces --svg and --eps. Please add svg or eps to the "
+                               "list of --image-formats instead.")
+        if args.movies is not None:
+            raise RuntimeError("The --movies option currently only works with .png images. Please remove "
+                               "--image-formats in order to generate animated plots.")
+        image_extensions = []
+        for image_format in args.image_formats:
+            extension = '.' + image_format.lower().lstrip('.')
+            if extension not in RASTER_EXTENSIONS and extension not in VECTOR_EXTENSIONS:
+                raise ValueError("Unsupported image format " + image_format + ". Valid formats are: " +
+                                 str([ext[1:] for ext in list(RASTER_EXTENSIONS) + VECTOR_EXTENSIONS]))
+            if extension not in image_extensions:
+                image_extensions.append(extension)
+        image_extension = getGalleryExtension(image_extensions)
+        if image_extension is None:
+            raise RuntimeError("The html gallery can only display png, svg or eps images. Please add one of these "
+                               "formats to --image-formats.")
+        if args.pdf and getPdfExtension(image_extensions) is None:
+            raise RuntimeError("The pdf output can only embed png or jpg images. Please add png to --image-formats "
+                               "or remove the --pdf option.")
 
     if args.high_quality:
         Style_definitions.IMG_OUTPUT_DPI = Style_definitions.HQ_DPI
@@ -778,6 +928,10 @@ def __processArguments__():
         raise ValueError('Error: Command line parameters --time-height-plots and -b (--plot-budgets) cannot ' 
                          'be used in conjunction.')
 
+    if args.skill_scores and (args.pdf or args.movies is not None):
+        raise ValueError('Error: Command line parameter --skill-scores does not produce any images and cannot be '
+                         'used in conjunction with --pdf or --movies.')
+
     if len(args.cases) > 0:
         cases_to_plot, cases_not_found = __convertCasenamesToCaseInstances__(args.cases)
         Case_definitions.CASES_TO_PLOT = cases_to_plot
@@ -797,14 +951,17 @@ def __processArguments__():
                           time_height=args.time_height_plots, animation=args.movies, samstyle=args.sam_style_budgets,
                           disable_multithreading=args.disable_multithreading, pdf=args.pdf,
                           pdf_filesize_limit=args.pdf_filesize_limit, plot_subcolumns=args.plot_subcolumns,
-                          image_extension=image_extension)
+                          image_extension=image_extension, skill_scores=args.skill_scores,
+                          image_extensions=image_extensions, encoding_threads=args.encoding_threads,
+                          archive_format=args.archive_format)
     return pyplotgen
 
 
 # Added to track progress with multithreading
-def tpc_init(x):
-    global total_progress_counter
+def tpc_init(x, queue=None):
+    global total_progress_counter, archive_queue
     total_progress_counter = x
+    archive_queue = queue
 
 
 if __name__ == "__main__":
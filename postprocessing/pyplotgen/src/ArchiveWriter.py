@@ -0,0 +1,194 @@
+"""
+:date: October 2026
+
+Streaming archive output for pyplotgen (-z/--zip).
+
+Tarring the output folder after pyplotgen has finished reads thousands of images from disk a second time.
+Instead, the pool workers put the name of every image or movie into a queue as soon as it has been written,
+and an ArchiveWriter appends it to the archive in a background thread of the main process while the remaining
+panels are still being plotted. Once the web pages have been generated they are added to the same archive.
+"""
+import os
+import queue
+import tarfile
+import threading
+import zipfile
+
+# Supported archive formats and the file extension of the resulting archive
+ARCHIVE_FORMATS = {'zip': '.zip', 'tar.gz': '.tar.gz', 'tar.zst': '.tar.zst'}
+
+# These formats are already compressed, so zip archives store them as they are
+PRECOMPRESSED_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.gif', '.mp4', '.avi']
+
+# Put into the queue to tell the writer thread that no more files will follow
+END_OF_FILES = None
+
+
+class ArchiveWriter:
+    """
+    Appends files to a zip or tar archive from a background thread, in the order their names arrive in a queue.
+
+    For information on the input parameters of this class, please see the documentation for the
+    ``__init__()`` method.
+    """
+
+    def __init__(self, root_folder, archive_format='zip', file_queue=None):
+        """
+        Create a new ArchiveWriter object. The archive is created next to root_folder, e.g. output.zip for the folder
+        output, and files are stored relative to the parent of root_folder.
+
+        :param root_folder: Folder containing all files that will be archived
+        :param archive_format: One of the keys of ARCHIVE_FORMATS
+        :param file_queue: Queue that file names are read from. Pass a multiprocessing.Manager().Queue() if other
+            processes add files. If None, a thread queue is created.
+        """
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError("Invalid archive format " + archive_format + ". Valid options are: " +
+                             str(list(ARCHIVE_FORMATS)))
+        self.root_folder = os.path.abspath(root_folder)
+        self.archive_format = archive_format
+        self.archive_filename = self.root_folder + ARCHIVE_FORMATS[archive_format]
+        self.file_queue = file_queue
+        if self.file_queue is None:
+            self.file_queue = queue.Queue()
+        self.archived_files = set()
+        self.error = None
+        self.thread = None
+        self.archive = None
+        self.raw_file = None
+        self.compressed_file = None
+
+    def start(self):
+        """
+        Starts the background thread, which opens the archive and appends queued files until close() is called
+
+        :return: None
+        """
+        self.thread = threading.Thread(target=self.__writeQueuedFiles__, name="ArchiveWriter", daemon=True)
+        self.thread.start()
+
+    def addFile(self, filename):
+        """
+        Queues a file to be appended to the archive. Files that were already archived are skipped.
+
+        :param filename: Name of a file inside root_folder
+        :return: None
+        """
+        self.file_queue.put(os.path.abspath(filename))
+
+    def addFolder(self, folder=None, exclude=()):
+        """
+        Queues every file inside a folder that has not been archived yet, e.g. the web pages of the gallery
+
+        :param folder: Folder to add recursively. Defaults to root_folder.
+        :param exclude: Names of files that must not be archived, e.g. the temporary log file
+        :return: None
+        """
+        if folder is None:
+            folder = self.root_folder
+        exclude = [os.path.abspath(filename) for filename in exclude]
+        for dirpath, _, filenames in sorted(os.walk(folder)):
+            for filename in sorted(filenames):
+                filename = os.path.join(dirpath, filename)
+                if os.path.abspath(filename) not in exclude:
+                    self.addFile(filename)
+
+    def close(self):
+        """
+        Waits until all queued files are archived and finalizes the archive.
+        Errors raised in the background thread are re-raised here.
+
+        :return: Name of the archive file
+        """
+        if self.thread is not None:
+            self.file_queue.put(END_OF_FILES)
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            raise self.error
+        return self.archive_filename
+
+    def __writeQueuedFiles__(self):
+        """
+        Body of the background thread. Appends files until END_OF_FILES is read from the queue.
+        If an error occurs, the remaining queue is drained so that producers never block.
+
+        :return: None
+        """
+        try:
+            self.__openArchive__()
+            try:
+                while True:
+                    filename = self.file_queue.get()
+                    if filename is END_OF_FILES:
+                        return
+                    if filename in self.archived_files or not os.path.isfile(filename):
+                        continue
+                    self.__addToArchive__(filename, os.path.relpath(filename, os.path.dirname(self.root_folder)))
+                    self.archived_files.add(filename)
+            finally:
+                self.__closeArchive__()
+        except Exception as error:
+            self.error = error
+            while self.file_queue.get() is not END_OF_FILES:
+                pass
+
+    def __openArchive__(self):
+        """
+        Opens the archive for streaming writes
+
+        :return: None
+        """
+        self.raw_file = None
+        self.compressed_file = None
+        if self.archive_format == 'zip':
+            self.archive = zipfile.ZipFile(self.archive_filename, 'w', compression=zipfile.ZIP_DEFLATED)
+        elif self.archive_format == 'tar.gz':
+            self.archive = tarfile.open(self.archive_filename, 'w|gz')
+        else:
+            compressor = getZstdCompressor()
+            self.raw_file = open(self.archive_filename, 'wb')
+            self.compressed_file = compressor.stream_writer(self.raw_file, closefd=False)
+            self.archive = tarfile.open(fileobj=self.compressed_file, mode='w|')
+
+    def __addToArchive__(self, filename, arcname):
+        """
+        Appends a single file to the archive. Zip archives store precompressed formats and deflate everything else.
+
+        :param filename: Name of the file on disk
+        :param arcname: Name of the file inside the archive
+        :return: None
+        """
+        if self.archive_format == 'zip':
+            compression = zipfile.ZIP_DEFLATED
+            if os.path.splitext(filename)[1].lower() in PRECOMPRESSED_EXTENSIONS:
+                compression = zipfile.ZIP_STORED
+            self.archive.write(filename, arcname, compress_type=compression)
+        else:
+            self.archive.add(filename, arcname=arcname)
+
+    def __closeArchive__(self):
+        """
+        Writes the end of the archive and closes all files
+
+        :return: None
+        """
+        self.archive.close()
+        if self.compressed_file is not None:
+            self.compressed_file.close()
+            self.raw_file.close()
+
+
+def getZstdCompressor():
+    """
+    Returns a zstandard compressor. The zstandard package is an optional dependency that is only needed for
+    tar.zst archives.
+
+    :return: zstandard.ZstdCompressor instance
+    """
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("tar.zst archives require the zstandard package (pip install zstandard). "
+                           "Please install it or use --archive-format zip or tar.gz.")
+    return zstandard.ZstdCompressor()
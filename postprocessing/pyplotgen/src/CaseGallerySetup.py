@@ -2,18 +2,23 @@
 :author: Nicolas Strike
 :date: 2019
 """
+import glob
 import os
 
 import numpy as np
 
-from config.VariableGroupBaseBudgets import VariableGroupBaseBudgets
-from config.VariableGroupBaseBudgetsSamStyle import VariableGroupBaseBudgetsSamStyle
-from config.VariableGroupSamBudgets import VariableGroupSamBudgets
-from config.VariableGroupSubcolumns import VariableGroupSubcolumns
-from config.VariableGroupSamProfiles import VariableGroupSamProfiles
 from src.DataReader import DataReader
+from src.FigureWriter import FigureWriter
 from src.Panel import Panel
 from src.OutputHandler import logToFile, logToFileAndConsole, updateProgress
+from src.VariableGroupRegistry import getVariableGroup
+
+# These groups are only needed for budget, subcolumn or SAM plots, so they are not imported until used
+VariableGroupBaseBudgets = getVariableGroup('VariableGroupBaseBudgets')
+VariableGroupBaseBudgetsSamStyle = getVariableGroup('VariableGroupBaseBudgetsSamStyle')
+VariableGroupSamBudgets = getVariableGroup('VariableGroupSamBudgets')
+VariableGroupSubcolumns = getVariableGroup('VariableGroupSubcolumns')
+VariableGroupSamProfiles = getVariableGroup('VariableGroupSamProfiles')
 
 
 class CaseGallerySetup:
@@ -31,7 +36,7 @@ class CaseGallerySetup:
     def __init__(self, case_definition, clubb_folders=[], diff_datasets=None, sam_folders=[""], wrf_folders=[""],
                  plot_les=False, plot_budgets=False, plot_r408=False, plot_hoc=False, e3sm_folders=[], cam_folders=[],
                  time_height=False, animation=None, samstyle=False, plot_subcolumns=False, image_extension=".png",
-                 total_panels_to_plot=0, priority_vars=False):
+                 total_panels_to_plot=0, priority_vars=False, image_extensions=None, encoding_threads=0):
         """
         Initialize a CaseGallerySetup object with the passed parameters
         :param case_definition: dict containing case specific elements. These are pulled in from Case_definitions.py,
@@ -53,6 +58,9 @@ class CaseGallerySetup:
         :param cam_folders: List of foldernames containing cam netcdf files to be plotted
         :param time_height: TODO
         :param animation: TODO
+        :param image_extensions: List of all image formats to save every panel as, e.g. ['.png', '.svg'].
+            Defaults to [image_extension]. Every figure is only built once, no matter how many formats are given.
+        :param encoding_threads: Number of background threads used to encode raster images (see src/FigureWriter.py)
         """
         self.name = case_definition['name']
         self.start_time = case_definition['start_time']
@@ -84,6 +92,10 @@ class CaseGallerySetup:
         self.r408_datasets = None
         self.hoc_datasets = None
         self.image_extension = image_extension
+        self.image_extensions = image_extensions
+        if self.image_extensions is None:
+            self.image_extensions = [image_extension]
+        self.encoding_threads = encoding_threads
         self.priority_vars = priority_vars
 
         self.VALID_MODEL_NAMES = ['clubb', 'clubb_hoc','clubb_r408', 'e3sm', 'sam', 'cam', 'wrf', 'coamps']
@@ -331,7 +343,7 @@ class CaseGallerySetup:
         return np.abs(long-short)
 
     def plot(self, output_folder, replace_images=False, no_legends=False, thin_lines=False,
-             show_alphabetic_id=False, total_progress_counter=[0,0]):
+             show_alphabetic_id=False, total_progress_counter=[0,0], archive_queue=None):
         """
         Plot all panels associated with the case, these will be saved to image files in the <<output>>/<<casename>>
         folder
@@ -356,41 +368,57 @@ class CaseGallerySetup:
         :param total_progress_counter: a variable shared between processes that tracks the total
             number to panels to be plotted as well as the total number plotted so far.  Used
             to give user some sense of total progress.
+        :param archive_queue: If given, the name of every image or movie is put into this queue as soon as the file
+            is completely written, so that it can be added to the -z archive (see src/ArchiveWriter.py)
         :return: None
         """
         # add total_panels_to_plot to first slot of shared variable counter
         with total_progress_counter.get_lock():
             total_progress_counter[0] += self.total_panels_to_plot
 
-        logToFile("\tSaving panels to {} images".format(self.image_extension))
-        num_plots = len(self.panels)
-        curr_panel_num = 1
-        for panel in self.panels:
-            logToFile("\tPlotting {} of {}: {}".format(curr_panel_num,num_plots,panel.title))
-            if show_alphabetic_id:
-                alphabetic_id = self.__getNextAlphabeticID__()
-            else:
-                alphabetic_id = ""
-            plot_paired_lines = True
-            if panel.panel_type == panel.TYPE_BUDGET or panel.panel_type == panel.TYPE_SUBCOLUMN:
-                plot_paired_lines = False
-            if self.animation is not None:
-                movie_extension="."+self.animation
-                filteringFlag = panel.plot(output_folder, self.name, replace_images=replace_images,
-                                           no_legends=no_legends, thin_lines=thin_lines,
-                                           alphabetic_id=alphabetic_id, paired_plots=plot_paired_lines,
-                                           image_extension=self.image_extension, movie_extension=movie_extension)
-            else:
-                panel.plot(output_folder, self.name, replace_images=replace_images, no_legends=no_legends,
-                           thin_lines=thin_lines, alphabetic_id=alphabetic_id, paired_plots=plot_paired_lines,
-                           image_extension=self.image_extension)
-            curr_panel_num += 1
-
-            # increment by 1 for each plotted panel
-            with total_progress_counter.get_lock():
-                total_progress_counter[1] += 1
-
-            updateProgress(total_progress_counter,self.image_extension,self.animation)
+        logToFile("\tSaving panels to {} images".format(", ".join(self.image_extensions)))
+        written_callback = None
+        if archive_queue is not None:
+            written_callback = archive_queue.put
+        # The writer waits for the queued image encodings when the block is left, also if a panel fails, so that
+        # errors raised while encoding are reported
+        with FigureWriter(self.image_extensions, encoding_threads=self.encoding_threads,
+                          written_callback=written_callback) as figure_writer:
+            archived_movies = set()
+            num_plots = len(self.panels)
+            curr_panel_num = 1
+            for panel in self.panels:
+                logToFile("\tPlotting {} of {}: {}".format(curr_panel_num,num_plots,panel.title))
+                if show_alphabetic_id:
+                    alphabetic_id = self.__getNextAlphabeticID__()
+                else:
+                    alphabetic_id = ""
+                plot_paired_lines = True
+                if panel.panel_type == panel.TYPE_BUDGET or panel.panel_type == panel.TYPE_SUBCOLUMN:
+                    plot_paired_lines = False
+                if self.animation is not None:
+                    movie_extension="."+self.animation
+                    filteringFlag = panel.plot(output_folder, self.name, replace_images=replace_images,
+                                               no_legends=no_legends, thin_lines=thin_lines,
+                                               alphabetic_id=alphabetic_id, paired_plots=plot_paired_lines,
+                                               image_extension=self.image_extension, movie_extension=movie_extension)
+                    # AnimationPanel does not report the name of its movie, so look for movies that weren't archived yet
+                    if archive_queue is not None:
+                        for movie in glob.glob(os.path.join(output_folder, self.name, '*' + movie_extension)):
+                            if movie not in archived_movies:
+                                archive_queue.put(movie)
+                                archived_movies.add(movie)
+                else:
+                    panel.plot(output_folder, self.name, replace_images=replace_images, no_legends=no_legends,
+                               thin_lines=thin_lines, alphabetic_id=alphabetic_id, paired_plots=plot_paired_lines,
+                               image_extension=self.image_extension, figure_writer=figure_writer)
+                curr_panel_num += 1
+
+                # increment by 1 for each plotted panel
+                with total_progress_counter.get_lock():
+                    total_progress_counter[1] += 1
+
+                updateProgress(total_progress_counter,self.image_extension,self.animation)
 
         if self.animation and filteringFlag:
             logToFile('Time slices have been filtered from some {} simulations '.format(self.name.upper()) +
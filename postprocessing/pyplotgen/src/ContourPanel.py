@@ -50,7 +50,7 @@ class ContourPanel(Panel):
         super().__init__(plots, panel_type, title, dependent_title, sci_scale=None, centered=False)
 
     def plot(self, output_folder, casename, replace_images = False, no_legends = True, thin_lines = False,
-             alphabetic_id = '', paired_plots = True, image_extension=".png"):
+             alphabetic_id = '', paired_plots = True, image_extension=".png", figure_writer=None):
         """
         Generate a single contourf plot from the given data
 
@@ -58,6 +58,8 @@ class ContourPanel(Panel):
         :param casename: The name of the case that is plotted in this panel
         :param replace_images: Switch to tell pyplotgen if existing files should be overwritten
         :param alphabetic_id: A string printed into the Panel at coordinates (.9,.9) as an identifier.
+        :param image_extension: File extension of the saved images. Ignored if figure_writer is given.
+        :param figure_writer: If given, this FigureWriter saves the plots to all of its formats.
         :return: None
         """
         # Suppress deprecation warnings
@@ -121,5 +123,8 @@ class ContourPanel(Panel):
             relative_filename = output_folder + '/' + casename + '/' + filename
             relative_filename = clean_path(relative_filename)
             # Save image file
-            plt.savefig(relative_filename+image_extension)
+            if figure_writer is not None:
+                figure_writer.save(plt.gcf(), relative_filename)
+            else:
+                plt.savefig(relative_filename+image_extension)
             plt.close()
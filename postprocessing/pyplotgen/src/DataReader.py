@@ -11,8 +11,12 @@ import numpy as np
 from netCDF4 import Dataset
 
 from config import Case_definitions
+from src.GradsDataset import GradsDataset
 from src.OutputHandler import logToFile, logToFileAndConsole
 
+# Extensions of the output files that are loaded from the input folders. GrADS files are read from their .ctl file.
+DATASET_EXTENSIONS = ['.nc', '.ctl']
+
 class NetCdfVariable:
     """
     Class used for conveniently storing the information about a given netcdf variable
@@ -348,13 +352,13 @@ class DataReader():
                 for filename in files:
                     abs_filename = os.path.abspath(os.path.join(root, filename))
                     file_ext = os.path.splitext(filename)[1]
-                    # Only process nc files (not containing '.git')
-                    if ignore_git and '.git' in abs_filename or file_ext != '.nc':
+                    # Only process nc and GrADS files (not containing '.git')
+                    if ignore_git and '.git' in abs_filename or file_ext not in DATASET_EXTENSIONS:
                         continue
                     # Find offset to eliminate trailing chars like "_zt.nc", "_zm.nc", and "_sfc.nc
                     ext_offset = filename.rindex('_')
                     # Get type of current file (zm, zt, or sfc)
-                    file_type = filename[ext_offset + 1:-3]
+                    file_type = filename[ext_offset + 1:-len(file_ext)]
                     # Remaining prefix of filename is the case's name to which the file data belongs
                     case_key = filename[:ext_offset]
 
@@ -490,14 +494,19 @@ class DataReader():
 
     def __loadNcFile__(self, filename):
         """
-        Load the given NetCDF file
+        Load the given NetCDF file. If it does not exist but a GrADS file (.ctl) with the same name does,
+        the GrADS file is converted to an in-memory NetCDF dataset.
 
-        :param filename: The netcdf file to be loaded
+        :param filename: The netcdf or GrADS .ctl file to be loaded
         :return: A netCDF4 Dataset object containing the data from the given file
         """
         dataset = None
-        if path.exists(filename):
-            dataset = Dataset(filename, "r", format="NETCDF4")
+        existing_filename = findDatasetFile(filename)
+        if existing_filename is not None and existing_filename.endswith('.ctl'):
+            with GradsDataset(existing_filename) as grads_dataset:
+                dataset = grads_dataset.toNetcdf()
+        elif existing_filename is not None:
+            dataset = Dataset(existing_filename, "r", format="NETCDF4")
         else:
             logToFile("Failed to find file " + filename)
 
@@ -802,3 +811,20 @@ class DataReader():
         """
         units = units.replace('#', '')
         return units
+
+
+def findDatasetFile(filename):
+    """
+    Finds the file a dataset is loaded from. CLUBB output written in GrADS format is used in place of the
+    NetCDF file with the same name, e.g. bomex_zt.ctl for bomex_zt.nc.
+
+    :param filename: Name of a .nc or .ctl file
+    :return: filename if it exists, else the name of the existing GrADS or NetCDF counterpart, else None
+    """
+    if path.exists(filename):
+        return filename
+    for extension in DATASET_EXTENSIONS:
+        alternative_filename = path.splitext(filename)[0] + extension
+        if path.exists(alternative_filename):
+            return alternative_filename
+    return None
@@ -0,0 +1,196 @@
+"""
+:date: October 2026
+
+Saves a matplotlib figure to several image formats in one pass.
+
+Producing e.g. png images for the html gallery and svg/eps images for papers used to require one pyplotgen run per
+format, each of which re-read all data and rebuilt every figure. A FigureWriter is handed the finished figure
+instead and writes it to all requested formats: vector formats are written by matplotlib, while all raster formats
+share a single Agg rendering whose pixel buffer is encoded by PIL. The raster encoding can optionally be done in
+background threads, so that the next panel is built while the previous one is being compressed.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image
+
+# Raster formats and the PIL format names used to encode them
+RASTER_EXTENSIONS = {'.png': 'PNG', '.jpg': 'JPEG', '.jpeg': 'JPEG', '.tif': 'TIFF', '.tiff': 'TIFF'}
+
+# Formats written directly by matplotlib
+VECTOR_EXTENSIONS = ['.svg', '.eps', '.ps', '.pdf']
+
+# Formats the html gallery can display, in order of preference
+GALLERY_EXTENSIONS = ['.png', '.svg', '.eps']
+
+# Formats the fpdf engine can embed into the --pdf output, in order of preference
+PDF_EXTENSIONS = ['.png', '.jpg', '.jpeg']
+
+
+class FigureWriter:
+    """
+    Writes finished matplotlib figures to a fixed list of image formats.
+    Used as a context manager, it is closed when the block is left, so that pending images are waited for.
+
+    For information on the input parameters of this class, please see the documentation for the
+    ``__init__()`` method.
+    """
+
+    def __init__(self, image_extensions, encoding_threads=0, written_callback=None):
+        """
+        Create a new FigureWriter object
+
+        :param image_extensions: List of file extensions to save every figure as, e.g. ['.png', '.svg']
+        :param encoding_threads: Number of background threads used to encode raster images.
+            If 0 (default), images are encoded before save() returns.
+        :param written_callback: Optional function that is called with the name of every image file once it has been
+            completely written, e.g. to add it to the -z archive. May be called from an encoding thread.
+        """
+        for extension in image_extensions:
+            if extension not in RASTER_EXTENSIONS and extension not in VECTOR_EXTENSIONS:
+                raise ValueError("Unsupported image format " + extension + ". Valid formats are: " +
+                                 str(list(RASTER_EXTENSIONS) + VECTOR_EXTENSIONS))
+        self.raster_extensions = [extension for extension in image_extensions if extension in RASTER_EXTENSIONS]
+        self.vector_extensions = [extension for extension in image_extensions if extension in VECTOR_EXTENSIONS]
+        self.encoding_threads = encoding_threads
+        self.written_callback = written_callback
+        self.executor = None
+        if encoding_threads > 0:
+            self.executor = ThreadPoolExecutor(max_workers=encoding_threads)
+        self.pending_encodings = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def save(self, figure, base_filename, dpi=None):
+        """
+        Saves the figure to every format of this writer.
+        The figure is not needed anymore once this returns and can be closed, even if encoding is still in progress.
+
+        :param figure: matplotlib Figure to save
+        :param base_filename: Filename without extension. The extension of each format is appended to it.
+        :param dpi: Resolution of the saved images. Defaults to the figure's own dpi.
+        :return: List of the filenames that are (or are being) written
+        """
+        if dpi is None:
+            dpi = figure.dpi
+        filenames = []
+        for extension in self.vector_extensions:
+            figure.savefig(base_filename + extension, dpi=dpi)
+            filenames.append(base_filename + extension)
+            if self.written_callback is not None:
+                self.written_callback(base_filename + extension)
+
+        if len(self.raster_extensions) > 0:
+            pixels = self.__renderPixels__(figure, dpi)
+            for extension in self.raster_extensions:
+                filenames.append(base_filename + extension)
+                if self.executor is None:
+                    self.__encodeImage__(pixels, base_filename + extension, RASTER_EXTENSIONS[extension], dpi)
+                else:
+                    self.__limitPendingEncodings__()
+                    self.pending_encodings.append(self.executor.submit(self.__encodeImage__, pixels,
+                                                                       base_filename + extension,
+                                                                       RASTER_EXTENSIONS[extension], dpi))
+        return filenames
+
+    def wait(self):
+        """
+        Blocks until all pending raster images are written. Errors raised while encoding are re-raised here.
+
+        :return: None
+        """
+        while len(self.pending_encodings) > 0:
+            self.pending_encodings.pop(0).result()
+
+    def close(self):
+        """
+        Waits for pending raster images and shuts down the encoding threads
+
+        :return: None
+        """
+        try:
+            self.wait()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+    def __renderPixels__(self, figure, dpi):
+        """
+        Draws the figure once with the Agg renderer and returns a copy of the resulting RGBA pixels
+
+        :param figure: matplotlib Figure to draw
+        :param dpi: Resolution to draw at
+        :return: numpy uint8 array of shape (height, width, 4)
+        """
+        original_dpi = figure.dpi
+        canvas = figure.canvas
+        if not isinstance(canvas, FigureCanvasAgg):
+            canvas = FigureCanvasAgg(figure)
+        try:
+            figure.set_dpi(dpi)
+            canvas.draw()
+            return np.array(canvas.buffer_rgba())
+        finally:
+            figure.set_dpi(original_dpi)
+
+    def __encodeImage__(self, pixels, filename, image_format, dpi):
+        """
+        Encodes an RGBA pixel array into an image file
+
+        :param pixels: numpy uint8 array of shape (height, width, 4)
+        :param filename: Name of the file to write
+        :param image_format: PIL format name, e.g. 'PNG'
+        :param dpi: Resolution stored in the image metadata
+        :return: None
+        """
+        image = Image.fromarray(pixels, 'RGBA')
+        if image_format == 'JPEG':
+            image = image.convert('RGB')
+        image.save(filename, format=image_format, dpi=(dpi, dpi))
+        if self.written_callback is not None:
+            self.written_callback(filename)
+
+    def __limitPendingEncodings__(self):
+        """
+        Keeps at most two pending images per encoding thread, so that finished figures don't pile up in memory when
+        encoding is slower than plotting. Also forwards errors of finished encodings.
+
+        :return: None
+        """
+        for future in [future for future in self.pending_encodings if future.done()]:
+            future.result()
+            self.pending_encodings.remove(future)
+        while len(self.pending_encodings) >= 2 * self.encoding_threads:
+            self.pending_encodings.pop(0).result()
+
+
+def getGalleryExtension(image_extensions):
+    """
+    Picks the format the html gallery should display from a list of saved formats
+
+    :param image_extensions: List of file extensions, e.g. ['.eps', '.png']
+    :return: The preferred extension out of GALLERY_EXTENSIONS, or None if none of them is in the list
+    """
+    for extension in GALLERY_EXTENSIONS:
+        if extension in image_extensions:
+            return extension
+    return None
+
+
+def getPdfExtension(image_extensions):
+    """
+    Picks the format embedded into the --pdf output from a list of saved formats
+
+    :param image_extensions: List of file extensions, e.g. ['.svg', '.png']
+    :return: The preferred extension out of PDF_EXTENSIONS, or None if none of them is in the list
+    """
+    for extension in PDF_EXTENSIONS:
+        if extension in image_extensions:
+            return extension
+    return None
@@ -0,0 +1,343 @@
+"""
+:date: October 2026
+
+Reader for the GrADS .ctl/.dat output CLUBB writes when it is not set to write NetCDF output.
+
+The .dat file written by output_grads.F90 is a direct access file without record markers: for every output time,
+one record of 4 byte floats per variable, each holding all z levels. A GradsDataset parses the .ctl descriptor
+and memory maps the .dat file, so that every variable is a zero-copy numpy view of shape (time, level).
+Only the parts of the file that are actually used are read from disk, and time averages or budget sums become
+simple numpy reductions over these views.
+
+GradsDataset mimics the parts of the netCDF4.Dataset interface used by the postprocessing scripts (variables,
+dimensions, long_name and units attributes, filepath() and close()), so scripts written for CLUBB's NetCDF output
+can mostly be pointed at GrADS output as they are. Code that needs a real netCDF4.Dataset, like pyplotgen's
+DataReader, can use toNetcdf().
+"""
+import os
+import re
+from datetime import datetime
+
+import numpy as np
+from netCDF4 import Dataset
+
+# Seconds per GrADS time increment unit (TDEF)
+GRADS_TIME_UNITS = {'mn': 60, 'hr': 3600, 'dy': 86400}
+
+# Months as written by output_grads.F90, e.g. 00:00Z01JUN1969
+GRADS_MONTHS = ['JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC']
+
+
+class GradsDimension:
+    """
+    Size of one dimension of a GradsDataset, used like a netCDF4.Dimension
+    """
+
+    def __init__(self, name, size, unlimited=False):
+        """
+        Create a new GradsDimension object
+
+        :param name: Name of the dimension, e.g. 'altitude'
+        :param size: Number of values along this dimension
+        :param unlimited: True for the time dimension
+        """
+        self.name = name
+        self.size = size
+        self.unlimited = unlimited
+
+    def __len__(self):
+        return self.size
+
+    def isunlimited(self):
+        """
+        :return: True if this dimension can grow, like the time dimension of a NetCDF file
+        """
+        return self.unlimited
+
+
+class GradsVariable:
+    """
+    A single variable of a GrADS file, used like a netCDF4.Variable.
+    Indexing it returns data from the underlying numpy memmap without reading the rest of the file.
+    """
+
+    def __init__(self, name, data, dimensions, long_name="", units=""):
+        """
+        Create a new GradsVariable object
+
+        :param name: Name of the variable as given in the .ctl file
+        :param data: numpy array (usually a memmap view) holding the values
+        :param dimensions: Tuple with the names of the dimensions of data, e.g. ('time', 'altitude')
+        :param long_name: Description of the variable
+        :param units: Units of the variable
+        """
+        self.name = name
+        self.data = data
+        self.dimensions = dimensions
+        self.long_name = long_name
+        self.units = units
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def ndim(self):
+        return self.data.ndim
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return np.asarray(self.data)
+        return np.asarray(self.data, dtype=dtype)
+
+    def ncattrs(self):
+        """
+        :return: Names of the attributes of this variable, like netCDF4.Variable.ncattrs()
+        """
+        return ['long_name', 'units']
+
+
+class GradsDataset:
+    """
+    Opens a CLUBB GrADS file pair (.ctl and .dat) for reading.
+
+    For information on the input parameters of this class, please see the documentation for the
+    ``__init__()`` method.
+    """
+
+    def __init__(self, filename):
+        """
+        Create a new GradsDataset object. This parses the .ctl file and memory maps the .dat file.
+
+        :param filename: Name of the .ctl file. The name of the .dat file or the name without extension work as well.
+        """
+        self.ctl_filename = os.path.splitext(filename)[0] + '.ctl'
+        self.dat_filename = None
+        self.byte_order = '='
+        self.undef = None
+        self.num_lon = 1
+        self.num_lat = 1
+        self.lon_values = np.zeros(1)
+        self.lat_values = np.zeros(1)
+        self.altitude_values = None
+        self.start_date = None
+        self.timestep = None
+        self.num_times = 0
+        self.var_definitions = []
+        self.variables = {}
+        self.dimensions = {}
+        self.memmap = None
+
+        with open(self.ctl_filename, 'r') as ctl_file:
+            self.__parseCtl__(ctl_file.read())
+        self.__mapData__()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def filepath(self):
+        """
+        :return: Name of the .ctl file, like netCDF4.Dataset.filepath()
+        """
+        return self.ctl_filename
+
+    def ncattrs(self):
+        """
+        :return: Names of the global attributes. GrADS files have none.
+        """
+        return []
+
+    def close(self):
+        """
+        Releases the memory map. Arrays that were taken from the variables before remain valid until they are
+        deleted themselves.
+
+        :return: None
+        """
+        self.variables = {}
+        self.memmap = None
+
+    def toNetcdf(self):
+        """
+        Copies the whole dataset into an in-memory netCDF4.Dataset with the same layout as CLUBB's NetCDF output,
+        i.e. dimensions (time, altitude, latitude, longitude).
+
+        :return: netCDF4.Dataset that is not backed by a file on disk
+        """
+        dataset = Dataset(os.path.splitext(self.ctl_filename)[0] + '.nc', 'w', diskless=True, persist=False)
+        dataset.createDimension('time', None)
+        dataset.createDimension('altitude', len(self.altitude_values))
+        dataset.createDimension('latitude', self.num_lat)
+        dataset.createDimension('longitude', self.num_lon)
+        data_shape = (self.num_times, len(self.altitude_values), self.num_lat, self.num_lon)
+        for name, variable in self.variables.items():
+            if len(variable.dimensions) == 1:
+                nc_variable = dataset.createVariable(name, 'f8', variable.dimensions)
+                nc_variable[:] = variable[:]
+            else:
+                nc_variable = dataset.createVariable(name, 'f4', ('time', 'altitude', 'latitude', 'longitude'))
+                nc_variable[:] = np.reshape(variable[:], data_shape)
+            for attribute in variable.ncattrs():
+                nc_variable.setncattr(attribute, getattr(variable, attribute))
+        return dataset
+
+    def __parseCtl__(self, text):
+        """
+        Reads the file layout and variable definitions from the text of a .ctl file
+
+        :param text: Contents of the .ctl file
+        :return: None
+        """
+        lines = text.splitlines()
+        line_num = 0
+        while line_num < len(lines):
+            fields = lines[line_num].split()
+            line_num += 1
+            if len(fields) == 0:
+                continue
+            keyword = fields[0].upper()
+
+            if keyword == 'DSET':
+                dat_filename = fields[1]
+                if dat_filename.startswith('^'):
+                    dat_filename = os.path.join(os.path.dirname(self.ctl_filename), dat_filename[1:])
+                self.dat_filename = dat_filename
+            elif keyword == 'OPTIONS':
+                for option in [field.upper() for field in fields[1:]]:
+                    if option == 'BIG_ENDIAN':
+                        self.byte_order = '>'
+                    elif option == 'LITTLE_ENDIAN':
+                        self.byte_order = '<'
+                    elif option == 'BYTESWAPPED':
+                        self.byte_order = '>' if np.little_endian else '<'
+                    elif option in ['SEQUENTIAL', 'TEMPLATE']:
+                        raise ValueError("GrADS option " + option + " is not supported. CLUBB writes direct access "
+                                         "files only.")
+            elif keyword == 'UNDEF':
+                self.undef = float(fields[1])
+            elif keyword in ['XDEF', 'YDEF', 'ZDEF']:
+                values, line_num = self.__parseDimension__(fields, lines, line_num)
+                if keyword == 'XDEF':
+                    self.num_lon, self.lon_values = len(values), values
+                elif keyword == 'YDEF':
+                    self.num_lat, self.lat_values = len(values), values
+                else:
+                    self.altitude_values = values
+            elif keyword == 'TDEF':
+                self.__parseTime__(fields)
+            elif keyword == 'VARS':
+                num_vars = int(fields[1])
+                for var_line in lines[line_num:line_num + num_vars]:
+                    var_fields = var_line.split(None, 3)
+                    description = var_fields[3].strip() if len(var_fields) > 3 else ""
+                    self.var_definitions.append((var_fields[0], max(int(var_fields[1]), 1), description))
+                line_num += num_vars
+
+        if self.dat_filename is None or self.altitude_values is None or self.timestep is None or \
+                len(self.var_definitions) == 0:
+            raise ValueError("Incomplete GrADS descriptor " + self.ctl_filename +
+                             ". DSET, ZDEF, TDEF and VARS are required.")
+
+    def __parseDimension__(self, fields, lines, line_num):
+        """
+        Reads the values of an XDEF, YDEF or ZDEF entry. LEVELS values may continue on the following lines.
+
+        :param fields: Fields of the line with the keyword, e.g. ['ZDEF', '74', 'LEVELS']
+        :param lines: All lines of the .ctl file
+        :param line_num: Index of the line after the keyword
+        :return: Tuple of the numpy array of values and the index of the next line to parse
+        """
+        size = int(fields[1])
+        mapping = fields[2].upper()
+        values = [float(value) for value in fields[3:]]
+        if mapping == 'LINEAR':
+            return values[0] + values[1] * np.arange(size), line_num
+        if mapping != 'LEVELS':
+            raise ValueError("Unsupported GrADS dimension mapping " + mapping + " in " + self.ctl_filename)
+        while len(values) < size:
+            values.extend(float(value) for value in lines[line_num].split())
+            line_num += 1
+        return np.array(values[:size]), line_num
+
+    def __parseTime__(self, fields):
+        """
+        Reads number of output times, start date and output timestep from a TDEF entry like
+        ``TDEF 180 LINEAR 00:01Z24JUN1969 1mn``
+
+        :param fields: Fields of the TDEF line
+        :return: None
+        """
+        self.num_times = int(fields[1])
+        increment = re.match(r'(\d+)(\w\w)', fields[4].lower())
+        if increment is None or increment.group(2) not in GRADS_TIME_UNITS:
+            raise ValueError("Unsupported GrADS time increment " + fields[4] + " in " + self.ctl_filename)
+        self.timestep = int(increment.group(1)) * GRADS_TIME_UNITS[increment.group(2)]
+
+        date = re.match(r'(?:(\d+)(?::(\d+))?Z)?(\d+)(\w{3})(\d{4})', fields[3].upper())
+        if date is not None and date.group(4) in GRADS_MONTHS:
+            self.start_date = datetime(int(date.group(5)), GRADS_MONTHS.index(date.group(4)) + 1,
+                                       int(date.group(3)), int(date.group(1) or 0), int(date.group(2) or 0))
+
+    def __mapData__(self):
+        """
+        Memory maps the .dat file and creates the variables as views into it.
+        If the .dat file holds fewer records than the .ctl file announces (e.g. a run that is still going),
+        only the complete output times are used.
+
+        :return: None
+        """
+        level_size = self.num_lon * self.num_lat
+        record_sizes = [num_levels * level_size for _, num_levels, _ in self.var_definitions]
+        time_size = sum(record_sizes)
+        dtype = np.dtype(self.byte_order + 'f4')
+
+        num_complete_times = os.path.getsize(self.dat_filename) // (time_size * dtype.itemsize)
+        self.num_times = min(self.num_times, num_complete_times)
+        if self.num_times > 0:
+            self.memmap = np.memmap(self.dat_filename, dtype=dtype, mode='r', shape=(self.num_times, time_size))
+        else:
+            self.memmap = np.zeros((0, time_size), dtype=dtype)
+
+        self.dimensions = {'time': GradsDimension('time', self.num_times, unlimited=True),
+                           'altitude': GradsDimension('altitude', len(self.altitude_values)),
+                           'latitude': GradsDimension('latitude', self.num_lat),
+                           'longitude': GradsDimension('longitude', self.num_lon)}
+
+        time_units = "seconds"
+        if self.start_date is not None:
+            time_units += " since " + self.start_date.strftime("%Y-%m-%d %H:%M:%S")
+        self.variables = {
+            'time': GradsVariable('time', self.timestep * np.arange(self.num_times, dtype=float), ('time',),
+                                  long_name='time', units=time_units),
+            'altitude': GradsVariable('altitude', self.altitude_values, ('altitude',),
+                                      long_name='altitude height', units='meters'),
+            'latitude': GradsVariable('latitude', self.lat_values, ('latitude',), long_name='latitude',
+                                      units='degrees_N'),
+            'longitude': GradsVariable('longitude', self.lon_values, ('longitude',), long_name='longitude',
+                                       units='degrees_E')}
+
+        offset = 0
+        for (name, num_levels, description), record_size in zip(self.var_definitions, record_sizes):
+            data = self.memmap[:, offset:offset + record_size]
+            dimensions = ('time', 'altitude')
+            if level_size > 1:
+                data = data.reshape(self.num_times, num_levels, self.num_lat, self.num_lon)
+                dimensions = ('time', 'altitude', 'latitude', 'longitude')
+            # CLUBB doesn't write units into the .ctl file, but some descriptions contain them in brackets
+            units = re.search(r'\[(.+)\]', description)
+            self.variables[name] = GradsVariable(name, data, dimensions, long_name=description,
+                                                 units=units.group(1) if units is not None else "")
+            offset += record_size
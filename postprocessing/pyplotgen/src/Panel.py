@@ -81,7 +81,7 @@ class Panel:
                              '. Valid options are: ' + str(Panel.VALID_PANEL_TYPES))
 
     def plot(self, output_folder, casename, replace_images = False, no_legends = True, thin_lines = False,
-             alphabetic_id="", paired_plots = True, image_extension=".png"):
+             alphabetic_id="", paired_plots = True, image_extension=".png", figure_writer=None):
         """
         Saves a single panel/graph as image to the output directory specified by the pyplotgen launch parameters
 
@@ -93,6 +93,8 @@ class Panel:
         :param alphabetic_id: A string printed into the Panel at coordinates (.9,.9) as an identifier.
         :paired_plots: If no format is specified and paired_plots is True,
             use the color/style rotation specified in Style_definitions.py
+        :param image_extension: File extension of the saved image. Ignored if figure_writer is given.
+        :param figure_writer: If given, this FigureWriter saves the panel to all of its formats.
         :return: None
         """
         # Suppress deprecation warnings
@@ -263,7 +265,10 @@ class Panel:
         rel_filename = output_folder + "/" +casename+'/' + filename
         rel_filename = clean_path(rel_filename)
         # Save image file
-        plt.savefig(rel_filename + image_extension, dpi=Style_definitions.IMG_OUTPUT_DPI)
+        if figure_writer is not None:
+            figure_writer.save(plt.gcf(), rel_filename, dpi=Style_definitions.IMG_OUTPUT_DPI)
+        else:
+            plt.savefig(rel_filename + image_extension, dpi=Style_definitions.IMG_OUTPUT_DPI)
         plt.close()
 
     def __removeInvalidFilenameChars__(self, filename):
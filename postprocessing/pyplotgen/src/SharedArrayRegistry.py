@@ -0,0 +1,376 @@
+"""
+:date: October 2026
+
+Shared-memory transport for the numeric data held by Line, Contour and Panel objects.
+
+Sending a Panel through a multiprocessing pipe pickles every x/y/data array it contains. For time-height and
+subcolumn data those copies dominate the cost of handing work from a loader process to a renderer process.
+This file provides a registry that moves such arrays into ``multiprocessing.shared_memory`` blocks and replaces them
+with small, picklable SharedArrayHandle descriptors. The receiving process turns the handles back into numpy views
+onto the same memory without copying.
+
+Lifetime of the shared blocks:
+
+* Every block belongs to a session. The session name is fixed by the process that created the registry (the owner),
+  and every process that receives a pickled copy of the registry creates its blocks inside the same session.
+* Blocks are removed either explicitly, by calling release() on the handle/Line/Contour/Panel once it is no longer
+  needed, or when the owner calls cleanup() (also registered with atexit).
+* If a worker dies before its blocks were handed off or released, the owner's cleanup() still removes them by
+  sweeping all blocks whose name starts with the session name.
+"""
+import atexit
+import copy
+import glob
+import os
+import sys
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from src.OutputHandler import logToFile
+
+# Prefix of every shared memory block created by pyplotgen
+SHARED_MEMORY_PREFIX = "pyplotgen"
+
+# Attributes of Line and Contour objects that hold numeric data which should be moved into shared memory
+SHARED_PLOT_ATTRIBUTES = ['x', 'y', 'data']
+
+# POSIX systems expose named shared memory blocks as files in this folder
+SHARED_MEMORY_FOLDER = "/dev/shm"
+
+
+class SharedArrayHandle:
+    """
+    Lightweight, picklable reference to a numpy array stored in a shared memory block.
+    Handles are created by SharedArrayRegistry.shareArray() and resolved back into arrays by
+    SharedArrayRegistry.getArray().
+
+    For information on the input parameters of this class, please see the documentation for the
+    ``__init__()`` method.
+    """
+
+    def __init__(self, name, shape, dtype, mask=None):
+        """
+        Create a new SharedArrayHandle object
+
+        :param name: Name of the shared memory block containing the array values
+        :param shape: Shape tuple of the shared array
+        :param dtype: Numpy dtype string of the shared array (e.g. '<f8')
+        :param mask: Optional SharedArrayHandle pointing to the mask of a masked array
+        """
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.mask = mask
+
+    def __repr__(self):
+        return "SharedArrayHandle(" + self.name + ", shape=" + str(self.shape) + ", dtype=" + self.dtype + ")"
+
+
+class SharedArrayRegistry:
+    """
+    Keeps track of the shared memory blocks used to pass Line, Contour and Panel data between processes.
+
+    A registry is created once in the process that owns the session (usually the main pyplotgen process).
+    When the registry is pickled into a worker process only the session name is transferred,
+    so the worker's blocks can still be found and removed by the owner.
+
+    For information on the input parameters of this class, please see the documentation for the
+    ``__init__()`` method.
+    """
+
+    def __init__(self, session_name=None):
+        """
+        Create a new SharedArrayRegistry object
+
+        :param session_name: Name shared by all blocks created in this session. If not specified, a name is
+            generated from SHARED_MEMORY_PREFIX and the process id of the owning process.
+        """
+        if session_name is None:
+            session_name = SHARED_MEMORY_PREFIX + "_" + str(os.getpid())
+        self.session_name = session_name
+        self.owner_pid = os.getpid()
+        self.created_blocks = {}
+        self.attached_blocks = {}
+        self.block_counter = 0
+        atexit.register(self.cleanup)
+
+    def __getstate__(self):
+        """
+        Only the session name and owner are sent to other processes. Open blocks are specific to each process.
+
+        :return: A dict containing the state to be pickled
+        """
+        return {'session_name': self.session_name, 'owner_pid': self.owner_pid}
+
+    def __setstate__(self, state):
+        """
+        Recreate a registry for the current process that belongs to the same session as the pickled one
+
+        :param state: The dict returned by __getstate__()
+        :return: None
+        """
+        self.session_name = state['session_name']
+        self.owner_pid = state['owner_pid']
+        self.created_blocks = {}
+        self.attached_blocks = {}
+        self.block_counter = 0
+        atexit.register(self.cleanup)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.cleanup()
+
+    def isOwner(self):
+        """
+        :return: True if the calling process created this session, False otherwise
+        """
+        return os.getpid() == self.owner_pid
+
+    def shareArray(self, array):
+        """
+        Copies an array into a new shared memory block and returns a handle to it.
+        Masked arrays are shared as two blocks, one for the values and one for the mask.
+
+        :param array: A numpy array or any object that can be converted to one (e.g. a list)
+        :return: A SharedArrayHandle if the array could be shared.
+            Arrays of python objects cannot be placed in shared memory and are returned unchanged.
+        """
+        mask_handle = None
+        if np.ma.isMaskedArray(array):
+            mask = np.ma.getmask(array)
+            if mask is not np.ma.nomask:
+                mask_handle = self.shareArray(mask)
+            array = np.ma.getdata(array)
+        array = np.asarray(array)
+        if array.dtype.hasobject:
+            logToFile("Array of dtype object cannot be placed into shared memory. Passing it by copy instead.")
+            return array
+
+        block = self.__createBlock__(array.nbytes)
+        shared_array = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        shared_array[...] = array
+        return SharedArrayHandle(block.name, array.shape, array.dtype.str, mask=mask_handle)
+
+    def getArray(self, handle):
+        """
+        Returns a read-only numpy view onto the shared memory block referenced by the given handle.
+        No data is copied. The block stays attached until release() or cleanup() is called.
+
+        :param handle: A SharedArrayHandle returned by shareArray()
+        :return: A numpy array (or masked array if the shared array had a mask)
+        """
+        block = self.__getBlock__(handle.name)
+        array = np.ndarray(handle.shape, dtype=np.dtype(handle.dtype), buffer=block.buf)
+        array.flags.writeable = False
+        if handle.mask is not None:
+            array = np.ma.array(array, mask=self.getArray(handle.mask), copy=False)
+        return array
+
+    def exportPlot(self, plot):
+        """
+        Returns a shallow copy of a Line or Contour object in which the numeric data
+        (see SHARED_PLOT_ATTRIBUTES) has been moved into shared memory and replaced by SharedArrayHandles.
+        The original object is not modified.
+
+        :param plot: A Line or Contour object
+        :return: A copy of the given object that is cheap to pickle
+        """
+        exported_plot = copy.copy(plot)
+        for attribute in SHARED_PLOT_ATTRIBUTES:
+            value = getattr(plot, attribute, None)
+            if value is not None and not isinstance(value, (SharedArrayHandle, str, dict)):
+                setattr(exported_plot, attribute, self.shareArray(value))
+        return exported_plot
+
+    def importPlot(self, plot):
+        """
+        Counterpart to exportPlot(). Replaces all SharedArrayHandles in the given Line or Contour with
+        numpy views onto the shared memory. Operates in-place.
+
+        :param plot: A Line or Contour object returned by exportPlot()
+        :return: The given plot object
+        """
+        for attribute in SHARED_PLOT_ATTRIBUTES:
+            value = getattr(plot, attribute, None)
+            if isinstance(value, SharedArrayHandle):
+                setattr(plot, attribute, self.getArray(value))
+        return plot
+
+    def exportPanel(self, panel):
+        """
+        Returns a shallow copy of a Panel (or Panel subclass) in which every plot has been exported with exportPlot().
+        The original panel is not modified.
+
+        :param panel: A Panel, ContourPanel or AnimationPanel object
+        :return: A copy of the given panel that is cheap to pickle
+        """
+        exported_panel = copy.copy(panel)
+        exported_panel.all_plots = [self.exportPlot(plot) for plot in panel.all_plots]
+        return exported_panel
+
+    def importPanel(self, panel):
+        """
+        Counterpart to exportPanel(). Resolves the SharedArrayHandles of every plot in the panel. Operates in-place.
+
+        :param panel: A panel returned by exportPanel()
+        :return: The given panel
+        """
+        for plot in panel.all_plots:
+            self.importPlot(plot)
+        return panel
+
+    def release(self, shared_object):
+        """
+        Removes the shared memory blocks referenced by the given object.
+        Any views returned by getArray() for those blocks must not be used afterwards.
+
+        :param shared_object: A SharedArrayHandle, or a Line, Contour or Panel returned by exportPlot()/exportPanel().
+            Imported objects no longer hold handles, so the exported object must be kept to release its blocks.
+        :return: None
+        """
+        for name in self.__getBlockNames__(shared_object):
+            block = self.attached_blocks.pop(name, None) or self.created_blocks.pop(name, None)
+            if block is None:
+                try:
+                    block = self.__openBlock__(name)
+                except FileNotFoundError:
+                    continue
+            self.__closeBlock__(block)
+            try:
+                self.__unlinkBlock__(block)
+            except FileNotFoundError:
+                pass
+
+    def cleanup(self):
+        """
+        Closes every block attached or created by this process. If called by the owner of the session,
+        all blocks of the session are also removed, including blocks left behind by crashed workers.
+        Safe to call multiple times.
+
+        :return: None
+        """
+        for block in list(self.attached_blocks.values()):
+            self.__closeBlock__(block)
+        self.attached_blocks = {}
+
+        for block in list(self.created_blocks.values()):
+            self.__closeBlock__(block)
+            if self.isOwner():
+                try:
+                    self.__unlinkBlock__(block)
+                except FileNotFoundError:
+                    pass
+        self.created_blocks = {}
+
+        if self.isOwner():
+            for block_path in glob.glob(os.path.join(SHARED_MEMORY_FOLDER, self.session_name + "_*")):
+                name = os.path.basename(block_path)
+                logToFile("Removing orphaned shared memory block " + name)
+                try:
+                    block = self.__openBlock__(name)
+                except FileNotFoundError:
+                    continue
+                self.__closeBlock__(block)
+                self.__unlinkBlock__(block)
+
+    def __getBlockNames__(self, shared_object):
+        """
+        Collects the names of all shared memory blocks referenced by the given object
+
+        :param shared_object: A SharedArrayHandle, a Line/Contour or a Panel
+        :return: List of block names
+        """
+        names = []
+        if isinstance(shared_object, SharedArrayHandle):
+            names.append(shared_object.name)
+            if shared_object.mask is not None:
+                names.extend(self.__getBlockNames__(shared_object.mask))
+        elif hasattr(shared_object, 'all_plots'):
+            for plot in shared_object.all_plots:
+                names.extend(self.__getBlockNames__(plot))
+        else:
+            for attribute in SHARED_PLOT_ATTRIBUTES:
+                value = getattr(shared_object, attribute, None)
+                if isinstance(value, SharedArrayHandle):
+                    names.extend(self.__getBlockNames__(value))
+        return names
+
+    def __createBlock__(self, size):
+        """
+        Creates a new shared memory block belonging to this session
+
+        :param size: Size of the block in bytes. Zero-sized arrays still get a one byte block.
+        :return: The SharedMemory object
+        """
+        self.block_counter += 1
+        name = self.session_name + "_" + str(os.getpid()) + "_" + str(self.block_counter)
+        block = self.__openBlock__(name, create=True, size=max(size, 1))
+        self.created_blocks[name] = block
+        return block
+
+    def __getBlock__(self, name):
+        """
+        Returns the SharedMemory object for the given name, attaching to it if needed
+
+        :param name: Name of the shared memory block
+        :return: The SharedMemory object
+        """
+        if name in self.created_blocks:
+            return self.created_blocks[name]
+        if name not in self.attached_blocks:
+            self.attached_blocks[name] = self.__openBlock__(name)
+        return self.attached_blocks[name]
+
+    @staticmethod
+    def __openBlock__(name, create=False, size=0):
+        """
+        Opens or creates a shared memory block without registering it with multiprocessing's resource tracker.
+        The resource tracker would otherwise remove blocks as soon as the process that created them exits,
+        even though another process may still need them. Lifetime is handled by the registry instead.
+
+        :param name: Name of the shared memory block
+        :param create: If True, a new block is created
+        :param size: Size of the new block in bytes
+        :return: The SharedMemory object
+        """
+        try:
+            block = shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+        except TypeError:
+            # Python < 3.13 does not support the track parameter
+            block = shared_memory.SharedMemory(name=name, create=create, size=size)
+            if os.name == 'posix':
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(block._name, 'shared_memory')
+        return block
+
+    @staticmethod
+    def __unlinkBlock__(block):
+        """
+        Removes a block from the system. Counterpart to __openBlock__(), it bypasses the resource tracker,
+        which would otherwise complain about blocks it was never told about.
+
+        :param block: SharedMemory object
+        :return: None
+        """
+        if os.name == 'posix' and sys.version_info < (3, 13):
+            import _posixshmem
+            _posixshmem.shm_unlink(block._name)
+        else:
+            block.unlink()
+
+    @staticmethod
+    def __closeBlock__(block):
+        """
+        Closes the mapping of a block in this process. Blocks that still have numpy views pointing at them
+        cannot be closed and are left to the garbage collector.
+
+        :param block: SharedMemory object
+        :return: None
+        """
+        try:
+            block.close()
+        except BufferError:
+            pass
@@ -0,0 +1,301 @@
+"""
+:date: October 2026
+
+Model skill scoring for pyplotgen.
+
+Instead of rendering panels, the lines loaded by a CaseGallerySetup are compared against the LES benchmark lines
+of the same panel. Every CLUBB line is interpolated onto the height (or time) grid of the SAM and COAMPS benchmark
+lines, and bias, RMSE, correlation and normalized error are computed for all variables of all cases in a single
+batched NumPy computation. The results are written to a sortable html table, a csv file and a per-case summary,
+which gives nightly tests a cheap regression signal.
+"""
+import csv
+import html
+import os
+
+import numpy as np
+
+from config import Style_definitions
+from src.OutputHandler import logToFile
+
+# Benchmarks the CLUBB lines are scored against
+SKILL_SCORE_BENCHMARKS = ['sam', 'coamps']
+
+# Panel types that contain a single line per model and can therefore be scored
+SKILL_SCORE_PANEL_TYPES = ['profile', 'timeseries']
+
+# Columns of the score table, in output order
+SKILL_SCORE_COLUMNS = ['case', 'variable', 'units', 'panel_type', 'benchmark', 'model', 'num_points',
+                       'bias', 'rmse', 'correlation', 'normalized_error']
+
+# Columns of the per-case summary, in output order
+SKILL_SUMMARY_COLUMNS = ['case', 'benchmark', 'model', 'num_variables', 'mean_normalized_error',
+                         'median_normalized_error', 'mean_correlation', 'worst_variable', 'worst_normalized_error']
+
+SKILL_SCORE_CSV = "skill_scores.csv"
+SKILL_SCORE_HTML = "skill_scores.html"
+SKILL_SUMMARY_CSV = "skill_summary.csv"
+
+# Makes every table on the page sortable by clicking on a header. Numeric columns are compared as numbers.
+SORT_TABLE_SCRIPT = """<script>
+document.querySelectorAll('th').forEach(function (header) {
+  header.addEventListener('click', function () {
+    var table = header.closest('table');
+    var body = table.tBodies[0];
+    var column = header.cellIndex;
+    var ascending = header.dataset.order !== 'asc';
+    header.dataset.order = ascending ? 'asc' : 'desc';
+    var rows = Array.from(body.rows);
+    rows.sort(function (a, b) {
+      var x = a.cells[column].textContent, y = b.cells[column].textContent;
+      var nx = parseFloat(x), ny = parseFloat(y);
+      var result = (isNaN(nx) || isNaN(ny)) ? x.localeCompare(y) : nx - ny;
+      return ascending ? result : -result;
+    });
+    rows.forEach(function (row) { body.appendChild(row); });
+  });
+});
+</script>
+"""
+
+
+def getScoringPairs(case_gallery_setup):
+    """
+    Finds every CLUBB line that has a matching LES benchmark line on the same panel and interpolates it onto the
+    benchmark grid. Only interpolation is done here, so this is cheap enough to run inside the pool workers.
+
+    :param case_gallery_setup: CaseGallerySetup instance whose panels have been generated with plot_les=True
+    :return: List of dicts, one per (panel, benchmark, clubb folder), containing the identifying columns of the
+        score table plus the arrays 'reference' and 'prediction' defined on the benchmark grid
+    """
+    benchmark_labels = {Style_definitions.BENCHMARK_LABELS[benchmark]: benchmark
+                        for benchmark in SKILL_SCORE_BENCHMARKS}
+    clubb_labels = [os.path.basename(folder) for folder in (case_gallery_setup.clubb_datasets or {})]
+
+    pairs = []
+    for panel in case_gallery_setup.panels:
+        if panel.panel_type not in SKILL_SCORE_PANEL_TYPES:
+            continue
+        is_profile = panel.panel_type == 'profile'
+        benchmark_lines = []
+        clubb_lines = []
+        for line in panel.all_plots:
+            if not hasattr(line, 'label'):
+                continue
+            if line.label in benchmark_labels:
+                benchmark_lines.append(line)
+            elif line.label in clubb_labels:
+                clubb_lines.append(line)
+
+        for benchmark_line in benchmark_lines:
+            reference_grid, reference = __getGridAndValues__(benchmark_line, is_profile)
+            # Benchmark lines of variables missing from the LES output are filled with NaN
+            if not np.any(np.isfinite(reference)):
+                continue
+            for clubb_line in clubb_lines:
+                model_grid, model_values = __getGridAndValues__(clubb_line, is_profile)
+                pairs.append({'case': case_gallery_setup.name,
+                              'variable': panel.title,
+                              'units': panel.dependent_title,
+                              'panel_type': panel.panel_type,
+                              'benchmark': benchmark_labels[benchmark_line.label],
+                              'model': clubb_line.label,
+                              'reference': reference,
+                              'prediction': interpolateOntoGrid(model_grid, model_values, reference_grid)})
+    logToFile("\tFound {} line pairs to score for {}".format(len(pairs), case_gallery_setup.name))
+    return pairs
+
+
+def interpolateOntoGrid(grid, values, target_grid):
+    """
+    Linearly interpolates values given on grid onto target_grid.
+    Points of target_grid outside of grid are set to NaN instead of being extrapolated.
+
+    :param grid: 1D array of grid coordinates, e.g. CLUBB heights. Does not need to be sorted.
+    :param values: 1D array of values on grid. NaN values are skipped.
+    :param target_grid: 1D array of coordinates to interpolate onto, e.g. LES heights
+    :return: 1D float array of the same length as target_grid
+    """
+    valid = np.isfinite(grid) & np.isfinite(values)
+    if not np.any(valid):
+        return np.full(len(target_grid), np.nan)
+    grid = grid[valid]
+    values = values[valid]
+    order = np.argsort(grid, kind='stable')
+    return np.interp(target_grid, grid[order], values[order], left=np.nan, right=np.nan)
+
+
+def computeSkillScores(pairs):
+    """
+    Computes the skill scores of all given pairs at once.
+    The pairs are padded with NaN into two (number of pairs, longest benchmark grid) arrays, so that every metric is
+    one reduction along the last axis, no matter how many cases and variables are scored.
+
+    :param pairs: List of dicts as returned by getScoringPairs()
+    :return: List of dicts with the keys given in SKILL_SCORE_COLUMNS, in the same order as pairs
+    """
+    if len(pairs) == 0:
+        return []
+    max_length = max(len(pair['reference']) for pair in pairs)
+    reference = np.full((len(pairs), max_length), np.nan)
+    prediction = np.full((len(pairs), max_length), np.nan)
+    for index, pair in enumerate(pairs):
+        reference[index, :len(pair['reference'])] = pair['reference']
+        prediction[index, :len(pair['prediction'])] = pair['prediction']
+
+    valid = np.isfinite(reference) & np.isfinite(prediction)
+    num_points = valid.sum(axis=1)
+    reference = np.where(valid, reference, 0.0)
+    prediction = np.where(valid, prediction, 0.0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        difference = prediction - reference
+        bias = difference.sum(axis=1) / num_points
+        rmse = np.sqrt((difference ** 2).sum(axis=1) / num_points)
+
+        reference_anomaly = np.where(valid, reference - (reference.sum(axis=1) / num_points)[:, np.newaxis], 0.0)
+        prediction_anomaly = np.where(valid, prediction - (prediction.sum(axis=1) / num_points)[:, np.newaxis], 0.0)
+        reference_std = np.sqrt((reference_anomaly ** 2).sum(axis=1) / num_points)
+        prediction_std = np.sqrt((prediction_anomaly ** 2).sum(axis=1) / num_points)
+        correlation = (reference_anomaly * prediction_anomaly).sum(axis=1) / num_points / \
+                      (reference_std * prediction_std)
+        normalized_error = rmse / reference_std
+
+    # A constant benchmark or model line has no meaningful correlation or normalized error
+    correlation[(reference_std == 0) | (prediction_std == 0)] = np.nan
+    normalized_error[reference_std == 0] = np.nan
+
+    scores = []
+    for index, pair in enumerate(pairs):
+        row = {column: pair[column] for column in SKILL_SCORE_COLUMNS[:6]}
+        row['num_points'] = int(num_points[index])
+        row['bias'] = float(bias[index])
+        row['rmse'] = float(rmse[index])
+        row['correlation'] = float(correlation[index])
+        row['normalized_error'] = float(normalized_error[index])
+        scores.append(row)
+    return scores
+
+
+def summarizeSkillScores(scores):
+    """
+    Aggregates the score table into one row per case, benchmark and CLUBB folder.
+    Variables without a finite normalized error (e.g. a constant benchmark line) are left out of the averages.
+
+    :param scores: List of dicts as returned by computeSkillScores()
+    :return: List of dicts with the keys given in SKILL_SUMMARY_COLUMNS
+    """
+    groups = {}
+    for row in scores:
+        groups.setdefault((row['case'], row['benchmark'], row['model']), []).append(row)
+
+    summary = []
+    for (casename, benchmark, model), rows in groups.items():
+        normalized_errors = np.array([row['normalized_error'] for row in rows])
+        correlations = np.array([row['correlation'] for row in rows])
+        finite = np.isfinite(normalized_errors)
+        summary_row = {'case': casename, 'benchmark': benchmark, 'model': model,
+                       'num_variables': int(finite.sum()), 'mean_normalized_error': np.nan,
+                       'median_normalized_error': np.nan, 'mean_correlation': np.nan,
+                       'worst_variable': "", 'worst_normalized_error': np.nan}
+        if np.any(finite):
+            worst_index = int(np.nanargmax(np.where(finite, normalized_errors, np.nan)))
+            summary_row['mean_normalized_error'] = float(normalized_errors[finite].mean())
+            summary_row['median_normalized_error'] = float(np.median(normalized_errors[finite]))
+            summary_row['worst_variable'] = rows[worst_index]['variable']
+            summary_row['worst_normalized_error'] = float(normalized_errors[worst_index])
+        if np.any(np.isfinite(correlations)):
+            summary_row['mean_correlation'] = float(np.nanmean(correlations))
+        summary.append(summary_row)
+    return summary
+
+
+def writeSkillScores(scores, summary, output_folder):
+    """
+    Writes the score table to csv and html and the per-case summary to csv.
+    The html table can be sorted by clicking on a column header.
+
+    :param scores: List of dicts as returned by computeSkillScores()
+    :param summary: List of dicts as returned by summarizeSkillScores()
+    :param output_folder: Folder to write SKILL_SCORE_CSV, SKILL_SCORE_HTML and SKILL_SUMMARY_CSV into
+    :return: None
+    """
+    __writeCsv__(os.path.join(output_folder, SKILL_SCORE_CSV), SKILL_SCORE_COLUMNS, scores)
+    __writeCsv__(os.path.join(output_folder, SKILL_SUMMARY_CSV), SKILL_SUMMARY_COLUMNS, summary)
+
+    with open(os.path.join(output_folder, SKILL_SCORE_HTML), 'w') as html_file:
+        html_file.write("<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+                        "<title>pyplotgen skill scores</title>\n"
+                        "<style>table{border-collapse:collapse}th,td{border:1px solid #999;padding:2px 6px}"
+                        "th{cursor:pointer;background:#ddd}td.num{text-align:right}</style>\n"
+                        "</head>\n<body>\n<h1>Skill scores against LES benchmarks</h1>\n")
+        html_file.write("<h2>Summary per case</h2>\n")
+        html_file.write(__getHtmlTable__(SKILL_SUMMARY_COLUMNS, summary))
+        html_file.write("<h2>All variables</h2>\n")
+        html_file.write(__getHtmlTable__(SKILL_SCORE_COLUMNS, scores))
+        html_file.write(SORT_TABLE_SCRIPT)
+        html_file.write("</body>\n</html>\n")
+
+
+def __formatValue__(value):
+    """
+    Formats a table cell. Floats are written with 6 significant digits.
+
+    :param value: The value to format
+    :return: Formatted string
+    """
+    if isinstance(value, float):
+        return "{:.6g}".format(value)
+    return str(value)
+
+
+def __writeCsv__(filename, columns, rows):
+    """
+    Writes rows of dicts into a csv file with the given columns
+
+    :param filename: Name of the csv file to write
+    :param columns: List of column names
+    :param rows: List of dicts containing the columns as keys
+    :return: None
+    """
+    with open(filename, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([__formatValue__(row[column]) for column in columns])
+
+
+def __getHtmlTable__(columns, rows):
+    """
+    Returns rows of dicts as an html table
+
+    :param columns: List of column names
+    :param rows: List of dicts containing the columns as keys
+    :return: String containing the html table
+    """
+    lines = ["<table>", "<thead><tr>" + "".join("<th>" + column + "</th>" for column in columns) + "</tr></thead>",
+             "<tbody>"]
+    for row in rows:
+        cells = []
+        for column in columns:
+            css_class = ' class="num"' if isinstance(row[column], (int, float)) else ''
+            cells.append("<td" + css_class + ">" + html.escape(__formatValue__(row[column])) + "</td>")
+        lines.append("<tr>" + "".join(cells) + "</tr>")
+    lines.append("</tbody>\n</table>\n")
+    return "\n".join(lines)
+
+
+def __getGridAndValues__(line, is_profile):
+    """
+    Returns the independent coordinate and the values of a line as float arrays with NaN instead of masked values.
+    Profile lines store the values on the x axis and heights on the y axis, timeseries lines the other way around.
+
+    :param line: Line object
+    :param is_profile: True if the line belongs to a profile panel
+    :return: Tuple (grid, values) of 1D float arrays
+    """
+    x = np.ma.filled(np.ma.asarray(line.x, dtype=float), np.nan).ravel()
+    y = np.ma.filled(np.ma.asarray(line.y, dtype=float), np.nan).ravel()
+    if is_profile:
+        return y, x
+    return x, y
@@ -0,0 +1,100 @@
+"""
+:date: October 2026
+
+Lazy registry of VariableGroup classes.
+
+The VariableGroup* modules in the config folder contain several thousand lines of variable definitions and pull in
+matplotlib and netCDF4 through src.VariableGroup. Importing all of them whenever Case_definitions.py is loaded
+made every pyplotgen invocation pay that cost, even for ``-h`` or single-case runs.
+Case_definitions.py therefore lists LazyVariableGroup objects instead of the classes themselves.
+A LazyVariableGroup behaves like the class it stands in for, but the defining module is only imported the first
+time the group is instantiated or one of its attributes is accessed.
+"""
+import importlib
+
+# Package containing the modules that define the VariableGroup subclasses
+VARIABLE_GROUP_PACKAGE = "config"
+
+# Maps class names to their LazyVariableGroup, so every name is only ever resolved once per process
+REGISTERED_VARIABLE_GROUPS = {}
+
+
+class LazyVariableGroup:
+    """
+    Stand-in for a VariableGroup subclass that is only imported on first use.
+
+    For information on the input parameters of this class, please see the documentation for the
+    ``__init__()`` method.
+    """
+
+    def __init__(self, class_name, module_name=None):
+        """
+        Create a new LazyVariableGroup object. Use getVariableGroup() instead of calling this directly.
+
+        :param class_name: Name of the VariableGroup subclass, e.g. 'VariableGroupBase'
+        :param module_name: Full name of the module defining the class.
+            Defaults to the module with the same name as the class inside VARIABLE_GROUP_PACKAGE.
+        """
+        if module_name is None:
+            module_name = VARIABLE_GROUP_PACKAGE + "." + class_name
+        self.class_name = class_name
+        self.module_name = module_name
+        self.resolved_class = None
+
+    def resolve(self):
+        """
+        Imports the module defining this variable group (if not done yet) and returns the actual class
+
+        :return: The VariableGroup subclass
+        """
+        if self.resolved_class is None:
+            module = importlib.import_module(self.module_name)
+            self.resolved_class = getattr(module, self.class_name)
+        return self.resolved_class
+
+    def isResolved(self):
+        """
+        :return: True if the module defining this variable group has already been imported
+        """
+        return self.resolved_class is not None
+
+    def __call__(self, *args, **kwargs):
+        """
+        Creates an instance of the VariableGroup subclass, exactly as calling the class itself would.
+        """
+        return self.resolve()(*args, **kwargs)
+
+    def __getattr__(self, name):
+        """
+        Forwards attribute lookups (e.g. variable_definitions) to the resolved class.
+        Only called for attributes not defined on the LazyVariableGroup itself.
+        __name__ and __qualname__ are answered from the class name, without importing the module.
+        """
+        if name in ('__name__', '__qualname__') and 'class_name' in self.__dict__:
+            return self.class_name
+        # Special names are looked up by copy/pickle before __init__ has run and must not trigger an import
+        if name.startswith('__') or name in ('class_name', 'module_name', 'resolved_class'):
+            raise AttributeError(name)
+        return getattr(self.resolve(), name)
+
+    def __reduce__(self):
+        """
+        Pickle by name, so pool workers get the registry entry of their own process
+        """
+        return getVariableGroup, (self.class_name, self.module_name)
+
+    def __repr__(self):
+        return "LazyVariableGroup(" + self.class_name + ")"
+
+
+def getVariableGroup(class_name, module_name=None):
+    """
+    Returns the registered LazyVariableGroup for the given class name, registering it on first request.
+
+    :param class_name: Name of the VariableGroup subclass, e.g. 'VariableGroupBase'
+    :param module_name: Full name of the module defining the class. See LazyVariableGroup.__init__()
+    :return: The LazyVariableGroup standing in for the requested class
+    """
+    if class_name not in REGISTERED_VARIABLE_GROUPS:
+        REGISTERED_VARIABLE_GROUPS[class_name] = LazyVariableGroup(class_name, module_name=module_name)
+    return REGISTERED_VARIABLE_GROUPS[class_name]
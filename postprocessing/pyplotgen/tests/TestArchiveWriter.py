@@ -0,0 +1,70 @@
+import multiprocessing
+import os
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+from src.ArchiveWriter import ArchiveWriter
+
+
+def write_and_queue(folder, file_queue):
+    """Worker that writes an image and queues it from another process."""
+    filename = os.path.join(folder, "from_worker.png")
+    with open(filename, 'wb') as image_file:
+        image_file.write(b"\x89PNG" + bytes(100))
+    file_queue.put(filename)
+
+
+class ArchiveWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_folder = tempfile.TemporaryDirectory()
+        self.output_folder = os.path.join(self.temp_folder.name, "output")
+        os.makedirs(os.path.join(self.output_folder, "bomex"))
+        self.image = self.__writeFile__("bomex/profile_thlm.png", b"\x89PNG" + bytes(1000))
+        self.page = self.__writeFile__("index.html", b"<html>" + b"gallery " * 100 + b"</html>")
+        self.errorlog = self.__writeFile__("error_temp.log", b"log")
+
+    def tearDown(self):
+        self.temp_folder.cleanup()
+
+    def __writeFile__(self, relative_name, content):
+        filename = os.path.join(self.output_folder, relative_name)
+        with open(filename, 'wb') as new_file:
+            new_file.write(content)
+        return filename
+
+    def test_zip(self):
+        writer = ArchiveWriter(self.output_folder)
+        writer.start()
+        writer.addFile(self.image)
+        writer.addFolder(exclude=[self.errorlog])
+        archive_filename = writer.close()
+
+        self.assertEqual(self.output_folder + ".zip", archive_filename)
+        with zipfile.ZipFile(archive_filename) as archive:
+            self.assertListEqual(["output/bomex/profile_thlm.png", "output/index.html"], archive.namelist())
+            self.assertEqual(zipfile.ZIP_STORED, archive.getinfo("output/bomex/profile_thlm.png").compress_type)
+            self.assertEqual(zipfile.ZIP_DEFLATED, archive.getinfo("output/index.html").compress_type)
+
+    def test_tar_gz_from_other_process(self):
+        with multiprocessing.Manager() as manager:
+            file_queue = manager.Queue()
+            writer = ArchiveWriter(self.output_folder, archive_format='tar.gz', file_queue=file_queue)
+            writer.start()
+            worker = multiprocessing.Process(target=write_and_queue,
+                                             args=(os.path.join(self.output_folder, "bomex"), file_queue))
+            worker.start()
+            worker.join()
+            archive_filename = writer.close()
+
+        with tarfile.open(archive_filename) as archive:
+            self.assertListEqual(["output/bomex/from_worker.png"], archive.getnames())
+
+    def test_invalid_format(self):
+        with self.assertRaises(ValueError):
+            ArchiveWriter(self.output_folder, archive_format='rar')
+
+
+if __name__ == '__main__':
+    unittest.main()
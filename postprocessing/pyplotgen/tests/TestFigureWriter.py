@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+from PIL import Image
+
+from src.FigureWriter import FigureWriter, getGalleryExtension, getPdfExtension
+
+
+class FigureWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.output_folder = tempfile.TemporaryDirectory()
+        self.figure = plt.figure(figsize=(4, 3))
+        plt.plot(np.arange(10.0), np.arange(10.0) ** 2, label="line")
+        plt.title("thlm")
+
+    def tearDown(self):
+        plt.close(self.figure)
+        self.output_folder.cleanup()
+
+    def test_all_formats_written(self):
+        base_filename = os.path.join(self.output_folder.name, "panel")
+        writer = FigureWriter(['.png', '.svg', '.eps', '.jpg'])
+        filenames = writer.save(self.figure, base_filename, dpi=30)
+        writer.close()
+        for extension in ['.png', '.svg', '.eps', '.jpg']:
+            self.assertIn(base_filename + extension, filenames)
+            self.assertGreater(os.path.getsize(base_filename + extension), 0)
+
+    def test_raster_matches_savefig(self):
+        reference_filename = os.path.join(self.output_folder.name, "reference.png")
+        self.figure.savefig(reference_filename, dpi=45)
+        writer = FigureWriter(['.png'], encoding_threads=2)
+        writer.save(self.figure, os.path.join(self.output_folder.name, "panel"), dpi=45)
+        writer.close()
+
+        reference = np.asarray(Image.open(reference_filename))
+        written = np.asarray(Image.open(os.path.join(self.output_folder.name, "panel.png")))
+        np.testing.assert_array_equal(reference, written)
+        self.assertEqual(100, self.figure.dpi)
+
+    def test_context_manager_waits_after_error(self):
+        base_filename = os.path.join(self.output_folder.name, "panel")
+        with self.assertRaises(RuntimeError):
+            with FigureWriter(['.png'], encoding_threads=2) as writer:
+                writer.save(self.figure, base_filename, dpi=30)
+                raise RuntimeError("panel failed")
+        self.assertIsNone(writer.executor)
+        self.assertGreater(os.path.getsize(base_filename + ".png"), 0)
+
+        # Errors of the pending encodings are still reported
+        with self.assertRaises(FileNotFoundError) as context:
+            with FigureWriter(['.png'], encoding_threads=2) as writer:
+                writer.save(self.figure, os.path.join(self.output_folder.name, "missing", "panel"), dpi=30)
+                raise RuntimeError("panel failed")
+        self.assertIsInstance(context.exception.__context__, RuntimeError)
+
+    def test_invalid_format(self):
+        with self.assertRaises(ValueError):
+            FigureWriter(['.bmp'])
+
+    def test_format_selection(self):
+        self.assertEqual('.svg', getGalleryExtension(['.eps', '.svg']))
+        self.assertEqual('.png', getGalleryExtension(['.eps', '.svg', '.png']))
+        self.assertIsNone(getGalleryExtension(['.pdf']))
+        self.assertIsNone(getPdfExtension(['.svg', '.eps']))
+        self.assertEqual('.png', getPdfExtension(['.svg', '.png']))
+
+
+if __name__ == '__main__':
+    unittest.main()
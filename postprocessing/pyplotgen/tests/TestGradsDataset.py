@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.DataReader import DataReader
+from src.GradsDataset import GradsDataset
+
+# Layout of a .ctl file as written by output_grads.F90
+CTL_TEXT = """OPTIONS BIG_ENDIAN
+DSET ^bomex_zt.dat
+UNDEF -0.99900E+34
+XDEF    1 LINEAR  295.500 1.
+YDEF    1 LINEAR   15.000 1.
+ZDEF    8 LEVELS
+      -20.0000      20.0000      60.0000     100.0000     140.0000     180.0000
+      220.0000     260.0000
+TDEF        5 LINEAR 00:01Z24JUN1969    1mn
+VARS    3
+thlm    8 99 Liquid water potential temperature (theta_l) [K]
+rtm    8 99 Total (vapor+liquid) water mixing ratio [kg/kg]
+rtm_bt    8 99 rtm_bt, rtm budget: rtm time tendency
+ENDVARS
+"""
+
+
+class GradsDatasetTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.ctl_filename = os.path.join(self.folder.name, "bomex_zt.ctl")
+        with open(self.ctl_filename, 'w') as ctl_file:
+            ctl_file.write(CTL_TEXT)
+        # One record per variable and time: values encode (time, variable, level)
+        self.values = np.arange(5 * 3 * 8, dtype=float).reshape(5, 3, 8)
+        self.values.astype('>f4').tofile(os.path.join(self.folder.name, "bomex_zt.dat"))
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_layout(self):
+        with GradsDataset(self.ctl_filename) as dataset:
+            self.assertEqual(5, len(dataset.dimensions['time']))
+            self.assertEqual(8, len(dataset.dimensions['altitude']))
+            self.assertEqual(60, dataset.timestep)
+            self.assertListEqual([0, 60, 120, 180, 240], list(dataset.variables['time'][:]))
+            self.assertEqual(260, dataset.variables['altitude'][-1])
+            self.assertListEqual(['thlm', 'rtm', 'rtm_bt'], [name for name in dataset.variables
+                                                             if name not in dataset.dimensions])
+
+            rtm = dataset.variables['rtm']
+            self.assertEqual((5, 8), rtm.shape)
+            self.assertIsInstance(rtm.data, np.memmap)
+            np.testing.assert_array_equal(self.values[:, 1, :], rtm[:])
+            np.testing.assert_array_equal(self.values[:, 2, :].mean(axis=0), np.mean(dataset.variables['rtm_bt'],
+                                                                                      axis=0))
+            self.assertEqual("kg/kg", rtm.units)
+            self.assertIn("rtm budget:", dataset.variables['rtm_bt'].long_name)
+
+    def test_incomplete_dat_file(self):
+        # Only 3 of the 5 output times announced in the .ctl file were written
+        self.values[:3].astype('>f4').tofile(os.path.join(self.folder.name, "bomex_zt.dat"))
+        with GradsDataset(self.ctl_filename) as dataset:
+            self.assertEqual((3, 8), dataset.variables['thlm'].shape)
+
+    def test_load_with_data_reader(self):
+        reader = DataReader()
+        datasets = reader.loadFolder([self.folder.name])
+        dataset = datasets['bomex'][self.folder.name]['zt']
+        self.assertEqual((5, 8, 1, 1), dataset.variables['thlm'].shape)
+        np.testing.assert_array_equal(self.values[:, 0, :], np.squeeze(dataset.variables['thlm'][:]))
+        self.assertEqual('clubb', reader.guessNcdfSourceModel(dataset))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import multiprocessing
+import os
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from src.Panel import Panel
+from src.SharedArrayRegistry import SharedArrayHandle, SharedArrayRegistry
+
+
+def sum_shared_panel(registry, exported_panel, result_queue):
+    """Worker used to check that an exported panel can be read in another process."""
+    panel = registry.importPanel(exported_panel)
+    result_queue.put([float(np.sum(plot.x)) for plot in panel.all_plots])
+    registry.cleanup()
+
+
+def crash_after_sharing(registry, result_queue):
+    """Worker that creates a shared block and then dies without cleaning up."""
+    handle = registry.shareArray(np.arange(10.0))
+    result_queue.put(handle.name)
+    result_queue.close()
+    result_queue.join_thread()
+    os._exit(1)
+
+
+class SharedArrayRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = SharedArrayRegistry(session_name="pyplotgen_test_" + str(os.getpid()))
+
+    def tearDown(self):
+        self.registry.cleanup()
+
+    def test_share_array_round_trip(self):
+        array = np.arange(12, dtype=np.float32).reshape(3, 4)
+        handle = self.registry.shareArray(array)
+        self.assertIsInstance(handle, SharedArrayHandle)
+        self.assertEqual((3, 4), handle.shape)
+
+        shared = self.registry.getArray(handle)
+        np.testing.assert_array_equal(array, shared)
+        self.assertEqual(np.float32, shared.dtype)
+        self.assertFalse(shared.flags.writeable)
+
+    def test_share_masked_array(self):
+        array = np.ma.array([1.0, 2.0, 3.0], mask=[False, True, False])
+        shared = self.registry.getArray(self.registry.shareArray(array))
+        self.assertTrue(np.ma.isMaskedArray(shared))
+        self.assertListEqual([False, True, False], shared.mask.tolist())
+        self.assertEqual(4.0, shared.sum())
+
+    def test_export_panel_leaves_original_untouched(self):
+        line = SimpleNamespace(x=np.linspace(0, 1, 5), y=np.arange(5.0), line_format="", label="clubb")
+        panel = Panel([line], title="thlm")
+        exported = self.registry.exportPanel(panel)
+
+        self.assertIs(line, panel.all_plots[0])
+        self.assertIsInstance(exported.all_plots[0].x, SharedArrayHandle)
+        self.assertEqual("thlm", exported.title)
+
+        imported = self.registry.importPanel(exported)
+        np.testing.assert_array_equal(line.y, imported.all_plots[0].y)
+
+    def test_panel_in_other_process(self):
+        line_a = SimpleNamespace(x=np.ones(100), y=np.arange(100.0), line_format="", label="a")
+        line_b = SimpleNamespace(x=np.full(10, 2.0), y=np.arange(10.0), line_format="", label="b")
+        exported = self.registry.exportPanel(Panel([line_a, line_b]))
+
+        result_queue = multiprocessing.Queue()
+        worker = multiprocessing.Process(target=sum_shared_panel, args=(self.registry, exported, result_queue))
+        worker.start()
+        sums = result_queue.get(timeout=30)
+        worker.join()
+        self.assertListEqual([100.0, 20.0], sums)
+
+    def test_release(self):
+        handle = self.registry.shareArray(np.zeros(4))
+        self.registry.release(handle)
+        self.assertNotIn(handle.name, self.registry.created_blocks)
+        with self.assertRaises(FileNotFoundError):
+            self.registry.getArray(handle)
+
+    @unittest.skipUnless(os.path.isdir("/dev/shm"), "Requires POSIX shared memory folder")
+    def test_cleanup_after_worker_crash(self):
+        result_queue = multiprocessing.Queue()
+        worker = multiprocessing.Process(target=crash_after_sharing, args=(self.registry, result_queue))
+        worker.start()
+        orphan_name = result_queue.get(timeout=30)
+        worker.join()
+        self.assertNotEqual(0, worker.exitcode)
+        self.assertTrue(os.path.exists("/dev/shm/" + orphan_name))
+
+        self.registry.cleanup()
+        self.assertFalse(os.path.exists("/dev/shm/" + orphan_name))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import csv
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from config import Style_definitions
+from src.Panel import Panel
+from src.SkillScores import computeSkillScores, getScoringPairs, interpolateOntoGrid, summarizeSkillScores, \
+    writeSkillScores, SKILL_SCORE_CSV, SKILL_SCORE_HTML, SKILL_SUMMARY_CSV
+
+
+def make_line(x, y, label):
+    return SimpleNamespace(x=np.asarray(x, dtype=float), y=np.asarray(y, dtype=float), line_format="", label=label)
+
+
+class SkillScoresTest(unittest.TestCase):
+    def setUp(self):
+        sam_label = Style_definitions.BENCHMARK_LABELS['sam']
+        les_heights = np.linspace(100, 900, 9)
+        clubb_heights = np.linspace(0, 1000, 41)
+        # CLUBB profile is the LES profile shifted by 2 and sampled on a finer grid
+        thlm_panel = Panel([make_line(les_heights / 100, les_heights, sam_label),
+                            make_line(clubb_heights / 100 + 2, clubb_heights, "default_run")], title="thlm")
+        rtm_panel = Panel([make_line(les_heights / 100, les_heights, sam_label),
+                           make_line(-clubb_heights / 100, clubb_heights, "default_run")], title="rtm")
+        missing_panel = Panel([make_line(np.full(9, np.nan), les_heights, sam_label),
+                               make_line(clubb_heights, clubb_heights, "default_run")], title="missing in LES")
+        budget_panel = Panel([make_line(les_heights, les_heights, sam_label),
+                              make_line(clubb_heights, clubb_heights, "default_run")], panel_type="budget")
+        self.case = SimpleNamespace(name="bomex", clubb_datasets={"/output/default_run": {}},
+                                    panels=[thlm_panel, rtm_panel, missing_panel, budget_panel])
+
+    def test_interpolation_does_not_extrapolate(self):
+        result = interpolateOntoGrid(np.array([10.0, 0.0]), np.array([1.0, 0.0]), np.array([-1.0, 5.0, 11.0]))
+        self.assertTrue(np.isnan(result[0]))
+        self.assertEqual(0.5, result[1])
+        self.assertTrue(np.isnan(result[2]))
+
+    def test_scores(self):
+        pairs = getScoringPairs(self.case)
+        self.assertListEqual(["thlm", "rtm"], [pair['variable'] for pair in pairs])
+
+        thlm_scores, rtm_scores = computeSkillScores(pairs)
+        self.assertEqual(9, thlm_scores['num_points'])
+        self.assertAlmostEqual(2.0, thlm_scores['bias'])
+        self.assertAlmostEqual(2.0, thlm_scores['rmse'])
+        self.assertAlmostEqual(1.0, thlm_scores['correlation'])
+        self.assertAlmostEqual(2.0 / np.std(np.arange(1.0, 10.0)), thlm_scores['normalized_error'])
+        self.assertAlmostEqual(-1.0, rtm_scores['correlation'])
+        self.assertEqual('sam', rtm_scores['benchmark'])
+
+        summary = summarizeSkillScores([thlm_scores, rtm_scores])
+        self.assertEqual(1, len(summary))
+        self.assertEqual(2, summary[0]['num_variables'])
+        self.assertEqual("rtm", summary[0]['worst_variable'])
+
+    def test_write(self):
+        scores = computeSkillScores(getScoringPairs(self.case))
+        with tempfile.TemporaryDirectory() as output_folder:
+            writeSkillScores(scores, summarizeSkillScores(scores), output_folder)
+            with open(os.path.join(output_folder, SKILL_SCORE_CSV)) as csv_file:
+                rows = list(csv.DictReader(csv_file))
+            self.assertEqual(2, len(rows))
+            self.assertEqual("default_run", rows[0]['model'])
+            self.assertTrue(os.path.exists(os.path.join(output_folder, SKILL_SCORE_HTML)))
+            self.assertTrue(os.path.exists(os.path.join(output_folder, SKILL_SUMMARY_CSV)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+PYPLOTGEN_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Upper bound in seconds for `./pyplotgen.py -h` (best of several runs, including interpreter startup)
+STARTUP_TIME_TARGET = 1.0
+
+# Modules that must not be loaded just by importing pyplotgen
+DEFERRED_MODULES = ['matplotlib', 'netCDF4', 'fpdf', 'PIL', 'src.DataReader', 'src.CaseGallerySetup',
+                    'config.VariableGroupBase', 'config.VariableGroupBaseBudgets']
+
+
+class StartupTest(unittest.TestCase):
+    def test_heavy_modules_deferred(self):
+        check_script = ("import sys, pyplotgen\n"
+                        "print('loaded:' + ','.join(name for name in " + str(DEFERRED_MODULES) +
+                        " if name in sys.modules))")
+        result = subprocess.run([sys.executable, '-c', check_script], cwd=PYPLOTGEN_FOLDER,
+                                capture_output=True, text=True, check=True)
+        self.assertEqual("loaded:", result.stdout.strip().splitlines()[-1])
+
+    def test_variable_groups_resolve_on_first_use(self):
+        check_script = ("import sys\n"
+                        "from config import Case_definitions\n"
+                        "group = Case_definitions.BOMEX['var_groups'][0]\n"
+                        "before = 'config.VariableGroupBase' in sys.modules\n"
+                        "print(before, group.resolve().__name__, 'config.VariableGroupBase' in sys.modules)")
+        result = subprocess.run([sys.executable, '-c', check_script], cwd=PYPLOTGEN_FOLDER,
+                                capture_output=True, text=True, check=True)
+        self.assertEqual("False VariableGroupBase True", result.stdout.strip().splitlines()[-1])
+
+    def test_variable_group_name_without_import(self):
+        check_script = ("import sys\n"
+                        "from config import Case_definitions\n"
+                        "group = Case_definitions.BOMEX['var_groups'][0]\n"
+                        "print(group.__name__, group.__qualname__, 'config.VariableGroupBase' in sys.modules)")
+        result = subprocess.run([sys.executable, '-c', check_script], cwd=PYPLOTGEN_FOLDER,
+                                capture_output=True, text=True, check=True)
+        self.assertEqual("VariableGroupBase VariableGroupBase False", result.stdout.strip().splitlines()[-1])
+
+    def test_help_startup_time(self):
+        fastest_run = float('inf')
+        for _ in range(3):
+            start_time = time.perf_counter()
+            subprocess.run([sys.executable, 'pyplotgen.py', '-h'], cwd=PYPLOTGEN_FOLDER,
+                           stdout=subprocess.DEVNULL, check=True)
+            fastest_run = min(fastest_run, time.perf_counter() - start_time)
+        self.assertLess(fastest_run, STARTUP_TIME_TARGET)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,196 +1,223 @@
-#!usr/bin/env python3
-# To use this script, edit caseName, ztVariable, sfcVariable, and dirRoot. Then type
-# python timestep_convergence_test.py
-# You will have to run the timestep_convergence_test.bash to create the input files for this script. Make sure clubb is compiled when you do this. After that, move all output files from the timestep_convergence_test.bash in clubb/output into the the location specified in the dirRoot var in this script. 
-import pdb
+#!/usr/bin/env python3
+# Plots the timestep convergence of CLUBB. You will have to run timestep_convergence_test.bash to create the input
+# files for this script. Make sure clubb is compiled when you do this. After that, move all output files from the
+# timestep_convergence_test.bash in clubb/output into a directory, and type
+#
+#     python timestep_convergence_test.py --dir ../output/bomex_restarted --case bomex -z T_in_K rtm -s lwp
+#
+# The runs are found automatically from the file names ({case}_{timestep}_zt.nc, where a decimal point in the time
+# step is written as p, e.g. bomex_0p5_zt.nc). The run with the smallest time step is the reference.
+# Each file is opened once and all variables are read from it, with the files read in parallel. The RMSEs and the
+# convergence exponents for all variables and output times are cached in an NPZ file, which is used to re-plot as
+# long as it is newer than the output files.
+
+import argparse
+import glob
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from netCDF4 import Dataset
 
 def main():
 
-    from netCDF4 import Dataset
-    import numpy as np
     import matplotlib
     import matplotlib.pyplot as plt
-    import os
-    import sys
 
-    # Set directory to the location of this script
+    # Paths are relative to the location of this script by default
     # Typically the script is run from the CLUBB postprocessing directory
-    #os.chdir(os.path.dirname(sys.argv[0]))  # used to work with Canopy
-    os.chdir(os.path.dirname(os.path.realpath(__file__))) # works with /usr/bin/python
-
-    #data = Dataset('../output/bomex/bomex_300_sfc.nc', "r")
-    #pdb.set_trace() 
-
-    #dir = '../output/'
-    caseName = 'bomex'
-
-    ztVariable = 'T_in_K'
-    
-    sfcVariable = 'lwp'
-
-    #listOfFilenames = findTimestepFiles(dir,caseName)
-    dirRoot = '../output/bomex_restarted'
-    ztFilenameSuffix = 'zt.nc'
-    listOfZtFilenames = constructListOfFilenames(dirRoot,caseName,ztFilenameSuffix)
+    scriptDir = os.path.dirname(os.path.realpath(__file__))
+
+    parser = argparse.ArgumentParser(description="Plot the timestep convergence of a CLUBB case")
+    parser.add_argument("-c", "--case", dest="caseName", default="bomex", help="case name (default: %(default)s)")
+    parser.add_argument("-d", "--dir", dest="dirRoot", default=os.path.join(scriptDir, "../output/bomex_restarted"),
+                        help="directory with the output files of timestep_convergence_test.bash (default: %(default)s)")
+    parser.add_argument("-z", "--zt-variables", dest="ztVariables", nargs="+", default=["T_in_K"],
+                        help="zt variables for the convergence plots (default: %(default)s)")
+    parser.add_argument("-s", "--sfc-variables", dest="sfcVariables", nargs="*", default=["lwp"],
+                        help="sfc variables to plot against time (default: %(default)s)")
+    parser.add_argument("-j", "--processes", type=int, default=os.cpu_count(),
+                        help="number of files read in parallel (default: number of CPUs)")
+    parser.add_argument("--cache", help="NPZ file for the results (default: DIR/CASE_timestep_convergence.npz)")
+    parser.add_argument("--no-cache", dest="noCache", action="store_true", help="recompute even if the cache is current")
+    parser.add_argument("-o", "--figure-dir", dest="figureDir", help="save the figures to this directory instead of showing them")
+    args = parser.parse_args()
+
+    cacheFilename = args.cache if args.cache else os.path.join(args.dirRoot, args.caseName + "_timestep_convergence.npz")
+
+    timesteps, listOfZtFilenames = findTimestepFiles(args.dirRoot, args.caseName, "zt.nc")
+    _, listOfSfcFilenames = findTimestepFiles(args.dirRoot, args.caseName, "sfc.nc")
     print(listOfZtFilenames)
+    if len(listOfZtFilenames) < 2:
+        raise SystemExit("Need output of at least 2 time steps in " + args.dirRoot)
+
+    results = None
+    if not args.noCache:
+        results = loadCache(cacheFilename, listOfZtFilenames + listOfSfcFilenames,
+                            args.ztVariables, args.sfcVariables)
+    if results is None:
+        results = computeResults(timesteps, listOfZtFilenames, listOfSfcFilenames,
+                                 args.ztVariables, args.sfcVariables, args.processes)
+        np.savez(cacheFilename, **results)
+        print("Wrote " + cacheFilename)
+
+    # The reference is the smallest time step, the errors are plotted for the other ones
+    timestepArrayMinus1 = results["timesteps"][1:]
+    np.set_printoptions(precision=3)
+    matplotlib.rcParams.update({'font.size': 18})
 
-    numFiles = len(listOfZtFilenames)
-
-    sfcFilenameSuffix = 'sfc.nc'
-    listOfSfcFilenames = constructListOfFilenames(dirRoot,caseName,sfcFilenameSuffix)
-
-    timestepArrayMinus1 = np.array([0.2, 0.3, 0.5, 1, 2, 3, 5, 10, 20, 30, 60, 100, 150, 300])
-
-    # Find number of vertical levels in netcdf file
-    print(listOfZtFilenames[0])
-    data = Dataset( listOfZtFilenames[0], "r" )
-    altitudes = data.variables['altitude']
-    numAltitudes = len(altitudes)
-    
-    # Find number of time of outputs in each simulation
-    data = Dataset( listOfSfcFilenames[0], "r" )    
-    times = data.variables['time'][:]
-    #variableArray[:,idx] = data.variables[variable][numTimes-1,:,0,0]    
-
-    ztVariableArray = extractZtVariableFromNetcdfFiles(ztVariable, listOfZtFilenames, numFiles, numAltitudes)
-
-    ztRmseArray = computeRmseArray(ztVariableArray, numFiles)
-
-    convergenceExponent = np.polyfit( np.log(timestepArrayMinus1), np.log(ztRmseArray), 1 )[0]
-    convergenceExponent = np.array([convergenceExponent])
-
-    print(listOfZtFilenames)
+    for ztVariable in args.ztVariables:
+
+        # Errors of the profiles at the last output time
+        ztRmseArray = results[ztVariable + "_rmse"][:, -1]
+        convergenceExponent = results[ztVariable + "_exponent"][-1:]
+        print(ztVariable, ztRmseArray, convergenceExponent)
+
+        fig = plt.figure(figsize=(8,6))
+        ax1 = fig.add_subplot(111)
+        #plt.title(caseName+' shallow cumulus case')
+        plt.title(args.caseName+' case')
+        ax1.set_xlabel('Time step [s]')
+        #ax1.set_ylabel('RMSE of Temperature  [K]')
+        ax1.set_ylabel('RMSE of ' + ztVariable)
+        clubb_errors, = ax1.loglog(timestepArrayMinus1, ztRmseArray,'r.', markersize=14)
+        conv_1, = ax1.loglog(timestepArrayMinus1, (ztRmseArray[0]/timestepArrayMinus1[0])*timestepArrayMinus1,'k')
+        ax1.text(0.95, 0.05, 'CLUBB convergence\n exponent\n ='+np.array_str(convergenceExponent), \
+            transform=ax1.transAxes, fontsize=16, verticalalignment='bottom', horizontalalignment='right')
+        plt.legend([clubb_errors, conv_1], ['CLUBB convergence', 'Convergence rate of 1'], loc=0, prop={'size': 16})
+        showOrSave(plt, fig, args.figureDir, args.caseName + "_" + ztVariable + "_convergence.png")
+
+    for sfcVariable in args.sfcVariables:
+
+        fig2 = plt.figure()
+        ax2 = fig2.add_subplot(111)
+        plt.title(args.caseName+' case')
+        ax2.set_xlabel('Time since beginning of simulation [s]')
+        ax2.set_ylabel(sfcVariable)
+        line = ax2.plot(results["times"], results[sfcVariable].T)
+        #plt.legend(handles=[line])
+        showOrSave(plt, fig2, args.figureDir, args.caseName + "_" + sfcVariable + ".png")
 
-    print(ztVariableArray)
+    print("Finished!")
 
-    print(ztRmseArray)
+def showOrSave(plt, fig, figureDir, filename):
+    """Show a figure, or save it to figureDir if that is set."""
 
-    sfcVariableArray = extractSfcVariableFromNetcdfFiles(sfcVariable, listOfSfcFilenames, numFiles, 1)
+    if figureDir is None:
+        plt.show()
+    else:
+        os.makedirs(figureDir, exist_ok=True)
+        fig.savefig(os.path.join(figureDir, filename))
+        plt.close(fig)
 
-    fig = plt.figure(figsize=(8,6))
-    matplotlib.rcParams.update({'font.size': 18})
-    ax1 = fig.add_subplot(111)
-    #plt.title(caseName+' shallow cumulus case')
-    plt.title(caseName+' case')
-    ax1.set_xlabel('Time step [s]')
-    #ax1.set_ylabel('RMSE of Temperature  [K]')
-    ax1.set_ylabel('RMSE of ' + ztVariable)
-    clubb_errors, = ax1.loglog(timestepArrayMinus1, ztRmseArray,'r.', markersize=14)
-    conv_1, = ax1.loglog(timestepArrayMinus1, (ztRmseArray[0]/timestepArrayMinus1[0])*timestepArrayMinus1,'k')
-    np.set_printoptions(precision=3)
-    ax1.text(0.95, 0.05, 'CLUBB convergence\n exponent\n ='+np.array_str(convergenceExponent), \
-        transform=ax1.transAxes, fontsize=16, verticalalignment='bottom', horizontalalignment='right')
-    plt.legend([clubb_errors, conv_1], ['CLUBB convergence', 'Convergence rate of 1'], loc=0, prop={'size': 16})
-    plt.show()
-#
-#    pdb.set_trace()
+def findTimestepFiles(dirRoot, caseName, filenameSuffix):
+    """Find the netcdf files of all time steps of a case, sorted by time step.
+    Returns the array of time steps and the list of filenames."""
 
-    fig2 = plt.figure()
-    ax2 = fig2.add_subplot(111)
-    plt.title(caseName+' case')
-    ax2.set_xlabel('Time since beginning of simulation [s]')
-    ax2.set_ylabel(sfcVariable)
-    line = ax2.plot(times, sfcVariableArray)
-    #plt.legend(handles=[line])
-    plt.show()
+    pattern = re.compile(re.escape(caseName) + r"_(\d+(?:p\d*)?)_" + re.escape(filenameSuffix) + "$")
 
+    runs = []
+    for filename in glob.glob(os.path.join(glob.escape(dirRoot), caseName + "_*_" + filenameSuffix)):
+        match = pattern.match(os.path.basename(filename))
+        if match:
+            runs.append((float(match.group(1).replace("p", ".")), filename))
+    runs.sort()
 
-    print("Finished!")
+    return np.array([timestep for timestep, _ in runs]), [filename for _, filename in runs]
 
+def readVariablesFromFile(filename, variables):
+    """Read all output times of the variables from one netcdf file.
+    Returns the times and a dictionary of (time, altitude) arrays."""
 
+    with Dataset(filename, "r") as data:
+        times = np.asarray(data.variables['time'][:])
+        values = {}
+        for variable in variables:
+            if variable not in data.variables:
+                raise SystemExit(variable + " is not in " + filename)
+            data.variables[variable].set_auto_mask(False)
+            values[variable] = data.variables[variable][:, :, 0, 0]
 
-def constructListOfFilenames(dirRoot,caseName,filenameSuffix):
+    return times, values
 
-    listOfFilenames = [dirRoot+'/'+caseName+'_0p1_'+filenameSuffix, \
-                       dirRoot+'/'+caseName+'_0p2_'+filenameSuffix, \
-                       dirRoot+'/'+caseName+'_0p3_'+filenameSuffix, \
-                       dirRoot+'/'+caseName+'_0p5_'+filenameSuffix, \
-                       dirRoot+'/'+caseName+'_1_'+filenameSuffix, \
-                       dirRoot+'/'+caseName+'_2_'+filenameSuffix, \
-                       dirRoot+'/'+caseName+'_3_'+filenameSuffix, \
-                       dirRoot+'/'+caseName+'_5_'+filenameSuffix, \
-                       dirRoot+'/'+caseName+'_10_'+filenameSuffix, \
-                       dirRoot+'/'+caseName+'_20_'+filenameSuffix, \
-                       dirRoot+'/'+caseName+'_30_'+filenameSuffix, \
-                       dirRoot+'/'+caseName+'_60_'+filenameSuffix, \
-                       dirRoot+'/'+caseName+'_100_'+filenameSuffix, \
-                       dirRoot+'/'+caseName+'_150_'+filenameSuffix, \
-                       dirRoot+'/'+caseName+'_300_'+filenameSuffix]    
+def extractVariablesFromNetcdfFiles(variables, listOfFilenames, numProcesses):
+    """Read the variables from all netcdf files, in parallel. Returns the output times
+    and a dictionary with a (file, time, altitude) array for each variable."""
 
-    return listOfFilenames
+    with ProcessPoolExecutor(max_workers=max(1, min(numProcesses, len(listOfFilenames)))) as executor:
+        fileValues = list(executor.map(readVariablesFromFile, listOfFilenames, [variables] * len(listOfFilenames)))
 
-def computeRmseArray(variableArray, numColumns):
+    # A run that stopped early has fewer output times, only compare the times all runs have
+    numTimes = min(len(times) for times, _ in fileValues)
+    if numTimes < max(len(times) for times, _ in fileValues):
+        print("Warning: not all runs have the same number of output times, using the first " + str(numTimes))
 
-    import numpy as np
+    variableArrays = {variable: np.stack([values[variable][:numTimes] for _, values in fileValues]).astype(np.float64)
+                      for variable in variables}
 
-    rmseArray = np.zeros( numColumns-1 )
+    return fileValues[0][0][:numTimes], variableArrays
 
-    for idx in range(1,numColumns):
+def computeRmseArray(variableArray):
+    """RMSE of the profiles of each run compared with the first (reference) run,
+    for all output times. Returns a (file-1, time) array."""
 
-           rmseArray[idx-1] = np.sqrt(( (variableArray[:,idx] - variableArray[:,0])**2 ).mean()) 
+    return np.sqrt(((variableArray[1:] - variableArray[0])**2).mean(axis=-1))
 
-    #pdb.set_trace()
+def computeConvergenceExponents(timesteps, rmseArray):
+    """Slope of log(RMSE) against log(time step), for all output times."""
 
-    return rmseArray
+    with np.errstate(divide='ignore'):
+        logRmse = np.log(rmseArray)
 
-def extractZtVariableFromNetcdfFiles(variable, listOfFilenames, numFiles, numAltitudes):
-    """ Pull one profile per netcdf file and glue them together in an array."""
+    exponents = np.full(rmseArray.shape[1], np.nan)
+    valid = np.all(np.isfinite(logRmse), axis=0)
+    if np.any(valid):
+        exponents[valid] = np.polyfit(np.log(timesteps), logRmse[:, valid], 1)[0]
 
-    from netCDF4 import Dataset
-    import numpy as np
+    return exponents
 
-    # Find number of time steps in each simulation
-    data = Dataset( listOfFilenames[0], "r" )    
-    times = data.variables['time']
-    numTimes = len(times)    
-        
-    # Initialize array to hold values of variable
-    variableArray = np.zeros( (numAltitudes, numFiles) )
-    
-    for idx, fileName in enumerate(listOfFilenames):
-            data = Dataset(fileName, "r")
-            # Extract a profile at the last time step
-            variableArray[:,idx] = data.variables[variable][numTimes-1,:,0,0]            
-            #pdb.set_trace() 
-                                 
-    return variableArray
+def computeResults(timesteps, listOfZtFilenames, listOfSfcFilenames, ztVariables, sfcVariables, numProcesses):
+    """Compute the RMSEs and convergence exponents of the zt variables and read the sfc variables."""
 
-def extractSfcVariableFromNetcdfFiles(variable, listOfFilenames, numFiles, numAltitudes):
-    """ Pull one profile per netcdf file and glue them together in an array."""
+    times, ztVariableArrays = extractVariablesFromNetcdfFiles(ztVariables, listOfZtFilenames, numProcesses)
 
-    from netCDF4 import Dataset
-    import numpy as np
+    results = {"timesteps": timesteps, "times": times, "filenames": np.array(listOfZtFilenames + listOfSfcFilenames)}
+    for ztVariable in ztVariables:
+        results[ztVariable + "_rmse"] = computeRmseArray(ztVariableArrays[ztVariable])
+        results[ztVariable + "_exponent"] = computeConvergenceExponents(timesteps[1:], results[ztVariable + "_rmse"])
 
-    # Find number of time steps in each simulation
-    data = Dataset( listOfFilenames[0], "r" )    
-    times = data.variables['time']
-    numTimes = len(times)    
-        
-    # Initialize array to hold values of variable
-    sfcVariableArray = np.zeros( (numTimes, numFiles) )
-    
-    for idx, fileName in enumerate(listOfFilenames):
-            data = Dataset(fileName, "r")
-            # Extract a profile at the last time step
-            #pdb.set_trace()
-            sfcVariableArray[:,idx] = data.variables[variable][0:numTimes,0,0,0]            
-            #pdb.set_trace() 
-                                 
-    return sfcVariableArray
+    if len(sfcVariables) > 0:
+        if len(listOfSfcFilenames) != len(listOfZtFilenames):
+            raise SystemExit("Need an sfc file for every zt file to plot " + ", ".join(sfcVariables))
+        sfcTimes, sfcVariableArrays = extractVariablesFromNetcdfFiles(sfcVariables, listOfSfcFilenames, numProcesses)
+        results["times"] = sfcTimes
+        for sfcVariable in sfcVariables:
+            results[sfcVariable] = sfcVariableArrays[sfcVariable][:, :, 0]
 
+    return results
 
-def findTimestepFiles(dir,caseName):
-    """Create a list of netcdf files, with one filename per time step value."""
+def loadCache(cacheFilename, listOfFilenames, ztVariables, sfcVariables):
+    """Load the cached results if they are newer than the files, are for the same files
+    and have all variables. Returns None otherwise."""
 
-    import glob
+    if not os.path.exists(cacheFilename):
+        return None
+    if max(os.path.getmtime(filename) for filename in listOfFilenames) > os.path.getmtime(cacheFilename):
+        return None
 
-    listOfFilenames = glob.glob(dir + caseName + "*" + "_zt.nc")
+    with np.load(cacheFilename) as cache:
+        results = dict(cache)
+    if list(results["filenames"]) != listOfFilenames:
+        return None
+    if not all(variable + "_rmse" in results for variable in ztVariables) or \
+       not all(variable in results for variable in sfcVariables):
+        return None
 
-    return listOfFilenames
+    print("Using cached results from " + cacheFilename)
+    return results
 
 # Standard boilerplate to call the main() function to begin
 # the program.
 if __name__ == '__main__':
     main()
-
-
@@ -1,45 +1,167 @@
 #!/usr/bin/env python3
 
+import argparse
+import json
 import netCDF4
+import numpy as np
 import sys
 
-def compute_relative_diff(ncfile1, ncfile2, field):
-    nc1  = netCDF4.Dataset(ncfile1)
-    nc2  = netCDF4.Dataset(ncfile2)
-    if field not in nc1.variables or field not in nc2.variables:
-        raise Exception("The field " + field + " is not in both NetCDF files.")
-    var1 = nc1.variables[field]
-    var2 = nc2.variables[field]
-    # The shape is assumed to be [num_timesteps,1,1,1]
-    var1 = var1[:,0,0,0]
-    var2 = var2[:,0,0,0]
-    if len(var1) != len(var2):
-        raise Exception("The fields don't have the same shape!")
-    num_timesteps = len(var1)
-    # Sum the field over all timesteps.
-    sum1 = sum(var1); sum2 = sum(var2)
-    if (sum1 != 0.0):
-        relative_diff = abs( (sum2-sum1) / sum1 )
+# Norms of the difference of the time-integrated fields. For fields with a single value per
+# timestep (shape [num_timesteps,1,1,1]) they are all the same.
+NORMS = {
+    "l1":  lambda values: np.sum(np.abs(values)),
+    "l2":  lambda values: np.sqrt(np.sum(values * values)),
+    "max": lambda values: np.max(np.abs(values)),
+}
+
+def time_integrate(var):
+    """
+    Sums a variable over all timesteps (its first dimension), for any number of dimensions.
+    Masked values are left out of the sum.
+    """
+    values = var[:]
+    if values.shape[0] == 0:
+        return np.zeros(values.shape[1:])
+    return np.ma.filled(np.ma.sum(values.astype(np.float64), axis=0), 0.0)
+
+def relative_diff_of_sums(sum1, sum2, norm="l1"):
+    """
+    Returns norm(sum2-sum1) / norm(sum1), or -999. if norm(sum1) is zero
+    """
+    reference = NORMS[norm](sum1)
+    if reference != 0.0:
+        return float( NORMS[norm](sum2-sum1) / reference )
     else:
-        relative_diff = -999.
-    return relative_diff
-
-###############################################################
-usage = "Usage: tolerance_check.py ncfile1 ncfile2 field tolerance"
-###############################################################
-if len(sys.argv) != 5:
-    print(usage)
-    sys.exit(2)
-
-ncfile1   = sys.argv[1]
-ncfile2   = sys.argv[2]
-field     = sys.argv[3]
-tolerance = float(sys.argv[4])
-
-relative_diff = compute_relative_diff( ncfile1, ncfile2, field )
-print("Relative diff: " + str(relative_diff))
-if relative_diff > tolerance:
-    print("Relative diff tolerance exceeded!")
-    sys.exit(1)
-else:
-    sys.exit(0)
+        return -999.
+
+def check_fields(nc1, nc2, checks):
+    """
+    Computes the relative differences of the time-integrated fields of two open NetCDF datasets.
+    checks is a list of (field, tolerance, norm) tuples. Each field is read once, even if it is
+    checked with several norms. Returns a list of dicts with the field, tolerance, norm,
+    relative_diff and passed. A NaN relative_diff does not pass. If a field can't be compared, the
+    dict has an error instead.
+    """
+    sums = {}
+    results = []
+    for field, tolerance, norm in checks:
+        result = {"field": field, "tolerance": tolerance, "norm": norm}
+        if field not in sums:
+            if field not in nc1.variables or field not in nc2.variables:
+                sums[field] = "The field " + field + " is not in both NetCDF files."
+            elif nc1.variables[field].shape != nc2.variables[field].shape:
+                sums[field] = "The fields don't have the same shape!"
+            else:
+                sums[field] = (time_integrate(nc1.variables[field]), time_integrate(nc2.variables[field]))
+
+        if isinstance(sums[field], str):
+            result["error"] = sums[field]
+            result["passed"] = False
+        else:
+            result["relative_diff"] = relative_diff_of_sums(sums[field][0], sums[field][1], norm)
+            result["passed"] = result["relative_diff"] <= tolerance
+        results.append(result)
+    return results
+
+def compute_relative_diff(ncfile1, ncfile2, field, norm="l1"):
+    with netCDF4.Dataset(ncfile1) as nc1, netCDF4.Dataset(ncfile2) as nc2:
+        result = check_fields(nc1, nc2, [(field, 0.0, norm)])[0]
+    if "error" in result:
+        raise Exception(result["error"])
+    return result["relative_diff"]
+
+def read_spec(spec_filename):
+    """
+    Reads a spec file. Each line is
+
+        ncfile1 ncfile2 field tolerance [norm]
+
+    where norm is one of l1 (default), l2 or max. Empty lines and lines starting with # are
+    ignored. Returns a dict from (ncfile1, ncfile2) to a list of (field, tolerance, norm) tuples.
+    """
+    checks = {}
+    with open(spec_filename) as spec_file:
+        for line_number, line in enumerate(spec_file, 1):
+            words = line.split()
+            if len(words) == 0 or words[0].startswith("#"):
+                continue
+            norm = words[4] if len(words) == 5 else "l1"
+            if len(words) not in (4, 5) or norm not in NORMS:
+                raise ValueError(spec_filename + ":" + str(line_number) + ": expected 'ncfile1 ncfile2 field tolerance [" +
+                                 "|".join(NORMS) + "]'")
+            try:
+                tolerance = float(words[3])
+            except ValueError:
+                raise ValueError(spec_filename + ":" + str(line_number) + ": tolerance '" + words[3] +
+                                 "' is not a number")
+            checks.setdefault((words[0], words[1]), []).append((words[2], tolerance, norm))
+    return checks
+
+def check_spec(checks):
+    """
+    Runs all checks of a spec, opening each pair of files once.
+    Returns one list of results, see check_fields, with the files added to each result.
+    """
+    report = []
+    for (ncfile1, ncfile2), file_checks in checks.items():
+        try:
+            with netCDF4.Dataset(ncfile1) as nc1, netCDF4.Dataset(ncfile2) as nc2:
+                results = check_fields(nc1, nc2, file_checks)
+        except OSError as error:
+            results = [{"field": field, "tolerance": tolerance, "norm": norm, "error": str(error), "passed": False}
+                       for field, tolerance, norm in file_checks]
+        for result in results:
+            report.append(dict({"ncfile1": ncfile1, "ncfile2": ncfile2}, **result))
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks whether the relative difference between the time-integrated "
+                                                 "fields of two CLUBB NetCDF output files exceeds a tolerance",
+                                     usage="%(prog)s ncfile1 ncfile2 field tolerance\n"
+                                           "       %(prog)s --spec SPEC [--json REPORT]")
+    parser.add_argument("args", nargs="*", help="ncfile1 ncfile2 field tolerance")
+    parser.add_argument("-n", "--norm", choices=NORMS, default="l1",
+                        help="norm of the difference of the time-integrated field (default: %(default)s)")
+    parser.add_argument("-s", "--spec",
+                        help="check all fields listed in this file, with lines 'ncfile1 ncfile2 field tolerance [norm]'")
+    parser.add_argument("-j", "--json", metavar="REPORT", help="write the results of all checks to this JSON file")
+    args = parser.parse_args()
+
+    if args.spec is None and len(args.args) != 4 or args.spec is not None and len(args.args) != 0:
+        parser.print_usage()
+        sys.exit(2)
+
+    if args.spec is None:
+        checks = {(args.args[0], args.args[1]): [(args.args[2], float(args.args[3]), args.norm)]}
+    else:
+        try:
+            checks = read_spec(args.spec)
+        except ValueError as error:
+            print(error)
+            sys.exit(2)
+
+    report = check_spec(checks)
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(report, json_file, indent=2)
+
+    for result in report:
+        if args.spec is not None:
+            print(result["ncfile2"] + " " + result["field"] + " (" + result["norm"] + "):", end=" ")
+        if "error" in result:
+            print(result["error"])
+        else:
+            print("Relative diff: " + str(result["relative_diff"]))
+            if np.isnan(result["relative_diff"]):
+                print("Relative diff is NaN, the fields contain NaN values!")
+            elif not result["passed"]:
+                print("Relative diff tolerance exceeded!")
+
+    if all(result["passed"] for result in report):
+        sys.exit(0)
+    else:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
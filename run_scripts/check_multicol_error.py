@@ -21,132 +21,118 @@
 #           ./check_multicolumn_error.py save_case_multicol.nc ../output/case_multicol.nc
 #
 #        It's assumed that for arm/bomex the total of all absolute differences of all fields 
-#        should be below 1.0e-5. If the differences of any field exceed this, then you will be 
-#        given the option to print the max absolute difference by timestep. 
+#        should be below 1.0e-5. If the differences of any field exceed this, the script exits
+#        with status 1. The max absolute difference by timestep is printed with e.g. -t 10 for
+#        every 10th timestep. The script never asks for input, so it can run in CI:
+#
+#           ./check_multicol_error.py -t 10 --csv diff.csv --json diff.json save_case_multicol.nc ../output/case_multicol.nc
+#
+#        All statistics are computed in one pass over each field, see field_diff_stats.py.
 #
 # Author: Gunther Huebler
 # Reference: https://github.com/larson-group/clubb/issues/1033
 #=========================================================================================================
 
 import argparse
+import csv
+import json
 import netCDF4
-import numpy as np
+import os
 import tabulate
 import sys
 
-# Threshold used to ignore field values for calculating % diff
-field_threshold = 1.0e-7
+from field_diff_stats import FIELD_THRESHOLD, compare_fields
+from diff_netcdf_outputs import MEMORY_BUDGET
 
 # Threshold used to determine if the ncfiles are close enough
 total_abs_error_threshold = 1.0e-5
 
-# Var to set if we find that the files differ significantly
-files_differ = False
-
-
-# Parse arguments, we only expect 2 file names
-parser = argparse.ArgumentParser(description='Run a test')
-
-parser.add_argument("files", nargs=2,
-                    help="need two files to diff")
-                    
-args = parser.parse_args()
-
-
-# Create dataset from nc file
-dset0 = netCDF4.Dataset(args.files[0])
-dset1 = netCDF4.Dataset(args.files[1])
-
-# Define table header, these are the values we're going to output
-table = [[  'Var', 
-            'Max Abs Diff', 
-            'Max % Diff', 
-            'Total Abs Diff', 
-            'Avg Abs Diff', 
-            'Index of Max Abs Diff (time,nz,ngrdcol)']]
-
-# Loop over each variable, the datasets should contain the same variables
-for var in dset0.variables:
-
-    # Only consider variables with 3 dimensions, these are the clubb vars we care about
-    if dset0[var].ndim == 3:
-
-        # Calculate absolute differences
-        abs_diff = abs( dset0[var][:,:,:] - dset1[var][:,:,:] )
-
-        # Clip fields to ignore tiny values for the % diff
-        field_1_clipped = np.clip( dset0[var][:,:,:], a_min = field_threshold, a_max = 9999999.0  )
-        field_2_clipped = np.clip( dset1[var][:,:,:], a_min = field_threshold, a_max = 9999999.0 )
-
-        # Calculate the percent difference, 100 * (a-b) / ((a+b)/2)
-        percent_diff = 200.0 * ( field_1_clipped-field_2_clipped ) \
-                               / ( field_1_clipped+field_2_clipped )
-                     
-        # Append the table array with the values we want to print   
-        table.append( [ var, 
-                        np.max(abs_diff), 
-                        np.max(percent_diff), 
-                        np.sum(abs_diff), 
-                        np.average(abs_diff), 
-                        np.where(abs_diff == np.max(abs_diff)) ] )
-
-        # If the total absolute difference excedes the threshold, then we consider the files different
-        if np.sum(abs_diff) > total_abs_error_threshold:
-            files_differ = True
-
-# Print a very pretty table of the values
-print("\n",tabulate.tabulate(table, headers='firstrow'))
-
 
-
-if not files_differ:
-    print("\nPASSED: Sum of all absolute differences does not excede",total_abs_error_threshold,"for any field.")
-    sys.exit()
-else:
-    print("\n###############################################################################################")
-    print("WARNING: Sum of all absolute differences excedes",total_abs_error_threshold," for some fields!")
-    print("         It's possible that no error has been introduced, but if the case being compared")
-    print("         is arm or bomex, this is not a good sign.")
-    print("###############################################################################################\n")
-
-    print("Print max absolute difference by timestep?")
-    timestep_jump = int(input("Enter timestep jump to view, or 0 to skip: "))
-
-    if timestep_jump == 0:
-        sys.exit()
-
-
-table = [[ 'Timestep' ]]
-
-# Loop over each variable in the dataset
-for var in dset0.variables:
-    if dset0[var].ndim == 3:
-        table[0].append(var)
-
-timesteps = dset0.dimensions['time'].size
-
-
-# Loop over each timestep
-for time in range(0,timesteps,timestep_jump):
-
-    # Save current timestep to table
-    table.append( [time] )
-
-    # Loop over each variable in the dataset
-    for var in dset0.variables:
-
-        # Only consider variables with 3 dimensions, these are the clubb vars we care about
-        if dset0[var].ndim == 3:
-
-            # Calculate max_abs_diff for the current timestep
-            max_abs_diff = np.max( abs( dset0[var][time,:,:] - dset1[var][time,:,:] ) )
+def write_csv(filename, table):
+    with open(filename, "w", newline="") as csv_file:
+        csv.writer(csv_file).writerows(table)
+
+def main():
+
+    # Parse arguments, we expect 2 file names
+    parser = argparse.ArgumentParser(description='Compare 2 multicolumn standalone netcdf files')
+
+    parser.add_argument("files", nargs=2,
+                        help="need two files to diff")
+    parser.add_argument("-t", "--timestep-jump", type=int, default=0,
+                        help="print the max absolute difference of every n-th timestep (default: 0, don't print)")
+    parser.add_argument("--threshold", type=float, default=total_abs_error_threshold,
+                        help="largest allowed sum of absolute differences of a field (default: %(default)s)")
+    parser.add_argument("--field-threshold", type=float, default=FIELD_THRESHOLD,
+                        help="field values below this are ignored for the %% diff (default: %(default)s)")
+    parser.add_argument("-m", "--memory-budget", type=int, default=MEMORY_BUDGET // (1024 * 1024),
+                        help="memory in MB the comparison of a field may use (default: %(default)s)")
+    parser.add_argument("--csv", metavar="FILE",
+                        help="write the table to a csv file. With -t, the table by timestep is written to FILE_by_timestep.csv")
+    parser.add_argument("--json", metavar="FILE",
+                        help="write all statistics, including the max absolute difference of every timestep, to a json file")
+
+    args = parser.parse_args()
+
+    # Create dataset from nc file, only consider variables with 3 dimensions, these are the clubb vars we care about
+    with netCDF4.Dataset(args.files[0]) as dset0, netCDF4.Dataset(args.files[1]) as dset1:
+        all_stats = compare_fields(dset0, dset1, ndim=3, field_threshold=args.field_threshold,
+                                   memory_budget=args.memory_budget * 1024 * 1024)
+
+    # Define table header, these are the values we're going to output
+    table = [[  'Var', 
+                'Max Abs Diff', 
+                'Max % Diff', 
+                'Total Abs Diff', 
+                'Avg Abs Diff', 
+                'Index of Max Abs Diff (time,nz,ngrdcol)']]
+
+    for stats in all_stats:
+        table.append( [ stats.var, 
+                        stats.max_abs_diff, 
+                        stats.max_percent_diff, 
+                        stats.total_abs_diff, 
+                        stats.avg_abs_diff, 
+                        stats.index_of_max_abs_diff ] )
+
+    # If the total absolute difference excedes the threshold (or is NaN), then we consider the files different
+    files_differ = any( not stats.total_abs_diff <= args.threshold for stats in all_stats )
+
+    # Print a very pretty table of the values
+    print("\n",tabulate.tabulate(table, headers='firstrow'))
+
+    if args.csv:
+        write_csv(args.csv, table)
+
+    if args.timestep_jump > 0:
+        timestep_table = [[ 'Timestep' ] + [ stats.var for stats in all_stats ]]
+        timesteps = all_stats[0].shape[0] if len(all_stats) > 0 else 0
+        for time in range(0,timesteps,args.timestep_jump):
 
             # It may be useful to view the absolute differences scaled by timestep since
             # we expect error to accumulate, by default we will not scale
-            scaled_diff = max_abs_diff #/ ( float(time+1) )
-
-            # Append the scaled_diff to the last entry of the current line in the table
-            table[-1].append( scaled_diff )
-
-
-print(tabulate.tabulate(table, headers='firstrow'))
+            timestep_table.append( [time] + [ stats.timestep_max_abs_diff[time] for stats in all_stats ] )
+
+        print("\n" + tabulate.tabulate(timestep_table, headers='firstrow'))
+
+        if args.csv:
+            write_csv(os.path.splitext(args.csv)[0] + "_by_timestep.csv", timestep_table)
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"files": args.files, "threshold": args.threshold, "files_differ": files_differ,
+                       "fields": [stats.as_dict() for stats in all_stats]}, json_file, indent=2)
+
+    if not files_differ:
+        print("\nPASSED: Sum of all absolute differences does not excede",args.threshold,"for any field.")
+        sys.exit(0)
+    else:
+        print("\n###############################################################################################")
+        print("WARNING: Sum of all absolute differences excedes",args.threshold," for some fields!")
+        print("         It's possible that no error has been introduced, but if the case being compared")
+        print("         is arm or bomex, this is not a good sign.")
+        print("###############################################################################################\n")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+#!/usr/bin/python3
+
+#=========================================================================================================
+# Description: Reads, merges and writes the Fortran namelists of CLUBB (clubb.in and its parts).
+#
+#              The input files (tunable_parameters.in, silhs_parameters.in, configurable_model_flags.in,
+#              the case _model.in and the stats file) are parsed once into a Namelist: the groups, and
+#              the variables of each group with their values as Fortran text, without comments. Parsed
+#              files are cached (until they change), so a script can build many variants of the same
+#              inputs, e.g. for parameter sweeps, without reading them again.
+#
+#              Variables are set by name, and only variables that are in the input files can be set
+#              (unless the group they go to is given), so a misspelled name is an error instead of a
+#              setting that is silently ignored.
+#
+#              The command line tool merges namelist files into one, like cat and sed in the run scripts.
+#
+# Usage:
+#
+#           ./clubb_namelist.py ../input/tunable_parameters/*.in ../input/case_setups/bomex_model.in \
+#                               ../input/stats/standard_stats.in -s dt_main=30.0 -s C8=0.6 -o clubb.in
+#=========================================================================================================
+
+import argparse
+import difflib
+import functools
+import os
+import re
+import sys
+
+# A variable and the start of its value, e.g. "C1 = 1.0" or "thlm_sponge_damp_settings%l_sponge_damping = .false."
+ASSIGNMENT = re.compile(r"([A-Za-z_][\w%]*(?:\([^)]*\))?)\s*=(.*)$")
+
+def strip_comment(line):
+    """
+    Returns a line without its comment (from a ! that is not in a string)
+    """
+    if "!" not in line:
+        return line
+    quote = None
+    for position, character in enumerate(line):
+        if quote is not None:
+            if character == quote:
+                quote = None
+        elif character in "'\"":
+            quote = character
+        elif character == "!":
+            return line[:position]
+    return line
+
+def format_value(value):
+    """
+    Returns the Fortran text of a value. Strings are used as they are (e.g. '"none"' or '.true.'),
+    so use quote() for character variables.
+    """
+    if isinstance(value, bool):
+        return ".true." if value else ".false."
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, (list, tuple)):
+        return ", ".join(format_value(item) for item in value)
+    return str(value)
+
+def quote(string):
+    return '"' + string.replace('"', '""') + '"'
+
+def parse_value(text):
+    """
+    Returns the Python value of the Fortran text of a scalar logical, integer or real, or the
+    text itself (without quotes for a string)
+    """
+    lower = text.strip().lower()
+    if lower in (".true.", ".t.", "t"):
+        return True
+    if lower in (".false.", ".f.", "f"):
+        return False
+    if len(lower) > 1 and lower[0] in "'\"" and lower[-1] == lower[0]:
+        return text.strip()[1:-1]
+    try:
+        return int(lower)
+    except ValueError:
+        pass
+    try:
+        return float(lower.replace("d", "e"))
+    except ValueError:
+        return text.strip()
+
+class Namelist:
+    """
+    The groups of a namelist file, each with its variables and their values (Fortran text), in file order.
+    Names are not case sensitive, like in Fortran.
+    """
+
+    def __init__(self):
+        self.groups = {}
+        self._index = {}
+        self._lines = None
+        self._positions = None
+
+    def __contains__(self, variable):
+        return variable.lower() in self._index
+
+    def copy(self):
+        namelist = Namelist()
+        namelist.groups = {group: dict(variables) for group, variables in self.groups.items()}
+        namelist._index = dict(self._index)
+        namelist._lines = self._lines
+        namelist._positions = self._positions
+        return namelist
+
+    def variables(self):
+        """
+        Returns the names of all variables
+        """
+        return [variable for variables in self.groups.values() for variable in variables]
+
+    def _find(self, variable):
+        """
+        Returns the group and the name (as written in the file) of a variable, raises KeyError if it's unknown
+        """
+        try:
+            return self._index[variable.lower()]
+        except KeyError:
+            close = difflib.get_close_matches(variable, self.variables(), n=3)
+            raise KeyError("unknown namelist variable " + variable +
+                           (" (did you mean " + ", ".join(close) + "?)" if close else "")) from None
+
+    def group_of(self, variable):
+        return self._find(variable)[0]
+
+    def get(self, variable, default=None):
+        """
+        Returns the Fortran text of the value of a variable, or default if it's unknown
+        """
+        if variable.lower() not in self._index:
+            return default
+        group, name = self._index[variable.lower()]
+        return self.groups[group][name]
+
+    def set(self, variable, value, group=None):
+        """
+        Sets a variable to a value (see format_value). A variable that isn't in the namelist is added
+        to group, or raises KeyError if no group is given.
+        """
+        if variable.lower() in self._index:
+            found_group, variable = self._index[variable.lower()]
+            if group is not None and group.lower() != found_group.lower():
+                raise KeyError(variable + " is in group " + found_group + ", not " + group)
+            group = found_group
+        elif group is None:
+            self._find(variable)
+        else:
+            group = self._add_group(group)
+            self._index[variable.lower()] = (group, variable)
+            self._lines = None
+        value = format_value(value)
+        if self._lines is not None and self.groups[group][variable] != value:
+            self._lines = None
+        self.groups[group][variable] = value
+
+    def update(self, values, group=None):
+        for variable, value in values.items():
+            self.set(variable, value, group)
+
+    def _add_group(self, group):
+        for name in self.groups:
+            if name.lower() == group.lower():
+                return name
+        self.groups[group] = {}
+        self._lines = None
+        return group
+
+    def merge(self, other):
+        """
+        Returns a new namelist with the groups and variables of other added to these, the values
+        of other replacing the ones of this namelist
+        """
+        namelist = self.copy()
+        for group, variables in other.groups.items():
+            group = namelist._add_group(group)
+            for variable, value in variables.items():
+                namelist.set(variable, value, group)
+        return namelist
+
+    def validate(self, names, group=None):
+        """
+        Returns the variables (of a group, or of all groups) that are not in names, e.g. misspelled
+        tunable parameters
+        """
+        known = set(name.lower() for name in names)
+        groups = [name for name in self.groups if group is None or name.lower() == group.lower()]
+        return [variable for name in groups for variable in self.groups[name] if variable.lower() not in known]
+
+    def _render(self):
+        # The lines of the namelist file and the line of each variable, kept until the namelist changes
+        if self._lines is None:
+            lines = []
+            positions = {}
+            for group, variables in self.groups.items():
+                lines.append("&" + group)
+                for variable, value in variables.items():
+                    positions[(group, variable)] = len(lines)
+                    lines.append(variable + " = " + value)
+                lines.append("/")
+                lines.append("")
+            self._lines = lines
+            self._positions = positions
+        return self._lines
+
+    def to_string(self, overrides=None):
+        """
+        Returns the text of the namelist file, with the values in overrides instead of the ones in
+        the namelist. The namelist isn't changed, so this is the fast way to write many variants.
+        """
+        lines = self._render()
+        if overrides:
+            lines = list(lines)
+            for variable, value in overrides.items():
+                group, name = self._find(variable)
+                lines[self._positions[(group, name)]] = name + " = " + format_value(value)
+        return "\n".join(lines)
+
+    def write(self, filename, overrides=None):
+        with open(filename, "w") as namelist_file:
+            namelist_file.write(self.to_string(overrides))
+
+def parse_namelist(text, filename="namelist"):
+    """
+    Returns the Namelist of the text of a namelist file. Text outside of the groups is ignored,
+    like when Fortran reads the file.
+    """
+    namelist = Namelist()
+    group = None
+    variable = None
+    value = []
+
+    def finish():
+        if variable is not None:
+            namelist.set(variable, "\n".join(value).strip().rstrip(",").rstrip(), group)
+
+    for line_number, line in enumerate(text.splitlines(), 1):
+        line = strip_comment(line).strip()
+        if group is None:
+            if line.startswith("&"):
+                group = namelist._add_group(line[1:].split()[0] if len(line) > 1 else "")
+                line = line[1 + len(group):].strip()
+            else:
+                continue
+        end = False
+        if line.lower() == "&end" or line.endswith("/") and line.count('"') % 2 == 0 and line.count("'") % 2 == 0:
+            end = True
+            line = "" if line.lower() == "&end" else line[:-1].strip()
+        if line:
+            match = ASSIGNMENT.match(line)
+            if match:
+                finish()
+                variable = match.group(1)
+                value = [match.group(2).strip()]
+            elif variable is not None:
+                value.append(line)
+            else:
+                raise ValueError(filename + ":" + str(line_number) + ": expected a variable assignment: " + line)
+        if end:
+            finish()
+            group = None
+            variable = None
+    finish()
+    return namelist
+
+@functools.lru_cache(maxsize=128)
+def _read_cached(filename, mtime, size):
+    with open(filename) as namelist_file:
+        return parse_namelist(namelist_file.read(), filename)
+
+def read_namelist(*filenames):
+    """
+    Returns the merged Namelist of namelist files. Parsed files are cached until they change.
+    """
+    namelist = Namelist()
+    for filename in filenames:
+        status = os.stat(filename)
+        namelist = namelist.merge(_read_cached(os.path.abspath(filename), status.st_mtime_ns, status.st_size))
+    return namelist
+
+@functools.lru_cache(maxsize=8)
+def tunable_parameter_names(source):
+    """
+    Returns the names of the tunable parameters, from params_list in parameters_tunable.F90
+    """
+    with open(source) as source_file:
+        text = source_file.read()
+    start = text.index("params_list = &")
+    return tuple(re.findall(r'"(\w+)\s*"', text[start:text.index("/)", start)]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge CLUBB namelist files into one (without comments), "
+                                                 "optionally changing variables")
+    parser.add_argument("files", nargs="+", help="namelist files, later files replace the values of earlier ones")
+    parser.add_argument("-s", "--set", action="append", default=[], metavar="VARIABLE=VALUE",
+                        help="set a variable that is in the files to a Fortran value, may be given several times")
+    parser.add_argument("-o", "--output", help="output file (default: standard output)")
+    parser.add_argument("--check-params", metavar="F90", nargs="?",
+                        const=os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+                                           "src", "CLUBB_core", "parameters_tunable.F90"),
+                        help="check that the variables of clubb_params_nl are tunable parameters in params_list "
+                             "(default: %(const)s)")
+    args = parser.parse_args()
+
+    namelist = read_namelist(*args.files)
+    try:
+        for setting in args.set:
+            variable, _, value = setting.partition("=")
+            namelist.set(variable.strip(), value.strip())
+    except KeyError as error:
+        sys.exit(error.args[0])
+
+    if args.check_params and "clubb_params_nl" in namelist.groups:
+        unknown = namelist.validate(tunable_parameter_names(args.check_params), "clubb_params_nl")
+        if unknown:
+            sys.exit("not tunable parameters: " + ", ".join(unknown))
+
+    if args.output:
+        namelist.write(args.output)
+    else:
+        print(namelist.to_string())
+
+if __name__ == "__main__":
+    main()
@@ -15,21 +15,13 @@ import os
 import sys
 import shutil
 from convergence_function import modify_ic_profile
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import clubb_namelist
 
 # check that Python 3 is being used
 if (sys.version_info.major < 3):
   sys.exit('must use Python 3 instead of {}'.format(sys.version))
 
-# get CLUBB root directory (assumed to be two above the CWD) and set directories
-clubb_dir = os.path.join(os.getcwd(),'..')
-output_dir = os.path.join(clubb_dir, 'output')
-case_dir = os.path.join(clubb_dir, 'input', 'case_setups')
-grid_dir = os.path.join(clubb_dir, 'input', 'grid')
-tunable_dir = os.path.join(clubb_dir, 'input', 'tunable_parameters')
-stats_dir = os.path.join(clubb_dir, 'input', 'stats')
-bin_dir = os.path.join(clubb_dir, 'bin')
-res_dir = os.path.join(clubb_dir, 'restart_ic') 
-
 # remind user to load modules if this is Quartz
 if ('quartz' in os.uname().nodename):
   print('########################################################')
@@ -88,6 +80,14 @@ parser.add_argument('-skip-check', action='store_true',
   help='skip the pause in the script that allows user to inspect configuration changes')
 parser.add_argument('-warm-init', dest='restart_run', action='store_true',
   help='do restart run instead of cold initialization using an existing simulation')
+parser.add_argument('-restart-path', metavar='prefix', dest='restart_path',
+  help='restart from the files prefix_zt.nc, prefix_zm.nc and prefix_sfc.nc, e.g. a snapshot of warm_start_sweep.py (default is restart_ic/case)')
+parser.add_argument('-restart-time', metavar='seconds', dest='restart_time',
+  help='model time of the restart (default is 3600 s after the initial time)')
+parser.add_argument('-clubb-dir', metavar='path', dest='clubb_dir',
+  help='CLUBB root directory (default is the parent of the CWD)')
+parser.add_argument('-no-run', dest='no_run', action='store_true',
+  help='only write the namelist files (and clubb.in) to the CWD, do not run CLUBB')
 
 # create dictionary of parameters to change (remove None and False vals)
 parameters = vars(parser.parse_args(sys.argv[1:]))
@@ -98,120 +98,64 @@ for key, val in parameters.items():
 for key in unset_keys:
   del parameters[key]
 
-# concatenate all other input namelist files to one file
-line_collections = []
-# "parameter" file
-input_file = open(os.path.join(tunable_dir, 'tunable_parameters.in'), 'r')
-line_collections.append(input_file.readlines())
-input_file.close()
-# "SILHS_PARAMS" file
-input_file = open(os.path.join(tunable_dir, 'silhs_parameters.in'), 'r')
-line_collections.append(input_file.readlines())
-input_file.close()
+# get CLUBB root directory (assumed to be one above the CWD unless specified) and set directories
+clubb_dir = parameters.pop('clubb_dir', os.path.join(os.getcwd(),'..'))
+restart_path = parameters.pop('restart_path', None)
+restart_time = parameters.pop('restart_time', None)
+output_dir = os.path.join(clubb_dir, 'output')
+case_dir = os.path.join(clubb_dir, 'input', 'case_setups')
+grid_dir = os.path.join(clubb_dir, 'input', 'grid')
+tunable_dir = os.path.join(clubb_dir, 'input', 'tunable_parameters')
+stats_dir = os.path.join(clubb_dir, 'input', 'stats')
+bin_dir = os.path.join(clubb_dir, 'bin')
+res_dir = os.path.join(clubb_dir, 'restart_ic') 
+
+# read all input namelist files into one namelist
+model_file_name = parameters['case'] + '_model.in'
+namelist = clubb_namelist.read_namelist(os.path.join(tunable_dir, 'tunable_parameters.in'),
+                                        os.path.join(tunable_dir, 'silhs_parameters.in'),
+                                        os.path.join(tunable_dir, 'configurable_model_flags.in'),
+                                        os.path.join(case_dir, model_file_name),
+                                        os.path.join(stats_dir, 'standard_stats.in'))
+
+def add_default(key, val, anchor):
+  # add a variable to the group of anchor, unless the input files set it already
+  if (key not in namelist and anchor in namelist):
+    namelist.set(key, val, namelist.group_of(anchor))
+    print('append line {} = {}'.format(key, val))
+
 # "FLAGS" file
-input_file = open(os.path.join(tunable_dir, 'configurable_model_flags.in'), 'r')
-input_lines = input_file.readlines()
-input_file.close()
-for line in input_lines:
-  if (not line.strip().startswith('!')):
-    ind = line.find('!')
-    if (ind != -1):
-      line = line[0:ind] + '\n'
-    line_collections.append(line)
-    if (line.startswith('tridiag_solve_method')):
-      if ('smoothed_tau' in parameters):
-        if (not any('l_smooth_Heaviside_tau_wpxp' in tmpstr for tmpstr in input_lines)):
-          lnew = 'l_smooth_Heaviside_tau_wpxp = .false.,' + '\n'
-          line_collections.append(lnew)
-          print('append line '+lnew)
-      if ('modified_BVF_Ri_limiter' in parameters):
-        if (not any('l_modify_limiters_for_cnvg_test' in tmpstr for tmpstr in input_lines)):
-          lnew = 'l_modify_limiters_for_cnvg_test = .false.,' + '\n'
-          line_collections.append(lnew)
-          print('append line '+lnew)
-      if ('modified_wp3_clip' in parameters):
-        if (not any('l_use_wp3_lim_with_smth_Heaviside' in tmpstr for tmpstr in input_lines)):
-          lnew = 'l_use_wp3_lim_with_smth_Heaviside = .false.,' + '\n'
-          line_collections.append(lnew)
-          print('append line '+lnew)
+if ('smoothed_tau' in parameters):
+  add_default('l_smooth_Heaviside_tau_wpxp', '.false.', 'tridiag_solve_method')
+if ('modified_BVF_Ri_limiter' in parameters):
+  add_default('l_modify_limiters_for_cnvg_test', '.false.', 'tridiag_solve_method')
+if ('modified_wp3_clip' in parameters):
+  add_default('l_use_wp3_lim_with_smth_Heaviside', '.false.', 'tridiag_solve_method')
 # "MOD_MODEL" file
-model_file_name = parameters['case'] + '_model.in'
-input_file = open(os.path.join(case_dir, model_file_name), 'r')
-input_lines = input_file.readlines()
-input_file.close()
-for line in input_lines:
-  if (not line.strip().startswith('!')):
-    ind = line.find('!')
-    if (ind != -1):
-      line = line[0:ind] + '\n'
-    line_collections.append(line)
-    if (line.startswith('runtype')):
-      if (not any('nzmax' in tmpstr for tmpstr in line_collections)):
-        lnew = 'nzmax = 999' + '\n'
-        line_collections.append(lnew)
-        print('append line '+lnew)
-      if ('modified_ic' in parameters):
-        if (not any('l_modify_ic_with_cubic_int' in tmpstr for tmpstr in input_lines)):
-          lnew = 'l_modify_ic_with_cubic_int = .false.,' + '\n'
-          line_collections.append(lnew)
-          print('append line '+lnew)
-      if ('modified_bc' in parameters):
-        if (not any('l_modify_bc_for_cnvg_test' in tmpstr for tmpstr in input_lines)):
-          lnew = 'l_modify_bc_for_cnvg_test = .false.,' + '\n'
-          line_collections.append(lnew)
-          print('append line '+lnew)
-    elif (line.startswith('rad_scheme')):
-      if (not any('l_calc_thlp2_rad' in tmpstr for tmpstr in input_lines)):
-        lnew = 'l_calc_thlp2_rad = .true.,' + '\n'
-        if (line.split()[2] == '"none",'):
-          lnew = 'l_calc_thlp2_rad = .false.,' + '\n'
-        line_collections.append(lnew)
-        print('append line '+lnew)
-      if (not any('l_rad_above_cloud' in tmpstr for tmpstr in input_lines)):
-        lnew = 'l_rad_above_cloud = .true.,' + '\n'
-        if (line.split()[2] == '"none",'):
-          lnew = 'l_rad_above_cloud = .false.,' + '\n'
-        line_collections.append(lnew)
-        print('append line '+lnew)
-    elif (line.startswith('microphys_scheme')):
-      if (not any('l_var_covar_src' in tmpstr for tmpstr in input_lines)):
-        lnew = 'l_var_covar_src = .true.' + '\n'
-        if (line.split()[2] == '"none"'):
-          lnew = 'l_var_covar_src = .false.' + '\n'
-        line_collections.append(lnew)
-        print('append line '+lnew)
-      if (not any('l_cloud_sed' in tmpstr for tmpstr in input_lines)):
-        lnew = 'l_cloud_sed = .true.' + '\n'
-        if (line.split()[2] == '"none"'):
-          lnew = 'l_cloud_sed = .false.' + '\n'
-        line_collections.append(lnew)
-        print('append line '+lnew)
-# "stats" file
-input_file = open(os.path.join(stats_dir,'standard_stats.in'), 'r')
-line_collections.append(input_file.readlines())
-input_file.close()
-# write out to namelist file
-out_file_name = parameters['case'] + '_default.in' 
-namelist_file = open(out_file_name, 'w')
-for line_collection in line_collections:
-  for line in line_collection:
-    ind = line.find('!')
-    if (ind != -1):
-      line = line[0:ind] + '\n'
-    namelist_file.write(line)
-namelist_file.close()
-
-# read the default namelist setup and modify it for convergence test 
-model_file      = open(out_file_name, 'r')
-model_config    = model_file.readlines()
-model_file.close()
+add_default('nzmax', '999', 'runtype')
+if ('modified_ic' in parameters):
+  add_default('l_modify_ic_with_cubic_int', '.false.', 'runtype')
+if ('modified_bc' in parameters):
+  add_default('l_modify_bc_for_cnvg_test', '.false.', 'runtype')
+if ('rad_scheme' in namelist):
+  rad_on = clubb_namelist.parse_value(namelist.get('rad_scheme')) != 'none'
+  add_default('l_calc_thlp2_rad', rad_on, 'rad_scheme')
+  add_default('l_rad_above_cloud', rad_on, 'rad_scheme')
+if ('microphys_scheme' in namelist):
+  micro_on = clubb_namelist.parse_value(namelist.get('microphys_scheme')) != 'none'
+  add_default('l_var_covar_src', micro_on, 'microphys_scheme')
+  add_default('l_cloud_sed', micro_on, 'microphys_scheme')
+
+# write out the default namelist file
+namelist.write(parameters['case'] + '_default.in')
+
 # create a file to save the modified namelist 
 # use concatenated model file name from specified parameters
 # unless user specified their own name
 if ('output_name' not in parameters):
   model_file_name = model_file_name.replace('_model.in', '')
   for parameter in parameters:
-    if (parameter == 'case' or parameter == 'skip_check'):
+    if (parameter == 'case' or parameter == 'skip_check' or parameter == 'no_run'):
       continue
     if (isinstance(parameters[parameter], bool) and parameters[parameter]):
       model_file_name += '_' + parameter.replace('_','-')
@@ -228,9 +172,8 @@ else:
     elif (parameters[parameter]):
       model_file_name += '_' + parameter + '-' + parameters[parameter]
 
-# create modified configuration model file
+# name of modified configuration model file
 model_file_name += '.in'
-model_file = open(model_file_name, 'w')
 
 # create dictionary of configuration strings from parameters
 config_strings = {}
@@ -248,9 +191,9 @@ if ('turn_off_microphysics' in parameters):
 
 # turn off radiation unless user has specified something else
 if ('turn_off_radiation' in parameters):
-  config_strings['rad_scheme']        = '"none",'
-  config_strings['l_calc_thlp2_rad']  = '.false.,'
-  config_strings['l_rad_above_cloud'] = '.false.,'
+  config_strings['rad_scheme']        = '"none"'
+  config_strings['l_calc_thlp2_rad']  = '.false.'
+  config_strings['l_rad_above_cloud'] = '.false.'
 
 # set l_standard_term_ta to true unless user has specified something else
 if ('standard_aterms' in parameters):
@@ -258,7 +201,7 @@ if ('standard_aterms' in parameters):
 
 # fix flux computation height unless user has specified otherwise
 if ('modified_ic' in parameters):
-  config_strings['l_modify_ic_with_cubic_int'] = '.true.,'
+  config_strings['l_modify_ic_with_cubic_int'] = '.true.'
   if ('dycoms2_rf02' in parameters['case']):
     case_name = 'dycoms2_rf02'
   else: 
@@ -273,13 +216,13 @@ if ('modified_ic' in parameters):
     sys.exit('must specify grid spacing or refinement level info.....') 
   modify_ic_profile(clubb_dir, case_dir, grid_dir, case_name, case_dz, case_ref)
 else:
-  config_strings['l_modify_ic_with_cubic_int'] = '.false.,'
+  config_strings['l_modify_ic_with_cubic_int'] = '.false.'
 
 # used revised boundary condition if user has specified 
 if ('modified_bc' in parameters):
-  config_strings['l_modify_bc_for_cnvg_test'] = '.true.,'
+  config_strings['l_modify_bc_for_cnvg_test'] = '.true.'
 else:
-  config_strings['l_modify_bc_for_cnvg_test'] = '.false.,'
+  config_strings['l_modify_bc_for_cnvg_test'] = '.false.'
 
 #set time-dependent forcing to false
 if ('fixed_forcing' in parameters):
@@ -291,9 +234,9 @@ if ('turn_off_splat' in parameters):
 
 # set l_smooth_Heaviside_tau_wpxp to true unless unless user has specified otherwise
 if ('smoothed_tau' in parameters):
-  config_strings['l_smooth_Heaviside_tau_wpxp'] = '.true.,'
+  config_strings['l_smooth_Heaviside_tau_wpxp'] = '.true.'
 else:
-  config_strings['l_smooth_Heaviside_tau_wpxp'] = '.false.,'
+  config_strings['l_smooth_Heaviside_tau_wpxp'] = '.false.'
 
 # use linear diffusion instead of nonlinear diffusion unless user has specified otherwise
 if ('linear_diffusion' in parameters):
@@ -315,9 +258,9 @@ if ('linear_diffusion' in parameters):
 
 # use modified setup for limiters on BVF and Ri unless user has specified otherwise
 if ('modified_BVF_Ri_limiter' in parameters):
-  config_strings['l_modify_limiters_for_cnvg_test'] = '.true.,'
+  config_strings['l_modify_limiters_for_cnvg_test'] = '.true.'
 else:
-  config_strings['l_modify_limiters_for_cnvg_test'] = '.false.,'
+  config_strings['l_modify_limiters_for_cnvg_test'] = '.false.'
 
 if ('modified_wp3_clip' in parameters): 
   config_strings['l_use_wp3_lim_with_smth_Heaviside'] = '.true.' 
@@ -327,8 +270,13 @@ else:
 # set restart run information
 if ('restart_run' in parameters):
   config_strings['l_restart'] = '.true.'
-  config_strings['restart_path'] = '"'+ os.path.join(res_dir,parameters['case']) +'"'
-  if ('tinitial' in parameters):
+  # CLUBB reads the restart files from "../" + restart_path_case, relative to the CWD
+  if (restart_path is None):
+    restart_path = os.path.join(res_dir,parameters['case'])
+  config_strings['restart_path_case'] = clubb_namelist.quote(os.path.relpath(restart_path, os.path.dirname(os.getcwd())))
+  if (restart_time is not None):
+    config_strings['time_restart'] = str(float(restart_time))
+  elif ('tinitial' in parameters):
     config_strings['time_restart'] = str(float(parameters['tinitial']) + 3600.0)
   else: 
     config_strings['time_restart'] = '3600.0'
@@ -351,18 +299,11 @@ if ('dz' in parameters):
 
 # if refinement specified, create grid file and set appropriate file name
 if ('refine' in parameters):
-  # read namelist file to obtain model height in case setup 
+  # obtain model height in case setup 
   config_strings['grid_type'] = '2'
-  tmp_file_name = parameters['case'] + '_model.in' 
-  input_file = open(os.path.join(case_dir, tmp_file_name), 'r')
-  input_lines = input_file.readlines()
-  input_file.close()
-  height = -999.0 
-  for line in input_lines:
-    if ('zm_top' in line):
-      height = float(line.split()[2])
-  if (height == -999.0): 
+  if ('zm_top' not in namelist): 
     sys.exit('Model height are not prescribed in namelist, space refinement failed...') 
+  height = float(clubb_namelist.parse_value(namelist.get('zm_top')))
   #generate refined grid 
   refine = int(parameters['refine'])
   grid128 = np.loadtxt(os.path.join(grid_dir,'deep_convection_128lev_27km_zt_grid.grd'))
@@ -405,37 +346,28 @@ if ('godunov_xpyp' in parameters):
 if ('Tsfc' in parameters):
   print("WARNING: Specifying Tsfc doesn't change model parammeters...")
   print("         this needs to be done in " + parameters['case'] + "_sounding.in")
-  input("Press Enter to acknowledge")
+  if ('skip_check' not in parameters):
+    input("Press Enter to acknowledge")
 
+# apply changes in model configurations, variables that are not in the input files are skipped
 modified_lines = []
-for line in model_config:
-  modified = False
-  # Apply changes in model configurations 
-  if (not line.strip().startswith('!')):
-    for key, val in config_strings.items():
-      # adjust values
-      if (line.startswith(key)):
-        if (line.split()[0] == key): 
-          default_value = line.split()[2]
-          line = line.replace(default_value, val)
-          modified = True
-          print(f'Setting {key} to {val}')
-          print(line)
-
-  # write line to model configuration (and record if modified)
-  if (not line.strip().startswith('!')):
-    model_file.write(line)
-  if (modified):
-    modified_lines.append(line)
-
-model_file.close()
+for key, val in config_strings.items():
+  if (key not in namelist):
+    print(f'{key} is not in the input files, not setting it to {val}')
+    continue
+  namelist.set(key, val)
+  modified_lines.append(f'{key} = {val}')
+  print(f'Setting {key} to {val}')
+namelist.write(model_file_name)
 
 print('Wrote ' + model_file_name + ' file with the following modified lines:\n')
 for line in modified_lines:
-  print(line),
+  print(line)
 
 # execute CLUBB
 shutil.copy(model_file_name, 'clubb.in')
+if ('no_run' in parameters):
+  sys.exit(0)
 if ('skip_check' not in parameters):
   input('Press Enter to run CLUBB...')
 os.system(os.path.join(bin_dir, 'clubb_standalone'))
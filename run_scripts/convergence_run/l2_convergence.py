@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+#######################################################################
+# $Id$
+#
+# Description:
+# Analysis of the convergence test simulations of one case and experiment
+# (see run_convergence_matrix.py). The solution at the finest refinement
+# level is the reference. Each output file is opened once, and all variables
+# are read at all requested output times. The profiles of every refinement
+# level are sampled on the levels of the coarsest grid and stacked, so the
+# RMS errors, observed convergence orders and Richardson-extrapolated
+# profiles are computed for all levels and times at once.
+#
+# The results are saved to a .npz file, which plot_l2_convergence.py plots.
+#
+# Usage:
+#   ./l2_convergence.py bomex default -r 0,1,2,3,4,5,6,7 \
+#       -dt 4,2,1,0.5,0.25,0.125,0.0625,0.03125 -t 59,119,179,239,299,359
+#
+#######################################################################
+import argparse
+import numpy as np
+import sys
+from netCDF4 import Dataset
+
+# variable names and output files (suffixes) analyzed by default
+VARIABLES = ['wp3','wp2','rtm','thlm','rtp2','thlp2','rtpthlp', 'um', 'vm', 'upwp', 'vpwp', 'wprtp', 'wpthlp', 'up2', 'vp2']
+SUFFIXES  = [ 'zt', 'zm', 'zt',  'zt',  'zm',   'zm',     'zm', 'zt', 'zt',   'zm',   'zm',    'zm',     'zm',  'zm',  'zm']
+
+# name of the output files of a convergence test simulation
+FILENAME = '{case}_dt-{dt}_refine-{refine}_output_name-{expnam}_{suffix}.nc'
+
+def coarse_levels(suffix, refine):
+  # Returns the slice of the levels of a grid refined 2**refine times that
+  # coincide with the coarsest grid. On the zt grid, the level below the
+  # surface is left out.
+  step = 2**refine
+  if (suffix == 'zm'):
+    return slice(0, None, step)
+  else:
+    return slice(step, None, step)
+
+def read_convergence_data(data_dir, case, expnam, dt_values, refine_levels, time_indices,
+                          variables=VARIABLES, suffixes=SUFFIXES):
+  # Reads the variables at the output time indices from the simulations at all
+  # refinement levels, opening each file once. Returns the times in seconds and
+  # a dictionary with an array (resolution, time, level) for every variable.
+  time_indices = np.asarray(time_indices)
+  values = {var: [] for var in variables}
+  times = None
+  for dt, refine in zip(dt_values, refine_levels):
+    relative_refine = int(refine) - int(refine_levels[0])
+    for suffix in sorted(set(suffixes)):
+      filename = FILENAME.format(case=case, dt=dt, refine=refine, expnam=expnam, suffix=suffix)
+      with Dataset(data_dir + '/' + filename) as data:
+        if times is None:
+          times = np.asarray(data['time'][time_indices])
+        for var, var_suffix in zip(variables, suffixes):
+          if (var_suffix == suffix):
+            data[var].set_auto_mask(False)
+            profiles = data[var][time_indices, :, 0, 0]
+            values[var].append(profiles[:, coarse_levels(suffix, relative_refine)])
+  for var in variables:
+    num_levels = min(profiles.shape[1] for profiles in values[var])
+    values[var] = np.stack([profiles[:, :num_levels] for profiles in values[var]]).astype(np.float64)
+  return times, values
+
+def rms_errors(values):
+  # RMS error of each resolution but the last, compared with the last (reference)
+  # resolution, for each time. values is (resolution, time, level).
+  return np.sqrt(np.mean((values[:-1] - values[-1])**2, axis=-1))
+
+def observed_orders(rms, dz):
+  # Observed convergence order between successive resolutions, for each time
+  dz = np.asarray(dz, dtype=np.float64)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    return np.log(rms[:-1]/rms[1:]) / np.log(dz[:-1]/dz[1:])[:, np.newaxis]
+
+def richardson_extrapolation(values, order, ratio):
+  # Richardson-extrapolated profiles from the two finest resolutions, given the
+  # convergence order for each time and the refinement ratio between them.
+  # Where the order is not positive, the extrapolation is NaN.
+  with np.errstate(divide='ignore', invalid='ignore'):
+    factor = np.where(order > 0.0, 1.0/(ratio**order - 1.0), np.nan)
+  return values[-1] + factor[:, np.newaxis] * (values[-1] - values[-2])
+
+def analyze_convergence(times, values, refine_levels):
+  # Returns a dictionary with the convergence results of every variable:
+  #   {var}_rms          (resolution-1, time)  RMS error compared with the finest resolution
+  #   {var}_order        (resolution-2, time)  observed order between successive resolutions
+  #   {var}_richardson   (time, level)         extrapolated profile, using the order of the
+  #                                            two finest resolutions with an RMS error
+  #   {var}_richardson_error (time)            RMS difference of the finest resolution from it
+  refine = np.asarray(refine_levels, dtype=int)
+  dz = 2.0**-(refine - refine[0])
+  results = {'times': times, 'dz': dz[:-1], 'refine_levels': refine}
+  for var, var_values in values.items():
+    rms = rms_errors(var_values)
+    results[var + '_rms'] = rms
+    results[var + '_order'] = observed_orders(rms, dz[:-1])
+    if (len(refine) > 2):
+      richardson = richardson_extrapolation(var_values, results[var + '_order'][-1], 2.0**(refine[-1] - refine[-2]))
+      results[var + '_richardson'] = richardson
+      results[var + '_richardson_error'] = np.sqrt(np.mean((var_values[-1] - richardson)**2, axis=-1))
+  return results
+
+def parse_list(string):
+  return [item for item in string.split(',') if item]
+
+def main():
+  parser = argparse.ArgumentParser(description='compute the convergence of a case from the convergence test output')
+  parser.add_argument('case', help='name of case')
+  parser.add_argument('expnam', help='experiment name (-output-name of convergence_config.py)')
+  parser.add_argument('-r', '--refine-levels', type=parse_list, required=True,
+    help='comma separated refinement levels, the last one is the reference')
+  parser.add_argument('-dt', '--dt-values', type=parse_list, required=True,
+    help='comma separated time steps, as in the output file names')
+  parser.add_argument('-t', '--time-indices', type=lambda string: [int(i) for i in parse_list(string)], required=True,
+    help='comma separated output time indices')
+  parser.add_argument('-v', '--variables', type=parse_list, default=VARIABLES,
+    help='comma separated variables (default: %(default)s)')
+  parser.add_argument('-d', '--data-dir', default='../output', help='output directory (default: %(default)s)')
+  parser.add_argument('-o', '--output', help='.npz file for the results (default: CASE_l2_cnvg_EXPNAM.npz)')
+  args = parser.parse_args()
+
+  if (len(args.refine_levels) != len(args.dt_values) or len(args.refine_levels) < 3):
+    sys.exit('need the same number (at least 3) of refinement levels and time steps')
+  unknown = [var for var in args.variables if var not in VARIABLES]
+  if unknown:
+    sys.exit('unknown variables: ' + ', '.join(unknown))
+  suffixes = [SUFFIXES[VARIABLES.index(var)] for var in args.variables]
+
+  times, values = read_convergence_data(args.data_dir, args.case, args.expnam, args.dt_values,
+                                        args.refine_levels, args.time_indices, args.variables, suffixes)
+  results = analyze_convergence(times, values, args.refine_levels)
+
+  output = args.output if args.output else '{}_l2_cnvg_{}.npz'.format(args.case, args.expnam)
+  np.savez(output, case=args.case, expnam=args.expnam, variables=args.variables,
+           dt_values=args.dt_values, time_indices=args.time_indices, **results)
+
+  # print the order between the two finest resolutions with an RMS error
+  print('{:>10}'.format('time [h]') + ''.join('{:>8.2f}'.format(time/3600.0) for time in times))
+  for var in args.variables:
+    print('{:>10}'.format(var) + ''.join('{:>8.2f}'.format(order) for order in results[var + '_order'][-1]))
+  print('Wrote ' + output)
+
+if __name__ == '__main__':
+  main()
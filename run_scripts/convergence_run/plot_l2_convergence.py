@@ -1,30 +1,25 @@
+#!/usr/bin/python3
+#######################################################################
+# $Id$
+#
+# Description:
+# Plots the L2 convergence of each variable from the results of
+# l2_convergence.py: log10 of the RMS error against log10 of the
+# normalized grid spacing, one line per output time, labeled with the
+# observed order between the two finest resolutions.
+#
+# Usage:
+#   ./plot_l2_convergence.py bomex_l2_cnvg_default.npz -f figure
+#
+#######################################################################
+import argparse
 import numpy as np
-from cycler import cycler
-from netCDF4 import Dataset
+import os
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
-import matplotlib.gridspec as gridspec
-from matplotlib.font_manager import FontProperties
-from matplotlib.ticker import (MultipleLocator, AutoMinorLocator)
+from matplotlib.ticker import MultipleLocator
 from matplotlib import rc
-import seaborn as sns
-
-case         = "CASE_NAME"
-expnam       = "EXP_NAME"
-#refinment factor and time step sizes 
-#refineLevels = [0, 1, 2, 3, 4, 5, 7]
-refineLevels = [REFINE_LEVELS]
-#coresponded time steps
-#dtValues     = [4, 2, 1, 0.5, 0.25, 0.125, 0.03125]
-dtValues     = [DTIME_VALUES]
-#corresponded plotting time index for 1-h, 2-h, 3-h, 4-h, 5-h, 6-h 
-#tIndices     = [5, 11, 17, 23, 29, 35]
-tIndices     = [DTIME_INDEX]
-
-Datadir      = '../output'
-Filename     = Datadir + '/' + case + '_dt-{}_refine-{}_output_name-'+expnam+'_{}.nc'
-Figstr       = case+'_l2_cnvg_'+expnam
-tstart       = 0
 
 color_cycle  = ['#377eb8', '#ff7f00', '#4daf4a',
                 '#f781bf', '#a65628', '#984ea3',
@@ -34,88 +29,69 @@ rc('font',**{'family':'serif','serif':['Times New Roman'],'style':'normal','weig
 #rc('text',usetex=True)
 font_size = 20
 
-##variable names and output levels 
-vnmList      = ['wp3','wp2','rtm','thlm','rtp2','thlp2','rtpthlp', 'um', 'vm', 'upwp', 'vpwp', 'wprtp', 'wpthlp', 'up2', 'vp2']
-sufList      = [ 'zt', 'zm', 'zt',  'zt',  'zm',   'zm',     'zm', 'zt', 'zt',   'zm',   'zm',    'zm',     'zm',  'zm',  'zm']
-
-for iv in range(len(vnmList)-1):
-
-  varName = vnmList[iv]
-  suffix  = sufList[iv]
-
-  if (suffix == 'zm'):
-    def startIndex(n):
-      return 0
-  else:
-    def startIndex(n):
-      return 2**n
-
-  dataList = []
-  for i,refineLevel in enumerate(refineLevels):
-    dt = dtValues[i]
-    dataList.append(Dataset(Filename.format(dt, refineLevel, suffix)))
+def plot_variable(results, varName, figure_dir):
+  case    = str(results['case'])
+  Figstr  = case+'_l2_cnvg_'+str(results['expnam'])
+  rms     = results[varName + '_rms']
+  order   = results[varName + '_order'][-1]
+  xlog    = np.log10(results['dz'])
 
-  n = refineLevels[-1] - refineLevels[0]
-  varRef = dataList[-1][varName][:,range(startIndex(n),len(dataList[-1]['altitude'][:]),2**n),0,0]
-
-  varList = []
-  for n in range(len(dataList)-1):
-    data = dataList[n]
-    varList.append(data[varName][:,range(startIndex(n),len(data['altitude'][:]),2**n),0,0])
-
-  z = dataList[0]['altitude'][1:]
   f, ax = plt.subplots(figsize=(8.0,6.6),nrows=1,ncols=1)
   ax.set_prop_cycle('color', color_cycle)
 
-  for tIndex in tIndices:
-    rmsList = []
-    dzList = []
-    for n,var in enumerate(varList):
-      dzList.append(1.0/2**n)
-      rms = np.sqrt(np.mean((var[tIndex,:]-varRef[tIndex,:])**2))
-      rmsList.append(rms)
-
-    # These are the colors that will be used in the plot
-    order = np.log(rmsList[-2]/rmsList[-1])/np.log(2)
-    ylog = np.log10(rmsList)
-    xlog = np.log10(dzList)
-    ax.plot(xlog,ylog, '-o', linewidth=2.0, markersize=8.0,
+  for it, time in enumerate(results['times']):
+    ax.plot(xlog,np.log10(rms[:,it]), '-o', linewidth=2.0, markersize=8.0,
                markeredgecolor='black', markeredgewidth=0.5,
-               label='{:.0f}{} ({:.2f})'.format(
-                   (dataList[0]['time'][tIndex])/3600.0,'h',order))
+               label='{:.0f}{} ({:.2f})'.format(time/3600.0,'h',order[it]))
 
   ax.set_title('Convergence of {} ( {} )'.format(varName,case.upper()),fontsize=font_size*1.1,loc='center',x=0.5,y=1.01)
   ax.set_ylabel('{}'.format('log10 (RMSE)'), fontsize=font_size)
   #normalized grid spacing(z^*)
   ax.set_xlabel('{}'.format('log10 (Normalized grid spacing)'), fontsize=font_size)
-  #set legend 
+  #set legend
   leg = ax.legend(loc='best',fontsize = font_size*0.94,labelspacing=0.24,markerscale=0.8,
-            handlelength=1.0,handletextpad=0.5,handleheight=0.8) 
+            handlelength=1.0,handletextpad=0.5,handleheight=0.8)
   # set the linewidth of each legend object
-  for legobj in leg.legendHandles:
+  for legobj in getattr(leg, 'legend_handles', None) or leg.legendHandles:
       legobj.set_linewidth(2.0)
 
   for axis in ['top','bottom','left','right']:
       ax.spines[axis].set_linewidth(0.6)
- 
+
   ax.xaxis.set_minor_locator(MultipleLocator(0.25))
   ax.xaxis.set_major_locator(MultipleLocator(0.5))
   ax.yaxis.set_minor_locator(MultipleLocator(0.25))
   ax.yaxis.set_major_locator(MultipleLocator(0.5))
 
-  ax.tick_params(which='both',  direction='in', pad=6, 
+  ax.tick_params(which='both',  direction='in', pad=6,
                  width=0.5, labelsize=font_size*0.95, right=True, top=True)
   ax.tick_params(which='major', length=4.5)
   ax.tick_params(which='minor', length=3.0) #, color='b')
   ax.set_xlim(-2.0, 1.0)
   ax.set_aspect('equal')
 
-  #add reference line with slope 1 
+  #add reference line with slope 1
   xref = ax.get_xlim()
   yrex = ax.get_ylim()
   yref = xref + np.mean(yrex) - np.mean(xref)
   ax.plot(xref,yref,dashes=[6, 2], linewidth=1.2, color='black')
 
   #plt.tight_layout(pad=1.5)
-  plt.savefig('figure/convergence_{}_{}.png'.format(Figstr,varName))
-
+  plt.savefig(os.path.join(figure_dir, 'convergence_{}_{}.png'.format(Figstr,varName)))
+  plt.close(f)
+
+def main():
+  parser = argparse.ArgumentParser(description='plot the results of l2_convergence.py')
+  parser.add_argument('results', help='.npz file written by l2_convergence.py')
+  parser.add_argument('-f', '--figure-dir', default='figure', help='directory for the figures (default: %(default)s)')
+  parser.add_argument('-v', '--variables', help='comma separated variables to plot (default: all in results)')
+  args = parser.parse_args()
+
+  results = np.load(args.results)
+  variables = args.variables.split(',') if args.variables else list(results['variables'])
+  os.makedirs(args.figure_dir, exist_ok=True)
+  for varName in variables:
+    plot_variable(results, varName, args.figure_dir)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,256 @@
+#!/usr/bin/python3
+#######################################################################
+# $Id$
+#
+# Description:
+# Driver to run a matrix of convergence test simulations concurrently.
+# The matrix is (case x time step/refinement level x experiment), where an
+# experiment is a name plus the flags passed to convergence_config.py.
+# Each simulation gets its own directory (work_dir/run_name) with its own
+# input tree: input links to the input files of CLUBB, except for the
+# soundings of its case in input/case_setups, which are copies, since
+# convergence_config.py -new-ic rewrites them for the grid of the
+# simulation. CLUBB runs in work_dir/run_name/run, which holds the namelist,
+# grid file and logs, and reads ../input from there. The namelists are
+# generated one at a time, then CLUBB is run on a bounded pool of local
+# processes. CLUBB writes the output to work_dir/output.
+#
+# The status and run time of each simulation are saved in
+# work_dir/convergence_state.json, so rerunning the same command skips
+# the simulations that already finished. With --history DB, every
+# simulation is also recorded in a runtime history database (see
+# ../runtime_history.py), and the simulations are started longest first
+# using the run times recorded there.
+#
+# Usage (same matrix as run_cnvg_test_multi_cases_baseline.csh):
+#   ./run_convergence_matrix.py ../../cnvg_baseline -j 8 \
+#       -e baseline "-rad-off -micro-off -standard-aterms -splat-off -new-ic -new-bc"
+#
+#######################################################################
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import product
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.dirname(script_dir))
+import runtime_history
+
+# name, start and end time for test cases, the default is the same as
+# simulation setup in clubb convergence paper (Zhang et. al., 2023, JAMES)
+CASE_TIMES = {
+  'bomex':           (0,     21600),
+  'rico':            (0,     21600),
+  'dycoms2_rf02_nd': (0,     21600),
+  'wangara':         (82800, 104400),
+}
+
+# time-step and grid-spacing refinements for convergence test, run in pairs
+REFINE_LEVELS = ['0', '1', '2', '3', '4', '5', '6', '7']
+TIME_STEPS    = ['4', '2', '1', '0.5', '0.25', '0.125', '0.0625', '0.03125']
+
+STATE_FILE = 'convergence_state.json'
+
+# exit status of clubb_standalone when the run finished normally
+CLUBB_SUCCESS = 6
+
+def expand_matrix(cases, time_steps, refine_levels, experiments, product_grid=False):
+  # Returns the list of runs. The time steps and refinement levels are paired
+  # up like in the csh scripts, unless product_grid is set.
+  if product_grid:
+    resolutions = list(product(time_steps, refine_levels))
+  else:
+    if len(time_steps) != len(refine_levels):
+      raise ValueError('need as many time steps as refinement levels, or --product')
+    resolutions = list(zip(time_steps, refine_levels))
+  runs = []
+  for (exp_name, flags), case, (dt, refine) in product(experiments, cases, resolutions):
+    runs.append({'name': '{}_{}_dt-{}_refine-{}'.format(exp_name, case, dt, refine),
+                 'experiment': exp_name, 'case': case, 'dt': dt, 'refine': refine,
+                 'flags': flags.split()})
+  return runs
+
+def load_state(work_dir):
+  state_path = os.path.join(work_dir, STATE_FILE)
+  if not os.path.exists(state_path):
+    return {}
+  with open(state_path) as state_file:
+    return json.load(state_file)
+
+def save_state(work_dir, state):
+  # write to a temporary file first, so an interrupted driver never leaves a broken state file
+  state_path = os.path.join(work_dir, STATE_FILE)
+  with open(state_path + '.tmp', 'w') as state_file:
+    json.dump(state, state_file, indent=2)
+  os.replace(state_path + '.tmp', state_path)
+
+def make_link(target, link_name):
+  if os.path.lexists(link_name):
+    os.remove(link_name)
+  os.symlink(target, link_name)
+
+def is_case_sounding(file_name, case):
+  # whether a file in input/case_setups is a sounding that convergence_config.py -new-ic may
+  # rewrite for the case, e.g. dycoms2_rf02_sounding.in for dycoms2_rf02_nd
+  if not file_name.endswith('_sounding.in'):
+    return False
+  sounding_case = file_name[:-len('_sounding.in')]
+  return case == sounding_case or case.startswith(sounding_case + '_')
+
+def prepare_run_tree(run_root, clubb_dir, work_dir, case):
+  # Makes the input tree of a run in run_root and returns the directory to run CLUBB in.
+  # input links to the input of clubb_dir, except for the soundings of the case, which are
+  # copied, so each run rewrites its own soundings. output links to work_dir/output.
+  input_dir = os.path.join(clubb_dir, 'input')
+  case_dir = os.path.join(run_root, 'input', 'case_setups')
+  os.makedirs(case_dir, exist_ok=True)
+  for entry in os.listdir(input_dir):
+    if entry != 'case_setups':
+      make_link(os.path.join(input_dir, entry), os.path.join(run_root, 'input', entry))
+  for entry in os.listdir(os.path.join(input_dir, 'case_setups')):
+    source = os.path.join(input_dir, 'case_setups', entry)
+    if is_case_sounding(entry, case):
+      if os.path.lexists(os.path.join(case_dir, entry)):
+        os.remove(os.path.join(case_dir, entry))
+      shutil.copy(source, case_dir)
+    else:
+      make_link(source, os.path.join(case_dir, entry))
+  for entry in ('bin', 'restart_ic'):
+    make_link(os.path.join(clubb_dir, entry), os.path.join(run_root, entry))
+  make_link(os.path.join(work_dir, 'output'), os.path.join(run_root, 'output'))
+  run_dir = os.path.join(run_root, 'run')
+  os.makedirs(run_dir, exist_ok=True)
+  return run_dir
+
+def configure_run(run, run_dir, dt_output, tinitial, tfinal):
+  # Writes the namelist of a run to its run directory, returns the exit code of convergence_config.py.
+  # convergence_config.py reads and rewrites the input tree of the run, in the parent of run_dir.
+  command = [sys.executable, os.path.join(script_dir, 'convergence_config.py'), run['case'],
+             '-output-name', run['experiment'], '-dt', run['dt'], '-ref', run['refine'],
+             '-ti', str(tinitial), '-tf', str(tfinal), '-dto', str(dt_output)] + run['flags'] + \
+            ['-skip-check', '-no-run', '-clubb-dir', os.path.dirname(run_dir)]
+  with open(os.path.join(run_dir, 'config.log'), 'w') as log_file:
+    return subprocess.call(command, cwd=run_dir, stdout=log_file, stderr=subprocess.STDOUT)
+
+def execute_run(run_dir, clubb_dir):
+  # Runs CLUBB in a run directory, returns the exit code (0 if CLUBB finished
+  # normally), the wall and CPU time in seconds and the peak RSS in kB
+  with open(os.path.join(run_dir, 'clubb.log'), 'w') as log_file:
+    returncode, seconds, cpu_seconds, max_rss_kb = runtime_history.run_and_measure(
+      [os.path.join(clubb_dir, 'bin', 'clubb_standalone')], run_dir, log_file)
+  if (returncode == CLUBB_SUCCESS):
+    returncode = 0
+  elif (returncode == 0):
+    returncode = 1
+  return returncode, seconds, cpu_seconds, max_rss_kb
+
+def output_prefix(run):
+  # prefix of the output files of a run, as set by convergence_config.py
+  return '{}_dt-{}_refine-{}_output_name-{}'.format(run['case'], run['dt'], run['refine'], run['experiment'])
+
+def main():
+  parser = argparse.ArgumentParser(description='run a matrix of convergence test simulations concurrently')
+  parser.add_argument('work_dir',
+    help='directory for the run directories, the output is written to work_dir/output')
+  parser.add_argument('-c', '--cases', nargs='+', default=list(CASE_TIMES), choices=list(CASE_TIMES),
+    help='cases to run (default: all)')
+  parser.add_argument('-dt', '--time-steps', nargs='+', default=TIME_STEPS,
+    help='time step sizes in seconds (default: %(default)s)')
+  parser.add_argument('-ref', '--refine-levels', nargs='+', default=REFINE_LEVELS,
+    help='grid refinement levels, paired with the time steps (default: %(default)s)')
+  parser.add_argument('--product', action='store_true',
+    help='run every time step with every refinement level instead of pairing them')
+  parser.add_argument('-e', '--experiment', nargs=2, action='append', metavar=('NAME', 'FLAGS'),
+    help='experiment name and flags for convergence_config.py, e.g. -e baseline "-rad-off -micro-off", ' +
+         'may be given several times (default: one experiment named default without flags)')
+  parser.add_argument('-dto', '--dt-output', type=float, default=60,
+    help='time interval between output in seconds (default: %(default)s)')
+  parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+    help='number of simulations to run at the same time (default: number of CPUs)')
+  parser.add_argument('--clubb-dir', default=os.path.join(script_dir, '..', '..'),
+    help='CLUBB root directory with bin/clubb_standalone and input (default: the one of this script)')
+  parser.add_argument('--rerun', action='store_true',
+    help='also run the simulations that already finished')
+  parser.add_argument('--history', metavar='DB',
+    help='record the simulations in this runtime history database and use it to start the longest ones first')
+  parser.add_argument('-n', '--dry-run', action='store_true',
+    help='only print the runs of the matrix')
+  args = parser.parse_args()
+
+  experiments = args.experiment if args.experiment else [('default', '')]
+  try:
+    runs = expand_matrix(args.cases, args.time_steps, args.refine_levels, experiments, args.product)
+  except ValueError as error:
+    sys.exit(str(error))
+
+  work_dir = os.path.abspath(args.work_dir)
+  clubb_dir = os.path.abspath(args.clubb_dir)
+  state = load_state(work_dir)
+
+  todo = [run for run in runs if args.rerun or state.get(run['name'], {}).get('status') != 'done']
+  print('{} runs in matrix, {} to run'.format(len(runs), len(todo)))
+  if args.dry_run:
+    for run in todo:
+      print(run['name'] + ' ' + ' '.join(run['flags']))
+    return
+  if len(todo) == 0:
+    return
+
+  # CLUBB writes the output to ../output relative to the run directory, which links to work_dir/output
+  os.makedirs(os.path.join(work_dir, 'output'), exist_ok=True)
+
+  # generate all namelists first, one at a time
+  ready = []
+  for run in todo:
+    run_dir = prepare_run_tree(os.path.join(work_dir, run['name']), clubb_dir, work_dir, run['case'])
+    tinitial, tfinal = CASE_TIMES[run['case']]
+    returncode = configure_run(run, run_dir, args.dt_output, tinitial, tfinal)
+    if returncode != 0:
+      state[run['name']] = {'status': 'config failed', 'returncode': returncode, 'run_dir': run_dir}
+      print('{}: convergence_config.py failed, see {}'.format(run['name'], os.path.join(run_dir, 'config.log')))
+    else:
+      state[run['name']] = {'status': 'configured', 'run_dir': run_dir}
+      ready.append(run)
+  save_state(work_dir, state)
+
+  history = None
+  commit = None
+  if args.history:
+    history = runtime_history.open_history(args.history)
+    commit = runtime_history.current_commit(clubb_dir)
+    hints = runtime_history.wall_time_hints(history, [run['name'] for run in ready], 'run_convergence_matrix')
+    ready.sort(key=lambda run: -hints.get(run['name'], float('inf')))
+
+  # run CLUBB, the state and history are only updated by this thread
+  start = time.time()
+  with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+    futures = {executor.submit(execute_run, state[run['name']]['run_dir'], clubb_dir): run for run in ready}
+    for count, future in enumerate(as_completed(futures), 1):
+      run = futures[future]
+      returncode, seconds, cpu_seconds, max_rss_kb = future.result()
+      state[run['name']].update({'status': 'done' if returncode == 0 else 'failed',
+                                 'returncode': returncode, 'seconds': round(seconds, 1)})
+      save_state(work_dir, state)
+      if history is not None:
+        runtime_history.record_run(history, 'run_convergence_matrix', run['name'],
+                                   runtime_history.config_hash(os.path.join(state[run['name']]['run_dir'], 'clubb.in')),
+                                   returncode, seconds, cpu_seconds, max_rss_kb,
+                                   runtime_history.output_size(os.path.join(work_dir, 'output'), output_prefix(run)),
+                                   commit)
+      print('[{}/{}] {} {} in {:.1f} s'.format(count, len(ready), run['name'], state[run['name']]['status'], seconds))
+
+  failed = [run['name'] for run in runs if state.get(run['name'], {}).get('status') != 'done']
+  print('\nran {} simulations in {:.1f} s, {} of {} runs in matrix failed'.format(
+    len(ready), time.time() - start, len(failed), len(runs)))
+  for name in failed:
+    print('  ' + name + ': ' + state[name]['status'] + ', see ' + state[name]['run_dir'])
+  if len(failed) > 0:
+    sys.exit(1)
+
+if __name__ == '__main__':
+  main()
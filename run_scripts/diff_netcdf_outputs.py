@@ -6,34 +6,129 @@ import netCDF4
 import sys
 import numpy
 
-parser = argparse.ArgumentParser(description='Run a test')
-
-parser.add_argument("files", nargs=2,
-                    help="need two files to diff")
-                    
-args = parser.parse_args()
-
-# Create datasets from nc files
-dset0 = netCDF4.Dataset(args.files[0])
-dset1 = netCDF4.Dataset(args.files[1])
-
-# Loop through all variables in dataset, and make sure they are all completely 0
-all_zero = True
-for var in dset0.variables:
-    
-    # The CLUBB netcdf variables we are interested in are all 
-    # 4 dimensional (time, altitude, latitude, longitude),
-    # but currently we don't actually have latitude or longitude in clubb, so those
-    # dimensions are hardcoded to be 1. If in the future we remove those useless
-    # dimensions (unlikely), then the variables of interested would be 2D. So 
-    # for futureproofing, we will just check all variables with more than 1 dimension.
-    if dset0[var].ndim > 1:
-        if numpy.any( dset0[var][:] != dset1[var][:] ):
-            print(var + " is NON-ZERO")
-            all_zero = False
-            
-if all_zero:
-    sys.exit(0)
-else:
-    print("FAIL: There were some non-zero fields.")
-    sys.exit(1)
+# Memory that the comparison of a variable may use. Variables are compared in chunks of time
+# records that fit into it, so large (e.g. multi-column) outputs don't have to fit into memory.
+MEMORY_BUDGET = 256 * 1024 * 1024
+
+def chunk_records(var, memory_budget):
+    """
+    Returns the number of time records of a variable that are compared at once. A chunk is read
+    from both files, and comparing them needs about as much memory again.
+    """
+    record_bytes = int(numpy.prod(var.shape[1:])) * var.dtype.itemsize
+    return max(1, memory_budget // (4 * max(1, record_bytes)))
+
+def compare_variable(var0, var1, full=False, memory_budget=MEMORY_BUDGET):
+    """
+    Compares two netCDF variables chunk by chunk along their first (time) dimension.
+    Returns None if they are equal. NaNs at the same position are equal.
+    Otherwise, a dictionary is returned. Unless full is True, the comparison stops at the first
+    chunk that differs and the dictionary is empty. If full is True, it contains the number of
+    differing points ("num_differences"), the largest absolute difference ("max_abs_diff", NaN
+    if only one file has a NaN) and the index of the first differing point ("first_index").
+    """
+    if var0.shape != var1.shape:
+        return {"shapes": (var0.shape, var1.shape)}
+
+    # Compare the stored values, masked arrays would ignore fill values and be slower
+    var0.set_auto_mask(False)
+    var1.set_auto_mask(False)
+    if var0.ndim == 0 or var0.shape[0] == 0:
+        chunks = [(0, Ellipsis)]
+    else:
+        num_records = chunk_records(var0, memory_budget)
+        chunks = [(start, slice(start, start+num_records)) for start in range(0, var0.shape[0], num_records)]
+
+    result = None
+    for start, chunk in chunks:
+        values0 = var0[chunk]
+        values1 = var1[chunk]
+        differs = values0 != values1
+        if values0.dtype.kind == "f":
+            differs &= ~( numpy.isnan(values0) & numpy.isnan(values1) )
+        if not numpy.any( differs ):
+            continue
+        if not full:
+            return {}
+
+        if result is None:
+            first_index = numpy.unravel_index(numpy.flatnonzero(differs)[0], differs.shape)
+            result = {"num_differences": 0, "max_abs_diff": 0.0,
+                      "first_index": tuple(int(index) for index in (first_index[0] + start,) + first_index[1:])}
+        result["num_differences"] += int(numpy.count_nonzero(differs))
+        if values0.dtype.kind in "fiu":
+            abs_diff = numpy.abs( values0[differs].astype(numpy.float64) - values1[differs].astype(numpy.float64) )
+            result["max_abs_diff"] = float(numpy.max([result["max_abs_diff"], numpy.max(abs_diff)]))
+    return result
+
+def describe_difference(var, difference):
+    """
+    Returns the details of a difference found by compare_variable in full mode
+    """
+    if "shapes" in difference:
+        return "shape " + str(difference["shapes"][0]) + " != " + str(difference["shapes"][1])
+    first_index = ", ".join([dim + "=" + str(index) for dim, index in zip(var.dimensions, difference["first_index"])])
+    return (str(difference["num_differences"]) + " differing points, max abs diff " + "%e" % difference["max_abs_diff"]
+            + ", first at " + first_index)
+
+def find_differing_variables(dset0, dset1, full=False, memory_budget=MEMORY_BUDGET):
+    """
+    Returns the messages for all variables of dset0 that differ in dset1.
+    An empty list means the datasets are equal. If full is True, the messages say where
+    and by how much the variables differ, see compare_variable.
+    """
+    messages = []
+    for var in dset0.variables:
+
+        # The CLUBB netcdf variables we are interested in are all
+        # 4 dimensional (time, altitude, latitude, longitude),
+        # but currently we don't actually have latitude or longitude in clubb, so those
+        # dimensions are hardcoded to be 1. If in the future we remove those useless
+        # dimensions (unlikely), then the variables of interested would be 2D. So
+        # for futureproofing, we will just check all variables with more than 1 dimension.
+        if dset0[var].ndim > 1:
+            if var not in dset1.variables:
+                messages.append(var + " is MISSING")
+            else:
+                difference = compare_variable( dset0[var], dset1[var], full, memory_budget )
+                if difference is not None and full:
+                    messages.append(var + " is NON-ZERO: " + describe_difference(dset0[var], difference))
+                elif difference is not None:
+                    messages.append(var + " is NON-ZERO")
+    return messages
+
+def diff_files(file0, file1, full=False, memory_budget=MEMORY_BUDGET):
+    """
+    Returns the output of this script for two netCDF files, without exiting.
+    An empty string means the files are equal.
+    """
+    with netCDF4.Dataset(file0) as dset0, netCDF4.Dataset(file1) as dset1:
+        messages = find_differing_variables(dset0, dset1, full, memory_budget)
+    if len(messages) > 0:
+        messages.append("FAIL: There were some non-zero fields.")
+    return "\n".join(messages)
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a test')
+
+    parser.add_argument("files", nargs=2,
+                        help="need two files to diff")
+    parser.add_argument("-f", "--full", action="store_true",
+                        help="compare all values and report the number of differing points, the max abs diff " +
+                             "and the first differing index of every variable, instead of stopping at the first difference")
+    parser.add_argument("-m", "--memory-budget", type=int, default=MEMORY_BUDGET // (1024 * 1024),
+                        help="memory in MB the comparison of a variable may use (default: %(default)s)")
+
+    args = parser.parse_args()
+
+    # Loop through all variables in dataset, and make sure they are all completely 0
+    output = diff_files(args.files[0], args.files[1], args.full, args.memory_budget * 1024 * 1024)
+
+    if len(output) == 0:
+        sys.exit(0)
+    else:
+        print(output)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
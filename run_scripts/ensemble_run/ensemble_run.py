@@ -0,0 +1,321 @@
+#!/usr/bin/python3
+
+#=========================================================================================================
+# Description: Runs the members of an ensemble several at a time, and computes the ensemble mean and
+#              spread of their output as they finish. This replaces ensemble_run.bash, which runs the
+#              members one after the other in the shared CLUBB directories.
+#
+#              The members are the ensembles/ensemble* directories created by ensemble_setup.bash (any
+#              number of them), with the forcing files of the case (e.g. twp_ice_sounding.in,
+#              twp_ice_forcings.in and twp_ice_sfc.in). Every member runs in its own directory,
+#              WORK_DIR/ensemble##, with an input directory that links to the CLUBB input files except
+#              for the files of the member, so the members don't overwrite each other's input. CLUBB
+#              writes the netCDF output of a member to WORK_DIR/ensemble##/output.
+#
+#              clubb.in is the same for all members: the parameter, flags, model and stats files of the
+#              case, with the changes given with --set. As each member finishes, its output is added to
+#              a running mean and variance of every variable, so the output of the members is read
+#              only once. The mean and spread (standard deviation) are written to
+#              STATISTICS_DIR/CASE_ensemble_{zt,zm,sfc}.nc, as VARIABLE_mean and VARIABLE_spread.
+#              STATISTICS_DIR is the statistics directory next to this script by default, since
+#              create_output.bash takes every entry of output for a member.
+#
+# Usage:
+#
+#           ./ensemble_run.py --jobs 16
+#           ./ensemble_run.py --jobs 4 --members ensemble00 ensemble01 --set dt_main=60.0
+#=========================================================================================================
+
+import argparse
+import os
+import re
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+from netCDF4 import Dataset
+
+scriptPath = os.path.dirname(os.path.realpath(__file__))
+clubbPath = os.path.dirname(os.path.dirname(scriptPath))
+
+sys.path.insert(0, os.path.dirname(scriptPath))
+import clubb_namelist
+import runtime_history
+
+# Exit status of clubb_standalone when the run finished normally
+CLUBB_SUCCESS = 6
+
+# Output files of every member that are reduced
+SUFFIXES = ["zt", "zm", "sfc"]
+
+def find_members(ensembles_dir):
+    """
+    Returns the member directories (ensemble##, with any number of digits) in ensembles_dir,
+    sorted by member number
+    """
+    members = []
+    for name in os.listdir(ensembles_dir):
+        match = re.fullmatch(r"ensemble(\d+)", name)
+        if match and os.path.isdir(os.path.join(ensembles_dir, name)):
+            members.append((int(match.group(1)), name))
+    return [name for _, name in sorted(members)]
+
+def make_link(target, link_name):
+    if os.path.islink(link_name):
+        os.remove(link_name)
+    os.symlink(target, link_name)
+
+def prepare_member(member_dir, work_dir, namelist_text):
+    """
+    Creates the directory of a member: input links to the CLUBB input files, except for the files
+    in member_dir, which replace the ones in input/case_setups. Returns the directory to run CLUBB in.
+    """
+    input_dir = os.path.join(work_dir, "input")
+    case_setups = os.path.join(input_dir, "case_setups")
+    run_dir = os.path.join(work_dir, "run")
+    os.makedirs(case_setups, exist_ok=True)
+    os.makedirs(run_dir, exist_ok=True)
+    os.makedirs(os.path.join(work_dir, "output"), exist_ok=True)
+
+    for name in os.listdir(os.path.join(clubbPath, "input")):
+        if name != "case_setups":
+            make_link(os.path.join(clubbPath, "input", name), os.path.join(input_dir, name))
+    member_files = set(os.listdir(member_dir))
+    for name in os.listdir(os.path.join(clubbPath, "input", "case_setups")):
+        if name not in member_files:
+            make_link(os.path.join(clubbPath, "input", "case_setups", name), os.path.join(case_setups, name))
+    for name in member_files:
+        link_name = os.path.join(case_setups, name)
+        if os.path.islink(link_name):
+            os.remove(link_name)
+        shutil.copy(os.path.join(member_dir, name), link_name)
+
+    with open(os.path.join(run_dir, "clubb.in"), "w") as namelist_file:
+        namelist_file.write(namelist_text)
+    return run_dir
+
+def run_member(run_dir, executable):
+    """
+    Runs CLUBB for a member. Returns the exit code (0 if CLUBB finished normally), the wall time,
+    the CPU time and the peak RSS in kB.
+    """
+    with open(os.path.join(run_dir, "clubb.log"), "w") as log_file:
+        exit_code, wall_time, cpu_time, max_rss_kb = runtime_history.run_and_measure([executable], run_dir, log_file)
+    if exit_code == CLUBB_SUCCESS:
+        exit_code = 0
+    elif exit_code == 0:
+        exit_code = 1
+    return exit_code, wall_time, cpu_time, max_rss_kb
+
+class RunningStatistics:
+    """
+    Mean and variance of arrays added one at a time (Welford's algorithm)
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        self.count += 1
+        if self.mean is None:
+            self.mean = values.copy()
+            self.m2 = np.zeros_like(values)
+            return
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (values - self.mean)
+
+    def spread(self):
+        """
+        Returns the standard deviation of the members (0 with a single member)
+        """
+        if self.count < 2:
+            return np.zeros_like(self.mean)
+        return np.sqrt(self.m2 / (self.count - 1))
+
+class EnsembleReduction:
+    """
+    Running statistics of every variable of the output files of the members
+    """
+
+    def __init__(self, case, suffixes=SUFFIXES, variables=None):
+        self.case = case
+        self.suffixes = suffixes
+        self.variables = variables
+        self.statistics = {suffix: {} for suffix in suffixes}
+        self.templates = {}
+        self.members = []
+
+    def read_member(self, output_dir):
+        """
+        Returns the values of the variables in the output files of a member, by suffix
+        """
+        values = {}
+        for suffix in self.suffixes:
+            filename = os.path.join(output_dir, self.case + "_" + suffix + ".nc")
+            values[suffix] = {}
+            with Dataset(filename) as data:
+                for name, variable in data.variables.items():
+                    if name in data.dimensions or "time" not in variable.dimensions:
+                        continue
+                    if self.variables is not None and name not in self.variables:
+                        continue
+                    variable.set_auto_mask(False)
+                    values[suffix][name] = variable[:]
+        return values
+
+    def add_member(self, member, output_dir):
+        """
+        Adds the output of a member. Returns an error message if it can't be added
+        (e.g. the run stopped early), or None.
+        """
+        try:
+            values = self.read_member(output_dir)
+        except (OSError, KeyError) as error:
+            return str(error)
+        for suffix in self.suffixes:
+            for name, statistics in self.statistics[suffix].items():
+                if name not in values[suffix]:
+                    return name + " is not in the " + suffix + " output"
+                if values[suffix][name].shape != statistics.mean.shape:
+                    return "the " + suffix + " output has shape " + str(values[suffix][name].shape) + \
+                           " instead of " + str(statistics.mean.shape)
+        for suffix in self.suffixes:
+            self.templates.setdefault(suffix, os.path.join(output_dir, self.case + "_" + suffix + ".nc"))
+            for name, array in values[suffix].items():
+                if name in self.statistics[suffix] or len(self.members) == 0:
+                    self.statistics[suffix].setdefault(name, RunningStatistics()).add(array)
+        self.members.append(member)
+        return None
+
+    def write(self, statistics_dir):
+        """
+        Writes the mean and spread of the variables to CASE_ensemble_SUFFIX.nc, with the dimensions
+        of the output of the first member. Returns the file names.
+        """
+        filenames = []
+        for suffix in self.suffixes:
+            if suffix not in self.templates:
+                continue
+            filename = os.path.join(statistics_dir, self.case + "_ensemble_" + suffix + ".nc")
+            with Dataset(self.templates[suffix]) as source, Dataset(filename, "w") as target:
+                for name, dimension in source.dimensions.items():
+                    target.createDimension(name, None if dimension.isunlimited() else len(dimension))
+                for name in source.dimensions:
+                    if name in source.variables:
+                        copy_variable(source.variables[name], target, name, source.variables[name][:])
+                for name, statistics in self.statistics[suffix].items():
+                    copy_variable(source.variables[name], target, name + "_mean", statistics.mean)
+                    copy_variable(source.variables[name], target, name + "_spread", statistics.spread())
+                target.ensemble_members = " ".join(self.members)
+            filenames.append(filename)
+        return filenames
+
+def copy_variable(source_variable, target, name, values):
+    variable = target.createVariable(name, source_variable.dtype if name in target.dimensions else "f8",
+                                     source_variable.dimensions)
+    variable.setncatts({attribute: source_variable.getncattr(attribute) for attribute in source_variable.ncattrs()
+                        if attribute not in ("_FillValue", "missing_value")})
+    variable[:] = values
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the members of an ensemble in parallel and compute the "
+                                                 "ensemble mean and spread of their output")
+    parser.add_argument("-c", "--case", default="twp_ice", help="case name (default: %(default)s)")
+    parser.add_argument("--ensembles", default=os.path.join(scriptPath, "ensembles"),
+                        help="directory with the ensemble## member directories (default: %(default)s)")
+    parser.add_argument("--members", nargs="+", help="run only these members")
+    parser.add_argument("--work-dir", default=os.path.join(scriptPath, "output"),
+                        help="directory for the member directories (default: %(default)s)")
+    parser.add_argument("--statistics-dir", default=os.path.join(scriptPath, "statistics"),
+                        help="directory for the mean and spread, outside of WORK_DIR (default: %(default)s)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        help="number of members run at the same time (default: number of CPUs)")
+    parser.add_argument("--executable", default=os.path.join(clubbPath, "bin", "clubb_standalone"),
+                        help="CLUBB executable, e.g. a stub for testing (default: %(default)s)")
+    parser.add_argument("-p", "--parameter-file",
+                        default=os.path.join(clubbPath, "input", "tunable_parameters", "tunable_parameters.in"),
+                        help="tunable parameter file (default: %(default)s)")
+    parser.add_argument("-t", "--stats-file", default=os.path.join(clubbPath, "input", "stats", "standard_stats.in"),
+                        help="stats file (default: %(default)s)")
+    parser.add_argument("-s", "--set", action="append", default=[], metavar="VARIABLE=VALUE",
+                        help="set a namelist variable for all members, may be given several times")
+    parser.add_argument("-v", "--variables", nargs="+", help="only compute the statistics of these variables")
+    parser.add_argument("--history", metavar="DB", help="record the runs in this runtime history database "
+                                                        "(see runtime_history.py)")
+    args = parser.parse_args()
+
+    members = args.members if args.members else find_members(args.ensembles)
+    if len(members) == 0:
+        sys.exit("No ensemble members in " + args.ensembles)
+
+    # The namelist is the same for all members, the output has to be netCDF for the statistics
+    tunable_dir = os.path.join(clubbPath, "input", "tunable_parameters")
+    namelist = clubb_namelist.read_namelist(args.parameter_file,
+                                            os.path.join(tunable_dir, "silhs_parameters.in"),
+                                            os.path.join(tunable_dir, "configurable_model_flags.in"),
+                                            os.path.join(clubbPath, "input", "case_setups", args.case + "_model.in"),
+                                            args.stats_file)
+    try:
+        namelist.set("stats_fmt", clubb_namelist.quote("netcdf"))
+        for setting in args.set:
+            variable, _, value = setting.partition("=")
+            namelist.set(variable.strip(), value.strip())
+    except KeyError as error:
+        sys.exit(error.args[0])
+    namelist_text = namelist.to_string()
+
+    work_dir = os.path.abspath(args.work_dir)
+    statistics_dir = args.statistics_dir
+    run_dirs = {member: prepare_member(os.path.join(args.ensembles, member), os.path.join(work_dir, member),
+                                       namelist_text) for member in members}
+
+    history = None
+    if args.history:
+        history = runtime_history.open_history(args.history)
+        commit = runtime_history.current_commit()
+
+    print("Running " + str(len(members)) + " members, " + str(args.jobs) + " at a time\n")
+    reduction = EnsembleReduction(args.case, variables=args.variables)
+    failures = []
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = {executor.submit(run_member, run_dirs[member], os.path.abspath(args.executable)): member
+                   for member in members}
+        for count, future in enumerate(as_completed(futures), 1):
+            member = futures[future]
+            exit_code, wall_time, cpu_time, max_rss_kb = future.result()
+            output_dir = os.path.join(work_dir, member, "output")
+            if history is not None:
+                config = runtime_history.config_hash(os.path.join(run_dirs[member], "clubb.in"),
+                                                     *sorted(os.path.join(args.ensembles, member, name) for name in
+                                                             os.listdir(os.path.join(args.ensembles, member))))
+                runtime_history.record_run(history, "ensemble_run", args.case, config, exit_code, wall_time,
+                                           cpu_time, max_rss_kb, runtime_history.output_size(output_dir, args.case),
+                                           commit)
+            if exit_code != 0:
+                failures.append(member)
+                print("[%d/%d] %s failure in %.1f s, see %s" % (count, len(members), member, wall_time,
+                      os.path.join(run_dirs[member], "clubb.log")))
+                continue
+            error = reduction.add_member(member, output_dir)
+            if error is not None:
+                failures.append(member)
+                print("[%d/%d] %s left out of the statistics: %s" % (count, len(members), member, error))
+                continue
+            print("[%d/%d] %s ran to completion in %.1f s" % (count, len(members), member, wall_time))
+
+    if len(reduction.members) > 0:
+        os.makedirs(statistics_dir, exist_ok=True)
+        for filename in reduction.write(statistics_dir):
+            print("Wrote " + filename)
+    print("\n" + str(len(reduction.members)) + " of " + str(len(members)) + " members in the statistics")
+    if len(failures) > 0:
+        print("Failed: " + " ".join(sorted(failures, key=lambda member: (len(member), member))))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+
+#=========================================================================================================
+# Description: Comparison engine for the fields of two netcdf files, e.g. multicolumn standalone
+#              outputs compared by check_multicol_error.py.
+#
+#              Each pair of variables is read once, in chunks of timesteps that fit into a memory
+#              budget, and all statistics are accumulated in that single pass: max/total/average
+#              absolute difference, max % difference, the index of the max absolute difference and
+#              the max absolute difference of every timestep.
+#
+# Usage:
+#
+#           import netCDF4
+#           from field_diff_stats import compare_fields
+#
+#           with netCDF4.Dataset(file0) as dset0, netCDF4.Dataset(file1) as dset1:
+#               for stats in compare_fields(dset0, dset1, ndim=3):
+#                   print(stats.var, stats.max_abs_diff, stats.index_of_max_abs_diff)
+#=========================================================================================================
+
+import numpy as np
+
+from diff_netcdf_outputs import MEMORY_BUDGET, chunk_records
+
+# Threshold used to ignore field values for calculating % diff
+FIELD_THRESHOLD = 1.0e-7
+
+# Upper bound the fields are clipped to for calculating % diff
+FIELD_MAX = 9999999.0
+
+class FieldDiffStats:
+    """
+    Differences between two versions of a field, accumulated chunk by chunk along the time dimension
+    """
+
+    def __init__(self, var, shape, field_threshold=FIELD_THRESHOLD):
+        self.var = var
+        self.shape = shape
+        self.field_threshold = field_threshold
+        self.max_abs_diff = 0.0
+        self.max_percent_diff = -np.inf
+        self.total_abs_diff = 0.0
+        self.index_of_max_abs_diff = None
+        self.timestep_max_abs_diff = np.zeros(shape[0])
+
+    @property
+    def avg_abs_diff(self):
+        return self.total_abs_diff / max(1, int(np.prod(self.shape)))
+
+    def update(self, values0, values1, start):
+        """
+        Adds the differences of the timesteps start, start+1, ... stored in values0 and values1
+        """
+        values0 = values0.astype(np.float64)
+        values1 = values1.astype(np.float64)
+        abs_diff = np.abs( values0 - values1 )
+
+        # NaNs at the same position are equal, like in diff_netcdf_outputs.py
+        both_nan = np.isnan(values0) & np.isnan(values1)
+        abs_diff[both_nan] = 0.0
+
+        # Clip fields to ignore tiny values for the % diff, 100 * (a-b) / ((a+b)/2)
+        field_0_clipped = np.clip( values0, a_min = self.field_threshold, a_max = FIELD_MAX )
+        field_1_clipped = np.clip( values1, a_min = self.field_threshold, a_max = FIELD_MAX )
+        percent_diff = 200.0 * ( field_0_clipped-field_1_clipped ) / ( field_0_clipped+field_1_clipped )
+        percent_diff[both_nan] = 0.0
+
+        self.max_percent_diff = float(np.max([self.max_percent_diff, np.max(percent_diff)]))
+        self.total_abs_diff += float(np.sum(abs_diff))
+
+        timestep_max = np.max(abs_diff.reshape(abs_diff.shape[0], -1), axis=1)
+        self.timestep_max_abs_diff[start:start+len(timestep_max)] = timestep_max
+
+        # Keep the first index of the max, like the first entry of np.where(abs_diff == max).
+        # A NaN is the max, so that it shows up in the results.
+        max_index = int(np.argmax(abs_diff))
+        chunk_max = float(abs_diff.flat[max_index])
+        if ( self.index_of_max_abs_diff is None or chunk_max > self.max_abs_diff
+             or ( np.isnan(chunk_max) and not np.isnan(self.max_abs_diff) ) ):
+            self.max_abs_diff = chunk_max
+            index = np.unravel_index(max_index, abs_diff.shape)
+            self.index_of_max_abs_diff = (int(index[0]) + start,) + tuple(int(i) for i in index[1:])
+
+    def as_dict(self):
+        return {"var": self.var,
+                "max_abs_diff": self.max_abs_diff,
+                "max_percent_diff": self.max_percent_diff,
+                "total_abs_diff": self.total_abs_diff,
+                "avg_abs_diff": self.avg_abs_diff,
+                "index_of_max_abs_diff": self.index_of_max_abs_diff,
+                "timestep_max_abs_diff": self.timestep_max_abs_diff.tolist()}
+
+def compare_fields(dset0, dset1, ndim=3, field_threshold=FIELD_THRESHOLD, memory_budget=MEMORY_BUDGET):
+    """
+    Compares all variables of dset0 with ndim dimensions to the same variables in dset1.
+    Returns a list of FieldDiffStats, in the order of the variables in dset0.
+    """
+    all_stats = []
+    for var in dset0.variables:
+        if dset0[var].ndim != ndim or dset0[var].shape[0] == 0:
+            continue
+        if dset0[var].shape != dset1[var].shape:
+            raise ValueError("Shapes of " + var + " differ: " + str(dset0[var].shape) + " and " + str(dset1[var].shape))
+
+        var0 = dset0[var]
+        var1 = dset1[var]
+        var0.set_auto_mask(False)
+        var1.set_auto_mask(False)
+
+        stats = FieldDiffStats(var, var0.shape, field_threshold)
+        num_records = chunk_records(var0, memory_budget)
+        for start in range(0, var0.shape[0], num_records):
+            stats.update(var0[start:start+num_records], var1[start:start+num_records], start)
+        all_stats.append(stats)
+    return all_stats
@@ -0,0 +1,310 @@
+#!/usr/bin/python3
+
+#=========================================================================================================
+# Description: Stores fingerprints of a reference run in a small sqlite database, so that new runs can
+#              be checked without keeping the reference output directory.
+#
+#              For every case, file (zt, zm, sfc, ...) and variable with more than 1 dimension, the
+#              fingerprint is an exact hash of the values plus summary statistics: min, max, L1, L2 and
+#              max norm and the time-integral (sum over all output times) at each level. Each variable
+#              is read once, in chunks of time records that fit into the memory budget.
+#
+#              Baselines are stored under a configuration name, e.g. one per compiler, so the
+#              baselines of many configurations can be kept in one database.
+#
+#              check compares a run with a baseline. By default the hashes have to match, which
+#              is the same test as run_bindiff_all.py. With --tolerance, the statistics have to match
+#              within a relative tolerance instead.
+#
+# Usage:
+#
+#           ./output_fingerprints.py record baselines.db ../output --config gfortran_debug
+#           ./output_fingerprints.py check baselines.db ../output --config gfortran_debug
+#           ./output_fingerprints.py check baselines.db ../output --config gfortran_debug --tolerance 1e-6
+#=========================================================================================================
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import netCDF4
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+from diff_netcdf_outputs import MEMORY_BUDGET, chunk_records
+
+# Statistics compared in tolerance mode, in the order of the columns of the fingerprints table
+STATISTICS = ["minimum", "maximum", "l1_norm", "l2_norm", "max_norm"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS baselines (
+    config TEXT PRIMARY KEY,
+    source TEXT,
+    created TEXT
+);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    config TEXT NOT NULL,
+    case_name TEXT NOT NULL,
+    file TEXT NOT NULL,
+    variable TEXT NOT NULL,
+    shape TEXT NOT NULL,
+    dtype TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    nan_count INTEGER,
+    minimum REAL,
+    maximum REAL,
+    l1_norm REAL,
+    l2_norm REAL,
+    max_norm REAL,
+    level_integrals BLOB,
+    PRIMARY KEY (config, case_name, file, variable)
+);
+"""
+
+def open_database(db_path):
+    """
+    Opens (and creates if needed) a fingerprint database
+    """
+    connection = sqlite3.connect(db_path)
+    connection.executescript(SCHEMA)
+    return connection
+
+def split_output_name(filename):
+    """
+    Returns the case name and the file type of an output file, e.g. ("dycoms2_rf01", "zt")
+    for dycoms2_rf01_zt.nc
+    """
+    case_name, _, file_type = os.path.splitext(filename)[0].rpartition("_")
+    return case_name, file_type
+
+def find_output_files(output_dir):
+    """
+    Returns the netcdf files in an output directory, sorted by name
+    """
+    return sorted(filename for filename in os.listdir(output_dir) if filename.endswith(".nc"))
+
+def fingerprint_variable(var, memory_budget=MEMORY_BUDGET):
+    """
+    Returns the fingerprint of a netCDF variable, reading it once in chunks of time records.
+    The statistics ignore NaNs, which are counted instead. They are None for non-numeric
+    variables and for variables that are all NaN.
+    """
+    var.set_auto_mask(False)
+    hasher = hashlib.blake2b(digest_size=16)
+    numeric = var.dtype.kind in "fiu"
+
+    nan_count = 0
+    minimum = np.inf
+    maximum = -np.inf
+    l1_norm = 0.0
+    sum_of_squares = 0.0
+    level_integrals = np.zeros(var.shape[1]) if numeric else None
+
+    num_records = chunk_records(var, memory_budget)
+    for start in range(0, var.shape[0], num_records):
+        values = np.ascontiguousarray(var[start:start+num_records])
+        hasher.update(memoryview(values).cast("B"))
+        if not numeric:
+            continue
+
+        values = values.astype(np.float64)
+        nans = np.isnan(values)
+        if np.any(nans):
+            nan_count += int(np.count_nonzero(nans))
+            values = np.where(nans, 0.0, values)
+            finite = values[~nans]
+        else:
+            finite = values
+        if finite.size > 0:
+            minimum = np.minimum(minimum, np.min(finite))
+            maximum = np.maximum(maximum, np.max(finite))
+        l1_norm += float(np.sum(np.abs(values)))
+        sum_of_squares += float(np.sum(values * values))
+
+        # Sum over time and over the horizontal dimensions, leaving one value per level
+        level_integrals += np.sum(values.reshape(values.shape[0], values.shape[1], -1), axis=(0, 2))
+
+    fingerprint = {"shape": json.dumps(list(var.shape)),
+                   "dtype": var.dtype.str,
+                   "hash": hasher.hexdigest(),
+                   "nan_count": nan_count,
+                   "minimum": None, "maximum": None, "l1_norm": None, "l2_norm": None, "max_norm": None,
+                   "level_integrals": None}
+    if numeric and np.isfinite(minimum):
+        fingerprint.update({"minimum": float(minimum),
+                            "maximum": float(maximum),
+                            "l1_norm": l1_norm,
+                            "l2_norm": float(np.sqrt(sum_of_squares)),
+                            "max_norm": float(np.maximum(abs(minimum), abs(maximum))),
+                            "level_integrals": level_integrals})
+    return fingerprint
+
+def fingerprint_file(path, memory_budget=MEMORY_BUDGET):
+    """
+    Returns the fingerprints of all variables with more than 1 dimension in a netCDF file,
+    as a dictionary from variable name to fingerprint
+    """
+    fingerprints = {}
+    with netCDF4.Dataset(path) as dset:
+        for var in dset.variables:
+            if dset[var].ndim > 1:
+                fingerprints[var] = fingerprint_variable(dset[var], memory_budget)
+    return fingerprints
+
+def record_baseline(connection, config, output_dir, memory_budget=MEMORY_BUDGET):
+    """
+    Stores the fingerprints of all output files in output_dir as the baseline of config,
+    replacing an existing baseline of that name. Returns the number of variables stored.
+    """
+    count = 0
+    with connection:
+        connection.execute("DELETE FROM fingerprints WHERE config = ?", (config,))
+        connection.execute("INSERT OR REPLACE INTO baselines VALUES (?, ?, ?)",
+                           (config, os.path.abspath(output_dir), time.strftime("%Y-%m-%d %H:%M:%S")))
+        for filename in find_output_files(output_dir):
+            case_name, file_type = split_output_name(filename)
+            for var, fingerprint in fingerprint_file(os.path.join(output_dir, filename), memory_budget).items():
+                level_integrals = fingerprint["level_integrals"]
+                connection.execute("INSERT INTO fingerprints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   (config, case_name, file_type, var, fingerprint["shape"], fingerprint["dtype"],
+                                    fingerprint["hash"], fingerprint["nan_count"],
+                                    *[fingerprint[statistic] for statistic in STATISTICS],
+                                    None if level_integrals is None else level_integrals.tobytes()))
+                count += 1
+    return count
+
+def load_baseline(connection, config):
+    """
+    Returns the fingerprints of a baseline as a dictionary from (case, file) to a dictionary
+    from variable name to fingerprint. Raises a ValueError if there is no such baseline.
+    """
+    if connection.execute("SELECT 1 FROM baselines WHERE config = ?", (config,)).fetchone() is None:
+        raise ValueError("There is no baseline called " + config)
+    columns = ["shape", "dtype", "hash", "nan_count"] + STATISTICS + ["level_integrals"]
+    baseline = {}
+    for row in connection.execute("SELECT case_name, file, variable, " + ", ".join(columns) +
+                                  " FROM fingerprints WHERE config = ?", (config,)):
+        fingerprint = dict(zip(columns, row[3:]))
+        if fingerprint["level_integrals"] is not None:
+            fingerprint["level_integrals"] = np.frombuffer(fingerprint["level_integrals"], dtype=np.float64)
+        baseline.setdefault((row[0], row[1]), {})[row[2]] = fingerprint
+    return baseline
+
+def relative_difference(reference, value):
+    """
+    Returns the largest relative difference of value from reference. Where the reference
+    is zero, the absolute difference is used.
+    """
+    reference = np.asarray(reference, dtype=np.float64)
+    difference = np.abs(np.asarray(value, dtype=np.float64) - reference)
+    scale = np.where(reference == 0.0, 1.0, np.abs(reference))
+    return float(np.max(difference / scale)) if difference.size > 0 else 0.0
+
+def compare_fingerprints(reference, fingerprint, tolerance=None):
+    """
+    Returns None if a fingerprint matches the reference, else a message saying how it differs.
+    Without a tolerance, the hashes have to be equal. With a tolerance, the NaN count has to be
+    equal and the statistics have to be within the relative tolerance.
+    """
+    if reference["shape"] != fingerprint["shape"]:
+        return "shape " + reference["shape"] + " != " + fingerprint["shape"]
+    if tolerance is None:
+        if reference["dtype"] != fingerprint["dtype"] or reference["hash"] != fingerprint["hash"]:
+            return "hash differs"
+        return None
+
+    if reference["nan_count"] != fingerprint["nan_count"]:
+        return "number of NaNs " + str(reference["nan_count"]) + " != " + str(fingerprint["nan_count"])
+    if (reference["minimum"] is None) != (fingerprint["minimum"] is None):
+        return "statistics are missing in one run"
+    if reference["minimum"] is None:
+        return None if reference["hash"] == fingerprint["hash"] else "hash differs"
+
+    differences = {statistic: relative_difference(reference[statistic], fingerprint[statistic])
+                   for statistic in STATISTICS}
+    differences["level_integrals"] = relative_difference(reference["level_integrals"], fingerprint["level_integrals"])
+    worst = max(differences, key=differences.get)
+    if differences[worst] > tolerance:
+        return "relative difference of " + worst + " is " + "%e" % differences[worst]
+    return None
+
+def check_run(connection, config, output_dir, tolerance=None, memory_budget=MEMORY_BUDGET):
+    """
+    Checks the output files of a run against the baseline of config, reading every file once.
+    Returns a list of dicts {case, file, variable, message} for all variables that differ or
+    are missing from the run, so an empty list means the run matches the baseline.
+    """
+    baseline = load_baseline(connection, config)
+    output_files = {split_output_name(filename): filename for filename in find_output_files(output_dir)}
+
+    differences = []
+    for (case_name, file_type), reference_file in sorted(baseline.items()):
+        if (case_name, file_type) not in output_files:
+            differences.append({"case": case_name, "file": file_type, "variable": None, "message": "file is MISSING"})
+            continue
+        fingerprints = fingerprint_file(os.path.join(output_dir, output_files[(case_name, file_type)]), memory_budget)
+        for var, reference in reference_file.items():
+            if var not in fingerprints:
+                message = "is MISSING"
+            else:
+                message = compare_fingerprints(reference, fingerprints[var], tolerance)
+            if message is not None:
+                differences.append({"case": case_name, "file": file_type, "variable": var, "message": message})
+    return differences
+
+def main():
+    parser = argparse.ArgumentParser(description="Record and check fingerprints of CLUBB output")
+    parser.add_argument("action", choices=["record", "check"],
+                        help="record a baseline from a reference run, or check a run against a baseline")
+    parser.add_argument("database", help="sqlite database of the baselines, created if needed")
+    parser.add_argument("output_dir", help="clubb output directory")
+    parser.add_argument("-c", "--config", default="default",
+                        help="name of the baseline, e.g. the compiler and configuration (default: %(default)s)")
+    parser.add_argument("-t", "--tolerance", type=float,
+                        help="compare the statistics within this relative tolerance instead of the hashes")
+    parser.add_argument("-m", "--memory-budget", type=int, default=MEMORY_BUDGET // (1024 * 1024),
+                        help="memory in MB the fingerprint of a variable may use (default: %(default)s)")
+    parser.add_argument("-s", "--summary", metavar="FILE",
+                        help="write the differences found by check to this JSON file")
+
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.output_dir):
+        print("Chosen directory does not exist. Please input a valid directory")
+        sys.exit(1)
+
+    memory_budget = args.memory_budget * 1024 * 1024
+    connection = open_database(args.database)
+
+    if args.action == "record":
+        count = record_baseline(connection, args.config, args.output_dir, memory_budget)
+        print("Recorded " + str(count) + " variables as baseline " + args.config)
+        sys.exit(0)
+
+    try:
+        differences = check_run(connection, args.config, args.output_dir, args.tolerance, memory_budget)
+    except ValueError as error:
+        print(error)
+        sys.exit(1)
+
+    if args.summary:
+        with open(args.summary, "w") as summary_file:
+            json.dump(differences, summary_file, indent=2)
+
+    for difference in differences:
+        name = difference["case"] + "_" + difference["file"]
+        if difference["variable"] is not None:
+            name += " " + difference["variable"]
+        print(name + " " + difference["message"])
+
+    if len(differences) > 0:
+        print("\nThere were differences from baseline " + args.config + ".")
+        sys.exit(1)
+    print("No differences from baseline " + args.config + ".")
+
+if __name__ == "__main__":
+    main()
@@ -4,15 +4,26 @@ import netCDF4
 import argparse
 import sys
 import os
-import subprocess
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
 
 scriptPath = os.path.realpath(__file__)[0:-18]
 #print(scriptPath)
 
+sys.path.insert(0, scriptPath)
+from diff_netcdf_outputs import diff_files
+
+# Size of the sequential reads used to checksum the output files
+READ_SIZE = 16 * 1024 * 1024
+
 def main():
 
     parser = argparse.ArgumentParser()
     parser.add_argument("-o", "--output", action="store_true", help="add this option if you want to get output for each file compared put into a file made in the cwd.")
+    parser.add_argument("-j", "--threads", type=int, default=8, help="number of threads used to checksum the files (default: 8)")
+    parser.add_argument("-f", "--full", action="store_true", help="report the number of differing points, the max abs diff and the first differing index of every differing field")
+    parser.add_argument("-s", "--summary", metavar="FILE", help="also write the summary of all compared files to this JSON file")
     parser.add_argument("dirs", nargs=2, help="need 2 clubb output directories to diff. Usage: python run_bindiff_all.py dir_path1 dir_path2")
 
     args = parser.parse_args()
@@ -26,9 +37,14 @@ def main():
         dir2_files = os.listdir(args.dirs[1])
         #print(dir1_files, dir2_files)
         cases = get_cases(dir1_files, dir2_files)
-        diffs = run_diff(cases, args.dirs[0], args.dirs[1])
+        summary = run_diff(cases, args.dirs[0], args.dirs[1], args.threads)
         
-        diff_in_files = run_py_diff(diffs, args.dirs[0], args.dirs[1],args.output)
+        diff_in_files = run_py_diff(summary, args.dirs[0], args.dirs[1],args.output, args.full)
+
+        print_summary(summary)
+        if(args.summary):
+            with open(args.summary, "w") as summary_file:
+                json.dump(summary, summary_file, indent=2)
 
         if(args.output and diff_in_files):
             print("\nOutput files made and placed in " + os.getcwd())
@@ -59,27 +75,53 @@ def get_cases(dir1_files, dir2_files):
     return cases
 
 
-def run_diff(cases, dir1_path, dir2_path):
-    diff_list = []
+def checksum(path):
+    # Checksums a file with large sequential reads. hashlib releases the GIL while hashing,
+    # so several files are read and hashed in parallel by the thread pool.
+    file_hash = hashlib.blake2b()
+    buffer = bytearray(READ_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as file:
+        while True:
+            num_read = file.readinto(buffer)
+            if not num_read:
+                break
+            file_hash.update(view[:num_read])
+    return file_hash.hexdigest()
+
+def run_diff(cases, dir1_path, dir2_path, num_threads):
+    summary = []
     nc_data_formats = ["_zm.nc", "_zt.nc", "_sfc.nc"]
-#This for loop runs through all the cases you have the files to check, and each netcdf format. It runs the linux diff on the bonary netcdf files to see which files are needed to be sent through the diff_netcdf_outputs.py script.
-    for case in cases:
-        print("DIFFING " + case + " netCDF (*.nc) files")
-        for out_form in nc_data_formats:
+#This for loop runs through all the cases you have the files to check, and each netcdf format. It checksums the binary netcdf files to see which files are needed to be compared by the diff_netcdf_outputs.py script. Files with different sizes can't be identical and are not checksummed.
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        for case in cases:
+            for out_form in nc_data_formats:
+                file_summary = {"case": case, "file": case + out_form, "binary_identical": False, "differences": []}
+                path1 = os.path.join(dir1_path, case + out_form)
+                path2 = os.path.join(dir2_path, case + out_form)
+                if(os.path.getsize(path1) == os.path.getsize(path2)):
+                    file_summary["checksums"] = (executor.submit(checksum, path1), executor.submit(checksum, path2))
+                summary.append(file_summary)
 
-            if(len(subprocess.getoutput("diff " + dir1_path + "/" + case + out_form + " " + dir2_path + "/" + case + out_form)) > 0):
-                diff_list.append(case + out_form)
-    return diff_list
+        for file_summary in summary:
+            if(file_summary["file"].endswith(nc_data_formats[0])):
+                print("DIFFING " + file_summary["case"] + " netCDF (*.nc) files")
+            if("checksums" in file_summary):
+                checksums = file_summary.pop("checksums")
+                file_summary["binary_identical"] = checksums[0].result() == checksums[1].result()
+    return summary
 
-def run_py_diff(diff_list, dir1_path, dir2_path, make_out_files):
+def run_py_diff(summary, dir1_path, dir2_path, make_out_files, full=False):
+    # Only the files whose checksums differ are decoded, all in this process
     diff_in_files = False
-    for test_file in diff_list:
-        #print("DIFFING " + test_file + "netCDF (*.nc) files")
-        #print(dir1_path + test_file)
-        #print(dir2_path + test_file)
-        output = subprocess.getoutput("python " + scriptPath + "diff_netcdf_outputs.py " + dir1_path + test_file + " " + dir2_path + test_file)
+    for file_summary in summary:
+        if(file_summary["binary_identical"]):
+            continue
+        test_file = file_summary["file"]
+        output = diff_files(os.path.join(dir1_path, test_file), os.path.join(dir2_path, test_file), full)
         if(len(output) > 0):
             diff_in_files = True
+            file_summary["differences"] = output.split("\n")[:-1]
             print("*** Differences detected in " + test_file + "! ***")
             if(make_out_files):
                 f = open(test_file+"-diff_out", "w")
@@ -87,6 +129,15 @@ def run_py_diff(diff_list, dir1_path, dir2_path, make_out_files):
                 f.close()
     return diff_in_files
 
+def print_summary(summary):
+    num_identical = len([file_summary for file_summary in summary if file_summary["binary_identical"]])
+    differing = [file_summary for file_summary in summary if len(file_summary["differences"]) > 0]
+    print("\nSUMMARY: " + str(len(summary)) + " files compared, " + str(num_identical) + " bit-for-bit identical, "
+          + str(len(summary) - num_identical - len(differing)) + " with identical fields, " + str(len(differing)) + " differing")
+    for file_summary in differing:
+        print("  " + file_summary["file"] + ": " + str(len(file_summary["differences"])) + " differing fields ("
+              + ", ".join([message.split(" ")[0] for message in file_summary["differences"]]) + ")")
+
 
 if __name__ == "__main__":
     main()
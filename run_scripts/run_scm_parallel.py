@@ -0,0 +1,257 @@
+#!/usr/bin/python3
+
+#=========================================================================================================
+# Description: Runs the cases in RUN_CASES like run_scm_all.bash, but several cases at a time.
+#
+#              clubb_standalone is not parallel, so the cases are run on a pool of processes. Every
+#              case runs run_scm.bash in its own directory (WORK_DIR/case), so the namelists and clubb.in
+#              of different cases don't collide. WORK_DIR contains links to the input and bin directories
+#              of CLUBB and to the output directory, so the relative paths in the namelists still work.
+#
+#              The cases are started longest first, using the wall times of the previous run from the
+#              summary file (cases without a wall time are started first). The exit code and wall time of
+#              every case are written to the JSON summary, which orders the next run.
+#
+#              With --history DB, every case run is also recorded in a runtime_history.py database
+#              (with CPU time, peak memory and output size), and the cases are ordered by the wall times
+#              recorded there.
+#
+#              Options that aren't listed below are passed on to run_scm.bash, except --grads, which
+#              edits the shared model files. Arguments that are neither options nor their values are
+#              rejected. As in run_scm_all.bash, -j means --min-cases; the number of jobs is --jobs.
+#              Use --executable to run a stub instead of clubb_standalone.
+#
+# Usage:
+#
+#           ./run_scm_parallel.py --jobs 16 -c
+#           ./run_scm_parallel.py --jobs 4 --executable ./stub_clubb.bash --summary test_summary.json
+#=========================================================================================================
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+import runtime_history
+
+scriptPath = os.path.dirname(os.path.realpath(__file__))
+clubbPath = os.path.dirname(scriptPath)
+
+# The cases that take the longest to run, left out with --short-cases
+LONG_CASES = ["gabls2", "cgils_s6", "cgils_s11", "cgils_s12",
+              "cloud_feedback_s6", "cloud_feedback_s11", "cloud_feedback_s12", "twp_ice"]
+
+# The cases run with --priority-cases
+PRIORITY_CASES = ["arm", "atex", "bomex", "dycoms2_rf01", "dycoms2_rf01_fixed_sst", "dycoms2_rf02_ds",
+                  "dycoms2_rf02_nd", "mpace_b", "rico", "wangara", "arm_97", "cgils_s6", "cgils_s11",
+                  "cgils_s12", "gabls3_night", "lba", "twp_ice"]
+
+# The cases run with --min-cases
+MIN_CASES = ["arm", "atex", "bomex", "dycoms2_rf01", "dycoms2_rf02_ds", "rico", "wangara", "arm_97",
+             "gabls3_night", "lba", "twp_ice"]
+
+# The options of run_scm.bash that take a value as the next argument
+RUN_SCM_VALUE_OPTIONS = ["-z", "--zt_grid", "-m", "--zm_grid", "-l", "--levels", "-t", "--timestep_test",
+                         "-s", "--stats", "-p", "--parameter_file"]
+
+def find_stray_arguments(options):
+    """
+    Returns the options passed on to run_scm.bash that are neither an option nor the value of an option,
+    e.g. the 8 of "-j 8", where -j means --min-cases like in run_scm_all.bash
+    """
+    stray_arguments = []
+    for i, option in enumerate(options):
+        if not option.startswith("-") and (i == 0 or options[i - 1] not in RUN_SCM_VALUE_OPTIONS):
+            stray_arguments.append(option)
+    return stray_arguments
+
+def read_run_cases(filename, short_cases=False, priority_cases=False, min_cases=False):
+    """
+    Returns the cases in a RUN_CASES file, filtered like in run_scm_all.bash
+    """
+    cases = []
+    with open(filename) as run_cases:
+        for line in run_cases:
+            case = line.strip()
+            if case == "" or case.startswith("!"):
+                continue
+            if short_cases and case in LONG_CASES:
+                continue
+            if priority_cases and case not in PRIORITY_CASES:
+                continue
+            if min_cases and case not in MIN_CASES:
+                continue
+            cases.append(case)
+    return cases
+
+def read_wall_times(summary_filename):
+    """
+    Returns the wall times of the cases that succeeded in a previous summary, as a dictionary
+    """
+    if summary_filename is None or not os.path.exists(summary_filename):
+        return {}
+    with open(summary_filename) as summary_file:
+        summary = json.load(summary_file)
+    return {result["case"]: result["wall_time"] for result in summary["cases"] if result["exit_code"] == 0}
+
+def order_longest_first(cases, wall_times):
+    """
+    Sorts cases by their wall time, longest first. Cases without a wall time go first,
+    since they may be long.
+    """
+    return sorted(cases, key=lambda case: -wall_times.get(case, float("inf")))
+
+def make_link(target, link_name):
+    if os.path.islink(link_name):
+        os.remove(link_name)
+    os.symlink(target, link_name)
+
+def prepare_work_dir(work_dir, output_dir, executable):
+    """
+    Creates the links to input, bin/clubb_standalone and output in the working directory
+    """
+    os.makedirs(os.path.join(work_dir, "bin"), exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+    make_link(os.path.join(clubbPath, "input"), os.path.join(work_dir, "input"))
+    make_link(os.path.abspath(output_dir), os.path.join(work_dir, "output"))
+    make_link(os.path.abspath(executable), os.path.join(work_dir, "bin", "clubb_standalone"))
+
+def run_case(case, work_dir, options):
+    """
+    Runs run_scm.bash for a case in its own directory.
+    Returns the exit code, the wall time, the CPU time and the peak RSS in kB.
+    """
+    case_dir = os.path.join(work_dir, case)
+    os.makedirs(case_dir, exist_ok=True)
+
+    # run_scm.bash changes to the directory it is called from, so it's called through a link
+    make_link(os.path.join(scriptPath, "run_scm.bash"), os.path.join(case_dir, "run_scm.bash"))
+
+    with open(os.path.join(case_dir, "run.log"), "w") as log_file:
+        return runtime_history.run_and_measure(["bash", os.path.join(case_dir, "run_scm.bash")] + options + [case],
+                                               case_dir, log_file)
+
+def prepare_nightly():
+    """
+    Moves the files of the last nightly run from CLUBB_current to CLUBB_previous, like run_scm_all.bash
+    """
+    output_dir = os.environ.get("nightlyOut", "")
+    current = os.path.join(output_dir, "CLUBB_current")
+    previous = os.path.join(output_dir, "CLUBB_previous")
+    os.makedirs(current, exist_ok=True)
+    os.makedirs(previous, exist_ok=True)
+    for filename in glob.glob(os.path.join(previous, "*")):
+        os.remove(filename)
+    for extension in ["ctl", "dat", "nc", "txt"]:
+        for filename in glob.glob(os.path.join(current, "*." + extension)):
+            shutil.move(filename, previous)
+
+def run_cases(cases, work_dir, options, jobs, history=None):
+    """
+    Runs the cases on a pool of jobs processes, in the given order. If history is a runtime
+    history database connection, the runs are recorded in it.
+    Returns the list of results {case, exit_code, wall_time, cpu_time, max_rss_kb}, in the order
+    the cases finished.
+    """
+    results = []
+    commit = runtime_history.current_commit() if history is not None else None
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = {executor.submit(run_case, case, work_dir, options): case for case in cases}
+        for future in as_completed(futures):
+            case = futures[future]
+            exit_code, wall_time, cpu_time, max_rss_kb = future.result()
+            results.append({"case": case, "exit_code": exit_code, "wall_time": round(wall_time, 2),
+                            "cpu_time": round(cpu_time, 2), "max_rss_kb": max_rss_kb})
+            if history is not None:
+                model_file = os.path.join(clubbPath, "input", "case_setups", case + "_model.in")
+                runtime_history.record_run(history, "run_scm_parallel", case,
+                                           runtime_history.config_hash(" ".join(options), model_file),
+                                           exit_code, wall_time, cpu_time, max_rss_kb,
+                                           runtime_history.output_size(os.path.join(work_dir, "output"), case),
+                                           commit)
+            print(case + (" ran to completion" if exit_code == 0 else " failure") + " in %.1f s" % wall_time)
+            if exit_code != 0:
+                with open(os.path.join(work_dir, case, "run.log")) as log_file:
+                    print("".join(log_file.readlines()[-10:]))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the cases in RUN_CASES in parallel. Options not listed here are "
+                                                 "passed on to run_scm.bash.")
+    parser.add_argument("-n", "--nightly", action="store_true", help="run in nightly mode")
+    parser.add_argument("-c", "--short-cases", action="store_true",
+                        help="omit the longest cases: " + ", ".join(LONG_CASES))
+    parser.add_argument("-i", "--priority-cases", action="store_true", help="only run the priority cases")
+    parser.add_argument("-j", "--min-cases", action="store_true",
+                        help="only run a minimal set of cases, like in run_scm_all.bash (the number of jobs is "
+                             "given with --jobs)")
+    parser.add_argument("-o", "--output_directory", default=os.path.join(clubbPath, "output"),
+                        help="directory for the output (default: %(default)s)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        help="number of cases run at the same time (default: number of CPUs)")
+    parser.add_argument("--cases", nargs="+", help="run these cases instead of the ones in RUN_CASES")
+    parser.add_argument("--run-cases", default=os.path.join(scriptPath, "RUN_CASES"),
+                        help="file with the cases to run (default: %(default)s)")
+    parser.add_argument("--work-dir", default=os.path.join(clubbPath, "scm_runs"),
+                        help="directory for the case directories (default: %(default)s)")
+    parser.add_argument("--executable", default=os.path.join(clubbPath, "bin", "clubb_standalone"),
+                        help="CLUBB executable, e.g. a stub for testing (default: %(default)s)")
+    parser.add_argument("--summary", help="JSON summary of the exit codes and wall times, also used to order the "
+                                          "cases (default: WORK_DIR/summary.json)")
+    parser.add_argument("--history", metavar="DB", help="record the runs in this runtime history database (see "
+                                                        "runtime_history.py) and use it to order the cases")
+
+    args, options = parser.parse_known_args()
+
+    stray_arguments = find_stray_arguments(options)
+    if len(stray_arguments) > 0:
+        parser.error("unrecognized arguments: " + " ".join(stray_arguments) +
+                     " (-j means --min-cases, the number of jobs is given with --jobs)")
+
+    if "--grads" in options:
+        sys.exit("--grads edits the shared model files and can't be used with parallel runs")
+    if args.nightly:
+        options = ["--nightly"] + options
+        prepare_nightly()
+
+    if args.cases:
+        cases = args.cases
+    else:
+        cases = read_run_cases(args.run_cases, args.short_cases, args.priority_cases, args.min_cases)
+
+    work_dir = os.path.abspath(args.work_dir)
+    summary_filename = args.summary if args.summary else os.path.join(work_dir, "summary.json")
+    wall_times = read_wall_times(summary_filename)
+    history = None
+    if args.history:
+        history = runtime_history.open_history(args.history)
+        wall_times.update(runtime_history.wall_time_hints(history, cases, runner="run_scm_parallel"))
+    cases = order_longest_first(cases, wall_times)
+
+    prepare_work_dir(work_dir, args.output_directory, args.executable)
+
+    print("Running " + str(len(cases)) + " cases, " + str(args.jobs) + " at a time\n")
+    start = time.time()
+    results = run_cases(cases, work_dir, options, args.jobs, history)
+    wall_time = time.time() - start
+
+    with open(summary_filename, "w") as summary_file:
+        json.dump({"jobs": args.jobs, "wall_time": round(wall_time, 2), "options": options,
+                   "cases": sorted(results, key=lambda result: result["case"])}, summary_file, indent=2)
+
+    failures = sorted(result["case"] for result in results if result["exit_code"] != 0)
+    for case in failures:
+        print(case + " failure")
+    print("\nRan " + str(len(cases)) + " cases in %.1f s, summary in %s" % (wall_time, summary_filename))
+
+    if len(failures) > 0:
+        sys.exit(1)
+    print("All cases ran to completion.")
+
+if __name__ == "__main__":
+    main()
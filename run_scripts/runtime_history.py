@@ -0,0 +1,222 @@
+#!/usr/bin/python3
+
+#=========================================================================================================
+# Description: Runtime history of CLUBB runs in a small sqlite database.
+#
+#              The case runners (run_scm_parallel.py, convergence_run/run_convergence_matrix.py) record
+#              every run with --history DB: the case, a hash of its configuration, the commit, the wall
+#              and CPU time, the peak memory (RSS) and the size of the output files.
+#
+#              The command line tool lists the runs, prints the expected wall times of the cases longest
+#              first (for scheduling), and compares the run times of two commits to find slowdowns.
+#
+# Usage:
+#
+#           ./runtime_history.py history.db show --case bomex
+#           ./runtime_history.py history.db hints
+#           ./runtime_history.py history.db regressions 1a2b3c4 5d6e7f8 --threshold 0.1
+#=========================================================================================================
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+# Number of recent successful runs of a case used for its expected wall time
+RECENT_RUNS = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    recorded TEXT NOT NULL,
+    commit_id TEXT,
+    runner TEXT,
+    case_name TEXT NOT NULL,
+    config_hash TEXT,
+    exit_code INTEGER,
+    wall_time REAL,
+    cpu_time REAL,
+    max_rss_kb INTEGER,
+    output_bytes INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_by_case ON runs (case_name, config_hash);
+CREATE INDEX IF NOT EXISTS runs_by_commit ON runs (commit_id);
+"""
+
+def open_history(db_path):
+    """
+    Opens (and creates if needed) a runtime history database. The connection may be
+    used from several threads, as long as they don't use it at the same time.
+    """
+    connection = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+    connection.executescript(SCHEMA)
+    return connection
+
+def current_commit(path=os.path.dirname(os.path.realpath(__file__))):
+    """
+    Returns the git commit of the CLUBB checkout (with a + if there are uncommitted changes), or None
+    """
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=path,
+                                         stderr=subprocess.DEVNULL, text=True).strip()
+        changes = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], cwd=path,
+                                          stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("+" if changes else "")
+
+def config_hash(*parts):
+    """
+    Returns a short hash of the configuration of a run. Parts are strings, or paths of
+    files (e.g. namelists) whose contents are hashed.
+    """
+    hasher = hashlib.blake2b(digest_size=8)
+    for part in parts:
+        if os.path.isfile(part):
+            with open(part, "rb") as part_file:
+                hasher.update(part_file.read())
+        else:
+            hasher.update(part.encode())
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+def output_size(output_dir, prefix):
+    """
+    Returns the total size of the output files of a run, which are named prefix_{zt,zm,sfc,...}
+    """
+    total = 0
+    for filename in os.listdir(output_dir):
+        if filename.startswith(prefix + "_") and "_" not in filename[len(prefix)+1:]:
+            total += os.path.getsize(os.path.join(output_dir, filename))
+    return total
+
+def run_and_measure(command, cwd, log_file):
+    """
+    Runs a command and waits for it. Returns its exit code, wall time, CPU time (user+system)
+    and peak RSS in kB. The CPU time and RSS include the processes started by the command.
+    """
+    start = time.time()
+    process = subprocess.Popen(command, cwd=cwd, stdout=log_file, stderr=subprocess.STDOUT)
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return process.returncode, time.time() - start, usage.ru_utime + usage.ru_stime, usage.ru_maxrss
+
+def record_run(connection, runner, case, config, exit_code, wall_time, cpu_time=None, max_rss_kb=None,
+               output_bytes=None, commit=None):
+    with connection:
+        connection.execute("INSERT INTO runs (recorded, commit_id, runner, case_name, config_hash, exit_code, "
+                           "wall_time, cpu_time, max_rss_kb, output_bytes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           (time.strftime("%Y-%m-%d %H:%M:%S"), commit, runner, case, config, exit_code,
+                            wall_time, cpu_time, max_rss_kb, output_bytes))
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 == 1 else (values[middle-1] + values[middle]) / 2
+
+def wall_time_hints(connection, cases=None, runner=None):
+    """
+    Returns the expected wall time of each case, the median of its last RECENT_RUNS successful runs,
+    as a dictionary. Cases without a successful run are left out.
+    """
+    query = "SELECT case_name, wall_time FROM runs WHERE exit_code = 0"
+    arguments = []
+    if runner is not None:
+        query += " AND runner = ?"
+        arguments.append(runner)
+    wall_times = {}
+    for case, wall_time in connection.execute(query + " ORDER BY id DESC", arguments):
+        if cases is None or case in cases:
+            wall_times.setdefault(case, [])
+            if len(wall_times[case]) < RECENT_RUNS:
+                wall_times[case].append(wall_time)
+    return {case: median(times) for case, times in wall_times.items()}
+
+def commit_medians(connection, commit):
+    """
+    Returns the median wall and CPU time of the successful runs of a commit,
+    as a dictionary from (runner, case, config hash) to (wall time, CPU time)
+    """
+    runs = {}
+    for runner, case, config, wall_time, cpu_time in connection.execute(
+            "SELECT runner, case_name, config_hash, wall_time, cpu_time FROM runs "
+            "WHERE commit_id = ? AND exit_code = 0", (commit,)):
+        runs.setdefault((runner, case, config), []).append((wall_time, cpu_time))
+    return {key: (median([run[0] for run in values]),
+                  median([run[1] for run in values]) if all(run[1] is not None for run in values) else None)
+            for key, values in runs.items()}
+
+def find_regressions(connection, base_commit, new_commit, threshold=0.1):
+    """
+    Compares the runs of two commits with the same runner, case and configuration.
+    Returns a list of dicts for the runs whose median CPU time (or wall time, if the CPU time
+    isn't known) grew by more than the threshold (a fraction), slowest first.
+    """
+    base = commit_medians(connection, base_commit)
+    new = commit_medians(connection, new_commit)
+    regressions = []
+    for key in sorted(set(base) & set(new)):
+        use_cpu = base[key][1] is not None and new[key][1] is not None and base[key][1] > 0
+        before, after = (base[key][1], new[key][1]) if use_cpu else (base[key][0], new[key][0])
+        if before > 0 and (after - before) / before > threshold:
+            regressions.append({"runner": key[0], "case": key[1], "config_hash": key[2],
+                                "measure": "cpu_time" if use_cpu else "wall_time",
+                                "before": before, "after": after, "change": (after - before) / before})
+    return sorted(regressions, key=lambda regression: -regression["change"])
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the runtime history of CLUBB runs")
+    parser.add_argument("database", help="sqlite database written by the case runners")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    show = subparsers.add_parser("show", help="list recent runs")
+    show.add_argument("--case", help="only runs of this case")
+    show.add_argument("-n", "--number", type=int, default=20, help="number of runs (default: %(default)s)")
+
+    hints = subparsers.add_parser("hints", help="print the expected wall time of every case, longest first")
+    hints.add_argument("--runner", help="only runs of this runner")
+
+    regressions = subparsers.add_parser("regressions", help="find cases that got slower between two commits")
+    regressions.add_argument("base_commit")
+    regressions.add_argument("new_commit")
+    regressions.add_argument("-t", "--threshold", type=float, default=0.1,
+                             help="relative slowdown that counts as a regression (default: %(default)s)")
+
+    args = parser.parse_args()
+    if not os.path.exists(args.database):
+        sys.exit(args.database + " does not exist")
+    connection = open_history(args.database)
+
+    if args.command == "show":
+        query = "SELECT recorded, commit_id, runner, case_name, config_hash, exit_code, wall_time, cpu_time, " \
+                "max_rss_kb, output_bytes FROM runs"
+        arguments = []
+        if args.case:
+            query += " WHERE case_name = ?"
+            arguments.append(args.case)
+        print("%-19s %-9s %-22s %-30s %-16s %4s %9s %9s %9s %11s" % ("recorded", "commit", "runner", "case",
+              "config", "exit", "wall [s]", "cpu [s]", "rss [kB]", "output [B]"))
+        for row in reversed(connection.execute(query + " ORDER BY id DESC LIMIT ?", arguments + [args.number]).fetchall()):
+            print("%-19s %-9s %-22s %-30s %-16s %4s %9.1f %9s %9s %11s" % (row[0], row[1], row[2], row[3], row[4],
+                  row[5], row[6], "-" if row[7] is None else "%.1f" % row[7], row[8], row[9]))
+
+    elif args.command == "hints":
+        for case, wall_time in sorted(wall_time_hints(connection, runner=args.runner).items(),
+                                      key=lambda item: -item[1]):
+            print("%-30s %9.1f" % (case, wall_time))
+
+    else:
+        found = find_regressions(connection, args.base_commit, args.new_commit, args.threshold)
+        for regression in found:
+            print("%s %s (%s): %s %.1f s -> %.1f s (%+.0f%%)" % (regression["runner"], regression["case"],
+                  regression["config_hash"], regression["measure"], regression["before"], regression["after"],
+                  100 * regression["change"]))
+        if len(found) > 0:
+            sys.exit(1)
+        print("No regressions from " + args.base_commit + " to " + args.new_commit)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+#!/usr/bin/python3
+
+#=========================================================================================================
+# Description: Runs a sweep of variants of a case (e.g. perturbed parameters) from a shared spin-up.
+#
+#              The spin-up is the case with the base namelist, run once from time_initial to the spin-up
+#              time. Its output is saved as a restart snapshot in RESTART_DIR/CASE_HASH, where HASH
+#              identifies the base namelist and the spin-up time, so a later sweep with the same base
+#              reuses it. snapshot.json in the snapshot directory records how it was made.
+#
+#              Every variant then restarts from the snapshot (l_restart, restart_path_case and
+#              time_restart) with its own changes to the namelist, so only the time after the spin-up
+#              is simulated again. The variants run several at a time, each in WORK_DIR/VARIANT with its
+#              output in WORK_DIR/VARIANT/output and provenance.json, which records the snapshot the
+#              variant started from. The spin-up writes its output every few minutes, at least twice,
+#              with one sample per output, so the restart starts from the instantaneous state at the
+#              spin-up time. CLUBB finds the restart time from the first two output times, so the
+#              spin-up length must be a multiple of one minute, and of the output interval.
+#
+#              Variants are given with --variant NAME VARIABLE=VALUE..., --perturb (a parameter
+#              multiplied by each factor, like the sensitivity runs of utilities/sens_matrix) or a JSON
+#              file {"name": {"variable": "value", ...}, ...}. Variants can't change the grid or the
+#              start time, since they would not match the snapshot.
+#
+# Usage:
+#
+#           ./warm_start_sweep.py bomex 10800 --perturb C8 0.8 1.2 --perturb C11 0.8 1.2 --jobs 4
+#           ./warm_start_sweep.py bomex 10800 --variant splat_off C_wp2_splat=0.0 --work-dir ../sweeps/splat
+#=========================================================================================================
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+import clubb_namelist
+import runtime_history
+
+scriptPath = os.path.dirname(os.path.realpath(__file__))
+clubbPath = os.path.dirname(scriptPath)
+
+# Exit status of clubb_standalone when the run finished normally
+CLUBB_SUCCESS = 6
+
+# A restart has to start a whole number of minutes after the start of its restart file
+SEC_PER_MIN = 60.0
+
+# Output files of the spin-up that are needed to restart
+RESTART_SUFFIXES = ["zt", "zm", "sfc"]
+
+# Variables that have to be the same in the spin-up and the variants
+FIXED_VARIABLES = ["runtype", "nzmax", "grid_type", "deltaz", "zm_init", "zm_top", "zt_grid_fname", "zm_grid_fname",
+                   "time_initial", "fname_prefix", "stats_fmt", "l_restart", "restart_path_case", "time_restart"]
+
+def read_base_namelist(case, parameter_file, stats_file, settings):
+    """
+    Returns the namelist of a case, like run_scm.bash makes it, with the settings (VARIABLE=VALUE) changed
+    """
+    tunable_dir = os.path.join(clubbPath, "input", "tunable_parameters")
+    namelist = clubb_namelist.read_namelist(parameter_file,
+                                            os.path.join(tunable_dir, "silhs_parameters.in"),
+                                            os.path.join(tunable_dir, "configurable_model_flags.in"),
+                                            os.path.join(clubbPath, "input", "case_setups", case + "_model.in"),
+                                            stats_file)
+    namelist.set("fname_prefix", clubb_namelist.quote(case))
+    namelist.set("stats_fmt", clubb_namelist.quote("netcdf"))
+    namelist.update(parse_settings(settings))
+    return namelist
+
+def parse_settings(settings):
+    """
+    Returns a dictionary of VARIABLE=VALUE strings
+    """
+    values = {}
+    for setting in settings:
+        variable, separator, value = setting.partition("=")
+        if not separator:
+            raise ValueError("expected VARIABLE=VALUE instead of " + setting)
+        values[variable.strip()] = value.strip()
+    return values
+
+def expand_variants(namelist, variants, perturbations, variants_file):
+    """
+    Returns the variants as a dictionary from name to the changes to the base namelist
+    """
+    expanded = {}
+    for name, *settings in variants:
+        expanded[name] = parse_settings(settings)
+    for parameter, *factors in perturbations:
+        base_value = clubb_namelist.parse_value(namelist.get(parameter, "nan"))
+        if not isinstance(base_value, (int, float)) or isinstance(base_value, bool):
+            raise ValueError(parameter + " is not a number in the base namelist")
+        for factor in factors:
+            expanded[parameter + "_x" + factor] = {parameter: base_value * float(factor)}
+    if variants_file:
+        with open(variants_file) as json_file:
+            expanded.update(json.load(json_file))
+    for name, changes in expanded.items():
+        fixed = [variable for variable in changes if variable.lower() in FIXED_VARIABLES]
+        if fixed:
+            raise ValueError("variant " + name + " changes " + ", ".join(fixed) + ", which must match the spin-up")
+        for variable in changes:
+            # Raises KeyError for a variable that isn't in the namelist
+            namelist.group_of(variable)
+    return expanded
+
+def make_link(target, link_name):
+    if os.path.islink(link_name):
+        os.remove(link_name)
+    os.symlink(target, link_name)
+
+def prepare_run_dir(work_dir, namelist_text):
+    """
+    Creates a directory to run CLUBB in (work_dir/run, with links to the CLUBB input and an output
+    directory next to it, so the relative paths in the namelist work). Returns the run directory.
+    """
+    run_dir = os.path.join(work_dir, "run")
+    os.makedirs(run_dir, exist_ok=True)
+    os.makedirs(os.path.join(work_dir, "output"), exist_ok=True)
+    make_link(os.path.join(clubbPath, "input"), os.path.join(work_dir, "input"))
+    with open(os.path.join(run_dir, "clubb.in"), "w") as namelist_file:
+        namelist_file.write(namelist_text)
+    return run_dir
+
+def run_clubb(run_dir, executable):
+    """
+    Runs CLUBB in run_dir. Returns the exit code (0 if CLUBB finished normally), the wall time,
+    the CPU time and the peak RSS in kB.
+    """
+    with open(os.path.join(run_dir, "clubb.log"), "w") as log_file:
+        exit_code, wall_time, cpu_time, max_rss_kb = runtime_history.run_and_measure([executable], run_dir, log_file)
+    if exit_code == CLUBB_SUCCESS:
+        exit_code = 0
+    elif exit_code == 0:
+        exit_code = 1
+    return exit_code, wall_time, cpu_time, max_rss_kb
+
+def is_multiple(value, step):
+    """
+    Returns whether value is a whole multiple of step, up to rounding errors
+    """
+    return abs(value / step - round(value / step)) <= 1e-6
+
+def spinup_overrides(namelist, spinup_time):
+    """
+    Returns the changes to the base namelist for the spin-up: it ends at the spin-up time, with one
+    stats sample per output. The output interval is the longest one that gives at least two outputs,
+    since CLUBB reads the output interval of a restart file from its first two output times. It
+    divides the spin-up length and is a multiple of one minute and of dt_main, as a restart needs.
+    """
+    time_initial = float(clubb_namelist.parse_value(namelist.get("time_initial")))
+    dt_main = float(clubb_namelist.parse_value(namelist.get("dt_main")))
+    length = spinup_time - time_initial
+    if length <= 0 or not is_multiple(length, dt_main):
+        raise ValueError("the spin-up time must be after time_initial (" + str(time_initial) +
+                         ") by a multiple of dt_main (" + str(dt_main) + ")")
+    if not is_multiple(length, SEC_PER_MIN):
+        raise ValueError("the spin-up time must be after time_initial (" + str(time_initial) +
+                         ") by a multiple of " + str(SEC_PER_MIN) + " s, or CLUBB can't restart from it")
+    for num_outputs in range(2, int(round(length / SEC_PER_MIN)) + 1):
+        output_interval = length / num_outputs
+        if is_multiple(output_interval, SEC_PER_MIN) and is_multiple(output_interval, dt_main):
+            return {"time_final": spinup_time, "stats_tsamp": output_interval, "stats_tout": output_interval,
+                    "l_restart": False}
+    raise ValueError("no output interval of the spin-up divides its length (" + str(length) + " s) and is a " +
+                     "multiple of both " + str(SEC_PER_MIN) + " s and dt_main (" + str(dt_main) + ")")
+
+def find_or_make_snapshot(namelist, case, spinup_time, restart_dir, executable, history=None, commit=None):
+    """
+    Returns the directory of the restart snapshot of the spin-up and its metadata, running the
+    spin-up if there is no snapshot of it yet
+    """
+    overrides = spinup_overrides(namelist, spinup_time)
+    spinup_text = namelist.to_string(overrides)
+    config = runtime_history.config_hash(spinup_text)
+    snapshot_dir = os.path.join(os.path.abspath(restart_dir), case + "_" + config)
+    metadata_filename = os.path.join(snapshot_dir, "snapshot.json")
+    if os.path.exists(metadata_filename):
+        with open(metadata_filename) as metadata_file:
+            metadata = json.load(metadata_file)
+        print("Using the restart snapshot in " + snapshot_dir)
+        return snapshot_dir, metadata
+
+    print("Running the spin-up of " + case + " to " + str(spinup_time) + " s")
+    spinup_dir = os.path.join(snapshot_dir, "spinup")
+    run_dir = prepare_run_dir(spinup_dir, spinup_text)
+    exit_code, wall_time, cpu_time, max_rss_kb = run_clubb(run_dir, executable)
+    if history is not None:
+        runtime_history.record_run(history, "warm_start_sweep", case + "_spinup", config, exit_code, wall_time,
+                                   cpu_time, max_rss_kb,
+                                   runtime_history.output_size(os.path.join(spinup_dir, "output"), case), commit)
+    if exit_code != 0:
+        raise RuntimeError("the spin-up failed, see " + os.path.join(run_dir, "clubb.log"))
+
+    for suffix in RESTART_SUFFIXES:
+        shutil.move(os.path.join(spinup_dir, "output", case + "_" + suffix + ".nc"), snapshot_dir)
+    metadata = {"snapshot": os.path.basename(snapshot_dir), "case": case, "spinup_time": spinup_time,
+                "config_hash": config, "commit": commit, "executable": os.path.abspath(executable),
+                "created": time.strftime("%Y-%m-%d %H:%M:%S"), "spinup_wall_time": round(wall_time, 2)}
+    with open(metadata_filename, "w") as metadata_file:
+        json.dump(metadata, metadata_file, indent=2)
+    print("Saved the restart snapshot to " + snapshot_dir)
+    return snapshot_dir, metadata
+
+def variant_namelist(namelist, changes, variant_dir, snapshot_dir, case, spinup_time):
+    """
+    Returns the namelist text of a variant that restarts from the snapshot
+    """
+    # CLUBB reads the restart files from "../" + restart_path_case, relative to the run directory
+    restart_path = os.path.relpath(os.path.join(snapshot_dir, case), variant_dir)
+    overrides = dict(changes)
+    overrides.update({"l_restart": True, "restart_path_case": clubb_namelist.quote(restart_path),
+                      "time_restart": spinup_time})
+    return namelist.to_string(overrides)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run variants of a case from a shared spin-up")
+    parser.add_argument("case", help="case name")
+    parser.add_argument("spinup_time", type=float, help="model time [s] at the end of the spin-up, where the "
+                                                        "variants start")
+    parser.add_argument("--variant", nargs="+", action="append", default=[], metavar="NAME VARIABLE=VALUE",
+                        help="a variant with its changes to the namelist, may be given several times")
+    parser.add_argument("--perturb", nargs="+", action="append", default=[], metavar="PARAMETER FACTOR",
+                        help="variants with a parameter multiplied by each factor, may be given several times")
+    parser.add_argument("--variants-file", help="JSON file with variants: {name: {variable: value}}")
+    parser.add_argument("-s", "--set", action="append", default=[], metavar="VARIABLE=VALUE",
+                        help="change the base namelist (spin-up and variants), may be given several times")
+    parser.add_argument("-p", "--parameter-file",
+                        default=os.path.join(clubbPath, "input", "tunable_parameters", "tunable_parameters.in"),
+                        help="tunable parameter file (default: %(default)s)")
+    parser.add_argument("-t", "--stats-file", default=os.path.join(clubbPath, "input", "stats", "standard_stats.in"),
+                        help="stats file, must have the variables needed to restart (default: %(default)s)")
+    parser.add_argument("--restart-dir", default=os.path.join(clubbPath, "restart_ic"),
+                        help="directory for the restart snapshots (default: %(default)s)")
+    parser.add_argument("--work-dir", default=os.path.join(clubbPath, "sweeps"),
+                        help="directory for the variant directories (default: %(default)s)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        help="number of variants run at the same time (default: number of CPUs)")
+    parser.add_argument("--executable", default=os.path.join(clubbPath, "bin", "clubb_standalone"),
+                        help="CLUBB executable (default: %(default)s)")
+    parser.add_argument("--history", metavar="DB", help="record the runs in this runtime history database "
+                                                        "(see runtime_history.py)")
+    args = parser.parse_args()
+
+    try:
+        namelist = read_base_namelist(args.case, args.parameter_file, args.stats_file, args.set)
+        variants = expand_variants(namelist, args.variant, args.perturb, args.variants_file)
+    except (KeyError, ValueError) as error:
+        sys.exit(error.args[0])
+    if len(variants) == 0:
+        sys.exit("No variants given, use --variant, --perturb or --variants-file")
+
+    history = runtime_history.open_history(args.history) if args.history else None
+    commit = runtime_history.current_commit()
+    try:
+        snapshot_dir, snapshot = find_or_make_snapshot(namelist, args.case, args.spinup_time, args.restart_dir,
+                                                       args.executable, history, commit)
+    except (RuntimeError, ValueError) as error:
+        sys.exit(error.args[0])
+
+    work_dir = os.path.abspath(args.work_dir)
+    run_dirs = {}
+    for name, changes in variants.items():
+        variant_dir = os.path.join(work_dir, name)
+        try:
+            text = variant_namelist(namelist, changes, variant_dir, snapshot_dir, args.case, args.spinup_time)
+        except KeyError as error:
+            sys.exit("variant " + name + ": " + error.args[0])
+        run_dirs[name] = prepare_run_dir(variant_dir, text)
+
+    print("Running " + str(len(variants)) + " variants from " + snapshot["snapshot"] + ", " + str(args.jobs) +
+          " at a time\n")
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = {executor.submit(run_clubb, run_dir, os.path.abspath(args.executable)): name
+                   for name, run_dir in run_dirs.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            exit_code, wall_time, cpu_time, max_rss_kb = future.result()
+            variant_dir = os.path.join(work_dir, name)
+            if history is not None:
+                runtime_history.record_run(history, "warm_start_sweep", args.case,
+                                           runtime_history.config_hash(os.path.join(run_dirs[name], "clubb.in")),
+                                           exit_code, wall_time, cpu_time, max_rss_kb,
+                                           runtime_history.output_size(os.path.join(variant_dir, "output"),
+                                                                       args.case), commit)
+            results[name] = {"exit_code": exit_code, "wall_time": round(wall_time, 2)}
+            with open(os.path.join(variant_dir, "provenance.json"), "w") as provenance_file:
+                json.dump({"variant": name, "case": args.case, "changes": variants[name], "base_settings": args.set,
+                           "snapshot": snapshot, "snapshot_dir": snapshot_dir, "commit": commit,
+                           "exit_code": exit_code, "wall_time": round(wall_time, 2)}, provenance_file, indent=2)
+            print(name + (" ran to completion" if exit_code == 0 else " failure") + " in %.1f s" % wall_time)
+
+    with open(os.path.join(work_dir, "sweep.json"), "w") as summary_file:
+        json.dump({"case": args.case, "snapshot": snapshot, "snapshot_dir": snapshot_dir,
+                   "variants": {name: dict(results[name], changes=variants[name]) for name in sorted(results)}},
+                  summary_file, indent=2)
+
+    failures = sorted(name for name, result in results.items() if result["exit_code"] != 0)
+    print("\nRan " + str(len(results)) + " variants from " + snapshot_dir + ", summary in " +
+          os.path.join(work_dir, "sweep.json"))
+    if len(failures) > 0:
+        print("Failed: " + " ".join(failures))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# $Id$
+#-------------------------------------------------------------------------------
+# Converts the SAM input files of many cases (e.g. the members of an ensemble)
+# to CLUBB input files at once, like snd_to_sounding.py, lsf_to_forcings.py and
+# sfc_to_sfc.py do for one file.
+#
+# Every directory under the given directories that contains a SAM "snd", "lsf"
+# or "sfc" file is a case. Its files are converted to CASE_sounding.in,
+# CASE_forcings.in and CASE_sfc.in in the output directory, where CASE is the
+# path of the directory relative to the given directory, with "_" instead of
+# "/" (the name of the directory itself if a case directory is given). day0 is
+# read from the "prm" file of the case unless it is given with --day0.
+#
+# The rows of a file are split once and the columns are converted with NumPy,
+# and the files are converted in parallel. The output is the same as the
+# output of the single file scripts, which --verify checks by running them
+# (with --reference-python) on every file and comparing the outputs.
+#-------------------------------------------------------------------------------
+import argparse
+import filecmp
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+scriptPath = os.path.dirname(os.path.realpath(__file__))
+
+# The SAM input files, the CLUBB input file each is converted to and the
+# script that converts it
+CONVERSIONS = {"snd": ("_sounding.in", "snd_to_sounding.py"),
+               "lsf": ("_forcings.in", "lsf_to_forcings.py"),
+               "sfc": ("_sfc.in", "sfc_to_sfc.py")}
+
+# The ASCII whitespace other than spaces and newlines, which
+# common_utils.parseLine does not split columns at
+OTHER_WHITESPACE = "\t\r\x0b\x0c\x1c\x1d\x1e\x1f"
+
+#-------------------------------------------------------------------------------
+# Splits the lines of a file into columns, like common_utils.parseLine does for
+# every line of f.readlines().
+#
+# Parameters:
+#  - text: the contents of the file
+# Return value:
+#  - the lines, or None if they have whitespace other than spaces (which
+#    np.loadtxt would split columns at)
+#  - a list with the list of columns of every line
+#-------------------------------------------------------------------------------
+def parseLines(text):
+    lines = text.split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    if text.isascii() and not any(character in text for character in OTHER_WHITESPACE):
+        # str.split() is faster and gives the same columns when spaces are the
+        # only whitespace
+        return lines, [line.split() for line in lines]
+    return None, [[token for token in line.split(' ') if token] for line in lines]
+
+#-------------------------------------------------------------------------------
+# Reads columns of numbers from lines that all have the same number of columns.
+#
+# Parameters:
+#  - lines:   the lines (from parseLines)
+#  - tokens:  the columns of the lines (from parseLines), used if lines is None
+#  - rows:    the indices of the lines to read
+#  - columns: the indices of the columns to read
+# Return value:
+#  - an array with a row for every line and a column for every column read
+#-------------------------------------------------------------------------------
+def readColumns(lines, tokens, rows, columns):
+    if len(rows) == 0:
+        return np.empty((0, len(columns)))
+    if lines is None:
+        return np.array([[float(tokens[row][column]) for column in columns] for row in rows])
+    return np.loadtxt([lines[row] for row in rows], usecols=columns, ndmin=2,
+                      comments=None, delimiter=None)
+
+#-------------------------------------------------------------------------------
+# Formats real numbers like str(float) in the Python 2 single file scripts:
+# 12 significant digits, with ".0" added to whole numbers.
+#
+# Parameters:
+#  - values: an array of numbers
+# Return value:
+#  - a list of strings
+#-------------------------------------------------------------------------------
+def formatReals(values):
+    strings = ['%.12g' % value for value in values.tolist()]
+    return [string if '.' in string or 'e' in string or 'n' in string else string + '.0'
+            for string in strings]
+
+#-------------------------------------------------------------------------------
+# Converts SAM days to CLUBB times like the single file scripts: whole seconds
+# after day0, followed by ".".
+#-------------------------------------------------------------------------------
+def formatTimes(days, day0):
+    seconds = ((days - day0) * 86400.0).astype(np.int64)
+    return [str(second) + '.' for second in seconds.tolist()]
+
+#-------------------------------------------------------------------------------
+# Formats rows of columns like common_utils.formatOutput: every column is padded
+# with spaces to its size.
+#
+# Parameters:
+#  - columns: a list with a list of entries (one per row) for every column, or a
+#             string for a column that is the same in every row
+#  - sizes:   the sizes of the columns
+#  - rows:    the number of rows
+# Return value:
+#  - a list with the line of every row
+#-------------------------------------------------------------------------------
+def formatRows(columns, sizes, rows):
+    lineFormat = ''.join('%-' + str(size) + 's' for size in sizes) + '\n'
+    columns = [[column] * rows if isinstance(column, str) else column for column in columns]
+    return [lineFormat % row for row in zip(*columns)]
+
+#-------------------------------------------------------------------------------
+# Converts the text of a SAM snd file to a *_sounding.in file, like
+# snd_to_sounding.py (only the first time of the file is used).
+#-------------------------------------------------------------------------------
+def convertSounding(text):
+    lines, tokens = parseLines(text)
+    sizes = [16, 15, 15, 13, 13, 14, 13, 0]
+    header = formatRows(["Press[Pa]", "thm[K]", "rt[kg\\kg]", "u[m\\s]", "v[m\\s]",
+                         "omega[Pa\\s]", "ug[m\\s]", "vg[m\\s]"], sizes, 1)
+    if len(tokens) < 2 or len(tokens[1]) != 3:
+        raise ValueError("second line of file does not give time information")
+    counts = np.array([len(line) for line in tokens[2:]], dtype=int)
+    # The rows end at the next time
+    nextTime = np.flatnonzero(counts == 3)
+    if len(nextTime) > 0:
+        counts = counts[:nextTime[0]]
+    if np.any(counts != 6):
+        raise ValueError("a file row did not have 6 columns")
+    rows = range(2, 2 + len(counts))
+    values = readColumns(lines, tokens, rows, (1, 3))
+    columns = list(zip(*[tokens[row] for row in rows])) or [()] * 6
+    press = formatReals(values[:, 0] * 100.0)
+    rt = formatReals(values[:, 1] / 1000.0)
+    return ''.join(header + formatRows([press, columns[2], rt, columns[4], columns[5],
+                                        "-999.9", columns[4], columns[5]],
+                                       sizes, len(rows)))
+
+#-------------------------------------------------------------------------------
+# Converts the text of a SAM lsf file to a *_forcings.in file, like
+# lsf_to_forcings.py.
+#-------------------------------------------------------------------------------
+def convertForcings(text, day0):
+    lines, tokens = parseLines(text)
+    sizes = [17, 16, 17, 14, 14, 14, 14, 15, 14, 0]
+    header = formatRows(["Press[Pa]", "thlm_f[K\\s]", "rtm_f[kg\\kg\\s]", "um_ref[m\\s]",
+                         "vm_ref[m\\s]", "um_f[m\\s^2]", "vm_f[m\\s^2]", "omega[mb\\hr]",
+                         "ug[m\\s]", "vg[m\\s]"], sizes, 1)
+    # Skip the first line
+    counts = np.array([len(line) for line in tokens[1:]], dtype=int)
+    if np.any((counts != 3) & (counts != 7)):
+        raise ValueError("An input line did not have the correct number of columns.")
+    timeRows = np.flatnonzero(counts == 3) + 1
+    dataRows = np.flatnonzero(counts == 7) + 1
+    outLines = [None] * len(tokens)
+
+    # The time declarations, with the number of rows for each time
+    times = formatTimes(readColumns(lines, tokens, timeRows, (0,))[:, 0], day0)
+    numRows = [tokens[row][1] for row in timeRows]
+    for row, line in zip(timeRows, formatRows([times, numRows], [17, 0], len(timeRows))):
+        outLines[row] = line
+
+    press = formatReals(readColumns(lines, tokens, dataRows, (1,))[:, 0] * 100.0)
+    columns = list(zip(*[tokens[row] for row in dataRows])) or [()] * 7
+    for row, line in zip(dataRows, formatRows([press, columns[2], columns[3], columns[4],
+                                               columns[5]] + ["-999.9"] * 5,
+                                              sizes, len(dataRows))):
+        outLines[row] = line
+    return ''.join(header + outLines[1:])
+
+#-------------------------------------------------------------------------------
+# Converts the text of a SAM sfc file to a *_sfc.in file, like sfc_to_sfc.py.
+#-------------------------------------------------------------------------------
+def convertSurface(text, day0):
+    lines, tokens = parseLines(text)
+    # Skip the first line
+    if any(len(line) != 5 for line in tokens[1:]):
+        raise ValueError("A row of the file did not have five columns!")
+    rows = range(1, len(tokens))
+    times = formatTimes(readColumns(lines, tokens, rows, (0,))[:, 0], day0)
+    columns = list(zip(*tokens[1:])) or [()] * 5
+    return "Time[s]    latent_ht[W\\m^2]   sens_ht[W\\m^2]    T_sfc[K]\n" + \
+           ''.join(formatRows([times, columns[3], columns[2], "299.27"], [11, 19, 18, 0],
+                              len(rows)))
+
+#-------------------------------------------------------------------------------
+# Reads day0 from the PARAMETERS namelist of a SAM prm file, or returns None if
+# the file doesn't exist or doesn't set it.
+#-------------------------------------------------------------------------------
+def readDay0(prmFile):
+    if not os.path.exists(prmFile):
+        return None
+    with open(prmFile) as f:
+        match = re.search(r"^\s*day0\s*=\s*([-+0-9.eEdD]+)", f.read(),
+                          re.MULTILINE | re.IGNORECASE)
+    return float(match.group(1).replace('d', 'e').replace('D', 'e')) if match else None
+
+#-------------------------------------------------------------------------------
+# Finds the case directories (with a snd, lsf or sfc file) under the given
+# directories.
+#
+# Return value:
+#  - a list of (case name, directory) pairs, sorted by name
+#-------------------------------------------------------------------------------
+def findCases(directories):
+    cases = {}
+    for top in directories:
+        top = os.path.normpath(top)
+        for directory, subdirectories, files in os.walk(top):
+            subdirectories.sort()
+            if not any(name in files for name in CONVERSIONS):
+                continue
+            relative = os.path.relpath(directory, top)
+            name = os.path.basename(top) if relative == '.' else relative.replace(os.sep, '_')
+            if name in cases and cases[name] != directory:
+                raise ValueError("cases " + cases[name] + " and " + directory +
+                                 " have the same name " + name)
+            cases[name] = directory
+    return sorted(cases.items())
+
+#-------------------------------------------------------------------------------
+# Converts one SAM file of a case and writes the CLUBB file.
+#
+# Return value:
+#  - the name of the CLUBB file
+#-------------------------------------------------------------------------------
+def convertFile(inputFile, outputFile, kind, day0):
+    with open(inputFile, 'r') as f:
+        text = f.read()
+    if kind == "snd":
+        outText = convertSounding(text)
+    elif kind == "lsf":
+        outText = convertForcings(text, day0)
+    else:
+        outText = convertSurface(text, day0)
+    with open(outputFile, 'w') as f:
+        f.write(outText)
+    return outputFile
+
+#-------------------------------------------------------------------------------
+# Runs the single file script of a conversion and checks that its output is
+# the same as the batch output.
+#
+# Return value:
+#  - None if the outputs are the same, or a message
+#-------------------------------------------------------------------------------
+def verifyFile(inputFile, outputFile, kind, day0, referencePython):
+    script = os.path.join(scriptPath, CONVERSIONS[kind][1])
+    with tempfile.TemporaryDirectory() as tempDir:
+        referenceFile = os.path.join(os.path.abspath(tempDir), os.path.basename(outputFile))
+        # The scripts import common_utils from the current directory, so all paths are absolute
+        if os.path.dirname(referencePython) != "":
+            referencePython = os.path.abspath(referencePython)
+        command = [referencePython, script, os.path.abspath(inputFile), referenceFile]
+        if kind != "snd":
+            command.append(repr(day0))
+        result = subprocess.run(command, cwd=scriptPath, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, universal_newlines=True)
+        if result.returncode != 0:
+            return outputFile + ": " + CONVERSIONS[kind][1] + " failed:\n" + result.stdout
+        if not filecmp.cmp(referenceFile, outputFile, shallow=False):
+            return outputFile + " differs from the output of " + CONVERSIONS[kind][1]
+    return None
+
+#-------------------------------------------------------------------------------
+# Main code
+#-------------------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Convert the SAM snd, lsf and sfc "
+                                     "files of many cases to CLUBB input files")
+    parser.add_argument("directories", nargs="+",
+                        help="case directories, or directories with case directories")
+    parser.add_argument("-o", "--output-dir", default=".",
+                        help="directory for the CLUBB files (default: %(default)s)")
+    parser.add_argument("--day0", type=float,
+                        help="the day that is t=0 in CLUBB (default: day0 in the prm "
+                        "file of each case)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="number of processes (default: number of CPUs)")
+    parser.add_argument("--verify", action="store_true",
+                        help="check that the outputs are the same as the outputs of "
+                        "the single file scripts")
+    parser.add_argument("--reference-python", default="python2",
+                        help="interpreter that runs the single file scripts with "
+                        "--verify (default: %(default)s)")
+    args = parser.parse_args()
+
+    try:
+        cases = findCases(args.directories)
+    except ValueError as error:
+        sys.exit(str(error))
+    if len(cases) == 0:
+        sys.exit("No SAM snd, lsf or sfc files found")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    tasks = []
+    for name, directory in cases:
+        day0 = args.day0 if args.day0 is not None else readDay0(os.path.join(directory, "prm"))
+        for kind, (suffix, script) in CONVERSIONS.items():
+            inputFile = os.path.join(directory, kind)
+            if not os.path.exists(inputFile):
+                continue
+            if kind != "snd" and day0 is None:
+                sys.exit(inputFile + ": no day0 in the prm file, use --day0")
+            tasks.append((inputFile, os.path.join(args.output_dir, name + suffix), kind, day0))
+
+    failures = []
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = [(task, executor.submit(convertFile, *task)) for task in tasks]
+        for task, future in futures:
+            try:
+                future.result()
+            except ValueError as error:
+                failures.append(task[0] + ": " + str(error))
+    print("Converted " + str(len(tasks) - len(failures)) + " files of " + str(len(cases)) +
+          " cases to " + args.output_dir)
+    for failure in failures:
+        print(failure)
+
+    if args.verify:
+        converted = [task for task in tasks if not any(failure.startswith(task[0] + ": ")
+                                                       for failure in failures)]
+        with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+            messages = [message for message in
+                        executor.map(verifyFile, *zip(*converted),
+                                     [args.reference_python] * len(converted))
+                        if message is not None] if converted else []
+        for message in messages:
+            print(message)
+        print("Verified " + str(len(converted) - len(messages)) + " of " + str(len(converted)) +
+              " files against the single file scripts")
+        failures += messages
+
+    if len(failures) > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()